@@ -0,0 +1,75 @@
+"""Compares the time taken to check paths against many exclude patterns with `is_path_excluded()` (one regular
+expression per pattern) and `PathExcludeSet` (combined expression and per-directory pattern subsets).
+
+Run from the repository root with: python -m benchmark.bench_exclude
+"""
+
+from time import perf_counter
+
+from incremental_backup.path_exclude import PathExcludePattern, PathExcludeSet, is_path_excluded
+
+ANCHORED_PATTERNS = 50
+UNANCHORED_PATTERNS = (r".*/\.git/", r".*/__pycache__/", r".*\.tmp", r".*/node_modules/", r".*~")
+DIRECTORIES = 500
+FILES_PER_DIRECTORY = 100
+REPEATS = 3
+
+
+def make_patterns() -> list[PathExcludePattern]:
+    patterns = [f"/home/user{i}/cache/.*" for i in range(ANCHORED_PATTERNS)]
+    patterns.extend(UNANCHORED_PATTERNS)
+    return [PathExcludePattern(p) for p in patterns]
+
+
+def make_paths() -> list[tuple[str, list[str]]]:
+    """Creates directory paths, each with the paths of the files within it."""
+
+    directories: list[tuple[str, list[str]]] = []
+    for d in range(DIRECTORIES):
+        directory_path = f"/data/project{d // 50}/src{d}/"
+        directories.append((directory_path, [f"{directory_path}file{f}.txt" for f in range(FILES_PER_DIRECTORY)]))
+    return directories
+
+
+def check_separate(patterns: list[PathExcludePattern], directories: list[tuple[str, list[str]]], /) -> int:
+    excluded = 0
+    for directory_path, file_paths in directories:
+        excluded += is_path_excluded(directory_path, patterns)
+        excluded += sum(is_path_excluded(path, patterns) for path in file_paths)
+    return excluded
+
+
+def check_set(patterns: list[PathExcludePattern], directories: list[tuple[str, list[str]]], /) -> int:
+    exclude_set = PathExcludeSet(patterns)
+    excluded = 0
+    for directory_path, file_paths in directories:
+        excluded += exclude_set.matches(directory_path)
+        directory_set = exclude_set.for_directory(directory_path)
+        excluded += sum(directory_set.matches(path) for path in file_paths)
+    return excluded
+
+
+def timed(check, patterns: list[PathExcludePattern], directories: list[tuple[str, list[str]]], /) -> float:
+    best_time = float("inf")
+    for _ in range(REPEATS):
+        start = perf_counter()
+        check(patterns, directories)
+        best_time = min(best_time, perf_counter() - start)
+    return best_time
+
+
+def main() -> None:
+    patterns = make_patterns()
+    directories = make_paths()
+    paths = DIRECTORIES * (FILES_PER_DIRECTORY + 1)
+    assert check_separate(patterns, directories) == check_set(patterns, directories)
+
+    print(f"{len(patterns)} patterns, {paths} paths")
+    print(f"{'matcher':<10} {'time (s)':>10} {'us/path':>10}")
+    for name, check in (("separate", check_separate), ("set", check_set)):
+        time = timed(check, patterns, directories)
+        print(f"{name:<10} {time:>10.3f} {time / paths * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
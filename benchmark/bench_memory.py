@@ -0,0 +1,155 @@
+"""Compares the memory used by the in-memory trees of a backup (source directory scan, backup sum and manifest) against
+the previous representation, which used per-instance dicts, `datetime` modification times and a separate string
+for each occurrence of a name.
+
+Memory is measured with `tracemalloc`, per file in the source directory. Results scale linearly, so the memory for
+e.g. 10 million files can be extrapolated.
+
+Run from the repository root with: python -m benchmark.bench_memory
+"""
+
+import gc
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+from incremental_backup._utility import datetime_to_ns
+from incremental_backup.backup import filesystem
+from incremental_backup.backup.sum import BackupSum
+from incremental_backup.meta import BackupManifest, BackupMetadata, BackupStartInfo
+
+DIRECTORIES = 2000
+FILES_PER_DIRECTORY = 50
+# Typical trees have many directories with files of the same names (e.g. build outputs, package metadata).
+DISTINCT_FILE_NAMES = 1000
+
+
+@dataclass
+class LegacyFile:
+    name: str
+    last_modified: datetime
+
+
+@dataclass
+class LegacyDirectory:
+    name: str
+    files: list[LegacyFile] = field(default_factory=list)
+    subdirectories: list["LegacyDirectory"] = field(default_factory=list)
+
+
+@dataclass
+class LegacySumFile:
+    name: str
+    last_backup: BackupMetadata
+
+
+@dataclass
+class LegacySumDirectory:
+    name: str
+    files: list[LegacySumFile] = field(default_factory=list)
+    subdirectories: list["LegacySumDirectory"] = field(default_factory=list)
+
+
+@dataclass
+class LegacyManifestDirectory:
+    name: str
+    copied_files: list[str] = field(default_factory=list)
+    removed_files: list[str] = field(default_factory=list)
+    removed_directories: list[str] = field(default_factory=list)
+    subdirectories: list["LegacyManifestDirectory"] = field(default_factory=list)
+    copied_file_hashes: list[str] = field(default_factory=list)
+
+
+def file_name(directory: int, file: int, /) -> str:
+    """Creates a new string object for each call, as reading names from the filesystem or a manifest does."""
+
+    return f"file{(directory * FILES_PER_DIRECTORY + file) % DISTINCT_FILE_NAMES}.dat"
+
+
+def build_legacy() -> list[Any]:
+    backup = BackupMetadata("benchmarkbackup1", BackupStartInfo(datetime(2024, 1, 1, tzinfo=timezone.utc)), None)
+    base_time = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    scan_root = LegacyDirectory("")
+    sum_root = LegacySumDirectory("")
+    manifest_root = LegacyManifestDirectory("")
+    for d in range(DIRECTORIES):
+        scan_root.subdirectories.append(
+            LegacyDirectory(
+                f"dir{d}",
+                [
+                    LegacyFile(file_name(d, f), base_time + timedelta(seconds=d * FILES_PER_DIRECTORY + f))
+                    for f in range(FILES_PER_DIRECTORY)
+                ],
+            )
+        )
+        sum_root.subdirectories.append(
+            LegacySumDirectory(f"dir{d}", [LegacySumFile(file_name(d, f), backup) for f in range(FILES_PER_DIRECTORY)])
+        )
+        manifest_root.subdirectories.append(
+            LegacyManifestDirectory(f"dir{d}", [file_name(d, f) for f in range(FILES_PER_DIRECTORY)])
+        )
+    return [scan_root, sum_root, manifest_root]
+
+
+def build_current() -> list[Any]:
+    backup = BackupMetadata("benchmarkbackup1", BackupStartInfo(datetime(2024, 1, 1, tzinfo=timezone.utc)), None)
+    base_time = datetime_to_ns(datetime(2023, 1, 1, tzinfo=timezone.utc))
+    scan_root = filesystem.Directory("")
+    sum_root = BackupSum.Directory("")
+    manifest_root = BackupManifest.Directory("")
+    for d in range(DIRECTORIES):
+        # The scanner and manifest parser intern names.
+        scan_root.subdirectories.append(
+            filesystem.Directory(
+                sys.intern(f"dir{d}"),
+                [
+                    filesystem.File(sys.intern(file_name(d, f)), base_time + (d * FILES_PER_DIRECTORY + f) * 10**9)
+                    for f in range(FILES_PER_DIRECTORY)
+                ],
+            )
+        )
+        sum_root.subdirectories.append(
+            BackupSum.Directory(
+                sys.intern(f"dir{d}"),
+                [BackupSum.File(sys.intern(file_name(d, f)), backup) for f in range(FILES_PER_DIRECTORY)],
+            )
+        )
+        manifest_root.subdirectories.append(
+            BackupManifest.Directory(
+                sys.intern(f"dir{d}"), [sys.intern(file_name(d, f)) for f in range(FILES_PER_DIRECTORY)]
+            )
+        )
+    return [scan_root, BackupSum(sum_root), BackupManifest(manifest_root)]
+
+
+def measure(build: Callable[[], list[Any]], /) -> int:
+    """Returns the number of bytes of memory held by the result of `build()`."""
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def main() -> None:
+    files = DIRECTORIES * FILES_PER_DIRECTORY
+    print(f"Python {sys.version.split()[0]}, {files} files")
+
+    legacy_size = measure(build_legacy)
+    current_size = measure(build_current)
+
+    print(f"{'representation':<15} {'memory (MB)':>12} {'bytes per file':>15} {'GB per 10M files':>17}")
+    for label, size in (("legacy", legacy_size), ("current", current_size)):
+        print(f"{label:<15} {size / 2**20:>12.1f} {size / files:>15.0f} {size / files * 10**7 / 2**30:>17.2f}")
+    print(f"Reduction: {legacy_size / current_size:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measures how the time taken by `BackupPlan.new()` scales with the number of files in a single directory.
+The time per file should stay roughly constant as the directory size grows.
+
+Run from the repository root with: python -m benchmark.bench_plan
+"""
+
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
+
+from incremental_backup._utility import datetime_to_ns
+from incremental_backup.backup import filesystem
+from incremental_backup.backup.plan import BackupPlan
+from incremental_backup.backup.sum import BackupSum
+from incremental_backup.meta import BackupMetadata, BackupStartInfo
+
+DIRECTORY_SIZES = (1000, 2000, 4000, 8000, 16000, 32000)
+REPEATS = 3
+
+
+def make_inputs(file_count: int, /) -> tuple[filesystem.Directory, BackupSum]:
+    """Creates a source directory and backup sum with one big directory, where half the files are unmodified, a quarter
+    are new, and a quarter have been removed since the last backup."""
+
+    backup_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    backup = BackupMetadata("benchmarkbackup1", BackupStartInfo(backup_time), None)
+    old_time = datetime_to_ns(backup_time - timedelta(days=1))
+
+    names = [f"file{i}.eml" for i in range(file_count)]
+    current_names = names[: file_count * 3 // 4]
+    backed_up_names = names[file_count // 4 :]
+
+    source_tree = filesystem.Directory(
+        "",
+        subdirectories=[
+            filesystem.Directory("mail", files=[filesystem.File(name, old_time) for name in reversed(current_names)])
+        ],
+    )
+    backup_sum = BackupSum(
+        BackupSum.Directory(
+            "",
+            subdirectories=[
+                BackupSum.Directory("mail", files=[BackupSum.File(name, backup) for name in backed_up_names])
+            ],
+        )
+    )
+    return source_tree, backup_sum
+
+
+def main() -> None:
+    print(f"{'files':>8} {'time (s)':>10} {'us per file':>12}")
+    for file_count in DIRECTORY_SIZES:
+        source_tree, backup_sum = make_inputs(file_count)
+        best_time = float("inf")
+        for _ in range(REPEATS):
+            start = perf_counter()
+            BackupPlan.new(source_tree, backup_sum)
+            best_time = min(best_time, perf_counter() - start)
+        print(f"{file_count:>8} {best_time:>10.4f} {1e6 * best_time / file_count:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Compares the number of stat calls and time taken by `scan_filesystem()` against the previous `Path.iterdir()` based
+implementation.
+
+Run from the repository root with: python -m benchmark.bench_scan
+"""
+
+import os
+import stat
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from incremental_backup.backup.filesystem import scan_filesystem
+
+DIRECTORIES = 200
+FILES_PER_DIRECTORY = 100
+REPEATS = 3
+
+
+def make_tree(root: Path, /) -> int:
+    """Creates a tree of empty files to scan. Returns the number of entries created."""
+
+    for d in range(DIRECTORIES):
+        directory = root / f"dir{d // 20}" / f"subdir{d}"
+        directory.mkdir(parents=True)
+        for f in range(FILES_PER_DIRECTORY):
+            (directory / f"file{f}.txt").touch()
+    return DIRECTORIES // 20 + DIRECTORIES + DIRECTORIES * FILES_PER_DIRECTORY
+
+
+class StatCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+
+def legacy_scan(path: Path, counter: StatCounter, /) -> int:
+    """Mirrors the filesystem calls of the old scanner: `Path.is_file()`, `Path.is_dir()`, then `os.path.getmtime()`.
+    Each of those is one stat call."""
+
+    files = 0
+    stack = [path]
+    while stack:
+        directory = stack.pop()
+        for child in os.listdir(directory):
+            child_path = os.path.join(directory, child)
+            counter.count += 1
+            if stat.S_ISREG(os.stat(child_path).st_mode):
+                counter.count += 1
+                datetime.fromtimestamp(os.stat(child_path).st_mtime, tz=timezone.utc)
+                files += 1
+            else:
+                counter.count += 1
+                if stat.S_ISDIR(os.stat(child_path).st_mode):
+                    stack.append(Path(child_path))
+    return files
+
+
+class _CountingDirEntry:
+    """Wraps `os.DirEntry` and counts the calls which need a stat syscall."""
+
+    def __init__(self, entry: os.DirEntry, counter: StatCounter, /) -> None:
+        self._entry = entry
+        self._counter = counter
+        self.name = entry.name
+        self.path = entry.path
+
+    def _count_type_query(self) -> None:
+        # The type of a symlink's target is not known from the directory listing.
+        if self._entry.is_symlink():
+            self._counter.count += 1
+
+    def is_file(self) -> bool:
+        self._count_type_query()
+        return self._entry.is_file()
+
+    def is_dir(self) -> bool:
+        self._count_type_query()
+        return self._entry.is_dir()
+
+    def stat(self) -> os.stat_result:
+        self._counter.count += 1
+        return self._entry.stat()
+
+
+class _CountingScandir:
+    def __init__(self, path, counter: StatCounter, /) -> None:
+        self._iterator = _real_scandir(path)
+        self._counter = counter
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._iterator.close()
+
+    def __iter__(self):
+        return (_CountingDirEntry(entry, self._counter) for entry in self._iterator)
+
+
+_real_scandir = os.scandir
+
+
+def scandir_scan(path: Path, counter: StatCounter, /) -> int:
+    os.scandir = lambda p: _CountingScandir(p, counter)
+    try:
+        results = scan_filesystem(path, ())
+    finally:
+        os.scandir = _real_scandir
+    stack = [results.tree]
+    files = 0
+    while stack:
+        directory = stack.pop()
+        files += len(directory.files)
+        stack.extend(directory.subdirectories)
+    return files
+
+
+def timed_scan(scan, path: Path, /) -> tuple[float, int, int]:
+    best_time = float("inf")
+    for _ in range(REPEATS):
+        counter = StatCounter()
+        start = perf_counter()
+        files = scan(path, counter)
+        best_time = min(best_time, perf_counter() - start)
+    return best_time, counter.count, files
+
+
+def main() -> None:
+    with TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        entries = make_tree(root)
+        print(f"Python {sys.version.split()[0]}, {entries} entries")
+
+        # Timing without the counting wrappers.
+        scan_filesystem(root, ())
+        best_time = float("inf")
+        for _ in range(REPEATS):
+            start = perf_counter()
+            scan_filesystem(root, ())
+            best_time = min(best_time, perf_counter() - start)
+
+        legacy_time, legacy_stats, legacy_files = timed_scan(legacy_scan, root)
+        _, scandir_stats, scandir_files = timed_scan(scandir_scan, root)
+        assert legacy_files == scandir_files
+
+        print(f"{'scanner':<10} {'time (s)':>10} {'stat calls':>12} {'per entry':>10}")
+        print(f"{'legacy':<10} {legacy_time:>10.3f} {legacy_stats:>12} {legacy_stats / entries:>10.2f}")
+        print(f"{'scandir':<10} {best_time:>10.3f} {scandir_stats:>12} {scandir_stats / entries:>10.2f}")
+        saved = (legacy_stats - scandir_stats) / legacy_files
+        print(f"Stat calls saved per file: {saved:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,4 @@
 from .console import *
+from .dataclass import *
 from .path import *
+from .time import *
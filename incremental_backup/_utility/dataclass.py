@@ -0,0 +1,29 @@
+from dataclasses import fields
+from typing import TypeVar
+
+__all__ = ["add_slots"]
+
+
+_T = TypeVar("_T", bound=type)
+
+
+def add_slots(cls: _T, /) -> _T:
+    """Recreates a dataclass with `__slots__` for its fields, like `dataclass(slots=True)` (which needs Python 3.10).
+    Instances then have no `__dict__`, which makes them much smaller, for classes of which there are very many
+    instances (e.g. one per file).
+
+    Usage: apply after `@dataclass`. The class must not use `super()` without arguments.
+    """
+
+    field_names = tuple(f.name for f in fields(cls))
+    class_dict = dict(cls.__dict__)
+    class_dict["__slots__"] = field_names
+    for name in field_names:
+        # Default values are stored in `__init__()`, and would conflict with the slots.
+        class_dict.pop(name, None)
+    class_dict.pop("__dict__", None)
+    class_dict.pop("__weakref__", None)
+    slots_cls = type(cls)(cls.__name__, cls.__bases__, class_dict)
+    # Needed to pickle nested classes.
+    slots_cls.__qualname__ = cls.__qualname__
+    return slots_cls
@@ -2,13 +2,20 @@ import os.path
 from os import PathLike
 from typing import Union
 
-__all__ = ["path_name_equal", "StrPath"]
+__all__ = ["normalise_path_name", "path_name_equal", "StrPath"]
 
 
 StrPath = Union[str, PathLike[str]]
 
 
+def normalise_path_name(name: str, /) -> str:
+    """Normalises a path component such that two components are the same (as per `path_name_equal()`) if and only if
+    their normalised forms are equal. Useful for looking up path components in a dictionary."""
+
+    return os.path.normcase(name)
+
+
 def path_name_equal(name1: str, name2: str, /) -> bool:
     """Checks if two path components are the same, using case sensitivity appropriate for the current system."""
 
-    return os.path.normcase(name1) == os.path.normcase(name2)
+    return normalise_path_name(name1) == normalise_path_name(name2)
@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta, timezone
+
+__all__ = ["datetime_from_ns", "datetime_to_ns"]
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def datetime_to_ns(value: datetime, /) -> int:
+    """Converts a timezone-aware datetime to nanoseconds since the Unix epoch (like `os.stat_result.st_mtime_ns`).
+    Exact, unlike `datetime.timestamp()`."""
+
+    return (value - _EPOCH) // _MICROSECOND * 1000
+
+
+def datetime_from_ns(value: int, /) -> datetime:
+    """Converts nanoseconds since the Unix epoch to a UTC datetime.
+    Rounds down to `datetime`'s microsecond precision."""
+
+    return _EPOCH + timedelta(microseconds=value // 1000)
@@ -2,3 +2,4 @@ from .backup import *
 from .filesystem import ScanFilesystemCallbacks, scan_filesystem
 from .plan import *
 from .sum import *
+from .sum_checkpoint import *
@@ -1,7 +1,9 @@
-from dataclasses import dataclass
+import shutil
+from contextlib import ExitStack
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Callable, Iterable, Optional, Sequence, overload
+from typing import Callable, Iterable, Optional, Sequence, cast, overload
 
 from incremental_backup._utility import StrPath
 from incremental_backup.backup.filesystem import (
@@ -9,32 +11,61 @@ from incremental_backup.backup.filesystem import (
     scan_filesystem,
 )
 from incremental_backup.backup.plan import (
+    BackupDestinationOptions,
+    BackupPipelineDestination,
     BackupPlan,
+    ExecuteBackupPipelineCallbacks,
     ExecuteBackupPlanCallbacks,
     ExecuteBackupPlanResults,
+    execute_backup_pipeline,
     execute_backup_plan,
 )
 from incremental_backup.backup.sum import BackupSum
+from incremental_backup.backup.sum_checkpoint import (
+    BackupSumCheckpoint,
+    LoadBackupSumCallbacks,
+    load_backup_sum,
+    write_backup_sum_checkpoint_file,
+)
+from incremental_backup.compression import Compression
+from incremental_backup.file_copy import CopyMethod
 from incremental_backup.meta import (
+    CATALOG_FILENAME,
     COMPLETE_INFO_FILENAME,
+    CONSOLIDATION_FILENAME,
     DATA_DIRECTORY_NAME,
+    JOURNAL_FILENAME,
     MANIFEST_FILENAME,
+    OBJECTS_DIRECTORY_NAME,
+    PACK_INDEX_FILENAME,
+    PACKS_DIRECTORY_NAME,
     START_INFO_FILENAME,
+    SUM_CHECKPOINT_FILENAME,
     BackupCompleteInfo,
     BackupDirectoryCreationError,
+    BackupJournal,
+    BackupJournalParseError,
+    BackupJournalWriter,
     BackupManifest,
+    BackupManifestWriter,
     BackupMetadata,
+    BackupPackWriter,
     BackupStartInfo,
+    BackupStartInfoParseError,
     ReadBackupsCallbacks,
     create_new_backup_directory,
+    read_backup_journal_file,
+    read_backup_start_info_file,
     read_backups,
+    truncate_backup_journal_file,
+    update_backup_catalog,
     write_backup_complete_info_file,
-    write_backup_manifest_file,
+    write_backup_pack_index_file,
     write_backup_start_info_file,
 )
 from incremental_backup.path_exclude import PathExcludePattern
 
-__all__ = ["BackupCallbacks", "BackupError", "BackupResults", "perform_backup"]
+__all__ = ["BackupCallbacks", "BackupError", "BackupOptions", "BackupResults", "perform_backup"]
 
 
 @dataclass(frozen=True)
@@ -48,6 +79,21 @@ class BackupResults:
     files_copied: int
     files_removed: int
 
+    copy_methods: dict[CopyMethod, int] = field(default_factory=dict, compare=False)
+    """The number of files copied with each method. See `ExecuteBackupPlanResults.copy_methods`."""
+
+    files_deduplicated: int = 0
+    """The number of copied files whose content was already stored. See
+        `ExecuteBackupPlanResults.files_deduplicated`."""
+
+    files_packed: int = 0
+    """The number of copied files whose data was appended to a pack file.
+        See `ExecuteBackupPlanResults.files_packed`."""
+
+    files_resumed: int = 0
+    """The number of copied files which were already copied before the backup was resumed. See
+        `ExecuteBackupPlanResults.files_resumed`."""
+
 
 @dataclass(frozen=True)
 class BackupCallbacks:
@@ -63,6 +109,9 @@ class BackupCallbacks:
     """Called just after the previous backups have been read from the target directory.
         Argument is the collection of backup metadatas (in arbitrary order)."""
 
+    load_backup_sum: LoadBackupSumCallbacks = LoadBackupSumCallbacks()
+    """Callbacks for `load_backup_sum()`."""
+
     on_before_initialise_backup: Callable[[], None] = lambda: None
     """Called just before creating and initialising the new backup directory."""
 
@@ -70,6 +119,14 @@ class BackupCallbacks:
     """Called just after creating the new backup directory.
         Argument is the path to the directory."""
 
+    on_resume_backup: Callable[[Path], None] = lambda path: None
+    """Called when resuming an incomplete backup, instead of creating a new backup directory.
+        Argument is the path to the backup directory."""
+
+    on_skip_outdated_backup: Callable[[Path], None] = lambda path: None
+    """Called when the most recent incomplete backup is not resumed because a newer backup was completed since.
+        Argument is the path to the incomplete backup directory."""
+
     on_before_scan_source: Callable[[], None] = lambda: None
     """Called just before scanning the source directory."""
 
@@ -83,12 +140,60 @@ class BackupCallbacks:
     """Callbacks for `execute_backup_plan()`."""
 
     on_before_save_metadata: Callable[[], None] = lambda: None
-    """Called just before saving the manifest and completion information to file."""
+    """Called just before saving the completion information, backup sum checkpoint, and backup catalog to file. (The
+        manifest is written while copying files.)"""
 
     on_write_complete_info_error: Callable[[Path, OSError], None] = lambda path, error: None
     """Called when writing the backup completion information file fails.
         First argument is the path to the file, second argument is the raised exception."""
 
+    on_write_sum_checkpoint_error: Callable[[Path, OSError], None] = lambda path, error: None
+    """Called when writing the backup sum checkpoint file fails.
+        First argument is the path to the file, second argument is the raised exception."""
+
+    on_update_catalog_error: Callable[[Path, OSError], None] = lambda path, error: None
+    """Called when updating the backup catalog file of the target directory fails.
+        First argument is the path to the file, second argument is the raised exception."""
+
+
+@dataclass(frozen=True)
+class BackupOptions:
+    """Optional settings for `perform_backup()`."""
+
+    scan_workers: int = 1
+    """Number of threads used to scan the source directory. See `scan_filesystem()`."""
+
+    copy_workers: int = 1
+    """Number of threads used to copy files. See `execute_backup_plan()`."""
+
+    read_workers: int = 1
+    """Number of threads used to read previous backups' metadata. See `read_backups()`."""
+
+    deduplicate: bool = False
+    """Store file data in the content-addressed object store of the target directory rather than the backup data
+        directory, so each distinct file content is only stored once. See `BackupDestinationOptions`."""
+
+    pack_threshold: Optional[int] = None
+    """If not `None`, the data of files no larger than this many bytes is appended to pack files in the backup
+        directory rather than copied to separate files, so that many small files don't create as many files in the
+        target directory. Cannot be used with `deduplicate`. See `BackupDestinationOptions`."""
+
+    compression: Optional[Compression] = None
+    """If not `None`, the data of copied files is compressed with this codec, which is recorded in the backup start
+        information. Cannot be used with `deduplicate`. See `BackupDestinationOptions`."""
+
+    pipeline: bool = False
+    """Copy files while the source directory is being scanned, rather than after scanning it and planning the whole
+        backup, so copying starts sooner and the source tree need not be held in memory. The backup is the same. See
+        `execute_backup_pipeline()`."""
+
+    resume: bool = False
+    """If the target directory contains an incomplete backup (one which was interrupted while copying files), complete
+        the most recent one rather than creating a new backup. Files it already copied are kept if they are unmodified
+        (see `BackupDestinationOptions`). The backup keeps its original start information, so its compression must match
+        `compression`. If there is no incomplete backup, or a backup newer than it was completed (so resuming it would
+        order its changes before that backup's, losing them), a new backup is created as usual."""
+
 
 @overload
 def perform_backup(
@@ -106,6 +211,7 @@ def perform_backup(
     exclude_patterns: Iterable[PathExcludePattern],
     callbacks: BackupCallbacks = BackupCallbacks(),
     skip_empty: bool = False,
+    options: BackupOptions = BackupOptions(),
 ) -> Optional[BackupResults]: ...
 
 
@@ -116,6 +222,7 @@ def perform_backup(
     exclude_patterns: Iterable[PathExcludePattern],
     callbacks: BackupCallbacks = BackupCallbacks(),
     skip_empty: bool = False,
+    options: BackupOptions = BackupOptions(),
 ) -> Optional[BackupResults]:
     """Performs the entire operation of creating a new backup, including creating the backup directory, copying files,
     and saving metadata.
@@ -126,13 +233,15 @@ def perform_backup(
     :param exclude_patterns: Patterns to match paths which will be excluded from the backup.
     :param callbacks: Callbacks for certain events during execution. See `BackupCallbacks`.
     :param skip_empty: Only perform the backup if there are file changes to record.
+    :param options: Optional settings. See `BackupOptions`.
     :return: Metadata and summary information for the backup operation. None if the backup was skipped.
+    :except ValueError: If `options` is invalid.
     :except BackupError: If an error occurs that prevents the backup operation from creating a valid backup. See
         `BackupError`.
     """
 
     return _BackupOperation(
-        source_directory, target_directory, exclude_patterns, skip_empty, callbacks
+        source_directory, target_directory, exclude_patterns, skip_empty, callbacks, options
     ).perform_backup()
 
 
@@ -146,12 +255,32 @@ class _BackupOperation:
         exclude_patterns: Iterable[PathExcludePattern],
         skip_empty: bool,
         callbacks: BackupCallbacks = BackupCallbacks(),
+        options: BackupOptions = BackupOptions(),
     ) -> None:
+        """
+        :except ValueError: If `options` is invalid.
+        """
+
+        if options.scan_workers < 1:
+            raise ValueError("scan_workers must be at least 1.")
+        if options.copy_workers < 1:
+            raise ValueError("copy_workers must be at least 1.")
+        if options.read_workers < 1:
+            raise ValueError("read_workers must be at least 1.")
+        if options.pack_threshold is not None:
+            if options.pack_threshold < 0:
+                raise ValueError("pack_threshold must be nonnegative.")
+            if options.deduplicate:
+                raise ValueError("pack_threshold and deduplicate cannot both be specified.")
+        if options.compression is not None and options.deduplicate:
+            raise ValueError("compression and deduplicate cannot both be specified.")
+
         self.source_directory = Path(source_directory)
         self.target_directory = Path(target_directory)
         self.exclude_patterns = tuple(exclude_patterns)
         self.skip_empty = skip_empty
         self.callbacks = callbacks
+        self.options = options
 
         self._init_working_state()
 
@@ -168,28 +297,45 @@ class _BackupOperation:
         self._validate_target_directory()
 
         previous_backups = self._read_previous_backups()
-        backup_sum = BackupSum.from_backups(previous_backups)
+        previous_sum = load_backup_sum(self.target_directory, previous_backups, self.callbacks.load_backup_sum)
+        backup_sum = previous_sum.backup_sum
 
-        start_time = datetime.now(timezone.utc)
-        if not self.skip_empty:
-            # If skip_empty is not specified, keep the old behaviour.
-            # If skip_empty is true, have to defer creating the backup till we know it's not empty.
-            backup_path, data_path, start_info = self._initialise_backup(start_time)
-
-        backup_plan = self._compute_backup_plan(backup_sum)
+        resumable_backup = self._find_resumable_backup(previous_backups) if self.options.resume else None
 
-        if self.skip_empty:
-            if self._is_backup_plan_empty(backup_plan):
+        start_time = datetime.now(timezone.utc)
+        if self.options.pipeline:
+            pipeline_results = self._back_up_files_pipelined(backup_sum, start_time, resumable_backup)
+            if pipeline_results is None:
                 return None
-
-            backup_path, data_path, start_info = self._initialise_backup(start_time)
-
-        execute_results = self._back_up_files(data_path, backup_plan)
+            backup_path, start_info, execute_results = pipeline_results
+        else:
+            if not self.skip_empty or resumable_backup is not None:
+                # If skip_empty is not specified, keep the old behaviour. A resumed backup already exists anyway.
+                # If skip_empty is true, have to defer creating the backup till we know it's not empty.
+                backup_path, data_path, start_info = self._initialise_backup(start_time, resumable_backup)
+
+            backup_plan = self._compute_backup_plan(backup_sum)
+
+            if self.skip_empty and resumable_backup is None:
+                if self._is_backup_plan_empty(backup_plan):
+                    return None
+
+                backup_path, data_path, start_info = self._initialise_backup(start_time, None)
+
+            execute_results = self._back_up_files(
+                backup_path,
+                data_path,
+                backup_plan,
+                None if resumable_backup is None else resumable_backup.journal,
+            )
+        self._remove_journal(backup_path)
         complete_info = self._create_complete_info()
 
         self.callbacks.on_before_save_metadata()
-        self._save_manifest(backup_path, execute_results.manifest)
         self._save_complete_info(backup_path, complete_info)
+        metadata = BackupMetadata(backup_path.name, start_info, execute_results.manifest)
+        self._save_sum_checkpoint(backup_path, BackupSumCheckpoint.from_backups((metadata,), previous_sum))
+        self._update_catalog((*previous_backups, metadata))
 
         return BackupResults(
             backup_path,
@@ -198,6 +344,10 @@ class _BackupOperation:
             complete_info,
             execute_results.files_copied,
             execute_results.files_removed,
+            execute_results.copy_methods,
+            execute_results.files_deduplicated,
+            execute_results.files_packed,
+            execute_results.files_resumed,
         )
 
     def _init_working_state(self) -> None:
@@ -224,14 +374,21 @@ class _BackupOperation:
         """Validates the backup target directory.
         Should mostly prevent other parts of the backup operation from failing strangely for invalid inputs.
 
-        :except BackupError: If the target directory is inaccessible, or exists and is not a directory.
+        :except BackupError: If the target directory is inaccessible, exists and is not a directory, or has an
+            interrupted consolidation.
         """
 
         try:
             if self.target_directory.exists() and not self.target_directory.is_dir():
                 raise BackupError("Target directory is not a directory")
+            consolidation_pending = (self.target_directory / CONSOLIDATION_FILENAME).exists()
         except OSError as e:
             raise BackupError(f"Failed to query target directory: {e}") from e
+        if consolidation_pending:
+            # The backups of the consolidation may be partially deleted or written.
+            raise BackupError(
+                "Target directory has an interrupted consolidation, run the consolidate command to finish it first"
+            )
 
     def _read_previous_backups(self) -> Sequence[BackupMetadata]:
         """Reads existing backups' metadata from the backup target directory.
@@ -247,7 +404,12 @@ class _BackupOperation:
             if not self.target_directory.exists():
                 backups = []
             else:
-                backups = read_backups(self.target_directory, self.callbacks.read_backups)
+                backups = read_backups(
+                    self.target_directory,
+                    self.callbacks.read_backups,
+                    self.options.read_workers,
+                    lazy_manifests=True,
+                )
         except OSError as e:
             raise BackupError(f"Failed to enumerate target directory: {e}") from e
         backups = tuple(backups)
@@ -256,19 +418,101 @@ class _BackupOperation:
 
         return backups
 
-    def _initialise_backup(self, start_time: datetime) -> tuple[Path, Path, BackupStartInfo]:
-        """Creates the backup directory and start info file.
+    def _find_resumable_backup(self, previous_backups: Sequence[BackupMetadata], /) -> Optional["_ResumableBackup"]:
+        """Finds the most recent incomplete backup in the target directory, i.e. one which has a journal but no
+        manifest, since it was interrupted while copying files.
+
+        If any backup's start information cannot be read, skips that backup. If any of `previous_backups` started after
+        the incomplete backup, it can't be resumed: it keeps its start time, so its changes would be ordered before
+        that backup's and never restored.
+
+        :except BackupError: If the target directory cannot be enumerated, or the backup's journal cannot be read.
+        """
+
+        if not self.target_directory.exists():
+            return None
+
+        found: Optional[tuple[Path, BackupStartInfo]] = None
+        try:
+            entries = list(self.target_directory.iterdir())
+        except OSError as e:
+            raise BackupError(f"Failed to enumerate target directory: {e}") from e
+        for entry in entries:
+            # Same name check as check_if_probably_backup(), to avoid hitting the filesystem if possible.
+            if not (len(entry.name) >= 10 and entry.name.isascii() and entry.name.isalnum()):
+                continue
+            try:
+                if not (entry / JOURNAL_FILENAME).is_file() or (entry / MANIFEST_FILENAME).exists():
+                    continue
+            except OSError as e:
+                (self.callbacks.read_backups.on_query_entry_error)(entry, e)
+                continue
+            try:
+                start_info = read_backup_start_info_file(entry / START_INFO_FILENAME)
+            except (OSError, BackupStartInfoParseError) as e:
+                (self.callbacks.read_backups.on_read_metadata_error)(entry, e)
+                continue
+            if found is None or start_info.start_time > found[1].start_time:
+                found = (entry, start_info)
+
+        if found is None:
+            return None
+        backup_path, start_info = found
+        if any(b.start_info.start_time >= start_info.start_time for b in previous_backups):
+            (self.callbacks.on_skip_outdated_backup)(backup_path)
+            return None
+        try:
+            journal = read_backup_journal_file(backup_path / JOURNAL_FILENAME)
+        except (OSError, BackupJournalParseError) as e:
+            raise BackupError(f"Failed to read journal of incomplete backup {backup_path.name}: {e}") from e
+        return _ResumableBackup(backup_path, start_info, journal)
+
+    def _initialise_backup(
+        self, start_time: datetime, resumable_backup: Optional["_ResumableBackup"]
+    ) -> tuple[Path, Path, BackupStartInfo]:
+        """Creates the backup directory and start info file, or prepares the incomplete backup to resume (if not
+        `None`).
 
         :return: Tuple of (backup_path, data_path, start_info).
         :except BackupError: If a fatal error occurs.
         """
 
+        if resumable_backup is not None:
+            return self._resume_backup(resumable_backup)
+
         self.callbacks.on_before_initialise_backup()
         backup_path = self._create_backup_directory()
         data_path = self._create_data_directory(backup_path)
         start_info = self._create_and_write_start_info(backup_path, start_time)
+        self._add_incomplete_to_catalog(backup_path, start_info)
         return backup_path, data_path, start_info
 
+    def _resume_backup(self, resumable_backup: "_ResumableBackup") -> tuple[Path, Path, BackupStartInfo]:
+        """Prepares an incomplete backup to continue copying files into.
+
+        :return: Tuple of (backup_path, data_path, start_info).
+        :except BackupError: If the backup can't be resumed.
+        """
+
+        backup_path = resumable_backup.path
+        if resumable_backup.start_info.compression != self.options.compression:
+            raise BackupError(f"Cannot resume backup {backup_path.name}, it was started with a different compression")
+
+        self.callbacks.on_resume_backup(backup_path)
+
+        data_path = backup_path / DATA_DIRECTORY_NAME
+        try:
+            data_path.mkdir(exist_ok=True)
+            # Packed files are not journaled, so the pack files are written again from scratch.
+            try:
+                shutil.rmtree(backup_path / PACKS_DIRECTORY_NAME)
+            except FileNotFoundError:
+                pass
+            truncate_backup_journal_file(backup_path / JOURNAL_FILENAME)
+        except OSError as e:
+            raise BackupError(f"Failed to prepare incomplete backup {backup_path.name} to resume: {e}") from e
+        return backup_path, data_path, resumable_backup.start_info
+
     @staticmethod
     def _is_backup_plan_empty(backup_plan: BackupPlan) -> bool:
         root = backup_plan.root
@@ -314,14 +558,13 @@ class _BackupOperation:
             raise BackupError(f"Failed to create backup data directory: {e}") from e
         return path
 
-    @staticmethod
-    def _create_and_write_start_info(backup_path: Path, start_time: datetime) -> BackupStartInfo:
+    def _create_and_write_start_info(self, backup_path: Path, start_time: datetime) -> BackupStartInfo:
         """Creates and writes the backup start information to file within the backup directory.
 
         :except BackupError: If the file could not be written to.
         """
 
-        start_info = BackupStartInfo(start_time)
+        start_info = BackupStartInfo(start_time, self.options.compression)
         file_path = backup_path / START_INFO_FILENAME
         try:
             write_backup_start_info_file(file_path, start_info)
@@ -334,42 +577,210 @@ class _BackupOperation:
 
         self.callbacks.on_before_scan_source()
 
-        scan_results = scan_filesystem(self.source_directory, self.exclude_patterns, self.callbacks.scan_source)
+        scan_results = scan_filesystem(
+            self.source_directory,
+            self.exclude_patterns,
+            self.callbacks.scan_source,
+            self.options.scan_workers,
+        )
         self.paths_skipped = self.paths_skipped or scan_results.paths_skipped
         backup_plan = BackupPlan.new(scan_results.tree, backup_sum)
         return backup_plan
 
-    def _back_up_files(self, destination_path: StrPath, backup_plan: BackupPlan) -> ExecuteBackupPlanResults:
-        """Backs up files from the source directory to the backup directory according to the backup plan."""
+    def _back_up_files(
+        self,
+        backup_path: Path,
+        destination_path: StrPath,
+        backup_plan: BackupPlan,
+        resume_journal: Optional[BackupJournal],
+    ) -> ExecuteBackupPlanResults:
+        """Backs up files from the source directory to the backup directory according to the backup plan, writing the
+        manifest file and journal as it goes.
+
+        :except BackupError: If the manifest file or pack files could not be written to.
+        """
 
         self.callbacks.on_before_copy_files()
 
-        execute_results = execute_backup_plan(
-            backup_plan,
-            self.source_directory,
-            destination_path,
-            self.callbacks.execute_plan,
-        )
+        with ExitStack() as exit_stack:
+            manifest_writer, pack_writer, journal_writer = self._open_backup_writers(backup_path, exit_stack)
+            try:
+                execute_results = execute_backup_plan(
+                    backup_plan,
+                    self.source_directory,
+                    destination_path,
+                    self.callbacks.execute_plan,
+                    self.options.copy_workers,
+                    manifest_writer,
+                    self._destination_options(pack_writer, journal_writer, resume_journal),
+                )
+            except OSError as e:
+                raise BackupError(f"Failed to write backup manifest or pack files: {e}") from e
+            self._finish_backup_writers(backup_path, manifest_writer, pack_writer)
+        self._commit_manifest(backup_path)
 
         self.paths_skipped = self.paths_skipped or execute_results.paths_skipped
 
         return execute_results
 
-    def _create_complete_info(self) -> BackupCompleteInfo:
-        return BackupCompleteInfo(datetime.now(timezone.utc), self.paths_skipped)
+    def _back_up_files_pipelined(
+        self, backup_sum: BackupSum, start_time: datetime, resumable_backup: Optional["_ResumableBackup"]
+    ) -> Optional[tuple[Path, BackupStartInfo, ExecuteBackupPlanResults]]:
+        """Scans the source directory and backs up files at the same time (see `execute_backup_pipeline()`), writing
+        the manifest file and journal as it goes.
+
+        If `skip_empty` is true and not resuming a backup, the backup directory is only created once the first change
+        is found.
+
+        :return: Tuple of (backup_path, start_info, execute_results), or `None` if the backup was skipped.
+        :except BackupError: If a fatal error occurs.
+        """
+
+        initialised: Optional[tuple[Path, BackupStartInfo, BackupPipelineDestination]] = None
+
+        with ExitStack() as exit_stack:
+
+            def initialise() -> BackupPipelineDestination:
+                nonlocal initialised
+
+                if initialised is None:
+                    backup_path, data_path, start_info = self._initialise_backup(start_time, resumable_backup)
+                    manifest_writer, pack_writer, journal_writer = self._open_backup_writers(backup_path, exit_stack)
+                    destination = BackupPipelineDestination(
+                        data_path,
+                        manifest_writer,
+                        self._destination_options(
+                            pack_writer, journal_writer, None if resumable_backup is None else resumable_backup.journal
+                        ),
+                    )
+                    initialised = (backup_path, start_info, destination)
+                return initialised[2]
+
+            if not self.skip_empty or resumable_backup is not None:
+                initialise()
+
+            self.callbacks.on_before_scan_source()
+            self.callbacks.on_before_copy_files()
+
+            try:
+                execute_results = execute_backup_pipeline(
+                    self.source_directory,
+                    self.exclude_patterns,
+                    backup_sum,
+                    initialise,
+                    ExecuteBackupPipelineCallbacks(self.callbacks.scan_source, self.callbacks.execute_plan),
+                    self.options.scan_workers,
+                    self.options.copy_workers,
+                )
+            except OSError as e:
+                raise BackupError(f"Failed to write backup manifest or pack files: {e}") from e
+
+            if initialised is None:
+                return None
+            backup_path, start_info, destination = initialised
+            if execute_results is None:
+                execute_results = ExecuteBackupPlanResults(BackupManifest(), False, 0, 0)
+            self._finish_backup_writers(
+                backup_path, cast(BackupManifestWriter, destination.manifest_writer), destination.options.pack_writer
+            )
+        self._commit_manifest(backup_path)
+
+        self.paths_skipped = self.paths_skipped or execute_results.paths_skipped
+
+        return backup_path, start_info, execute_results
+
+    def _objects_directory(self) -> Optional[Path]:
+        """The object store directory to store file data in, if deduplicating."""
+
+        return self.target_directory / OBJECTS_DIRECTORY_NAME if self.options.deduplicate else None
+
+    def _destination_options(
+        self,
+        pack_writer: Optional[BackupPackWriter],
+        journal_writer: BackupJournalWriter,
+        resume_journal: Optional[BackupJournal],
+        /,
+    ) -> BackupDestinationOptions:
+        """How files are stored in the backup, according to the backup options."""
+
+        return BackupDestinationOptions(
+            self._objects_directory(),
+            pack_writer,
+            self.options.pack_threshold or 0,
+            self.options.compression,
+            journal_writer,
+            resume_journal,
+        )
+
+    def _open_backup_writers(
+        self, backup_path: Path, exit_stack: ExitStack, /
+    ) -> tuple[BackupManifestWriter, Optional[BackupPackWriter], BackupJournalWriter]:
+        """Opens the manifest file, pack files (if packing) and journal file for writing, to be closed by `exit_stack`.
+
+        The manifest is written to a temporary file which is renamed when complete (see `_commit_manifest()`), so an
+        interrupted backup does not leave an incomplete manifest. The journal is appended to, in case the backup is
+        being resumed.
+
+        :except BackupError: If the manifest file or journal file could not be opened.
+        """
+
+        try:
+            file = exit_stack.enter_context(open(backup_path / (MANIFEST_FILENAME + ".tmp"), "w", encoding="utf8"))
+            journal_file = exit_stack.enter_context(open(backup_path / JOURNAL_FILENAME, "a", encoding="utf8"))
+        except OSError as e:
+            raise BackupError(f"Failed to write backup manifest or pack files: {e}") from e
+        if self.options.pack_threshold is None:
+            pack_writer = None
+        else:
+            pack_writer = BackupPackWriter(backup_path / PACKS_DIRECTORY_NAME)
+            exit_stack.callback(pack_writer.close)
+        return BackupManifestWriter(file), pack_writer, BackupJournalWriter(journal_file)
 
     @staticmethod
-    def _save_manifest(backup_path: Path, manifest: BackupManifest) -> None:
-        """Writes the backup manifest to file within the backup directory.
+    def _finish_backup_writers(
+        backup_path: Path, manifest_writer: BackupManifestWriter, pack_writer: Optional[BackupPackWriter], /
+    ) -> None:
+        """Completes the pack files (if any) and the manifest, once all files are backed up.
 
-        :except BackupError: If the file could not be written to.
+        :except BackupError: If the manifest file or pack files could not be written to.
+        """
+
+        try:
+            if pack_writer is not None:
+                pack_index = pack_writer.finish()
+                # The index is written before the manifest is complete, so a valid backup always has it.
+                if pack_index.entries:
+                    write_backup_pack_index_file(backup_path / PACKS_DIRECTORY_NAME / PACK_INDEX_FILENAME, pack_index)
+            manifest_writer.finish()
+        except OSError as e:
+            raise BackupError(f"Failed to write backup manifest or pack files: {e}") from e
+
+    @staticmethod
+    def _commit_manifest(backup_path: Path, /) -> None:
+        """Renames the completed temporary manifest file to the manifest file.
+
+        :except BackupError: If the file could not be renamed.
         """
 
-        file_path = backup_path / MANIFEST_FILENAME
         try:
-            write_backup_manifest_file(file_path, manifest)
+            (backup_path / (MANIFEST_FILENAME + ".tmp")).replace(backup_path / MANIFEST_FILENAME)
         except OSError as e:
-            raise BackupError(f"Failed to write backup manifest file: {e}") from e
+            raise BackupError(f"Failed to write backup manifest or pack files: {e}") from e
+
+    @staticmethod
+    def _remove_journal(backup_path: Path, /) -> None:
+        """Removes the journal file once the manifest is complete, since the backup no longer needs resuming.
+
+        The journal is not needed for the backup to be valid, so failure to remove it is ignored.
+        """
+
+        try:
+            (backup_path / JOURNAL_FILENAME).unlink(missing_ok=True)
+        except OSError:
+            pass
+
+    def _create_complete_info(self) -> BackupCompleteInfo:
+        return BackupCompleteInfo(datetime.now(timezone.utc), self.paths_skipped)
 
     def _save_complete_info(self, backup_path: Path, complete_info: BackupCompleteInfo) -> None:
         """Writes the backup completion information to file within the backup directory.
@@ -384,6 +795,56 @@ class _BackupOperation:
             # Not fatal since the completion info isn't currently used by the software.
             self.callbacks.on_write_complete_info_error(file_path, e)
 
+    def _save_sum_checkpoint(self, backup_path: Path, checkpoint: BackupSumCheckpoint) -> None:
+        """Writes the backup sum checkpoint to file within the backup directory.
+
+        It is not a fatal error if this operation fails, since later operations can recompute the sum from the
+        manifests."""
+
+        file_path = backup_path / SUM_CHECKPOINT_FILENAME
+        try:
+            write_backup_sum_checkpoint_file(file_path, checkpoint)
+        except OSError as e:
+            self.callbacks.on_write_sum_checkpoint_error(file_path, e)
+
+    def _add_incomplete_to_catalog(self, backup_path: Path, start_info: BackupStartInfo) -> None:
+        """Adds the new backup to the backup catalog of the target directory (if it exists) as not valid yet, so that
+        readers still find it if the operation is interrupted after its manifest is written.
+
+        It is not a fatal error if this operation fails, since readers fall back to enumerating the target directory
+        (the outdated catalog is deleted if possible)."""
+
+        catalog_path = self.target_directory / CATALOG_FILENAME
+        try:
+            # If the catalog doesn't exist, readers enumerate the target directory, and it's created once the backup
+            # is complete.
+            if catalog_path.exists():
+                update_backup_catalog(
+                    self.target_directory, (BackupMetadata(backup_path.name, start_info, BackupManifest()),)
+                )
+        except OSError as e:
+            self.callbacks.on_update_catalog_error(catalog_path, e)
+
+    def _update_catalog(self, backups: Sequence[BackupMetadata]) -> None:
+        """Updates the backup catalog of the target directory to include the new backup.
+
+        It is not a fatal error if this operation fails, since readers fall back to enumerating the target directory
+        (the outdated catalog is deleted if possible)."""
+
+        try:
+            update_backup_catalog(self.target_directory, backups)
+        except OSError as e:
+            self.callbacks.on_update_catalog_error(self.target_directory / CATALOG_FILENAME, e)
+
+
+@dataclass(frozen=True)
+class _ResumableBackup:
+    """An incomplete backup found to resume."""
+
+    path: Path
+    start_info: BackupStartInfo
+    journal: BackupJournal
+
 
 class BackupError(Exception):
     """Raised when creating a backup fails such that a valid backup cannot be produced.
@@ -393,6 +854,8 @@ class BackupError(Exception):
      - A new backup directory couldn't be created.
      - Writing the backup start information file failed.
      - Writing the backup manifest file failed.
+     - Writing the backup pack files failed.
+     - An incomplete backup to resume couldn't be read or was started with different options.
     """
 
     def __init__(self, message: str) -> None:
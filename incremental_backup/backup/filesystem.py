@@ -1,28 +1,44 @@
-import os.path
+import os
+import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from datetime import datetime, timezone
+from datetime import datetime
 from functools import partial
 from pathlib import Path
-from typing import Callable, Iterable
+from typing import Callable, Generator, Iterable, Optional, Union, cast
 
-from incremental_backup._utility import StrPath
-from incremental_backup.path_exclude import PathExcludePattern, is_path_excluded
+from incremental_backup._utility import StrPath, add_slots, datetime_from_ns
+from incremental_backup.path_exclude import PathExcludePattern, PathExcludeSet
 
 __all__ = [
+    "DEFAULT_SCAN_QUEUE_SIZE",
     "Directory",
     "File",
+    "iter_scan_filesystem",
     "scan_filesystem",
+    "ScanEnterDirectory",
+    "ScanExitDirectory",
     "ScanFilesystemCallbacks",
+    "ScanFilesystemEvent",
     "ScanFilesystemResults",
 ]
 
 
+@add_slots
 @dataclass
 class File:
     name: str
-    last_modified: datetime
 
+    last_modified_ns: int
+    """Last modification time, in nanoseconds since the Unix epoch (as `os.stat_result.st_mtime_ns`). An integer is
+        much smaller than a `datetime`."""
 
+    @property
+    def last_modified(self) -> datetime:
+        return datetime_from_ns(self.last_modified_ns)
+
+
+@add_slots
 @dataclass
 class Directory:
     name: str
@@ -58,11 +74,39 @@ class ScanFilesystemResults:
     """Indicates if any paths were skipped due to I/O errors (does not include paths matched by exclude patterns)."""
 
 
+@dataclass(frozen=True)
+class ScanEnterDirectory:
+    """Scan event: entered a subdirectory of the current directory (or the scanned directory itself, first)."""
+
+    name: str
+    """The name of the directory. Empty for the scanned directory itself."""
+
+    files: list[File]
+
+    subdirectory_names: list[str]
+    """The names of the subdirectories, which are entered next in this order (excluded subdirectories are omitted)."""
+
+
+@dataclass(frozen=True)
+class ScanExitDirectory:
+    """Scan event: finished the current directory and its descendents, moving back up to its parent."""
+
+
+ScanFilesystemEvent = Union[ScanEnterDirectory, ScanExitDirectory]
+"""An event from scanning the filesystem incrementally. See `iter_scan_filesystem()`."""
+
+
+DEFAULT_SCAN_QUEUE_SIZE = 4096
+"""Default maximum number of directories listed ahead of the search by `scan_filesystem()`."""
+
+
 def scan_filesystem(
     path: StrPath,
     /,
     exclude_patterns: Iterable[PathExcludePattern],
     callbacks: ScanFilesystemCallbacks = ScanFilesystemCallbacks(),
+    workers: int = 1,
+    queue_size: int = DEFAULT_SCAN_QUEUE_SIZE,
 ) -> ScanFilesystemResults:
     """Produces a tree representation of the filesystem at a given directory.
 
@@ -72,71 +116,250 @@ def scan_filesystem(
     :param exclude_patterns: Compiled exclude patterns. If a directory or file matches any of these, it and its
         descendents are not included in the scan.
     :param callbacks: Callbacks for certain events during scanning. See `ScanFilesystemCallbacks`.
+    :param workers: Number of threads used to query the filesystem. If greater than 1, directories are listed
+        concurrently ahead of the search, up to `queue_size` directories at a time (preferring those the search visits
+        soonest), so memory use is bounded. The resulting tree and the callbacks (which are always invoked from the
+        calling thread, in the same order) do not depend on this value.
+    :param queue_size: See `workers`.
+    :except ValueError: If `workers` or `queue_size` is less than 1.
     """
 
+    root = Directory("")
+    tree_node_stack: list[Directory] = []
+    for event in iter_scan_filesystem(path, exclude_patterns, callbacks, workers, queue_size):
+        if isinstance(event, ScanEnterDirectory):
+            if tree_node_stack:
+                tree_node = Directory(event.name, event.files)
+                tree_node_stack[-1].subdirectories.append(tree_node)
+            else:
+                tree_node = root
+                root.files = event.files
+            tree_node_stack.append(tree_node)
+        else:
+            del tree_node_stack[-1]
+
+    return ScanFilesystemResults(root, False)
+
+
+def iter_scan_filesystem(
+    path: StrPath,
+    /,
+    exclude_patterns: Iterable[PathExcludePattern],
+    callbacks: ScanFilesystemCallbacks = ScanFilesystemCallbacks(),
+    workers: int = 1,
+    queue_size: int = DEFAULT_SCAN_QUEUE_SIZE,
+) -> Generator[ScanFilesystemEvent, None, None]:
+    """Scans the filesystem at a given directory incrementally, as a sequence of events, so the whole tree need not be
+    held in memory. See `scan_filesystem()`.
+
+    The scanned directory is always entered (even if it is excluded or can't be listed, in which case it is empty),
+    then each directory's subdirectories are entered in depth-first order.
+
+    If the generator is not run to completion, it should be closed so its worker threads are stopped.
+
+    :except ValueError: If `workers` or `queue_size` is less than 1.
+    """
+
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if queue_size < 1:
+        raise ValueError("queue_size must be at least 1")
+
     path = Path(path)
+    exclude_set = PathExcludeSet(exclude_patterns)
 
-    paths_skipped = False
-    root = Directory("")
-    search_stack: list[Callable[[], None]] = []
-    path_segments: list[str] = []
-    tree_node_stack = [root]
-    is_root = True
+    search_stack: list[Callable[[], Optional[ScanFilesystemEvent]]] = []
+
+    executor = ThreadPoolExecutor(workers) if workers > 1 else None
+    # Listings of directories yet to be visited which haven't been started, in the same order as `search_stack` (so
+    # the directory visited soonest is last).
+    unstarted_listings: list[_DirectoryLister] = []
+    # Number of listings started on the worker threads whose directories haven't been visited yet.
+    started_listings = 0
+
+    def start_listings(listers: Iterable[_DirectoryLister], /) -> None:
+        """Queues listings to start, in search stack order, and starts those visited soonest if there is room."""
+
+        nonlocal started_listings
+
+        # Without worker threads, the listing is done when the directory is visited, so the search stays strictly one
+        # directory at a time.
+        if executor is None:
+            return
+        unstarted_listings.extend(listers)
+        while unstarted_listings and started_listings < queue_size:
+            if unstarted_listings.pop().start(cast(ThreadPoolExecutor, executor)):
+                started_listings += 1
 
-    def pop_path_segment() -> None:
-        del path_segments[-1]
+    def exit_directory() -> ScanExitDirectory:
+        return ScanExitDirectory()
 
-    def pop_tree_node() -> None:
-        del tree_node_stack[-1]
+    def visit_directory(
+        search_directory: Path,
+        directory_path: str,
+        excludes: PathExcludeSet,
+        lister: _DirectoryLister,
+        name: str,
+        /,
+    ) -> ScanEnterDirectory:
+        nonlocal started_listings
 
-    def visit_directory(search_directory: Path, /) -> None:
-        if is_root:
-            directory_path = "/"
+        # Pretty sure it is impossible to re-enter a directory during the search.
+        search_stack.append(exit_directory)
+
+        files: list[File] = []
+        subdirectory_names: list[str] = []
+        subdirectory_listers: list[_DirectoryLister] = []
+        if lister.started:
+            started_listings -= 1
+        # Lists the directory now if its listing wasn't started, in which case it stays in `unstarted_listings` until
+        # popped.
+        children = lister.result()
+        if isinstance(children, OSError):
+            (callbacks.on_listdir_error)(search_directory, children)
         else:
-            path_segments.append(os.path.normcase(search_directory.name))
-            search_stack.append(pop_path_segment)
-            directory_path = "/" + "/".join(path_segments) + "/"
+            subdirectories: list[Callable[[], Optional[ScanFilesystemEvent]]] = []
+            for child in children:
+                if isinstance(child, File):
+                    files.append(child)
+                elif isinstance(child, _ExcludedFile):
+                    (callbacks.on_exclude)(search_directory / child.name)
+                elif isinstance(child, _MetadataError):
+                    (callbacks.on_metadata_error)(search_directory / child.name, child.error)
+                else:
+                    subdirectory = search_directory / child.name
+                    subdirectory_path = directory_path + os.path.normcase(child.name) + "/"
+                    # Need to use partial instead of lambda to avoid name rebinding issues.
+                    if not excludes.is_empty and excludes.matches(subdirectory_path):
+                        subdirectories.append(partial(callbacks.on_exclude, subdirectory))
+                    else:
+                        subdirectory_excludes = excludes.for_directory(subdirectory_path)
+                        subdirectory_lister = _DirectoryLister(subdirectory, subdirectory_path, subdirectory_excludes)
+                        subdirectory_listers.append(subdirectory_lister)
+                        subdirectories.append(
+                            partial(
+                                visit_directory,
+                                subdirectory,
+                                subdirectory_path,
+                                subdirectory_excludes,
+                                subdirectory_lister,
+                                child.name,
+                            )
+                        )
+                        subdirectory_names.append(child.name)
+
+            search_stack.extend(reversed(subdirectories))
+
+        # Replaces this directory's listing with the next one, if there are more.
+        start_listings(reversed(subdirectory_listers))
 
-        if is_path_excluded(directory_path, exclude_patterns):
-            (callbacks.on_exclude)(search_directory)
+        return ScanEnterDirectory(name, files, subdirectory_names)
+
+    try:
+        if exclude_set.matches("/"):
+            (callbacks.on_exclude)(path)
+            yield ScanEnterDirectory("", [], [])
+            yield ScanExitDirectory()
         else:
-            if is_root:
-                tree_node = root
-            else:
-                # Pretty sure it is impossible to re-enter a directory during the search.
-                tree_node = Directory(search_directory.name)
-                tree_node_stack[-1].subdirectories.append(tree_node)
-                tree_node_stack.append(tree_node)
-                search_stack.append(pop_tree_node)
+            root_excludes = exclude_set.for_directory("/")
+            root_lister = _DirectoryLister(path, "/", root_excludes)
+            search_stack.append(partial(visit_directory, path, "/", root_excludes, root_lister, ""))
+            start_listings((root_lister,))
+        while search_stack:
+            event = search_stack.pop()()
+            if event is not None:
+                yield event
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
 
-            try:
-                children = list(search_directory.iterdir())
-            except OSError as e:
-                (callbacks.on_listdir_error)(search_directory, e)
-            else:
-                files: list[File] = []
-                subdirectories: list[Path] = []
-                for child in children:
-                    try:
-                        if child.is_file():
-                            file_path = directory_path + os.path.normcase(child.name)
-                            if is_path_excluded(file_path, exclude_patterns):
-                                (callbacks.on_exclude)(child)
-                            else:
-                                last_modified = datetime.fromtimestamp(os.path.getmtime(child), tz=timezone.utc)
-                                files.append(File(child.name, last_modified))
-                        elif child.is_dir():
-                            subdirectories.append(child)
-                    except OSError as e:
-                        (callbacks.on_metadata_error)(child, e)
-
-                tree_node.files.extend(files)
-                # Need to use partial instead of lambda to avoid name rebinding issues.
-                search_stack.extend(partial(visit_directory, d) for d in reversed(subdirectories))
-
-    search_stack.append(partial(visit_directory, path))
-    while search_stack:
-        search_stack.pop()()
-        is_root = False
-
-    return ScanFilesystemResults(root, paths_skipped)
+
+@dataclass(frozen=True)
+class _ExcludedFile:
+    name: str
+
+
+@dataclass(frozen=True)
+class _MetadataError:
+    name: str
+    error: OSError
+
+
+@dataclass(frozen=True)
+class _Subdirectory:
+    name: str
+
+
+_DirectoryListing = Union[list[Union[File, _ExcludedFile, _MetadataError, _Subdirectory]], OSError]
+"""The children of a directory, in enumeration order, or the error raised enumerating it."""
+
+
+class _DirectoryLister:
+    """Lists a directory for `iter_scan_filesystem()`, on a worker thread if started ahead of the search, otherwise on
+    the calling thread when the directory is visited."""
+
+    def __init__(self, directory: Path, directory_path: str, excludes: PathExcludeSet, /) -> None:
+        self._arguments = (directory, directory_path, excludes)
+        self._future: Optional[Future[_DirectoryListing]] = None
+        self._listed = False
+
+    @property
+    def started(self) -> bool:
+        """Indicates if the listing was started on a worker thread."""
+
+        return self._future is not None
+
+    def start(self, executor: ThreadPoolExecutor, /) -> bool:
+        """Starts the listing on a worker thread, unless it was already done.
+
+        :return: `True` if the listing was started.
+        """
+
+        if self._listed:
+            return False
+        self._future = executor.submit(_list_directory, *self._arguments)
+        self._listed = True
+        return True
+
+    def result(self) -> _DirectoryListing:
+        """Gets the listing, waiting for it to complete if started, otherwise listing the directory now."""
+
+        if self._future is None:
+            self._listed = True
+            return _list_directory(*self._arguments)
+        else:
+            return self._future.result()
+
+
+def _list_directory(directory: Path, directory_path: str, excludes: PathExcludeSet, /) -> _DirectoryListing:
+    """Queries the entries of a directory. Does all the filesystem access for one directory of `scan_filesystem()`, so
+    it may run on a worker thread.
+
+    :param directory_path: The path of `directory` in the format used for matching exclude patterns.
+    :param excludes: The exclude patterns which could match paths within `directory`.
+    """
+
+    try:
+        with os.scandir(directory) as entries:
+            children = list(entries)
+    except OSError as e:
+        return e
+
+    # No need to check each file if no pattern could match within this directory.
+    check_excluded = not excludes.is_empty
+    listing: list[Union[File, _ExcludedFile, _MetadataError, _Subdirectory]] = []
+    for child in children:
+        # DirEntry takes the file type from the directory listing where the OS provides it, and caches the stat
+        # result, so this is typically one stat call per file and none per directory.
+        try:
+            if child.is_file():
+                if check_excluded and excludes.matches(directory_path + os.path.normcase(child.name)):
+                    listing.append(_ExcludedFile(child.name))
+                else:
+                    # Names repeat a lot across directories (e.g. "__init__.py"), so share the strings.
+                    listing.append(File(sys.intern(child.name), child.stat().st_mtime_ns))
+            elif child.is_dir():
+                listing.append(_Subdirectory(sys.intern(child.name)))
+        except OSError as e:
+            listing.append(_MetadataError(child.name, e))
+    return listing
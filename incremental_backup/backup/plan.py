@@ -1,17 +1,40 @@
-import shutil
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from functools import partial
 from pathlib import Path
-from typing import Callable, Optional
+from stat import S_IMODE
+from typing import Any, Callable, Iterable, Optional, Sequence, TypeVar, Union, cast
 
-from incremental_backup._utility import StrPath, path_name_equal
+from incremental_backup._utility import StrPath, add_slots, normalise_path_name
 from incremental_backup.backup import filesystem
+from incremental_backup.backup.filesystem import (
+    ScanEnterDirectory,
+    ScanFilesystemCallbacks,
+    iter_scan_filesystem,
+)
 from incremental_backup.backup.sum import BackupSum
-from incremental_backup.meta import BackupManifest
+from incremental_backup.compression import Compression, compress_file
+from incremental_backup.file_copy import CopyMethod, copy_file
+from incremental_backup.meta import (
+    BackupJournal,
+    BackupJournalWriter,
+    BackupManifest,
+    BackupManifestWriter,
+    BackupPackWriter,
+)
+from incremental_backup.object_store import StoreFileResult, get_object_path, store_file
+from incremental_backup.path_exclude import PathExcludePattern
 
 __all__ = [
+    "BackupDestinationOptions",
+    "BackupPipelineDestination",
     "BackupPlan",
+    "DEFAULT_PIPELINE_QUEUE_SIZE",
+    "execute_backup_pipeline",
     "execute_backup_plan",
+    "ExecuteBackupPipelineCallbacks",
     "ExecuteBackupPlanCallbacks",
     "ExecuteBackupPlanResults",
 ]
@@ -22,6 +45,7 @@ class BackupPlan:
     """The data required to perform a backup operation.
     Describes which files are to be copied, as well as information for creating the backup manifest."""
 
+    @add_slots
     @dataclass
     class Directory:
         name: str
@@ -46,20 +70,17 @@ class BackupPlan:
         plan_directories = [plan.root]
 
         search_stack: list[Callable[[], None]] = []
-        backup_sum_stack: list[Optional[BackupSum.Directory]] = [backup_sum.root]
         plan_stack = [plan.root]
         is_root = True
 
-        def pop_backup_sum_node() -> None:
-            del backup_sum_stack[-1]
-
         def pop_plan_node() -> None:
             del plan_stack[-1]
 
-        def visit_directory(search_directory: filesystem.Directory, /) -> None:
+        def visit_directory(
+            search_directory: filesystem.Directory, backup_sum_directory: Optional[BackupSum.Directory], /
+        ) -> None:
             if is_root:
                 plan_directory = plan.root
-                backup_sum_directory = backup_sum.root
             else:
                 # Assume filesystem tree doesn't re-enter the same directory. I think this will never happen, if it does
                 # then I don't think it will cause real issues, just yield unoptimised tree structure.
@@ -69,59 +90,22 @@ class BackupPlan:
                 search_stack.append(pop_plan_node)
                 plan_directories.append(plan_directory)
 
-                if backup_sum_stack[-1] is None:
-                    backup_sum_directory = None
-                else:
-                    backup_sum_directory = next(
-                        (
-                            d
-                            for d in backup_sum_stack[-1].subdirectories
-                            if path_name_equal(d.name, search_directory.name)
-                        ),
-                        None,
-                    )
-                backup_sum_stack.append(backup_sum_directory)
-                search_stack.append(pop_backup_sum_node)
-
-            if backup_sum_directory is None:
-                # Nothing backed up here so far, only possibility is new files to back up.
-                plan_directory.copied_files.extend(f.name for f in search_directory.files)
-            else:
-                # Something backed up here before, could have new files, modified files, removed files, removed
-                # subdirectories.
-
-                for current_file in search_directory.files:
-                    backed_up_file = next(
-                        (f for f in backup_sum_directory.files if path_name_equal(f.name, current_file.name)),
-                        None,
-                    )
-                    # File never backed up or modified since last backup.
-                    if (
-                        backed_up_file is None
-                        or current_file.last_modified > backed_up_file.last_backup.start_info.start_time
-                    ):
-                        plan_directory.copied_files.append(current_file.name)
-
-                plan_directory.removed_files.extend(
-                    f.name
-                    for f in backup_sum_directory.files
-                    if not any(path_name_equal(f.name, f2.name) for f2 in search_directory.files)
-                )
-
-                removed_directories = [
-                    d
-                    for d in backup_sum_directory.subdirectories
-                    if not any(path_name_equal(d.name, d2.name) for d2 in search_directory.subdirectories)
-                ]
-                plan_directory.removed_directories.extend(d.name for d in removed_directories)
-                plan_directory.removed_directory_file_count = sum(
-                    d.count_contained_files() for d in removed_directories
-                )
+            directory_plan = _plan_directory(
+                search_directory.files, [d.name for d in search_directory.subdirectories], backup_sum_directory
+            )
+            plan_directory.copied_files = directory_plan.copied_files
+            plan_directory.removed_files = directory_plan.removed_files
+            plan_directory.removed_directories = directory_plan.removed_directories
+            plan_directory.removed_directory_file_count = directory_plan.removed_directory_file_count
+            backup_sum_subdirectories = directory_plan.backup_sum_subdirectories
 
             # Need to use partial instead of lambda to avoid name rebinding issues.
-            search_stack.extend(partial(visit_directory, d) for d in reversed(search_directory.subdirectories))
+            search_stack.extend(
+                partial(visit_directory, d, backup_sum_subdirectories.get(normalise_path_name(d.name)))
+                for d in reversed(search_directory.subdirectories)
+            )
 
-        search_stack.append(partial(visit_directory, source_tree))
+        search_stack.append(partial(visit_directory, source_tree, backup_sum.root))
         while search_stack:
             search_stack.pop()()
             is_root = False
@@ -142,6 +126,79 @@ class BackupPlan:
         return plan
 
 
+@dataclass(frozen=True)
+class _DirectoryPlan:
+    """The plan for a single directory. See `BackupPlan.Directory`."""
+
+    copied_files: list[str]
+    removed_files: list[str]
+    removed_directories: list[str]
+    removed_directory_file_count: int
+
+    backup_sum_subdirectories: dict[str, BackupSum.Directory]
+    """The subdirectories of the directory in the backup sum, by normalised name (see `normalise_path_name()`)."""
+
+
+def _plan_directory(
+    files: Sequence[filesystem.File],
+    subdirectory_names: Sequence[str],
+    backup_sum_directory: Optional[BackupSum.Directory],
+    /,
+) -> _DirectoryPlan:
+    """Determines which files in a directory are to be copied, and which files and subdirectories were removed.
+
+    :param files: The files currently in the directory.
+    :param subdirectory_names: The names of the subdirectories currently in the directory.
+    :param backup_sum_directory: The directory in the backup sum, or `None` if nothing was backed up in it so far.
+    """
+
+    if backup_sum_directory is None:
+        # Nothing backed up here so far, only possibility is new files to back up.
+        return _DirectoryPlan([f.name for f in files], [], [], 0, {})
+
+    # Something backed up here before, could have new files, modified files, removed files, removed subdirectories.
+
+    copied_files: list[str] = []
+    backed_up_files = _index_by_name(backup_sum_directory.files)
+    for current_file in files:
+        backed_up_file = backed_up_files.get(normalise_path_name(current_file.name))
+        # File never backed up or modified since last backup.
+        # Compares integer nanoseconds, which is cheaper than datetimes and doesn't lose precision.
+        if (
+            backed_up_file is None
+            or current_file.last_modified_ns > backed_up_file.last_backup.start_info.start_time_ns
+        ):
+            copied_files.append(current_file.name)
+
+    current_file_names = {normalise_path_name(f.name) for f in files}
+    removed_files = [
+        f.name for f in backup_sum_directory.files if normalise_path_name(f.name) not in current_file_names
+    ]
+
+    current_subdirectory_names = {normalise_path_name(name) for name in subdirectory_names}
+    removed_directories = [
+        d for d in backup_sum_directory.subdirectories if normalise_path_name(d.name) not in current_subdirectory_names
+    ]
+
+    return _DirectoryPlan(
+        copied_files,
+        removed_files,
+        [d.name for d in removed_directories],
+        sum(d.count_contained_files() for d in removed_directories),
+        _index_by_name(backup_sum_directory.subdirectories),
+    )
+
+
+_NamedT = TypeVar("_NamedT", BackupSum.File, BackupSum.Directory)
+
+
+def _index_by_name(items: Sequence[_NamedT], /) -> dict[str, _NamedT]:
+    """Maps the normalised names (see `normalise_path_name()`) of backup sum files or directories to the items.
+    If multiple items have the same name, the first is used, as a linear search would find."""
+
+    return {normalise_path_name(item.name): item for item in reversed(items)}
+
+
 @dataclass(frozen=True)
 class ExecuteBackupPlanResults:
     """Return results of `execute_backup_plan()`."""
@@ -151,6 +208,22 @@ class ExecuteBackupPlanResults:
     files_copied: int
     files_removed: int
 
+    copy_methods: dict[CopyMethod, int] = field(default_factory=dict, compare=False)
+    """The number of files copied with each method (see `copy_file()`). Only for diagnostics, since it depends on the
+        platform and filesystems, so not included in comparisons."""
+
+    files_deduplicated: int = 0
+    """The number of files in `files_copied` whose content was already in the object store, so their data was not
+        copied. Always 0 if no object store was used."""
+
+    files_packed: int = 0
+    """The number of files in `files_copied` whose data was appended to a pack file. Always 0 if no pack writer was
+        used."""
+
+    files_resumed: int = 0
+    """The number of files in `files_copied` which were already copied by the interrupted backup being resumed, so
+        were not copied again. Always 0 if no backup was resumed."""
+
 
 @dataclass(frozen=True)
 class ExecuteBackupPlanCallbacks:
@@ -166,19 +239,65 @@ class ExecuteBackupPlanCallbacks:
         exception."""
 
 
+@dataclass(frozen=True)
+class BackupDestinationOptions:
+    """Options for how `execute_backup_plan()` and `execute_backup_pipeline()` store the backed up files."""
+
+    objects_directory: Optional[Path] = None
+    """If not `None`, file data is stored in this content-addressed object store (see `store_file()`) instead of being
+        copied to the destination directory, and the manifest records the files' content hashes. Files with the same
+        content are only stored once, across all backups using the same store. No directories are created in the
+        destination directory. Cannot be used with `pack_writer` or `compression`."""
+
+    pack_writer: Optional[BackupPackWriter] = None
+    """If not `None`, the data of files no larger than `pack_threshold` bytes is appended to pack files with this,
+        rather than copied to separate files in the destination directory. Destination directories are then only
+        created as needed for larger files. The caller should call `BackupPackWriter.finish()` afterwards and save the
+        index."""
+
+    pack_threshold: int = 0
+    """See `pack_writer`."""
+
+    compression: Optional[Compression] = None
+    """If not `None`, files copied to the destination directory are compressed with this codec (see
+        `compress_file()`). Compression runs on the worker threads, if any. Packed data is not compressed. Cannot be
+        used with `objects_directory`, since objects are shared between backups."""
+
+    journal_writer: Optional[BackupJournalWriter] = None
+    """If not `None`, each file copied to the destination directory or stored in `objects_directory` is recorded with
+        this, so the backup can be resumed if interrupted. The source file is queried just before it is copied, so a
+        file modified while being copied is copied again when resuming."""
+
+    resume_journal: Optional[BackupJournal] = None
+    """If not `None`, the journal of an interrupted backup to the destination directory (and `objects_directory`) to
+        resume. Files recorded in it which are unmodified (same modification time and size) and whose copies are still
+        present are not copied again, but are still recorded in the manifest."""
+
+
+DEFAULT_PIPELINE_QUEUE_SIZE = 4096
+"""Default maximum number of directories (or files) queued between the scan and the manifest in
+`execute_backup_pipeline()`, or started ahead of the manifest in `execute_backup_plan()`. Also the default maximum
+number of file batches submitted ahead by `restore_files()`."""
+
+
 def execute_backup_plan(
     backup_plan: BackupPlan,
     source_directory: StrPath,
     destination_directory: StrPath,
     callbacks: ExecuteBackupPlanCallbacks = ExecuteBackupPlanCallbacks(),
+    workers: int = 1,
+    manifest_writer: Optional[BackupManifestWriter] = None,
+    options: BackupDestinationOptions = BackupDestinationOptions(),
+    queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
 ) -> ExecuteBackupPlanResults:
     """Enacts a backup plan, copying files and creating the backup manifest.
 
     If a file cannot be backup up (i.e. copied), it is ignored and excluded from the manifest.
 
-    If a directory cannot be created, no files will be backed up into it or its (planned) child directories.
-    Any files planned to be backed up within it will not be copied and will be excluded from the manifest.
-    However, any removed files or directories within it will still be recorded in the manifest.
+    Destination directories are only created for directories with files to copy (along with their ancestors). If a
+    directory cannot be created, no files will be backed up into it or its (planned) child directories. Any files
+    planned to be backed up within it will not be copied and will be excluded from the manifest. However, any removed
+    files or directories within it will still be recorded in the manifest.
 
     :param backup_plan: The backup plan to enact. Should be based off `source_directory`, otherwise the results will
         be nonsense.
@@ -186,61 +305,96 @@ def execute_backup_plan(
     :param destination_directory: The location to copy files to. Need not exist. This directory itself represents
         the backup source directory.
     :param callbacks: Callbacks for certain events during execution. See `ExecuteBackupPlanCallbacks`.
+    :param workers: Number of threads used to copy files. If greater than 1, destination directories are created ahead
+        of the manifest (up to `queue_size` directories or files ahead, so memory use is bounded), and files are copied
+        concurrently. The results and the callbacks (which are always invoked from the calling thread, in the same
+        order) do not depend on this value.
+    :param manifest_writer: If not `None`, the manifest is also written with this as each directory is completed. The
+        caller should call `BackupManifestWriter.finish()` afterwards.
+    :param options: How the files are stored. See `BackupDestinationOptions`.
+    :param queue_size: See `workers`.
+    :except ValueError: If `workers` or `queue_size` is less than 1, or `options.objects_directory` is specified with
+        `options.pack_writer` or `options.compression`.
+    :except OSError: If writing to `manifest_writer` or `options.pack_writer` failed.
     """
 
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if queue_size < 1:
+        raise ValueError("queue_size must be at least 1")
+
     manifest = BackupManifest()
-    paths_skipped = False
-    files_copied = 0
     files_removed = 0
     search_stack: list[Callable[[], None]] = []
     manifest_stack = [manifest.root]
     path_segments: list[str] = []
     is_root = True
 
+    executor = ThreadPoolExecutor(workers) if workers > 1 else None
+    copier = _FileCopier(source_directory, destination_directory, callbacks, executor, workers, options)
+    # For when there are worker threads: directories yet to be started, and directories already created and their
+    # files started copying (with the number of files), in the same order as the main search.
+    start_stack: list[tuple[BackupPlan.Directory, Path]] = [(backup_plan.root, Path())]
+    started_directories: deque[tuple[_StartedDirectory, int]] = deque()
+    started_files = 0
+
+    def start_directories() -> None:
+        """Creates destination directories and starts copying their files ahead of the main search, until at least one
+        directory and up to `queue_size` directories or files are started."""
+
+        nonlocal started_files
+
+        while start_stack and (
+            not started_directories or (len(started_directories) < queue_size and started_files < queue_size)
+        ):
+            directory, relative_directory_path = start_stack.pop()
+            if directory.contains_copied_files:
+                started = copier.start_directory(relative_directory_path, directory.copied_files)
+                if isinstance(started, _MkdirError):
+                    file_count = 0
+                else:
+                    file_count = len(started)
+                    start_stack.extend(
+                        (d, relative_directory_path / d.name) for d in reversed(directory.subdirectories)
+                    )
+                started_directories.append((started, file_count))
+                started_files += file_count
+
     def pop_manifest_node() -> None:
         del manifest_stack[-1]
+        if manifest_writer is not None:
+            manifest_writer.exit_directory()
 
     def pop_path_segment() -> None:
         del path_segments[-1]
 
     def visit_directory(search_directory: BackupPlan.Directory, /, mkdir_failed: bool) -> None:
-        nonlocal paths_skipped
-        nonlocal files_copied
-        nonlocal files_removed
+        nonlocal files_removed, started_files
 
         if not is_root:
             path_segments.append(search_directory.name)
             search_stack.append(pop_path_segment)
 
         copied_files: list[str] = []
+        copied_file_hashes: list[str] = []
 
         # Once we fail to create a destination directory, or the current directory doesn't contain any more files to
         # copy, no need to try to create the destination directory or copy any files.
         if (not mkdir_failed) and search_directory.contains_copied_files:
-            relative_directory_path = Path(*path_segments)
-            destination_directory_path = destination_directory / relative_directory_path
+            if executor is None:
+                started = copier.start_directory(Path(*path_segments), search_directory.copied_files)
+            else:
+                start_directories()
+                started, file_count = started_directories.popleft()
+                started_files -= file_count
+                # Keep the workers busy while this directory's copies are waited for.
+                start_directories()
 
-            try:
-                destination_directory_path.mkdir(parents=True, exist_ok=True)
-            except OSError as e:
-                paths_skipped = True
+            if isinstance(started, _MkdirError):
                 mkdir_failed = True
-
-                (callbacks.on_mkdir_error)(destination_directory_path, e)
+                copier.report_mkdir_error(started)
             else:
-                for file in search_directory.copied_files:
-                    relative_file_path = relative_directory_path / file
-                    source_file_path = source_directory / relative_file_path
-                    destination_file_path = destination_directory / relative_file_path
-                    try:
-                        shutil.copy2(source_file_path, destination_file_path)
-                    except OSError as e:
-                        paths_skipped = True
-
-                        (callbacks.on_copy_error)(source_file_path, destination_file_path, e)
-                    else:
-                        copied_files.append(file)
-                        files_copied += 1
+                copied_files, copied_file_hashes = copier.finish_directory(started, path_segments)
 
         # Keep searching through child directories if:
         #   a) destination directory was created successfully, or
@@ -262,16 +416,623 @@ def execute_backup_plan(
                 search_stack.append(pop_manifest_node)
 
             manifest_directory.copied_files = copied_files
+            manifest_directory.copied_file_hashes = copied_file_hashes
             manifest_directory.removed_files = search_directory.removed_files
             manifest_directory.removed_directories = search_directory.removed_directories
+            if manifest_writer is not None:
+                _write_manifest_directory(manifest_writer, manifest_directory)
             files_removed += len(search_directory.removed_files) + search_directory.removed_directory_file_count
 
         # Need to use partial instead of lambda to avoid name rebinding issues.
         search_stack.extend(partial(visit_directory, d, mkdir_failed) for d in children_to_visit)
 
-    search_stack.append(partial(visit_directory, backup_plan.root, False))
-    while search_stack:
-        search_stack.pop()()
-        is_root = False
+    try:
+        search_stack.append(partial(visit_directory, backup_plan.root, False))
+        while search_stack:
+            search_stack.pop()()
+            is_root = False
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    return copier.results(manifest, files_removed)
+
+
+@dataclass(frozen=True)
+class BackupPipelineDestination:
+    """Where `execute_backup_pipeline()` backs up files to. See the parameters of `execute_backup_plan()`."""
+
+    destination_directory: Path
+    manifest_writer: Optional[BackupManifestWriter] = None
+    options: BackupDestinationOptions = BackupDestinationOptions()
+
+
+@dataclass(frozen=True)
+class ExecuteBackupPipelineCallbacks:
+    """Callbacks for events that occur in `execute_backup_pipeline()`."""
+
+    scan_source: ScanFilesystemCallbacks = ScanFilesystemCallbacks()
+    """Callbacks for scanning the source directory. See `iter_scan_filesystem()`."""
+
+    execute_plan: ExecuteBackupPlanCallbacks = ExecuteBackupPlanCallbacks()
+    """Callbacks for copying files. See `execute_backup_plan()`."""
+
+
+def execute_backup_pipeline(
+    source_directory: StrPath,
+    exclude_patterns: Iterable[PathExcludePattern],
+    backup_sum: BackupSum,
+    initialise: Callable[[], BackupPipelineDestination],
+    callbacks: ExecuteBackupPipelineCallbacks = ExecuteBackupPipelineCallbacks(),
+    scan_workers: int = 1,
+    copy_workers: int = 1,
+    queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
+) -> Optional[ExecuteBackupPlanResults]:
+    """Scans the backup source directory, plans the backup and enacts it all at once. Equivalent to
+    `scan_filesystem()`, `BackupPlan.new()` and `execute_backup_plan()` in turn, but without holding the whole source
+    tree or backup plan in memory, and copying starts as soon as the first changed directory is scanned.
+
+    Each directory is planned as soon as it is scanned, and its files start copying (on the worker threads, if any)
+    while the scan continues. The manifest is written as the copies complete, in order. Up to `queue_size` directories
+    and `queue_size` files may be waiting for the manifest at a time, beyond which the scan waits for copies to
+    complete, and up to `queue_size` directories may be listed ahead of the scan (see `scan_filesystem()`), so memory
+    use is bounded.
+
+    The manifest and the destination directories created are the same as from enacting the whole backup plan, even if
+    destination directories can't be created.
+
+    :param source_directory: The backup source directory.
+    :param exclude_patterns: See `scan_filesystem()`.
+    :param backup_sum: The sum of the previous backups. See `BackupPlan.new()`.
+    :param initialise: Called when the first change to back up is found, before any files are copied or the manifest is
+        written to. Returns where to back up to. Not called if there are no changes.
+    :param callbacks: Callbacks for certain events during execution. See `ExecuteBackupPipelineCallbacks`. All are
+        invoked from the calling thread, in the same order regardless of the numbers of workers.
+    :param scan_workers: Number of threads used to scan the source directory. See `scan_filesystem()`.
+    :param copy_workers: Number of threads used to copy files. See `execute_backup_plan()`.
+    :param queue_size: See above.
+    :return: The same as `execute_backup_plan()`, or `None` if there were no changes (`initialise` was not called).
+    :except ValueError: If `scan_workers`, `copy_workers` or `queue_size` is less than 1, or the destination returned by
+        `initialise` is invalid (see `execute_backup_plan()`).
+    :except OSError: If writing to the manifest writer or pack writer failed.
+    """
+
+    if scan_workers < 1:
+        raise ValueError("scan_workers must be at least 1")
+    if copy_workers < 1:
+        raise ValueError("copy_workers must be at least 1")
+    if queue_size < 1:
+        raise ValueError("queue_size must be at least 1")
+
+    manifest = BackupManifest()
+    files_removed = 0
+    copier: Optional[_FileCopier] = None
+    manifest_writer: Optional[BackupManifestWriter] = None
+    # Directories entered by the scan and not yet exited.
+    scan_stack: list[_PipelineDirectory] = []
+    # Directories (or `None` for exiting a directory) waiting for their file copies to complete to be added to the
+    # manifest, in scan order.
+    queue: deque[Optional[_PipelineDirectory]] = deque()
+    queued_files = 0
+    # Directories entered in the manifest order and not yet exited. Those in the manifest are always a prefix.
+    manifest_directory_stack: list[_PipelineDirectory] = []
+    manifest_stack = [manifest.root]
+
+    executor = ThreadPoolExecutor(copy_workers) if copy_workers > 1 else None
+
+    def plan_directory(event: ScanEnterDirectory, /) -> _PipelineDirectory:
+        nonlocal files_removed
+        nonlocal copier
+        nonlocal manifest_writer
+
+        if scan_stack:
+            parent = scan_stack[-1]
+            path_segments = (*parent.path_segments, event.name)
+            backup_sum_directory = parent.backup_sum_subdirectories.get(normalise_path_name(event.name))
+            mkdir_failed = parent.mkdir_failed
+        else:
+            path_segments = ()
+            backup_sum_directory = backup_sum.root
+            mkdir_failed = False
+
+        directory_plan = _plan_directory(event.files, event.subdirectory_names, backup_sum_directory)
+        # Once we fail to create a destination directory, no files are copied within it.
+        copied_files = [] if mkdir_failed else directory_plan.copied_files
+        has_changes = bool(copied_files or directory_plan.removed_files or directory_plan.removed_directories)
+
+        if has_changes and copier is None:
+            destination = initialise()
+            copier = _FileCopier(
+                source_directory,
+                destination.destination_directory,
+                callbacks.execute_plan,
+                executor,
+                copy_workers,
+                destination.options,
+            )
+            manifest_writer = destination.manifest_writer
+
+        copies: list[_FileCopy] = []
+        if copied_files:
+            started = cast(_FileCopier, copier).start_directory(Path(*path_segments), copied_files)
+            if isinstance(started, _MkdirError):
+                mkdir_failed = True
+                cast(_FileCopier, copier).report_mkdir_error(started)
+            else:
+                copies = started
+
+        files_removed += len(directory_plan.removed_files) + directory_plan.removed_directory_file_count
+
+        return _PipelineDirectory(
+            event.name,
+            path_segments,
+            directory_plan.backup_sum_subdirectories,
+            mkdir_failed,
+            has_changes,
+            copies,
+            directory_plan.removed_files,
+            directory_plan.removed_directories,
+        )
+
+    def write_manifest_directory(
+        directory: _PipelineDirectory, copied_files: list[str], copied_file_hashes: list[str], /
+    ) -> None:
+        if directory is manifest_directory_stack[0]:
+            manifest_directory = manifest.root
+        else:
+            manifest_directory = BackupManifest.Directory(directory.name)
+            manifest_stack[-1].subdirectories.append(manifest_directory)
+            manifest_stack.append(manifest_directory)
+        manifest_directory.copied_files = copied_files
+        manifest_directory.copied_file_hashes = copied_file_hashes
+        manifest_directory.removed_files = directory.removed_files
+        manifest_directory.removed_directories = directory.removed_directories
+        if manifest_writer is not None:
+            _write_manifest_directory(manifest_writer, manifest_directory)
+        directory.in_manifest = True
+
+    def process_queue() -> None:
+        nonlocal queued_files
+
+        directory = queue.popleft()
+        if directory is None:
+            exited = manifest_directory_stack.pop()
+            if exited.in_manifest and manifest_directory_stack:
+                del manifest_stack[-1]
+                if manifest_writer is not None:
+                    manifest_writer.exit_directory()
+        else:
+            manifest_directory_stack.append(directory)
+            copied_files: list[str] = []
+            copied_file_hashes: list[str] = []
+            if directory.copies:
+                queued_files -= len(directory.copies)
+                copied_files, copied_file_hashes = cast(_FileCopier, copier).finish_directory(
+                    directory.copies, directory.path_segments
+                )
+                directory.copies = []
+            if directory.has_changes:
+                # Ancestors are in the manifest if anything changed within them, even if their own files failed to
+                # copy, as with the whole backup plan.
+                for ancestor in manifest_directory_stack[:-1]:
+                    if not ancestor.in_manifest:
+                        write_manifest_directory(ancestor, [], [])
+                if copied_files or directory.removed_files or directory.removed_directories:
+                    write_manifest_directory(directory, copied_files, copied_file_hashes)
+
+    scan = iter_scan_filesystem(source_directory, exclude_patterns, callbacks.scan_source, scan_workers, queue_size)
+    try:
+        for event in scan:
+            if isinstance(event, ScanEnterDirectory):
+                directory = plan_directory(event)
+                scan_stack.append(directory)
+                queue.append(directory)
+                queued_files += len(directory.copies)
+            else:
+                del scan_stack[-1]
+                queue.append(None)
+            # Without worker threads, files are only copied when the queue is processed, so there's nothing to wait for.
+            while queue and (executor is None or len(queue) > queue_size or queued_files > queue_size):
+                process_queue()
+        while queue:
+            process_queue()
+    finally:
+        scan.close()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if copier is None:
+        return None
+    return copier.results(manifest, files_removed)
+
+
+@dataclass(frozen=True)
+class _MkdirError:
+    path: Path
+    error: OSError
+
+
+@dataclass(frozen=True)
+class _FileCopy:
+    name: str
+    source_path: Path
+    destination_path: Path
+    """The destination file, or the object store directory if storing the file there."""
+
+    result: Callable[
+        [], Union[CopyMethod, StoreFileResult, "_SmallFile", "_JournaledCopy", "_ResumedFile", None, OSError]
+    ]
+    """Waits for the copy to complete, returning the copy method used (or store result, or data to pack, or `None` if
+        compressed, possibly with the journal information) or the error raised."""
+
+
+@dataclass(frozen=True)
+class _SmallFile:
+    """The data of a file small enough to be packed."""
+
+    data: bytes
+    last_modified_ns: int
+    mode: int
+
+
+@dataclass(frozen=True)
+class _JournaledCopy:
+    """The result of copying a file, and the source file's metadata to record in the journal."""
+
+    result: Union[CopyMethod, StoreFileResult, None]
+    last_modified_ns: int
+    size: int
+
+
+@dataclass(frozen=True)
+class _ResumedFile:
+    """A file already copied by the backup being resumed."""
+
+    content_hash: Optional[str]
+
+
+_StartedDirectory = Union[list[_FileCopy], _MkdirError]
+"""The file copies into a destination directory, in order, or the error raised creating it."""
+
+
+class _QueuedCopy:
+    """A file copy to run on the worker threads, submitted once few enough copies are in progress."""
+
+    __slots__ = ("function", "future")
+
+    def __init__(self, function: Callable[[], Any], /) -> None:
+        self.function = function
+        self.future: Optional[Future[Any]] = None
+
+
+_COPIES_IN_FLIGHT_PER_WORKER = 8
+"""Maximum number of file copies submitted to the worker threads and not yet waited for, per worker. Keeps the workers
+busy (even if some files take longer than others) while bounding the memory held by completed copies, in particular
+the data of files to pack."""
+
+
+class _FileCopier:
+    """Copies the files of directories to the backup, and counts the results. Shared by `execute_backup_plan()` and
+    `execute_backup_pipeline()`, whose parameters these are."""
+
+    def __init__(
+        self,
+        source_directory: StrPath,
+        destination_directory: StrPath,
+        callbacks: ExecuteBackupPlanCallbacks,
+        executor: Optional[ThreadPoolExecutor],
+        workers: int,
+        options: BackupDestinationOptions,
+        /,
+    ) -> None:
+        """
+        :param executor: If not `None`, files are copied on these worker threads. Otherwise, each file is only copied
+            when its result is needed.
+        :param workers: The number of threads of `executor`. Copies are submitted to it in order, only a few per worker
+            ahead of the copy being waited for, so the data of files to pack isn't all held in memory at once.
+        :except ValueError: If `options.objects_directory` is specified with `options.pack_writer` or
+            `options.compression`.
+        """
+
+        if options.objects_directory is not None and options.pack_writer is not None:
+            raise ValueError("objects_directory and pack_writer cannot both be specified")
+        if options.objects_directory is not None and options.compression is not None:
+            raise ValueError("objects_directory and compression cannot both be specified")
+
+        self._source_directory = Path(source_directory)
+        self._destination_directory = Path(destination_directory)
+        self._callbacks = callbacks
+        self._executor = executor
+        self._max_copies_in_flight = workers * _COPIES_IN_FLIGHT_PER_WORKER
+        # Copies not submitted to the executor yet, in order, and the number submitted and not waited for.
+        self._queued_copies: deque[_QueuedCopy] = deque()
+        self._copies_in_flight = 0
+        self._objects_directory = options.objects_directory
+        self._pack_writer = options.pack_writer
+        self._compression = options.compression
+        self._journal_writer = options.journal_writer
+        # Later entries for the same file are current.
+        resume_journal = options.resume_journal
+        self._resume_entries = {} if resume_journal is None else {e.path: e for e in resume_journal.entries}
+
+        self._copy_function: Callable[[Path, Path], Union[CopyMethod, StoreFileResult, _SmallFile, None, OSError]]
+        if options.objects_directory is not None:
+            self._copy_function = _store_file
+        elif options.pack_writer is not None:
+            self._copy_function = partial(
+                _pack_or_copy_file, threshold=options.pack_threshold, compression=options.compression
+            )
+        else:
+            self._copy_function = partial(_copy_file, compression=options.compression)
+
+        self.paths_skipped = False
+        self.files_copied = 0
+        self.files_deduplicated = 0
+        self.files_packed = 0
+        self.files_resumed = 0
+        self.copy_methods: dict[CopyMethod, int] = {}
+
+    def start_directory(self, relative_directory_path: Path, files: Sequence[str], /) -> _StartedDirectory:
+        """Creates a destination directory and its ancestors if there are files to copy into it (unless storing or
+        packing files, where directories are created only as needed) and starts copying the files.
+
+        Directories are only created for their own files, so that `execute_backup_plan()` and
+        `execute_backup_pipeline()` create the same directories and report the same errors.
+        """
+
+        if files and self._objects_directory is None and self._pack_writer is None:
+            destination_directory_path = self._destination_directory / relative_directory_path
+            try:
+                destination_directory_path.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                return _MkdirError(destination_directory_path, e)
+
+        copies: list[_FileCopy] = []
+        for file in files:
+            relative_file_path = relative_directory_path / file
+            source_file_path = self._source_directory / relative_file_path
+            if self._objects_directory is not None:
+                destination_file_path = Path(self._objects_directory)
+            else:
+                destination_file_path = self._destination_directory / relative_file_path
+            if self._journal_writer is None and not self._resume_entries:
+                copy_function = self._copy_function
+            else:
+                copy_function = partial(self._copy_file_journaled, self._resume_entries.get(relative_file_path.parts))
+            if self._executor is None:
+                # Defer the copy until its result is needed, so files are copied strictly one at a time.
+                result = partial(copy_function, source_file_path, destination_file_path)
+            else:
+                queued_copy = _QueuedCopy(partial(copy_function, source_file_path, destination_file_path))
+                self._queued_copies.append(queued_copy)
+                result = partial(self._wait_for_copy, queued_copy)
+            copies.append(_FileCopy(file, source_file_path, destination_file_path, result))
+        self._submit_copies()
+        return copies
+
+    def report_mkdir_error(self, error: _MkdirError, /) -> None:
+        self.paths_skipped = True
+
+        (self._callbacks.on_mkdir_error)(error.path, error.error)
+
+    def finish_directory(
+        self, copies: Sequence[_FileCopy], path_segments: Sequence[str], /
+    ) -> tuple[list[str], list[str]]:
+        """Waits for the file copies into a directory to complete, in order.
+
+        :param path_segments: The path of the directory relative to the source directory.
+        :return: The names of the files successfully copied, and their content hashes (if stored in the object store).
+        :except OSError: If writing to the pack writer failed.
+        """
+
+        copied_files: list[str] = []
+        copied_file_hashes: list[str] = []
+        for copy in copies:
+            result = copy.result()
+            journaled = None
+            if isinstance(result, _JournaledCopy):
+                journaled = result
+                result = result.result
+            if isinstance(result, OSError):
+                self.paths_skipped = True
+
+                (self._callbacks.on_copy_error)(copy.source_path, copy.destination_path, result)
+            else:
+                copied_files.append(copy.name)
+                self.files_copied += 1
+                if journaled is not None and self._journal_writer is not None:
+                    self._journal_writer.add_file(
+                        (*path_segments, copy.name),
+                        journaled.last_modified_ns,
+                        journaled.size,
+                        result.content_hash if isinstance(result, StoreFileResult) else None,
+                    )
+                if isinstance(result, _ResumedFile):
+                    if result.content_hash is not None:
+                        copied_file_hashes.append(result.content_hash)
+                    self.files_resumed += 1
+                elif isinstance(result, StoreFileResult):
+                    copied_file_hashes.append(result.content_hash)
+                    if not result.stored:
+                        self.files_deduplicated += 1
+                elif isinstance(result, _SmallFile):
+                    # Appended on this thread, so the pack contents don't depend on the number of workers.
+                    cast(BackupPackWriter, self._pack_writer).add_file(
+                        (*path_segments, copy.name), result.data, result.last_modified_ns, result.mode
+                    )
+                    self.files_packed += 1
+                elif result is not None:
+                    self.copy_methods[result] = self.copy_methods.get(result, 0) + 1
+        return copied_files, copied_file_hashes
+
+    def results(self, manifest: BackupManifest, files_removed: int, /) -> ExecuteBackupPlanResults:
+        return ExecuteBackupPlanResults(
+            manifest,
+            self.paths_skipped,
+            self.files_copied,
+            files_removed,
+            self.copy_methods,
+            self.files_deduplicated,
+            self.files_packed,
+            self.files_resumed,
+        )
+
+    def _submit_copies(self) -> None:
+        """Submits queued copies to the executor, up to the maximum number in progress."""
+
+        executor = cast(ThreadPoolExecutor, self._executor)
+        while self._queued_copies and self._copies_in_flight < self._max_copies_in_flight:
+            queued_copy = self._queued_copies.popleft()
+            queued_copy.future = executor.submit(queued_copy.function)
+            self._copies_in_flight += 1
+
+    def _wait_for_copy(self, queued_copy: _QueuedCopy, /) -> Any:
+        """Waits for a copy on the executor to complete, then submits more queued copies."""
+
+        # Copies are waited for in the order they're started, so this is only needed if that's not the case.
+        while queued_copy.future is None:
+            earlier_copy = self._queued_copies.popleft()
+            earlier_copy.future = cast(ThreadPoolExecutor, self._executor).submit(earlier_copy.function)
+            self._copies_in_flight += 1
+        result = queued_copy.future.result()
+        self._copies_in_flight -= 1
+        self._submit_copies()
+        return result
+
+    def _copy_file_journaled(
+        self, resume_entry: Optional[BackupJournal.Entry], source_path: Path, destination_path: Path, /
+    ) -> Union[_JournaledCopy, _ResumedFile, _SmallFile, OSError]:
+        """Copies a file, querying the source file first to record it in the journal, unless the file was already
+        copied by the backup being resumed. May run on a worker thread.
+
+        :param resume_entry: The file's entry in the journal of the backup being resumed, if any.
+        """
+
+        try:
+            stat = os.stat(source_path)
+            if resume_entry is not None and self._is_copy_current(resume_entry, stat, destination_path):
+                return _ResumedFile(resume_entry.content_hash)
+        except OSError as e:
+            return e
+        result = self._copy_function(source_path, destination_path)
+        if isinstance(result, (_SmallFile, OSError)):
+            # Packed files aren't journaled, since the pack index is only written at the end.
+            return result
+        return _JournaledCopy(result, stat.st_mtime_ns, stat.st_size)
+
+    def _is_copy_current(
+        self, entry: BackupJournal.Entry, source_stat: os.stat_result, destination_path: Path, /
+    ) -> bool:
+        """Checks if the copy of a file recorded in the journal of the backup being resumed is still present and
+        matches the source file.
+
+        :except OSError: If querying the copy failed.
+        """
+
+        if entry.last_modified_ns != source_stat.st_mtime_ns or entry.size != source_stat.st_size:
+            return False
+        if self._objects_directory is not None:
+            return (
+                entry.content_hash is not None
+                and get_object_path(self._objects_directory, entry.content_hash).is_file()
+            )
+        if entry.content_hash is not None:
+            return False
+        try:
+            destination_stat = os.stat(destination_path)
+        except FileNotFoundError:
+            return False
+        # The size of compressed data isn't known, but an incomplete copy is never journaled.
+        return self._compression is not None or destination_stat.st_size == entry.size
+
+
+class _PipelineDirectory:
+    """A directory scanned by `execute_backup_pipeline()`."""
+
+    def __init__(
+        self,
+        name: str,
+        path_segments: tuple[str, ...],
+        backup_sum_subdirectories: dict[str, BackupSum.Directory],
+        mkdir_failed: bool,
+        has_changes: bool,
+        copies: list[_FileCopy],
+        removed_files: list[str],
+        removed_directories: list[str],
+        /,
+    ) -> None:
+        self.name = name
+        self.path_segments = path_segments
+        self.backup_sum_subdirectories = backup_sum_subdirectories
+        self.mkdir_failed = mkdir_failed
+        self.has_changes = has_changes
+        """Whether any files are planned to be copied (even if creating the destination directory failed), or files or
+            directories were removed."""
+        self.copies = copies
+        self.removed_files = removed_files
+        self.removed_directories = removed_directories
+        self.in_manifest = False
+        """Whether an entry for the directory has been written to the manifest."""
+
+
+def _write_manifest_directory(manifest_writer: BackupManifestWriter, directory: BackupManifest.Directory, /) -> None:
+    manifest_writer.enter_directory(
+        directory.name,
+        directory.copied_files,
+        directory.removed_files,
+        directory.removed_directories,
+        directory.copied_file_hashes,
+    )
+
+
+def _copy_file(
+    source_path: Path, destination_path: Path, /, compression: Optional[Compression]
+) -> Union[CopyMethod, None, OSError]:
+    """Copies a file and its metadata, compressing the data if `compression` is not `None`. May run on a worker thread.
+
+    :return: The copy method used (`None` if compressed), or the error raised.
+    """
+
+    try:
+        if compression is None:
+            return copy_file(source_path, destination_path)
+        else:
+            compress_file(source_path, destination_path, compression)
+            return None
+    except OSError as e:
+        return e
+
+
+def _pack_or_copy_file(
+    source_path: Path, destination_path: Path, /, threshold: int, compression: Optional[Compression]
+) -> Union[_SmallFile, CopyMethod, None, OSError]:
+    """Reads a file's data if it is no larger than `threshold` bytes, otherwise copies the file like `_copy_file()`,
+    creating the destination directory if needed. May run on a worker thread.
+
+    :return: The file data, or the result of `_copy_file()`, or the error raised.
+    """
+
+    try:
+        with open(source_path, "rb") as file:
+            stat = os.fstat(file.fileno())
+            if stat.st_size <= threshold:
+                data = file.read(threshold + 1)
+                # Might have grown since the stat.
+                if len(data) <= threshold:
+                    return _SmallFile(data, stat.st_mtime_ns, S_IMODE(stat.st_mode))
+        destination_path.parent.mkdir(parents=True, exist_ok=True)
+    except OSError as e:
+        return e
+    return _copy_file(source_path, destination_path, compression=compression)
+
+
+def _store_file(source_path: Path, objects_directory: Path, /) -> Union[StoreFileResult, OSError]:
+    """Stores a file in an object store. May run on a worker thread.
+
+    :return: The result of `store_file()`, or the error raised.
+    """
 
-    return ExecuteBackupPlanResults(manifest, paths_skipped, files_copied, files_removed)
+    try:
+        return store_file(objects_directory, source_path)
+    except OSError as e:
+        return e
@@ -1,8 +1,17 @@
 from dataclasses import dataclass, field
-from typing import Iterable, Union
-
-from incremental_backup._utility import path_name_equal
-from incremental_backup.meta import BackupManifest, BackupMetadata
+from typing import Iterable, Optional, Union
+
+from incremental_backup._utility import add_slots, normalise_path_name
+from incremental_backup.meta import (
+    BackupManifest,
+    BackupManifestEvent,
+    BackupMetadata,
+    ManifestCopiedFile,
+    ManifestEnterDirectory,
+    ManifestRemovedDirectory,
+    ManifestRemovedFile,
+)
+from incremental_backup.path_filter import PathFilter
 
 __all__ = ["BackupSum"]
 
@@ -13,6 +22,7 @@ class BackupSum:
     That is, reconstructs the state of the source directory given backup data.
     """
 
+    @add_slots
     @dataclass
     class File:
         name: str
@@ -20,6 +30,12 @@ class BackupSum:
         last_backup: BackupMetadata
         """The metadata of the last backup which copied this file."""
 
+        content_hash: Optional[str] = None
+        """The content hash of the file's data in the object store of the target directory, if `last_backup` stored
+            it there (see `BackupManifest.Directory.copied_file_hashes`). Otherwise, the data is in the data directory
+            of `last_backup`."""
+
+    @add_slots
     @dataclass
     class Directory:
         name: str
@@ -43,23 +59,22 @@ class BackupSum:
     """
 
     @classmethod
-    def from_backups(cls, backups: Iterable[BackupMetadata], /) -> "BackupSum":
+    def from_backups(cls, backups: Iterable[BackupMetadata], /, base: Optional["BackupSum"] = None) -> "BackupSum":
         """Constructs a backup sum from previous backup metadata.
 
         :param backups: 0 or more backups to sum. Should all be for the same source directory, or the results will
             be meaningless.
+        :param base: If not `None`, `backups` are applied on top of this sum, which is not modified. `backups` should
+            all be newer than the backups summed in `base`.
         """
 
-        backup_sum = cls()
-
         backups_sorted = sorted(backups, key=lambda backup: backup.start_info.start_time)
 
-        # list of all directories. Parent will always occur before child in list.
-        directories: list[BackupSum.Directory] = [backup_sum.root]
-
+        # Build the sum with files and subdirectories indexed by name, so applying a manifest is linear in its size.
+        root = _SumDirectory.from_backup_sum(base)
         for backup in backups_sorted:
             search_stack: list[Union[BackupManifest.Directory, None]] = [backup.manifest.root]
-            sum_stack = [backup_sum.root]
+            sum_stack = [root]
             is_root = True
             while search_stack:
                 search_directory = search_stack.pop()
@@ -67,40 +82,138 @@ class BackupSum:
                     del sum_stack[-1]
                 else:
                     if not is_root:
-                        sum_directory = next(
-                            (d for d in sum_stack[-1].subdirectories if path_name_equal(d.name, search_directory.name)),
-                            None,
-                        )
-                        if sum_directory is None:
-                            sum_directory = BackupSum.Directory(search_directory.name)
-                            sum_stack[-1].subdirectories.append(sum_directory)
-                            directories.append(sum_directory)
-                        sum_stack.append(sum_directory)
-
-                    for copied_file in search_directory.copied_files:
-                        prev_file = next(
-                            (f for f in sum_stack[-1].files if path_name_equal(f.name, copied_file)),
-                            None,
-                        )
-                        if prev_file is None:
-                            sum_stack[-1].files.append(BackupSum.File(copied_file, backup))
-                        else:
-                            prev_file.last_backup = backup
+                        sum_stack.append(sum_stack[-1].enter_subdirectory(search_directory.name))
+
+                    if search_directory.copied_file_hashes:
+                        for copied_file, content_hash in zip(
+                            search_directory.copied_files, search_directory.copied_file_hashes
+                        ):
+                            sum_stack[-1].add_file(copied_file, backup, content_hash)
+                    else:
+                        for copied_file in search_directory.copied_files:
+                            sum_stack[-1].add_file(copied_file, backup)
 
                     for removed_file in search_directory.removed_files:
-                        sum_stack[-1].files = [
-                            f for f in sum_stack[-1].files if not path_name_equal(f.name, removed_file)
-                        ]
+                        sum_stack[-1].files.pop(normalise_path_name(removed_file), None)
 
                     for removed_directory in search_directory.removed_directories:
-                        sum_stack[-1].subdirectories = [
-                            d for d in sum_stack[-1].subdirectories if not path_name_equal(d.name, removed_directory)
-                        ]
+                        sum_stack[-1].subdirectories.pop(normalise_path_name(removed_directory), None)
 
                     search_stack.append(None)
                     search_stack.extend(reversed(search_directory.subdirectories))
                 is_root = False
 
+        return cls(root.to_backup_sum_directory())
+
+    @classmethod
+    def from_manifest_events(
+        cls,
+        manifests: Iterable[tuple[BackupMetadata, Iterable[BackupManifestEvent]]],
+        /,
+        base: Optional["BackupSum"] = None,
+    ) -> "BackupSum":
+        """Constructs a backup sum from manifests read incrementally (e.g. with `iter_backup_manifest_file()`), so no
+        whole manifest needs to be in memory.
+
+        :param manifests: 0 or more pairs of backup metadata and the events of the backup's manifest (the metadata's
+            `manifest` is not used). Applied in the given order, which should be chronological.
+        :param base: See `from_backups()`.
+        """
+
+        root = _SumDirectory.from_backup_sum(base)
+        for backup, events in manifests:
+            sum_stack = [root]
+            for event in events:
+                if isinstance(event, ManifestCopiedFile):
+                    sum_stack[-1].add_file(event.name, backup, event.content_hash)
+                elif isinstance(event, ManifestRemovedFile):
+                    sum_stack[-1].files.pop(normalise_path_name(event.name), None)
+                elif isinstance(event, ManifestRemovedDirectory):
+                    sum_stack[-1].subdirectories.pop(normalise_path_name(event.name), None)
+                elif isinstance(event, ManifestEnterDirectory):
+                    sum_stack.append(sum_stack[-1].enter_subdirectory(event.name))
+                else:
+                    del sum_stack[-event.count :]
+
+        return cls(root.to_backup_sum_directory())
+
+    def filtered(self, path_filter: PathFilter, /) -> "BackupSum":
+        """Gets the part of this sum selected by a filter, without directories which contain nothing selected. Shares
+        the file objects with this sum."""
+
+        root = _SumDirectory("")
+        stack: list[tuple[BackupSum.Directory, _SumDirectory, PathFilter]] = [(self.root, root, path_filter)]
+        while stack:
+            directory, sum_directory, directory_filter = stack.pop()
+            for file in directory.files:
+                if directory_filter.includes_all or directory_filter.includes_file(file.name):
+                    sum_directory.files[normalise_path_name(file.name)] = file
+            for subdirectory in directory.subdirectories:
+                subdirectory_filter = directory_filter.enter_directory(subdirectory.name)
+                if subdirectory_filter is not None:
+                    sum_subdirectory = sum_directory.enter_subdirectory(subdirectory.name)
+                    stack.append((subdirectory, sum_subdirectory, subdirectory_filter))
+        return BackupSum(root.to_backup_sum_directory())
+
+
+class _SumDirectory:
+    """Directory of a backup sum under construction. Files and subdirectories are keyed by normalised name (see
+    `normalise_path_name()`), in order of insertion."""
+
+    __slots__ = ("name", "files", "subdirectories")
+
+    def __init__(self, name: str, /) -> None:
+        self.name = name
+        self.files: dict[str, BackupSum.File] = {}
+        self.subdirectories: dict[str, _SumDirectory] = {}
+
+    @classmethod
+    def from_backup_sum(cls, backup_sum: Optional[BackupSum], /) -> "_SumDirectory":
+        """Creates the root of a sum under construction, starting from an existing sum (if not `None`)."""
+
+        root = cls("")
+        if backup_sum is not None:
+            stack: list[tuple[BackupSum.Directory, _SumDirectory]] = [(backup_sum.root, root)]
+            while stack:
+                directory, sum_directory = stack.pop()
+                sum_directory.files = {normalise_path_name(f.name): f for f in directory.files}
+                for subdirectory in directory.subdirectories:
+                    sum_subdirectory = cls(subdirectory.name)
+                    sum_directory.subdirectories[normalise_path_name(subdirectory.name)] = sum_subdirectory
+                    stack.append((subdirectory, sum_subdirectory))
+        return root
+
+    def enter_subdirectory(self, name: str, /) -> "_SumDirectory":
+        """Gets the subdirectory with the given name, creating it if it doesn't exist."""
+
+        key = normalise_path_name(name)
+        subdirectory = self.subdirectories.get(key)
+        if subdirectory is None:
+            subdirectory = _SumDirectory(name)
+            self.subdirectories[key] = subdirectory
+        return subdirectory
+
+    def add_file(self, name: str, backup: BackupMetadata, content_hash: Optional[str] = None, /) -> None:
+        """Records that a file was copied by a backup. Keeps the existing name if the file was already present."""
+
+        key = normalise_path_name(name)
+        prev_file = self.files.get(key)
+        self.files[key] = BackupSum.File(name if prev_file is None else prev_file.name, backup, content_hash)
+
+    def to_backup_sum_directory(self) -> BackupSum.Directory:
+        """Converts this directory and its descendents to `BackupSum.Directory`, removing empty directories."""
+
+        # list of all directories. Parent will always occur before child in list.
+        directories: list[BackupSum.Directory] = []
+        convert_stack: list[tuple[_SumDirectory, Optional[BackupSum.Directory]]] = [(self, None)]
+        while convert_stack:
+            sum_directory, parent = convert_stack.pop()
+            directory = BackupSum.Directory(sum_directory.name, list(sum_directory.files.values()))
+            if parent is not None:
+                parent.subdirectories.append(directory)
+            directories.append(directory)
+            convert_stack.extend((d, directory) for d in reversed(sum_directory.subdirectories.values()))
+
         # Calculate if each directory has nonempty descendents has and remove empty directories.
         # Empty = contains nothing or only directories.
         nonempty_map: dict[int, bool] = {}
@@ -116,4 +229,4 @@ class BackupSum:
             nonempty_map[id(directory)] = nonempty
             directory.subdirectories = nonempty_subdirectories
 
-        return backup_sum
+        return directories[0]
@@ -0,0 +1,421 @@
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, NoReturn, Optional, Sequence, Union, cast
+
+from incremental_backup._utility import StrPath
+from incremental_backup.backup.sum import BackupSum
+from incremental_backup.meta import (
+    MANIFEST_FILENAME,
+    SUM_CHECKPOINT_FILENAME,
+    BackupManifest,
+    BackupManifestEvent,
+    BackupManifestParseError,
+    BackupMetadata,
+    iter_backup_manifest_file,
+)
+from incremental_backup.path_filter import PathFilter
+
+__all__ = [
+    "BackupSumCheckpoint",
+    "BackupSumCheckpointParseError",
+    "deserialise_backup_sum_checkpoint",
+    "load_backup_sum",
+    "load_partial_backup_sum",
+    "LoadBackupSumCallbacks",
+    "read_backup_sum_checkpoint_file",
+    "serialise_backup_sum_checkpoint",
+    "write_backup_sum_checkpoint_file",
+]
+
+
+@dataclass(frozen=True)
+class BackupSumCheckpoint:
+    """A backup sum saved along with the backups it was computed from, so it can be reused instead of reapplying all
+    those backups."""
+
+    backup_sum: BackupSum
+
+    backup_names: tuple[str, ...]
+    """Names of the backups summed, in chronological order."""
+
+    empty_backup_names: frozenset[str]
+    """Names of the backups in `backup_names` which recorded no changes. These do not affect the sum, so the
+        checkpoint is still valid if they are deleted (e.g. by pruning)."""
+
+    @classmethod
+    def from_backups(
+        cls, backups: Iterable[BackupMetadata], /, base: Optional["BackupSumCheckpoint"] = None
+    ) -> "BackupSumCheckpoint":
+        """Constructs a checkpoint by summing backups.
+
+        :param backups: 0 or more backups to sum. Should all be newer than the backups in `base`.
+        :param base: If not `None`, `backups` are applied on top of this checkpoint.
+        """
+
+        backups_sorted = sorted(backups, key=lambda backup: backup.start_info.start_time)
+        if base is None:
+            base = cls(BackupSum(), (), frozenset())
+        backup_sum = BackupSum.from_backups(backups_sorted, base.backup_sum)
+        backup_names = base.backup_names + tuple(backup.name for backup in backups_sorted)
+        empty_backup_names = base.empty_backup_names.union(
+            backup.name for backup in backups_sorted if _is_manifest_empty(backup.manifest)
+        )
+        return cls(backup_sum, backup_names, empty_backup_names)
+
+    def is_valid_for(self, backups: Iterable[BackupMetadata], /) -> bool:
+        """Checks if this checkpoint is the sum of exactly `backups`, ignoring empty backups which no longer exist."""
+
+        names = {backup.name for backup in backups}
+        summed_names = set(self.backup_names)
+        return names <= summed_names and summed_names - names <= self.empty_backup_names
+
+
+def _is_manifest_empty(manifest: BackupManifest, /) -> bool:
+    root = manifest.root
+    return not (root.copied_files or root.removed_files or root.removed_directories or root.subdirectories)
+
+
+def serialise_backup_sum_checkpoint(value: BackupSumCheckpoint, /) -> str:
+    """Writes a backup sum checkpoint to a string.
+
+    :except ValueError: If the backup sum references a backup not in `value.backup_names`.
+    """
+
+    backup_indices = {name: i for i, name in enumerate(value.backup_names)}
+
+    def search(backup_sum: BackupSum, /) -> Iterator[Optional[BackupSum.Directory]]:
+        stack: list[Optional[BackupSum.Directory]] = [backup_sum.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node is not None:
+                stack.append(None)
+                stack.extend(reversed(node.subdirectories))
+
+    def compress_backtracks(
+        nodes: Iterator[Optional[BackupSum.Directory]], /
+    ) -> Iterator[Union[BackupSum.Directory, int]]:
+        backtrack_count = 0
+        for node in nodes:
+            if node is None:
+                backtrack_count += 1
+            else:
+                if backtrack_count > 0:
+                    yield backtrack_count
+                    backtrack_count = 0
+                yield node
+        # Also trims trailing backtracks since they are not required.
+
+    def node_to_object(node: Union[BackupSum.Directory, int], /) -> Union[dict[str, Any], str]:
+        if isinstance(node, int):
+            return f"^{node}"
+        else:
+            obj: dict[str, Any] = {"n": node.name}
+            if node.files:
+                files: list[Union[tuple[str, int], tuple[str, int, str]]] = []
+                for file in node.files:
+                    try:
+                        backup_index = backup_indices[file.last_backup.name]
+                    except KeyError as e:
+                        raise ValueError(f'File "{file.name}" is from backup not in checkpoint: {e}') from e
+                    if file.content_hash is None:
+                        files.append((file.name, backup_index))
+                    else:
+                        files.append((file.name, backup_index, file.content_hash))
+                obj["f"] = files
+            return obj
+
+    json_data = {
+        "backups": value.backup_names,
+        "empty_backups": sorted(value.empty_backup_names),
+        "tree": [node_to_object(node) for node in compress_backtracks(search(value.backup_sum))],
+    }
+    return json.dumps(json_data, indent=0, ensure_ascii=False)
+
+
+def write_backup_sum_checkpoint_file(path: StrPath, value: BackupSumCheckpoint, /) -> None:
+    """Writes a backup sum checkpoint to file.
+
+    :except OSError: If the file could not be written to.
+    :except ValueError: See `serialise_backup_sum_checkpoint()`.
+    """
+
+    string = serialise_backup_sum_checkpoint(value)
+    with open(path, "w", encoding="utf8") as file:
+        file.write(string)
+
+
+def deserialise_backup_sum_checkpoint(
+    string: str, backups: Iterable[BackupMetadata], /
+) -> Optional[BackupSumCheckpoint]:
+    """Reads a backup sum checkpoint from a string.
+
+    :param backups: The backups the checkpoint is expected to be the sum of. Used to resolve the backups referenced by
+        the checkpoint.
+    :return: The checkpoint, or `None` if it is stale, i.e. not valid for `backups` (see
+        `BackupSumCheckpoint.is_valid_for()`).
+    :except BackupSumCheckpointParseError: If the string is not a valid backup sum checkpoint.
+    """
+
+    def parse_error(reason: str, e: Optional[Exception] = None, /) -> NoReturn:
+        if e is None:
+            raise BackupSumCheckpointParseError(reason)
+        else:
+            raise BackupSumCheckpointParseError(reason) from e
+
+    def parse_backtrack(entry: str, entry_num: int, /) -> int:
+        if not entry.startswith("^"):
+            parse_error(f'Tree entry {entry_num}: invalid value, backtrack must be in form "^n"')
+
+        try:
+            backtracks = int(entry[1:])
+        except ValueError:
+            pass
+        else:
+            if backtracks >= 1:
+                return backtracks
+        parse_error(f"Tree entry {entry_num}: invalid backtrack amount, must be positive integer")
+
+    def parse_directory_entry(entry: dict[Any, Any], entry_num: int, /) -> BackupSum.Directory:
+        name = entry.pop("n", "" if entry_num == 1 else None)
+        if not isinstance(name, str):
+            parse_error(f'Tree entry {entry_num}: field "n" must be a string')
+
+        file_entries = entry.pop("f", [])
+        if not isinstance(file_entries, list):
+            parse_error(f'Tree entry {entry_num}: field "f" must be a list')
+        files: list[BackupSum.File] = []
+        for file in cast(list[Any], file_entries):
+            if not (
+                isinstance(file, list)
+                and len(file) in (2, 3)
+                and isinstance(file[0], str)
+                and isinstance(file[1], int)
+                and 0 <= file[1] < len(summed_backups)
+                and (len(file) == 2 or isinstance(file[2], str))
+            ):
+                parse_error(
+                    f'Tree entry {entry_num}: field "f" must be a list of [name, backup index] or '
+                    "[name, backup index, content hash] lists"
+                )
+            backup = summed_backups[file[1]]
+            if backup is None:
+                parse_error(f'Tree entry {entry_num}: file "{file[0]}" is from an empty backup')
+            files.append(BackupSum.File(file[0], backup, file[2] if len(file) == 3 else None))
+
+        if extra_fields := list(entry.keys()):
+            parse_error(f"Tree entry {entry_num}: invalid fields {extra_fields}")
+
+        return BackupSum.Directory(name, files)
+
+    try:
+        json_data = json.loads(string)
+    except json.JSONDecodeError as e:
+        parse_error(str(e), e)
+
+    if not isinstance(json_data, dict):
+        parse_error("Expected an object")
+    json_data = cast(dict[Any, Any], json_data)
+
+    fields = {"backups", "empty_backups", "tree"}
+    if set(json_data.keys()) != fields:
+        parse_error(f"Expected fields {fields}")
+
+    backup_names = json_data["backups"]
+    if not isinstance(backup_names, list) or not all(isinstance(n, str) for n in backup_names):
+        parse_error('Field "backups" must be a list of strings')
+    backup_names = tuple(cast(list[str], backup_names))
+
+    empty_backup_names = json_data["empty_backups"]
+    if not isinstance(empty_backup_names, list) or not all(
+        isinstance(n, str) and n in backup_names for n in empty_backup_names
+    ):
+        parse_error('Field "empty_backups" must be a list of names from field "backups"')
+    empty_backup_names = frozenset(cast(list[str], empty_backup_names))
+
+    # Check staleness before parsing the tree, because the tree can only be resolved for the backups we expect.
+    backups_by_name = {backup.name: backup for backup in backups}
+    if not BackupSumCheckpoint(BackupSum(), backup_names, empty_backup_names).is_valid_for(backups_by_name.values()):
+        return None
+    # Empty backups may have been deleted, but no file can be from them anyway.
+    summed_backups = [None if name in empty_backup_names else backups_by_name[name] for name in backup_names]
+
+    tree = json_data["tree"]
+    if not isinstance(tree, list) or not tree or not isinstance(tree[0], dict):
+        parse_error('Field "tree" must be a list starting with the source directory')
+    tree = cast(list[Any], tree)
+
+    backup_sum = BackupSum()
+    directory_stack: list[BackupSum.Directory] = []
+    for entry_num, entry in enumerate(tree, 1):
+        if isinstance(entry, str):
+            backtracks = parse_backtrack(entry, entry_num)
+            if len(directory_stack) <= backtracks:
+                parse_error(f"Tree entry {entry_num}: cannot backtrack past backup source directory")
+            del directory_stack[-backtracks:]
+        elif isinstance(entry, dict):
+            directory = parse_directory_entry(cast(dict[Any, Any], entry), entry_num)
+            if entry_num == 1:
+                backup_sum.root = directory
+            else:
+                # Unlike manifests, each directory appears exactly once, so no need to handle re-entry.
+                directory_stack[-1].subdirectories.append(directory)
+            directory_stack.append(directory)
+        else:
+            parse_error(f"Tree entry {entry_num}: invalid value, expected object or string")
+
+    return BackupSumCheckpoint(backup_sum, backup_names, empty_backup_names)
+
+
+def read_backup_sum_checkpoint_file(
+    path: StrPath, backups: Iterable[BackupMetadata], /
+) -> Optional[BackupSumCheckpoint]:
+    """Reads a backup sum checkpoint from file.
+
+    :param backups: See `deserialise_backup_sum_checkpoint()`.
+    :return: The checkpoint, or `None` if it is stale.
+    :except OSError: If the file could not be read.
+    :except BackupSumCheckpointParseError: If the file is not a valid backup sum checkpoint.
+    """
+
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return deserialise_backup_sum_checkpoint(file.read(), backups)
+    except BackupSumCheckpointParseError as e:
+        raise BackupSumCheckpointParseError(e.reason, str(path)) from e
+
+
+class BackupSumCheckpointParseError(Exception):
+    """Raised when a backup sum checkpoint file cannot be parsed due to invalid format."""
+
+    def __init__(self, reason: str, file_path: Optional[str] = None) -> None:
+        if file_path is None:
+            message = f"Failed to parse backup sum checkpoint: {reason}"
+        else:
+            message = f'Failed to parse backup sum checkpoint file "{file_path}": {reason}'
+        super().__init__(message)
+        self.reason = reason
+        self.file_path = file_path
+
+
+@dataclass(frozen=True)
+class LoadBackupSumCallbacks:
+    """Callbacks for events that occur during `load_backup_sum()`."""
+
+    on_read_checkpoint_error: Callable[[Path, Union[OSError, BackupSumCheckpointParseError]], None] = (
+        lambda path, error: None
+    )
+    """Called when a backup sum checkpoint file exists but cannot be read. The checkpoint is ignored.
+        First argument is the path to the file, second argument is the raised exception."""
+
+    on_checkpoint_used: Callable[[BackupMetadata], None] = lambda backup: None
+    """Called when a valid checkpoint is found and will be used.
+        Argument is the backup containing the checkpoint."""
+
+    on_read_manifest_error: Callable[[Path, Union[OSError, BackupManifestParseError]], None] = lambda path, error: None
+    """Called when loading the manifest of a backup to be summed fails (see `BackupMetadata.manifest`). The backup is
+        excluded from the sum.
+        First argument is the path of the backup, second argument is the raised exception."""
+
+
+def load_backup_sum(
+    backup_target_directory: StrPath,
+    backups: Iterable[BackupMetadata],
+    /,
+    callbacks: LoadBackupSumCallbacks = LoadBackupSumCallbacks(),
+) -> BackupSumCheckpoint:
+    """Computes the sum of backups, starting from the newest valid checkpoint saved in those backups (if any) and
+    applying only the backups newer than it.
+
+    The result is the same as `BackupSumCheckpoint.from_backups(backups)`. Missing, invalid and stale checkpoints are
+    skipped, in the worst case falling back to summing all the backups.
+
+    Only the manifests of the backups newer than the checkpoint are accessed, so if `backups` have lazily loaded
+    manifests (see `read_backups()`), the other manifests are never read.
+
+    :param backup_target_directory: The directory containing the backups.
+    :param backups: The backups to sum.
+    :param callbacks: Callbacks for certain events during execution. See `LoadBackupSumCallbacks`.
+    """
+
+    def load_manifests(backups_to_apply: Sequence[BackupMetadata], /) -> list[BackupMetadata]:
+        loaded: list[BackupMetadata] = []
+        for backup in backups_to_apply:
+            try:
+                backup.manifest
+            except (OSError, BackupManifestParseError) as e:
+                (callbacks.on_read_manifest_error)(Path(backup_target_directory, backup.name), e)
+            else:
+                loaded.append(backup)
+        return loaded
+
+    checkpoint, backups_to_apply = _find_checkpoint(backup_target_directory, backups, callbacks)
+    return BackupSumCheckpoint.from_backups(load_manifests(backups_to_apply), checkpoint)
+
+
+def load_partial_backup_sum(
+    backup_target_directory: StrPath,
+    backups: Iterable[BackupMetadata],
+    path_filter: PathFilter,
+    /,
+    callbacks: LoadBackupSumCallbacks = LoadBackupSumCallbacks(),
+) -> BackupSum:
+    """Computes the part of the sum of backups selected by a filter, like `load_backup_sum()` followed by
+    `BackupSum.filtered()`, but without building the rest of the sum.
+
+    The manifests of the backups newer than the checkpoint are read incrementally from their files in
+    `backup_target_directory` (not via `BackupMetadata.manifest`), skipping the directories which contain nothing
+    selected (see `iter_backup_manifest()`).
+
+    :param backup_target_directory: The directory containing the backups.
+    :param backups: The backups to sum.
+    :param path_filter: Selects the files to sum.
+    :param callbacks: Callbacks for certain events during execution. See `LoadBackupSumCallbacks`.
+    """
+
+    def read_manifest_events(backup: BackupMetadata, /) -> Optional[list[BackupManifestEvent]]:
+        backup_path = Path(backup_target_directory, backup.name)
+        try:
+            # Read all the events first, so an invalid manifest doesn't partially apply. Only the selected part of the
+            # manifest is kept.
+            return list(iter_backup_manifest_file(backup_path / MANIFEST_FILENAME, path_filter))
+        except (OSError, BackupManifestParseError) as e:
+            (callbacks.on_read_manifest_error)(backup_path, e)
+            return None
+
+    checkpoint, backups_to_apply = _find_checkpoint(backup_target_directory, backups, callbacks)
+    base = None if checkpoint is None else checkpoint.backup_sum.filtered(path_filter)
+    manifests: list[tuple[BackupMetadata, Iterable[BackupManifestEvent]]] = []
+    for backup in backups_to_apply:
+        events = read_manifest_events(backup)
+        if events is not None:
+            manifests.append((backup, events))
+    return BackupSum.from_manifest_events(manifests, base)
+
+
+def _find_checkpoint(
+    backup_target_directory: StrPath, backups: Iterable[BackupMetadata], callbacks: LoadBackupSumCallbacks, /
+) -> tuple[Optional[BackupSumCheckpoint], Sequence[BackupMetadata]]:
+    """Finds the newest valid checkpoint saved in `backups`.
+
+    :return: Tuple of (checkpoint, backups newer than the checkpoint in chronological order). The checkpoint is `None`
+        if there is no valid checkpoint, in which case all the backups are returned.
+    """
+
+    backups_sorted = sorted(backups, key=lambda backup: backup.start_info.start_time)
+
+    for i in reversed(range(len(backups_sorted))):
+        path = Path(backup_target_directory, backups_sorted[i].name, SUM_CHECKPOINT_FILENAME)
+        try:
+            checkpoint = read_backup_sum_checkpoint_file(path, backups_sorted[: i + 1])
+        except FileNotFoundError:
+            continue
+        except (OSError, BackupSumCheckpointParseError) as e:
+            (callbacks.on_read_checkpoint_error)(path, e)
+            continue
+        if checkpoint is not None:
+            (callbacks.on_checkpoint_used)(backups_sorted[i])
+            return checkpoint, backups_sorted[i + 1 :]
+
+    return None, backups_sorted
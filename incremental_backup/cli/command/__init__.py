@@ -1,5 +1,8 @@
 from .backup import *
+from .collect_orphans import *
 from .command import *
+from .consolidate import *
 from .exception import *
 from .registry import *
 from .restore import *
+from .restore_file import *
@@ -6,13 +6,19 @@ from incremental_backup._utility import print_warning
 from incremental_backup.backup import (
     BackupCallbacks,
     BackupError,
+    BackupOptions,
     BackupResults,
     ExecuteBackupPlanCallbacks,
+    LoadBackupSumCallbacks,
     ScanFilesystemCallbacks,
     perform_backup,
 )
 from incremental_backup.cli.command.command import Command
-from incremental_backup.cli.command.exception import CommandRuntimeError
+from incremental_backup.cli.command.exception import (
+    CommandArgumentError,
+    CommandRuntimeError,
+)
+from incremental_backup.compression import Compression
 from incremental_backup.meta import ReadBackupsCallbacks
 from incremental_backup.path_exclude import PathExcludePattern
 
@@ -48,10 +54,65 @@ class BackupCommand(Command):
             default=False,
             help="Only back up if there are file changes to record.",
         )
+        parser.add_argument(
+            "--deduplicate",
+            action="store_true",
+            default=False,
+            help="Store file data in a content-addressed store in the target directory, so identical files are only "
+            "stored once.",
+        )
+        parser.add_argument(
+            "--pack-threshold",
+            type=int,
+            required=False,
+            metavar="BYTES",
+            help="Append files no larger than this many bytes to a few large pack files in the backup, rather than "
+            "copying them to separate files. Cannot be used with --deduplicate.",
+        )
+        parser.add_argument(
+            "--compression",
+            choices=[c.value for c in Compression],
+            required=False,
+            help="Compress the data of copied files with this codec. Cannot be used with --deduplicate.",
+        )
+        parser.add_argument(
+            "--pipeline",
+            action="store_true",
+            default=False,
+            help="Copy files while the source directory is still being scanned, rather than after.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            default=False,
+            help="If a previous backup was interrupted while copying files, complete it rather than creating a new "
+            "backup. Files it already copied are not copied again if unmodified. Not done if a newer backup was "
+            "completed since.",
+        )
+        parser.add_argument(
+            "--scan-workers",
+            type=int,
+            default=1,
+            help="Number of threads used to scan the source directory.",
+        )
+        parser.add_argument(
+            "--copy-workers",
+            type=int,
+            default=1,
+            help="Number of threads used to copy files.",
+        )
+        parser.add_argument(
+            "--read-workers",
+            type=int,
+            default=1,
+            help="Number of threads used to read backup metadata.",
+        )
 
     def __init__(self, arguments: argparse.Namespace, /) -> None:
         """
         :param arguments: The parsed command line arguments object acquired from argparse.
+
+        :except CommandArgumentError: If the arguments are invalid.
         """
 
         super().__init__(arguments)
@@ -59,6 +120,30 @@ class BackupCommand(Command):
         self.target_path: Path = arguments.target_dir
         self.exclude_patterns: Sequence[PathExcludePattern] = arguments.exclude or ()
         self.skip_empty: bool = arguments.skip_empty
+        self.deduplicate: bool = arguments.deduplicate
+        self.pack_threshold: Optional[int] = arguments.pack_threshold
+        self.compression: Optional[Compression] = (
+            None if arguments.compression is None else Compression(arguments.compression)
+        )
+        self.pipeline: bool = arguments.pipeline
+        self.resume: bool = arguments.resume
+        self.scan_workers: int = arguments.scan_workers
+        self.copy_workers: int = arguments.copy_workers
+        self.read_workers: int = arguments.read_workers
+
+        if self.scan_workers < 1:
+            raise CommandArgumentError("--scan-workers must be at least 1.")
+        if self.copy_workers < 1:
+            raise CommandArgumentError("--copy-workers must be at least 1.")
+        if self.read_workers < 1:
+            raise CommandArgumentError("--read-workers must be at least 1.")
+        if self.pack_threshold is not None:
+            if self.pack_threshold < 0:
+                raise CommandArgumentError("--pack-threshold must be nonnegative.")
+            if self.deduplicate:
+                raise CommandArgumentError("--pack-threshold cannot be used with --deduplicate.")
+        if self.compression is not None and self.deduplicate:
+            raise CommandArgumentError("--compression cannot be used with --deduplicate.")
 
     def run(self) -> None:
         """Executes the backup command.
@@ -77,12 +162,25 @@ class BackupCommand(Command):
                 self.exclude_patterns,
                 callbacks,
                 self.skip_empty,
+                self._backup_options(),
             )
         except BackupError as e:
             raise CommandRuntimeError(str(e)) from e
 
         self._print_results(results)
 
+    def _backup_options(self) -> BackupOptions:
+        return BackupOptions(
+            scan_workers=self.scan_workers,
+            copy_workers=self.copy_workers,
+            read_workers=self.read_workers,
+            deduplicate=self.deduplicate,
+            pack_threshold=self.pack_threshold,
+            compression=self.compression,
+            pipeline=self.pipeline,
+            resume=self.resume,
+        )
+
     @staticmethod
     def _backup_callbacks() -> BackupCallbacks:
         """Creates the callbacks for `perform_backup()`."""
@@ -96,10 +194,26 @@ class BackupCommand(Command):
                 on_read_metadata_error=lambda path, error: print_warning(
                     f"Failed to read metadata of previous backup {path.name}: {error}"
                 ),
+                on_read_catalog_error=lambda path, error: print_warning(
+                    f"Failed to read backup catalog, reading all backups instead: {error}"
+                ),
             ),
             on_after_read_previous_backups=lambda backups: print(f"Read {len(backups)} previous backups"),
+            load_backup_sum=LoadBackupSumCallbacks(
+                on_read_checkpoint_error=lambda path, error: print_warning(
+                    f"Failed to read backup sum checkpoint of backup {path.parent.name}: {error}"
+                ),
+                on_checkpoint_used=lambda backup: print(f"Using backup sum checkpoint from backup {backup.name}"),
+                on_read_manifest_error=lambda path, error: print_warning(
+                    f"Failed to read manifest of previous backup {path.name}: {error}"
+                ),
+            ),
             on_before_initialise_backup=lambda: print("Initialising backup"),
             on_created_backup_directory=lambda path: print(f"Backup name: {path.name}"),
+            on_resume_backup=lambda path: print(f"Resuming incomplete backup {path.name}"),
+            on_skip_outdated_backup=lambda path: print_warning(
+                f"Not resuming incomplete backup {path.name}, since a newer backup was completed"
+            ),
             on_before_scan_source=lambda: print("Scanning source directory"),
             scan_source=ScanFilesystemCallbacks(
                 on_exclude=lambda path: print(f'Excluded path "{path}"'),
@@ -117,6 +231,10 @@ class BackupCommand(Command):
             on_write_complete_info_error=lambda path, error: print_warning(
                 f"Failed to write backup completion information file: {error}"
             ),
+            on_write_sum_checkpoint_error=lambda path, error: print_warning(
+                f"Failed to write backup sum checkpoint file: {error}"
+            ),
+            on_update_catalog_error=lambda path, error: print_warning(f"Failed to update backup catalog file: {error}"),
         )
 
     def _print_config(self) -> None:
@@ -132,6 +250,22 @@ class BackupCommand(Command):
             print("  <none>")
         if self.skip_empty:
             print("Skip empty backup: yes")
+        if self.deduplicate:
+            print("Deduplicate: yes")
+        if self.pack_threshold is not None:
+            print(f"Pack threshold: {self.pack_threshold} bytes")
+        if self.compression is not None:
+            print(f"Compression: {self.compression.value}")
+        if self.pipeline:
+            print("Pipeline: yes")
+        if self.resume:
+            print("Resume: yes")
+        if self.scan_workers > 1:
+            print(f"Scan workers: {self.scan_workers}")
+        if self.copy_workers > 1:
+            print(f"Copy workers: {self.copy_workers}")
+        if self.read_workers > 1:
+            print(f"Read workers: {self.read_workers}")
         print()
 
     @staticmethod
@@ -143,3 +277,12 @@ class BackupCommand(Command):
         print(f"+{files_copied} / -{files_removed} files")
         if results is None:
             print("Skipping empty backup")
+        else:
+            if results.copy_methods:
+                print("Copy methods: " + ", ".join(f"{m.value} {n}" for m, n in results.copy_methods.items()))
+            if results.files_deduplicated:
+                print(f"{results.files_deduplicated} files already stored")
+            if results.files_packed:
+                print(f"{results.files_packed} files packed")
+            if results.files_resumed:
+                print(f"{results.files_resumed} files already copied before resuming")
@@ -0,0 +1,94 @@
+import argparse
+from pathlib import Path
+
+from incremental_backup._utility import print_warning
+from incremental_backup.cli.command.command import Command
+from incremental_backup.cli.command.exception import CommandRuntimeError
+from incremental_backup.collect_orphans import (
+    CollectOrphansCallbacks,
+    CollectOrphansConfig,
+    CollectOrphansError,
+    CollectOrphansResults,
+    collect_orphans,
+)
+
+__all__ = ["CollectOrphansCommand"]
+
+
+class CollectOrphansCommand(Command):
+    """The program command which deletes orphaned backed up data, which no backup references."""
+
+    COMMAND_STRING = "collect-orphans"
+
+    @staticmethod
+    def add_arg_subparser(subparser, /) -> None:
+        """Adds the argparse subparser for the collect-orphans command."""
+
+        parser = subparser.add_parser(
+            CollectOrphansCommand.COMMAND_STRING,
+            description="Deletes orphaned backed up data, which no backup references. Data superseded by newer backups "
+            "is still referenced, and is only reclaimed by the consolidate command.",
+            help="Deletes orphaned backed up data, which no backup references.",
+        )
+        parser.add_argument(
+            "backup_target_dir",
+            type=Path,
+            help="Directory containing backups to operate on.",
+        )
+        parser.add_argument(
+            "--commit",
+            action="store_true",
+            default=False,
+            help="If not specified, don't modify anything.",
+        )
+
+    def __init__(self, arguments: argparse.Namespace, /) -> None:
+        """
+        :param arguments: The parsed command line arguments object acquired from argparse.
+
+        :except CommandArgumentError: If the arguments are invalid.
+        """
+
+        super().__init__(arguments)
+        self.backup_target_directory: Path = arguments.backup_target_dir
+        self.commit: bool = arguments.commit
+
+    def run(self) -> None:
+        """Executes the collect-orphans command.
+
+        :except CommandRuntimeError: If an error occurs such that the orphan collection operation cannot continue.
+        """
+
+        self._print_config()
+
+        config = CollectOrphansConfig(not self.commit)
+        callbacks = CollectOrphansCallbacks(
+            on_query_entry_error=lambda path, error: print_warning(f'Failed to query "{path}": {error}'),
+            on_read_backup_error=lambda path, error: print_warning(
+                f"Failed to read metadata of backup {path.name}, skipping it: {error}"
+            ),
+            on_delete_error=lambda path, error: print_warning(f'Failed to delete "{path}": {error}'),
+        )
+
+        try:
+            results = collect_orphans(self.backup_target_directory, config, callbacks)
+        except CollectOrphansError as e:
+            raise CommandRuntimeError(str(e)) from e
+
+        self._print_results(results)
+
+    def _print_config(self) -> None:
+        """Prints the configuration of the application to stdout."""
+
+        print(f"Backup target directory: {self.backup_target_directory}")
+        if not self.commit:
+            print("Dry run: True")
+        print()
+
+    def _print_results(self, results: CollectOrphansResults) -> None:
+        """Prints orphan collection results to the console."""
+
+        if not self.commit:
+            print("DRY RUN - simulated results only")
+        print(f"Deleted {results.files_deleted} data files and {results.objects_deleted} objects")
+        print(f"Reclaimed {results.bytes_reclaimed} bytes")
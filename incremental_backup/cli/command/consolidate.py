@@ -0,0 +1,193 @@
+import argparse
+from pathlib import Path
+
+from incremental_backup._utility import print_warning
+from incremental_backup.backup import LoadBackupSumCallbacks
+from incremental_backup.cli.command.command import Command
+from incremental_backup.cli.command.exception import (
+    CommandArgumentError,
+    CommandRuntimeError,
+)
+from incremental_backup.consolidate import (
+    ConsolidateBackupsCallbacks,
+    ConsolidateBackupsConfig,
+    ConsolidateBackupsError,
+    ConsolidateBackupsResults,
+    RetentionPolicy,
+    consolidate_backups,
+)
+from incremental_backup.meta import ReadBackupsCallbacks
+
+__all__ = ["ConsolidateCommand"]
+
+
+class ConsolidateCommand(Command):
+    """The program command which merges old backups according to a retention policy."""
+
+    COMMAND_STRING = "consolidate"
+
+    @staticmethod
+    def add_arg_subparser(subparser, /) -> None:
+        """Adds the argparse subparser for the consolidate command."""
+
+        parser = subparser.add_parser(
+            ConsolidateCommand.COMMAND_STRING,
+            description="Merges backups which are not retained as restore points into newer backups.",
+            help="Merges backups which are not retained as restore points into newer backups.",
+        )
+        parser.add_argument(
+            "backup_target_dir",
+            type=Path,
+            help="Directory containing backups to operate on.",
+        )
+        parser.add_argument(
+            "--commit",
+            action="store_true",
+            default=False,
+            help="If not specified, don't modify anything.",
+        )
+        parser.add_argument(
+            "--read-workers",
+            type=int,
+            default=1,
+            help="Number of threads used to read backup metadata.",
+        )
+        retention_parser = parser.add_argument_group("Retention policy")
+        retention_parser.add_argument(
+            "--keep-last",
+            type=int,
+            default=1,
+            help="Number of newest backups to keep. Defaults to 1.",
+        )
+        retention_parser.add_argument(
+            "--keep-daily",
+            type=int,
+            default=0,
+            help="Number of days to keep the last backup of.",
+        )
+        retention_parser.add_argument(
+            "--keep-weekly",
+            type=int,
+            default=0,
+            help="Number of weeks to keep the last backup of.",
+        )
+        retention_parser.add_argument(
+            "--keep-monthly",
+            type=int,
+            default=0,
+            help="Number of months to keep the last backup of.",
+        )
+
+    def __init__(self, arguments: argparse.Namespace, /) -> None:
+        """
+        :param arguments: The parsed command line arguments object acquired from argparse.
+
+        :except CommandArgumentError: If the arguments are invalid.
+        """
+
+        super().__init__(arguments)
+        self.backup_target_directory: Path = arguments.backup_target_dir
+        self.commit: bool = arguments.commit
+        self.read_workers: int = arguments.read_workers
+        self.retention_policy = RetentionPolicy(
+            arguments.keep_last, arguments.keep_daily, arguments.keep_weekly, arguments.keep_monthly
+        )
+
+        if self.read_workers < 1:
+            raise CommandArgumentError("--read-workers must be at least 1.")
+        if self.retention_policy.last < 1:
+            raise CommandArgumentError("--keep-last must be at least 1.")
+        if min(self.retention_policy.daily, self.retention_policy.weekly, self.retention_policy.monthly) < 0:
+            raise CommandArgumentError("--keep-daily, --keep-weekly and --keep-monthly must not be negative.")
+
+    def run(self) -> None:
+        """Executes the consolidate command.
+
+        :except CommandRuntimeError: If an error occurs such that the consolidate operation cannot continue.
+        """
+
+        self._print_config()
+
+        config = ConsolidateBackupsConfig(self.retention_policy, not self.commit, self.read_workers)
+        callbacks = self._consolidate_backups_callbacks()
+
+        try:
+            results = consolidate_backups(self.backup_target_directory, config, callbacks)
+        except ConsolidateBackupsError as e:
+            raise CommandRuntimeError(str(e)) from e
+
+        self._print_results(results)
+
+    def _print_config(self) -> None:
+        """Prints the configuration of the application to stdout."""
+
+        print(f"Backup target directory: {self.backup_target_directory}")
+        if not self.commit:
+            print("Dry run: True")
+        if self.read_workers > 1:
+            print(f"Read workers: {self.read_workers}")
+        print("Keeping:")
+        print(f"  Last {self.retention_policy.last} backups")
+        if self.retention_policy.daily > 0:
+            print(f"  {self.retention_policy.daily} daily backups")
+        if self.retention_policy.weekly > 0:
+            print(f"  {self.retention_policy.weekly} weekly backups")
+        if self.retention_policy.monthly > 0:
+            print(f"  {self.retention_policy.monthly} monthly backups")
+        print()
+
+    @staticmethod
+    def _consolidate_backups_callbacks() -> ConsolidateBackupsCallbacks:
+        """Creates the callbacks for `consolidate_backups()`."""
+
+        return ConsolidateBackupsCallbacks(
+            on_recover_consolidation=lambda consolidation, completed: print(
+                f"{'Completed' if completed else 'Undid'} interrupted consolidation of backups "
+                f"{', '.join(consolidation.replaced_backup_names)} into backup {consolidation.backup_name}"
+            ),
+            on_before_read_backups=lambda: print("Reading backups"),
+            read_backups=ReadBackupsCallbacks(
+                on_query_entry_error=lambda path, error: print_warning(
+                    f'Failed to query entry in backup target directory "{path}": {error}'
+                ),
+                on_read_metadata_error=lambda path, error: print_warning(
+                    f"Failed to read metadata of backup {path.name}: {error}"
+                ),
+                on_read_catalog_error=lambda path, error: print_warning(
+                    f"Failed to read backup catalog, reading all backups instead: {error}"
+                ),
+            ),
+            on_after_read_backups=lambda backups: print(f"Read {len(backups)} backups"),
+            on_selected_groups=lambda groups: print(
+                f"Consolidating {sum(len(g) for g in groups)} backups into {len(groups)} backups"
+            ),
+            on_after_consolidate_group=lambda group, path: print(
+                f"Merged backups {', '.join(b.name for b in group)} into backup {path.name} "
+                f"(backup {group[-1].name} is now named {path.name})"
+            ),
+            on_consolidate_error=lambda group, error: print_warning(
+                f"Failed to merge backups {', '.join(b.name for b in group)}: {error}"
+            ),
+            load_backup_sum=LoadBackupSumCallbacks(
+                on_read_checkpoint_error=lambda path, error: print_warning(
+                    f"Failed to read backup sum checkpoint of backup {path.parent.name}: {error}"
+                ),
+                on_read_manifest_error=lambda path, error: print_warning(
+                    f"Failed to read manifest of backup {path.name}: {error}"
+                ),
+            ),
+            on_write_sum_checkpoint_error=lambda path, error: print_warning(
+                f"Failed to write backup sum checkpoint file: {error}"
+            ),
+            on_delete_error=lambda path, error: print_warning(f'Failed to delete "{path}": {error}'),
+            on_update_catalog_error=lambda path, error: print_warning(f"Failed to update backup catalog file: {error}"),
+        )
+
+    def _print_results(self, results: ConsolidateBackupsResults) -> None:
+        """Prints backup consolidation results to the console."""
+
+        print()
+        if not self.commit:
+            print("DRY RUN - simulated results only")
+        print(f"Merged {results.backups_consolidated} backups into {results.backups_created} backups")
+        print(f"{results.backups_remaining} backups remaining")
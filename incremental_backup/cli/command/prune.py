@@ -45,6 +45,12 @@ class PruneCommand(Command):
             default=False,
             help="If not specified, don't delete anything.",
         )
+        parser.add_argument(
+            "--read-workers",
+            type=int,
+            default=1,
+            help="Number of threads used to read backup metadata.",
+        )
         prune_modes_parser = parser.add_argument_group("Prune modes")
         # TODO: (breaking) replace underscore with hypen in flag name
         prune_modes_parser.add_argument(
@@ -65,9 +71,12 @@ class PruneCommand(Command):
         self.backup_target_directory: Path = arguments.backup_target_dir
         self.commit: bool = arguments.commit
         self.delete_empty: bool = arguments.delete_empty
+        self.read_workers: int = arguments.read_workers
 
         if not self.delete_empty:
             raise CommandArgumentError("At least one prune mode must be specified.")
+        if self.read_workers < 1:
+            raise CommandArgumentError("--read-workers must be at least 1.")
 
     def run(self) -> None:
         """Executes the prune command.
@@ -93,6 +102,8 @@ class PruneCommand(Command):
         print(f"Backup target directory: {self.backup_target_directory}")
         if not self.commit:
             print("Dry run: True")
+        if self.read_workers > 1:
+            print(f"Read workers: {self.read_workers}")
         print("Deleting:")
         if self.delete_empty:
             print("  Empty backups")
@@ -102,6 +113,7 @@ class PruneCommand(Command):
         return PruneBackupsConfig(
             not self.commit,
             BackupPrunabilityOptions(prune_empty=self.delete_empty, prune_other_data=False),
+            self.read_workers,
         )
 
     @staticmethod
@@ -117,10 +129,14 @@ class PruneCommand(Command):
                 on_read_metadata_error=lambda path, error: print_warning(
                     f"Failed to read metadata of backup {path.name}: {error}"
                 ),
+                on_read_catalog_error=lambda path, error: print_warning(
+                    f"Failed to read backup catalog, reading all backups instead: {error}"
+                ),
             ),
             on_after_read_backups=lambda backups: print(f"Read {len(backups)} backups"),
             on_selected_backups=lambda backups: print(f"Pruning {len(backups)} backups"),
             on_delete_error=lambda path, error: print_warning(f'Failed to delete backup "{path}": {error}'),
+            on_update_catalog_error=lambda path, error: print_warning(f"Failed to update backup catalog file: {error}"),
         )
 
     def _print_results(self, results: PruneBackupsResults) -> None:
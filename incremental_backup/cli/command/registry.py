@@ -1,14 +1,24 @@
 from collections.abc import Sequence
 
 from incremental_backup.cli.command.backup import BackupCommand
+from incremental_backup.cli.command.collect_orphans import CollectOrphansCommand
 from incremental_backup.cli.command.command import Command
+from incremental_backup.cli.command.consolidate import ConsolidateCommand
 from incremental_backup.cli.command.prune import PruneCommand
 from incremental_backup.cli.command.restore import RestoreCommand
+from incremental_backup.cli.command.restore_file import RestoreFileCommand
 
 __all__ = ["COMMAND_CLASSES", "get_command_class"]
 
 
-COMMAND_CLASSES: Sequence[type[Command]] = (BackupCommand, RestoreCommand, PruneCommand)
+COMMAND_CLASSES: Sequence[type[Command]] = (
+    BackupCommand,
+    RestoreCommand,
+    RestoreFileCommand,
+    PruneCommand,
+    ConsolidateCommand,
+    CollectOrphansCommand,
+)
 """List of all commands recognised by the program.
     Add or remove commands here.
 """
@@ -1,12 +1,18 @@
 import argparse
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Union
+from typing import Optional, Sequence, Union
 
 from incremental_backup._utility import print_warning
+from incremental_backup.backup import LoadBackupSumCallbacks
 from incremental_backup.cli.command.command import Command
-from incremental_backup.cli.command.exception import CommandRuntimeError
+from incremental_backup.cli.command.exception import (
+    CommandArgumentError,
+    CommandRuntimeError,
+)
 from incremental_backup.meta import ReadBackupsCallbacks
+from incremental_backup.path_exclude import PathExcludePattern
+from incremental_backup.path_filter import PathFilter
 from incremental_backup.restore import (
     RestoreCallbacks,
     RestoreError,
@@ -47,10 +53,37 @@ class RestoreCommand(Command):
             nargs="?",
             help="Name or timestamp of latest backup to restore.",
         )
+        parser.add_argument(
+            "--path",
+            nargs="+",
+            required=False,
+            help="Only restore these files or directories (relative to the backup source directory).",
+        )
+        parser.add_argument(
+            "--include",
+            nargs="+",
+            type=PathExcludePattern,
+            required=False,
+            help="Only restore paths matching these patterns.",
+        )
+        parser.add_argument(
+            "--read-workers",
+            type=int,
+            default=1,
+            help="Number of threads used to read backup metadata.",
+        )
+        parser.add_argument(
+            "--copy-workers",
+            type=int,
+            default=1,
+            help="Number of threads used to copy files.",
+        )
 
     def __init__(self, arguments: argparse.Namespace, /) -> None:
         """
         :param arguments: The parsed command line arguments object acquired from argparse.
+
+        :except CommandArgumentError: If the arguments are invalid.
         """
 
         super().__init__(arguments)
@@ -67,6 +100,21 @@ class RestoreCommand(Command):
             backup_time = None
         self.backup_name: Optional[str] = backup_name
         self.backup_time: Optional[datetime] = backup_time
+        self.paths: Sequence[str] = arguments.path or ()
+        self.include_patterns: Sequence[PathExcludePattern] = arguments.include or ()
+        self.read_workers: int = arguments.read_workers
+        self.copy_workers: int = arguments.copy_workers
+
+        if self.read_workers < 1:
+            raise CommandArgumentError("--read-workers must be at least 1.")
+        if self.copy_workers < 1:
+            raise CommandArgumentError("--copy-workers must be at least 1.")
+        try:
+            self.path_filter: Optional[PathFilter] = (
+                PathFilter(self.paths, self.include_patterns) if self.paths or self.include_patterns else None
+            )
+        except ValueError as e:
+            raise CommandArgumentError(f"--path: {e}.") from e
 
     def run(self) -> None:
         """Executes the restore command.
@@ -85,6 +133,9 @@ class RestoreCommand(Command):
                 self.backup_name,
                 self.backup_time,
                 callbacks,
+                self.read_workers,
+                self.copy_workers,
+                self.path_filter,
             )
         except RestoreError as e:
             raise CommandRuntimeError(str(e)) from e
@@ -127,8 +178,20 @@ class RestoreCommand(Command):
                 on_read_metadata_error=lambda path, error: print_warning(
                     f"Failed to read metadata of previous backup {path.name}: {error}"
                 ),
+                on_read_catalog_error=lambda path, error: print_warning(
+                    f"Failed to read backup catalog, reading all backups instead: {error}"
+                ),
             ),
             on_after_read_previous_backups=lambda backups: print(f"Read {len(backups)} previous backups"),
+            load_backup_sum=LoadBackupSumCallbacks(
+                on_read_checkpoint_error=lambda path, error: print_warning(
+                    f"Failed to read backup sum checkpoint of backup {path.parent.name}: {error}"
+                ),
+                on_checkpoint_used=lambda backup: print(f"Using backup sum checkpoint from backup {backup.name}"),
+                on_read_manifest_error=lambda path, error: print_warning(
+                    f"Failed to read manifest of previous backup {path.name}: {error}"
+                ),
+            ),
             on_selected_backups=lambda backups: print(f"Using {len(backups)} for restore"),
             on_before_initialise_restore=lambda: print("Initialising restoration"),
             on_before_restore_files=lambda: print("Copying files"),
@@ -137,6 +200,9 @@ class RestoreCommand(Command):
                 on_copy_error=lambda src, dest, error: print_warning(
                     f'Failed to copy file "{src}" to "{dest}": {error}'
                 ),
+                on_read_pack_index_error=lambda path, error: print_warning(
+                    f"Failed to read pack index of backup {path.parent.parent.name}: {error}"
+                ),
             ),
         )
 
@@ -151,6 +217,18 @@ class RestoreCommand(Command):
             print(f"Restore up to {self.backup_time.isoformat()}")
         else:
             print("Restore up to latest backup")
+        if self.paths:
+            print("Paths:")
+            for path in self.paths:
+                print(f"  {path}")
+        if self.include_patterns:
+            print("Include patterns:")
+            for pattern in self.include_patterns:
+                print(f"  {pattern}")
+        if self.read_workers > 1:
+            print(f"Read workers: {self.read_workers}")
+        if self.copy_workers > 1:
+            print(f"Copy workers: {self.copy_workers}")
         print()
 
     @staticmethod
@@ -158,3 +236,5 @@ class RestoreCommand(Command):
         """Prints restore results to the console."""
 
         print(f"Restored {results.files_restored} files")
+        if results.copy_methods:
+            print("Copy methods: " + ", ".join(f"{m.value} {n}" for m, n in results.copy_methods.items()))
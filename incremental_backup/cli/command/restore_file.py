@@ -0,0 +1,176 @@
+import argparse
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from incremental_backup._utility import print_warning
+from incremental_backup.cli.command.command import Command
+from incremental_backup.cli.command.exception import (
+    CommandArgumentError,
+    CommandRuntimeError,
+)
+from incremental_backup.locate import LocatedFile, LocateFileCallbacks, locate_file
+from incremental_backup.meta import ReadBackupsCallbacks
+from incremental_backup.path_filter import split_relative_path
+from incremental_backup.restore import RestoreFilesCallbacks, restore_file
+
+__all__ = ["RestoreFileCommand"]
+
+
+class RestoreFileCommand(Command):
+    """The program command which restores a single file from backups."""
+
+    COMMAND_STRING = "restore-file"
+
+    @staticmethod
+    def add_arg_subparser(subparser, /) -> None:
+        """Adds the argparse subparser for the restore-file command."""
+
+        parser = subparser.add_parser(
+            RestoreFileCommand.COMMAND_STRING,
+            description="Restores a single file from backups.",
+            help="Restores a single file from backups.",
+        )
+        parser.add_argument(
+            "backup_target_dir",
+            type=Path,
+            help="Directory containing backups to restore from.",
+        )
+        parser.add_argument("path", help="Path of the file to restore, relative to the backup source directory.")
+        parser.add_argument("destination", type=Path, help="Path to restore the file to.")
+        parser.add_argument(
+            "time",
+            type=RestoreFileCommand._parse_time,
+            nargs="?",
+            help="Timestamp at which to restore the file's version.",
+        )
+        parser.add_argument(
+            "--read-workers",
+            type=int,
+            default=1,
+            help="Number of threads used to read backup metadata.",
+        )
+
+    def __init__(self, arguments: argparse.Namespace, /) -> None:
+        """
+        :param arguments: The parsed command line arguments object acquired from argparse.
+
+        :except CommandArgumentError: If the arguments are invalid.
+        """
+
+        super().__init__(arguments)
+        self.backup_target_directory: Path = arguments.backup_target_dir
+        self.path: str = arguments.path
+        self.destination_path: Path = arguments.destination
+        self.time: Optional[datetime] = arguments.time
+        self.read_workers: int = arguments.read_workers
+
+        if self.read_workers < 1:
+            raise CommandArgumentError("--read-workers must be at least 1.")
+        try:
+            path_components = split_relative_path(self.path)
+        except ValueError as e:
+            raise CommandArgumentError(f"path: {e}.") from e
+        if not path_components:
+            raise CommandArgumentError("path must name a file.")
+
+    def run(self) -> None:
+        """Executes the restore-file command.
+
+        :except CommandRuntimeError: If the file could not be found or restored.
+        """
+
+        self._print_config()
+
+        try:
+            if self.destination_path.exists():
+                raise CommandRuntimeError("Destination already exists")
+        except OSError as e:
+            raise CommandRuntimeError(f"Failed to query destination: {e}") from e
+
+        print("Searching backups")
+        try:
+            located_file = locate_file(
+                self.backup_target_directory, self.path, self.time, self._locate_file_callbacks(), self.read_workers
+            )
+        except OSError as e:
+            raise CommandRuntimeError(f"Failed to enumerate backup target directory: {e}") from e
+        if located_file is None:
+            raise CommandRuntimeError("File not found in any backup")
+        if located_file.removed:
+            raise CommandRuntimeError(f"File was removed in backup {located_file.backup.name}")
+        self._print_located_file(located_file)
+
+        try:
+            restore_file(
+                self.backup_target_directory,
+                located_file,
+                self.destination_path,
+                RestoreFilesCallbacks(
+                    on_read_pack_index_error=lambda path, error: print_warning(
+                        f"Failed to read pack index of backup {path.parent.parent.name}: {error}"
+                    )
+                ),
+            )
+        except OSError as e:
+            raise CommandRuntimeError(f"Failed to restore file: {e}") from e
+
+        print("Restored file")
+
+    @staticmethod
+    def _parse_time(time_string: str, /) -> datetime:
+        """Parses the timestamp command line argument, which is an ISO-8601 timestamp.
+
+        :except ArgumentTypeError: If the value is not a valid timestamp.
+        """
+
+        try:
+            time = datetime.fromisoformat(time_string)
+        except ValueError:
+            raise argparse.ArgumentTypeError("Must be an ISO-8601 timestamp.")
+        if time.tzinfo is None:
+            local_tz = datetime.now().astimezone().tzinfo
+            time = time.replace(tzinfo=local_tz)
+        return time
+
+    @staticmethod
+    def _locate_file_callbacks() -> LocateFileCallbacks:
+        """Creates the callbacks for `locate_file()`."""
+
+        return LocateFileCallbacks(
+            read_backups=ReadBackupsCallbacks(
+                on_query_entry_error=lambda path, error: print_warning(
+                    f'Failed to query entry in backup target directory "{path}": {error}'
+                ),
+                on_read_metadata_error=lambda path, error: print_warning(
+                    f"Failed to read metadata of previous backup {path.name}: {error}"
+                ),
+                on_read_catalog_error=lambda path, error: print_warning(
+                    f"Failed to read backup catalog, reading all backups instead: {error}"
+                ),
+            ),
+            on_read_manifest_error=lambda path, error: print_warning(
+                f"Failed to read manifest of previous backup {path.name}: {error}"
+            ),
+        )
+
+    def _print_config(self) -> None:
+        """Prints the configuration of the application to stdout."""
+
+        print(f"Backup target directory: {self.backup_target_directory}")
+        print(f"Path: {self.path}")
+        print(f"Destination: {self.destination_path}")
+        if self.time is None:
+            print("Restore latest version")
+        else:
+            print(f"Restore version at {self.time.isoformat()}")
+        if self.read_workers > 1:
+            print(f"Read workers: {self.read_workers}")
+        print()
+
+    @staticmethod
+    def _print_located_file(located_file: LocatedFile, /) -> None:
+        """Prints where the file was found to the console."""
+
+        location = "object store" if located_file.content_hash is not None else "backup data"
+        print(f"Found file in backup {located_file.backup.name} ({location})")
@@ -0,0 +1,312 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional, Union
+
+from incremental_backup._utility import StrPath, normalise_path_name
+from incremental_backup.meta import (
+    CONSOLIDATION_FILENAME,
+    DATA_DIRECTORY_NAME,
+    JOURNAL_FILENAME,
+    MANIFEST_FILENAME,
+    OBJECTS_DIRECTORY_NAME,
+    PACK_INDEX_FILENAME,
+    PACKS_DIRECTORY_NAME,
+    BackupJournalParseError,
+    BackupManifestParseError,
+    BackupPackIndexParseError,
+    ManifestBacktrack,
+    ManifestCopiedFile,
+    ManifestEnterDirectory,
+    get_pack_file_name,
+    iter_backup_manifest_file,
+    read_backup_journal_file,
+    read_backup_pack_index_file,
+)
+
+__all__ = [
+    "collect_orphans",
+    "CollectOrphansCallbacks",
+    "CollectOrphansConfig",
+    "CollectOrphansError",
+    "CollectOrphansResults",
+]
+
+
+@dataclass
+class CollectOrphansConfig:
+    dry_run: bool
+    """If true, only find the unreferenced files, without modifying the filesystem."""
+
+
+@dataclass(frozen=True)
+class CollectOrphansCallbacks:
+    """Callbacks for events that occur in `collect_orphans()`."""
+
+    on_query_entry_error: Callable[[Path, OSError], None] = lambda path, error: None
+    """Called when an error is raised querying a directory or file.
+        First argument is the path, second argument is the raised exception."""
+
+    on_read_backup_error: Callable[
+        [Path, Union[OSError, BackupManifestParseError, BackupPackIndexParseError, BackupJournalParseError]],
+        None,
+    ] = lambda path, error: None
+    """Called when the manifest, pack index or journal of a backup could not be read. None of the backup's files are
+        deleted, and if its manifest or journal could not be read, no objects are deleted either (since the backup may
+        reference any of them).
+        First argument is the backup directory path, second argument is the raised exception."""
+
+    on_delete_error: Callable[[Path, OSError], None] = lambda path, error: None
+    """Called when an error is raised deleting a file.
+        First argument is the path, second argument is the raised exception."""
+
+
+@dataclass(frozen=True)
+class CollectOrphansResults:
+    """Return results of `collect_orphans()`."""
+
+    files_deleted: int
+    """The number of unreferenced data files and pack files deleted from backup directories (or which would be
+        deleted, if a dry run)."""
+
+    objects_deleted: int
+    """The number of unreferenced objects and leftover temporary files deleted from the object store (or which would
+        be deleted, if a dry run)."""
+
+    bytes_reclaimed: int
+    """The total size of the deleted files, in bytes (or of the files which would be deleted, if a dry run). Files with
+        other hard links (e.g. shared with consolidated backups) are not counted, since deleting them frees nothing."""
+
+
+def collect_orphans(
+    backup_target_directory: StrPath,
+    config: CollectOrphansConfig,
+    callbacks: CollectOrphansCallbacks = CollectOrphansCallbacks(),
+) -> CollectOrphansResults:
+    """Deletes orphaned backed up data, i.e. data which no backup references, and so can never be restored.
+
+    Every backup is a restore point (restoring at its time uses the data it copied), so a backup's data is reachable
+    exactly if the backup's manifest lists it. Old copies of files superseded by newer backups are therefore still
+    referenced, and are not deleted; they are only dropped by merging backups (see `consolidate_backups()`). Orphaned
+    data is left behind by interrupted operations and by deleting backups, in particular:
+
+    - Files in a backup's data directory which its manifest doesn't list as copied there (e.g. copied by an interrupted
+      backup before it was resumed), or which are also packed.
+    - Pack files of a backup which its pack index doesn't use.
+    - Objects in the object store which no backup references (e.g. after the backups referencing them were pruned or
+      consolidated), and temporary object files left by interrupted backups.
+
+    Incomplete backups (which have a journal but no manifest) are left alone, and the objects in their journals are
+    kept, so they can still be resumed. Only files are deleted, not directories.
+
+    Must not be run while another operation is modifying the target directory, since the files of a backup in progress
+    are not referenced yet.
+
+    :param backup_target_directory: The directory containing the backups. I.e. the "target directory" from the backup
+        creation operation.
+    :param config: Options for the orphan collection operation.
+    :param callbacks: Callbacks for certain events during execution. See `CollectOrphansCallbacks`.
+    :return: Summary information for the orphan collection operation.
+    :except CollectOrphansError: If an error occurs that prevents the orphan collection operation from completing.
+    """
+
+    backup_target_directory = Path(backup_target_directory)
+
+    try:
+        consolidation_pending = (backup_target_directory / CONSOLIDATION_FILENAME).exists()
+        entries = list(backup_target_directory.iterdir())
+    except OSError as e:
+        raise CollectOrphansError(f"Failed to query backup target directory: {e}") from e
+    if consolidation_pending:
+        # The backups of the consolidation may be partially deleted or written.
+        raise CollectOrphansError(
+            "Backup target directory has an interrupted consolidation, run the consolidate command to finish it first"
+        )
+
+    collector = _OrphanCollector(config, callbacks)
+    referenced_objects: Optional[set[str]] = set()
+    for entry in entries:
+        # Same name check as check_if_probably_backup(), to avoid hitting the filesystem if possible.
+        if not (len(entry.name) >= 10 and entry.name.isascii() and entry.name.isalnum()):
+            continue
+        try:
+            has_manifest = (entry / MANIFEST_FILENAME).is_file()
+            has_journal = not has_manifest and (entry / JOURNAL_FILENAME).is_file()
+        except OSError as e:
+            (callbacks.on_query_entry_error)(entry, e)
+            referenced_objects = None
+            continue
+
+        if has_manifest:
+            backup_objects = collector.collect_backup(entry)
+        elif has_journal:
+            backup_objects = _read_journal_objects(entry, callbacks)
+        else:
+            continue
+        if backup_objects is None:
+            referenced_objects = None
+        elif referenced_objects is not None:
+            referenced_objects.update(backup_objects)
+
+    if referenced_objects is not None:
+        collector.collect_objects(backup_target_directory / OBJECTS_DIRECTORY_NAME, referenced_objects)
+
+    return CollectOrphansResults(collector.files_deleted, collector.objects_deleted, collector.bytes_reclaimed)
+
+
+def _read_journal_objects(backup_path: Path, callbacks: CollectOrphansCallbacks, /) -> Optional[set[str]]:
+    """Gets the content hashes of the objects referenced by the journal of an incomplete backup.
+
+    :return: The content hashes, or `None` if the journal could not be read.
+    """
+
+    try:
+        journal = read_backup_journal_file(backup_path / JOURNAL_FILENAME)
+    except (OSError, BackupJournalParseError) as e:
+        (callbacks.on_read_backup_error)(backup_path, e)
+        return None
+    # Including superseded entries of files copied more than once, which is harmless.
+    return {entry.content_hash for entry in journal.entries if entry.content_hash is not None}
+
+
+class _OrphanCollector:
+    """Finds and deletes unreferenced files, keeping count of them."""
+
+    def __init__(self, config: CollectOrphansConfig, callbacks: CollectOrphansCallbacks, /) -> None:
+        self.config = config
+        self.callbacks = callbacks
+        self.files_deleted = 0
+        self.objects_deleted = 0
+        self.bytes_reclaimed = 0
+
+    def collect_backup(self, backup_path: Path, /) -> Optional[set[str]]:
+        """Deletes the data files and pack files of a complete backup which its manifest and pack index don't use.
+
+        :return: The content hashes of the objects referenced by the backup, or `None` if its manifest could not be
+            read.
+        """
+
+        # Paths of files copied to the data directory, normalised (see `normalise_path_name()`).
+        data_files: set[tuple[str, ...]] = set()
+        objects: set[str] = set()
+        try:
+            path: list[str] = []
+            for event in iter_backup_manifest_file(backup_path / MANIFEST_FILENAME):
+                if isinstance(event, ManifestEnterDirectory):
+                    path.append(normalise_path_name(event.name))
+                elif isinstance(event, ManifestBacktrack):
+                    del path[-event.count :]
+                elif isinstance(event, ManifestCopiedFile):
+                    if event.content_hash is None:
+                        data_files.add((*path, normalise_path_name(event.name)))
+                    else:
+                        objects.add(event.content_hash)
+        except (OSError, BackupManifestParseError) as e:
+            (self.callbacks.on_read_backup_error)(backup_path, e)
+            return None
+
+        try:
+            pack_entries = read_backup_pack_index_file(backup_path / PACKS_DIRECTORY_NAME / PACK_INDEX_FILENAME).entries
+        except FileNotFoundError:
+            pack_entries = []
+        except (OSError, BackupPackIndexParseError) as e:
+            (self.callbacks.on_read_backup_error)(backup_path, e)
+            return objects
+        # Packed files are restored from the pack files, even if also in the data directory.
+        data_files.difference_update(tuple(normalise_path_name(c) for c in entry.path) for entry in pack_entries)
+        pack_files = {get_pack_file_name(entry.pack) for entry in pack_entries}
+
+        for file_path, relative_path in self._iter_files(backup_path / DATA_DIRECTORY_NAME):
+            if tuple(normalise_path_name(c) for c in relative_path) not in data_files:
+                if self._delete_file(file_path):
+                    self.files_deleted += 1
+
+        packs_path = backup_path / PACKS_DIRECTORY_NAME
+        for file_path, relative_path in self._iter_files(packs_path, recursive=False):
+            name = relative_path[0]
+            if name.endswith(".pack") and name[: -len(".pack")].isdecimal() and name not in pack_files:
+                if self._delete_file(file_path):
+                    self.files_deleted += 1
+
+        return objects
+
+    def collect_objects(self, objects_path: Path, referenced_objects: set[str], /) -> None:
+        """Deletes the objects of the object store which are not referenced, and leftover temporary object files."""
+
+        for file_path, relative_path in self._iter_files(objects_path):
+            if len(relative_path) == 1:
+                # Objects are written to a temporary file first (see `store_file()`).
+                orphan = relative_path[0].endswith(".tmp")
+            elif len(relative_path) == 2:
+                content_hash = relative_path[0] + relative_path[1]
+                # Other files can't be objects, so are left alone.
+                orphan = _is_content_hash(content_hash) and content_hash not in referenced_objects
+            else:
+                orphan = False
+            if orphan and self._delete_file(file_path):
+                self.objects_deleted += 1
+
+    def _iter_files(self, directory: Path, /, recursive: bool = True) -> list[tuple[Path, tuple[str, ...]]]:
+        """Lists the files within a directory.
+
+        If the directory doesn't exist, it has no files. Errors querying entries are reported and the entries skipped.
+
+        :return: Tuples of (path, path components relative to `directory`).
+        """
+
+        files: list[tuple[Path, tuple[str, ...]]] = []
+        search_stack: list[tuple[Path, tuple[str, ...]]] = [(directory, ())]
+        while search_stack:
+            search_path, relative_path = search_stack.pop()
+            try:
+                children = list(os.scandir(search_path))
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                (self.callbacks.on_query_entry_error)(search_path, e)
+                continue
+            for child in children:
+                child_path = search_path / child.name
+                try:
+                    is_directory = child.is_dir(follow_symlinks=False)
+                except OSError as e:
+                    (self.callbacks.on_query_entry_error)(child_path, e)
+                    continue
+                if not is_directory:
+                    files.append((child_path, (*relative_path, child.name)))
+                elif recursive:
+                    search_stack.append((child_path, (*relative_path, child.name)))
+        return files
+
+    def _delete_file(self, path: Path, /) -> bool:
+        """Deletes a file (unless a dry run) and counts the bytes reclaimed.
+
+        :return: `True` if the file was deleted (or would be, if a dry run), `False` on error.
+        """
+
+        try:
+            stat = path.lstat()
+        except OSError as e:
+            (self.callbacks.on_query_entry_error)(path, e)
+            return False
+        if not self.config.dry_run:
+            try:
+                path.unlink()
+            except OSError as e:
+                (self.callbacks.on_delete_error)(path, e)
+                return False
+        if stat.st_nlink <= 1:
+            self.bytes_reclaimed += stat.st_size
+        return True
+
+
+def _is_content_hash(value: str, /) -> bool:
+    """Checks if a string is a content hash as produced by `hash_file()`."""
+
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+class CollectOrphansError(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
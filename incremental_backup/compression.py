@@ -0,0 +1,68 @@
+import bz2
+import gzip
+import lzma
+import shutil
+import zlib
+from enum import Enum
+from typing import BinaryIO, cast
+
+from incremental_backup._utility import StrPath
+
+__all__ = ["Compression", "compress_file", "decompress_file"]
+
+
+class Compression(Enum):
+    """Codec used to compress the data of backed up files. The values are as recorded in backup metadata."""
+
+    GZIP = "gzip"
+    """Fast, with a moderate compression ratio."""
+
+    LZMA = "lzma"
+    """Slow, with the best compression ratio. Decompression is faster than compression."""
+
+    BZ2 = "bz2"
+    """Slow, with a good compression ratio for text."""
+
+
+_CHUNK_SIZE = 2**20
+"""Number of bytes processed at a time when compressing or decompressing a file, so memory use doesn't depend on the
+file size."""
+
+_GZIP_LEVEL = 6
+"""Compression level for gzip. The default of `gzip.open()` (9) is much slower for little gain."""
+
+
+def _open_compressed(path: StrPath, mode: str, compression: Compression, /) -> BinaryIO:
+    if compression is Compression.GZIP:
+        return cast(BinaryIO, gzip.open(path, mode, compresslevel=_GZIP_LEVEL))
+    elif compression is Compression.LZMA:
+        return cast(BinaryIO, lzma.open(path, mode))
+    else:
+        return cast(BinaryIO, bz2.open(path, mode))
+
+
+def compress_file(source: StrPath, destination: StrPath, compression: Compression, /) -> None:
+    """Compresses a file's data to a new file, and copies the file's metadata, like `shutil.copy2()`.
+
+    :except OSError: If the source file could not be read, or the destination file could not be written to.
+    """
+
+    with open(source, "rb") as source_file, _open_compressed(destination, "wb", compression) as destination_file:
+        shutil.copyfileobj(source_file, destination_file, _CHUNK_SIZE)
+    shutil.copystat(source, destination)
+
+
+def decompress_file(source: StrPath, destination: StrPath, compression: Compression, /) -> None:
+    """Decompresses a file created by `compress_file()` to a new file, and copies the file's metadata.
+
+    :except OSError: If the source file could not be read or is not validly compressed, or the destination file could
+        not be written to.
+    """
+
+    try:
+        with _open_compressed(source, "rb", compression) as source_file, open(destination, "wb") as destination_file:
+            shutil.copyfileobj(source_file, destination_file, _CHUNK_SIZE)
+    except (EOFError, zlib.error, lzma.LZMAError) as e:
+        # Truncated or corrupted data. (Otherwise gzip and bz2 raise OSError for invalid data.)
+        raise OSError(f"Invalid {compression.value} data in {source}: {e}") from e
+    shutil.copystat(source, destination)
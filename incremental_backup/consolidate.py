@@ -0,0 +1,761 @@
+import os
+import shutil
+from collections.abc import Sequence
+from contextlib import ExitStack
+from dataclasses import dataclass
+from datetime import datetime, timezone, tzinfo
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Hashable, Iterable, Optional, Union
+
+from incremental_backup._utility import StrPath, normalise_path_name
+from incremental_backup.backup import (
+    LoadBackupSumCallbacks,
+    load_backup_sum,
+    write_backup_sum_checkpoint_file,
+)
+from incremental_backup.file_copy import copy_file
+from incremental_backup.meta import (
+    BACKUP_DIRECTORY_CREATION_RETRIES,
+    CATALOG_FILENAME,
+    COMPLETE_INFO_FILENAME,
+    CONSOLIDATION_FILENAME,
+    DATA_DIRECTORY_NAME,
+    MANIFEST_FILENAME,
+    OBJECTS_DIRECTORY_NAME,
+    PACK_INDEX_FILENAME,
+    PACKS_DIRECTORY_NAME,
+    START_INFO_FILENAME,
+    SUM_CHECKPOINT_FILENAME,
+    BackupCompleteInfo,
+    BackupCompleteInfoParseError,
+    BackupConsolidation,
+    BackupConsolidationParseError,
+    BackupDirectoryCreationError,
+    BackupManifestParseError,
+    BackupManifestWriter,
+    BackupMetadata,
+    BackupPackIndex,
+    BackupPackIndexParseError,
+    BackupPackWriter,
+    BackupStartInfo,
+    BackupStartInfoParseError,
+    ManifestBacktrack,
+    ManifestCopiedFile,
+    ManifestEnterDirectory,
+    ManifestRemovedDirectory,
+    ManifestRemovedFile,
+    ReadBackupsCallbacks,
+    generate_backup_name,
+    get_pack_file_name,
+    iter_backup_manifest_file,
+    read_backup_complete_info_file,
+    read_backup_consolidation_file,
+    read_backup_metadata,
+    read_backup_pack_index_file,
+    read_backups,
+    update_backup_catalog,
+    write_backup_complete_info_file,
+    write_backup_consolidation_file,
+    write_backup_pack_index_file,
+    write_backup_start_info_file,
+)
+from incremental_backup.object_store import get_object_path
+
+__all__ = [
+    "consolidate_backups",
+    "ConsolidateBackupsCallbacks",
+    "ConsolidateBackupsConfig",
+    "ConsolidateBackupsError",
+    "ConsolidateBackupsResults",
+    "RetentionPolicy",
+    "select_retained_backups",
+]
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Selects the backups to keep as restore points, in the style of grandfather-father-son rotation.
+
+    Each count keeps the newest backup of that many distinct periods, going back from the newest backup. A backup may
+    count towards several periods.
+    """
+
+    last: int = 1
+    """Number of the newest backups to keep. Must be at least 1, since the newest backup is needed to create the next
+        backup."""
+
+    daily: int = 0
+    """Number of days to keep a backup for."""
+
+    weekly: int = 0
+    """Number of weeks (ISO-8601 weeks, starting on Monday) to keep a backup for."""
+
+    monthly: int = 0
+    """Number of months to keep a backup for."""
+
+
+def select_retained_backups(
+    backups: Iterable[BackupMetadata], policy: RetentionPolicy, /, tz: Optional[tzinfo] = None
+) -> list[BackupMetadata]:
+    """Selects the backups kept by a retention policy.
+
+    :param tz: The time zone which determines the days, weeks and months of backups' start times. If `None`, the local
+        time zone is used.
+    :return: The retained backups, in chronological order.
+    :except ValueError: If `policy` has a negative count, or `policy.last` is less than 1.
+    """
+
+    _check_retention_policy(policy)
+
+    periods: tuple[tuple[int, Callable[[datetime], Hashable]], ...] = (
+        (policy.daily, lambda time: time.date()),
+        (policy.weekly, lambda time: tuple(time.isocalendar())[:2]),
+        (policy.monthly, lambda time: (time.year, time.month)),
+    )
+    # Per period type: the number of periods kept so far, and the period of the last backup kept.
+    kept_counts = [0] * len(periods)
+    last_periods: list[Optional[Hashable]] = [None] * len(periods)
+
+    backups_sorted = sorted(backups, key=lambda backup: backup.start_info.start_time, reverse=True)
+    retained: list[BackupMetadata] = []
+    for i, backup in enumerate(backups_sorted):
+        time = backup.start_info.start_time.astimezone(tz)
+        keep = i < policy.last
+        for j, (count, get_period) in enumerate(periods):
+            period = get_period(time)
+            if kept_counts[j] < count and period != last_periods[j]:
+                kept_counts[j] += 1
+                last_periods[j] = period
+                keep = True
+        if keep:
+            retained.append(backup)
+    retained.reverse()
+    return retained
+
+
+def _check_retention_policy(policy: RetentionPolicy, /) -> None:
+    """:except ValueError: If the policy is not valid."""
+
+    if policy.last < 1:
+        raise ValueError("Retention policy must keep at least the last backup")
+    if policy.daily < 0 or policy.weekly < 0 or policy.monthly < 0:
+        raise ValueError("Retention policy counts must not be negative")
+
+
+@dataclass
+class ConsolidateBackupsConfig:
+    retention_policy: RetentionPolicy
+    """Selects the backups which are kept as restore points. Other backups are merged into newer ones."""
+
+    dry_run: bool
+    """If true, only select the backups to consolidate, without modifying the filesystem."""
+
+    read_workers: int = 1
+    """Number of threads used to read backups' metadata. See `read_backups()`."""
+
+    time_zone: Optional[tzinfo] = None
+    """See `select_retained_backups()`."""
+
+
+@dataclass(frozen=True)
+class ConsolidateBackupsCallbacks:
+    """Callbacks for events that occur in `consolidate_backups()`."""
+
+    on_recover_consolidation: Callable[[BackupConsolidation, bool], None] = lambda consolidation, completed: None
+    """Called when a consolidation interrupted by an earlier run is recovered, before anything else.
+        First argument is the consolidation record, second argument is true if the consolidation was completed, or
+        false if it was undone."""
+
+    on_before_read_backups: Callable[[], None] = lambda: None
+    """Called just before reading backups from the backup target directory."""
+
+    read_backups: ReadBackupsCallbacks = ReadBackupsCallbacks()
+    """Callbacks for reading backups."""
+
+    on_after_read_backups: Callable[[Sequence[BackupMetadata]], None] = lambda backups: None
+    """Called just after the backups have been read from the target directory.
+        Argument is the collection of backup metadatas (in arbitrary order)."""
+
+    on_selected_groups: Callable[[Sequence[Sequence[BackupMetadata]]], None] = lambda groups: None
+    """Called after selecting which backups to consolidate.
+        Argument is the groups of backups which are each merged into one backup, in chronological order."""
+
+    on_before_consolidate_group: Callable[[Sequence[BackupMetadata]], None] = lambda group: None
+    """Called just before merging a group of backups.
+        Argument is the backups of the group, in chronological order."""
+
+    on_after_consolidate_group: Callable[[Sequence[BackupMetadata], Path], None] = lambda group, path: None
+    """Called just after a group of backups was merged, before the old backups are deleted.
+        First argument is the backups of the group, second argument is the path of the new backup. The new backup has
+        a new name, so it replaces the newest backup of the group under a different name."""
+
+    on_consolidate_error: Callable[[Sequence[BackupMetadata], Exception], None] = lambda group, error: None
+    """Called when merging a group of backups fails. The new backup is deleted and the group's backups are kept.
+        First argument is the backups of the group, second argument is the raised exception (`OSError`,
+        `BackupManifestParseError`, `BackupPackIndexParseError`, `BackupStartInfoParseError` or
+        `BackupDirectoryCreationError`)."""
+
+    load_backup_sum: LoadBackupSumCallbacks = LoadBackupSumCallbacks()
+    """Callbacks for `load_backup_sum()`, when creating the backup sum checkpoint of a new backup."""
+
+    on_write_sum_checkpoint_error: Callable[[Path, OSError], None] = lambda path, error: None
+    """Called when writing the backup sum checkpoint file of a new backup fails.
+        First argument is the path to the file, second argument is the raised exception."""
+
+    on_delete_error: Callable[[Path, OSError], None] = lambda path, error: None
+    """Called when an error is raised deleting a file or directory.
+        First argument is the path, second argument is the raised exception."""
+
+    on_update_catalog_error: Callable[[Path, OSError], None] = lambda path, error: None
+    """Called when updating the backup catalog file of the target directory fails.
+        First argument is the path to the file, second argument is the raised exception."""
+
+
+@dataclass(frozen=True)
+class ConsolidateBackupsResults:
+    """Return results of `consolidate_backups()`."""
+
+    backups_consolidated: int
+    """The number of backups merged into new backups (and removed)."""
+
+    backups_created: int
+    """The number of new backups created from merged backups."""
+
+    backups_remaining: int
+    """The number of valid backups after consolidation."""
+
+
+def consolidate_backups(
+    backup_target_directory: StrPath,
+    config: ConsolidateBackupsConfig,
+    callbacks: ConsolidateBackupsCallbacks = ConsolidateBackupsCallbacks(),
+) -> ConsolidateBackupsResults:
+    """Merges backups which are not retained as restore points, so that the number of backups (and thus the cost of
+    reading and summing them) stays bounded.
+
+    Backups are grouped in chronological order: each group is a run of backups which are not retained, plus the
+    following retained backup. (Groups also end where the compression of the backups changes, and before each backup
+    which skipped paths.) Each group of 2 or more
+    backups is replaced by one new backup (with a new name), with the same start time and contents as the newest backup
+    of the group, whose manifest is the net effect of the group's manifests. Only the data of the files still present in the last
+    backup of the group is kept; superseded copies are dropped with the old backups.
+
+    Data is hard linked (or copied, if linking fails) from the old backups, which are only deleted once the new backup
+    is complete. The consolidation is recorded in the target directory while in progress (see `BackupConsolidation`),
+    so if interrupted, it is completed or undone by the next call.
+
+    :param backup_target_directory: The directory containing the backups. I.e. the "target directory" from the backup
+        creation operation.
+    :param config: Options to tune what and how backups are consolidated.
+    :param callbacks: Callbacks for certain events during execution. See `ConsolidateBackupsCallbacks`.
+    :return: Summary information for the consolidation operation.
+    :except ValueError: If `config.read_workers` is less than 1 or `config.retention_policy` is invalid.
+    :except ConsolidateBackupsError: If an error occurs that prevents the consolidation operation from completing.
+    """
+
+    if config.read_workers < 1:
+        raise ValueError("read_workers must be at least 1.")
+    _check_retention_policy(config.retention_policy)
+
+    backup_target_directory = Path(backup_target_directory)
+
+    if not config.dry_run:
+        _recover_consolidation(backup_target_directory, callbacks)
+
+    (callbacks.on_before_read_backups)()
+
+    try:
+        backups = read_backups(
+            backup_target_directory, callbacks.read_backups, config.read_workers, lazy_manifests=True
+        )
+    except OSError as e:
+        raise ConsolidateBackupsError(f"Failed to query backup target directory: {e}") from e
+    (callbacks.on_after_read_backups)(tuple(backups))
+
+    backups.sort(key=lambda backup: backup.start_info.start_time)
+    retained = select_retained_backups(backups, config.retention_policy, config.time_zone)
+    groups = _group_backups(
+        backups, {backup.name for backup in retained}, _get_backups_skipping_paths(backup_target_directory, backups)
+    )
+    (callbacks.on_selected_groups)(tuple(groups))
+
+    if config.dry_run:
+        backups_consolidated = sum(len(group) for group in groups)
+        return ConsolidateBackupsResults(
+            backups_consolidated, len(groups), len(backups) - backups_consolidated + len(groups)
+        )
+
+    backups_consolidated = 0
+    backups_created = 0
+    for group in groups:
+        # Backups compare by manifest, so find the group by name to avoid loading manifests.
+        first_index = next(i for i, backup in enumerate(backups) if backup.name == group[0].name)
+        (callbacks.on_before_consolidate_group)(group)
+        new_backup = _consolidate_group(backup_target_directory, backups[:first_index], group, callbacks)
+        if new_backup is None:
+            continue
+        (callbacks.on_after_consolidate_group)(group, backup_target_directory / new_backup.name)
+
+        group_names = {backup.name for backup in group}
+        backups[first_index : first_index + len(group)] = [new_backup]
+        try:
+            update_backup_catalog(backup_target_directory, backups, group_names)
+        except OSError as e:
+            (callbacks.on_update_catalog_error)(backup_target_directory / CATALOG_FILENAME, e)
+        for backup in group:
+            _delete_backup(backup_target_directory / backup.name, callbacks)
+        _delete_consolidation_record(backup_target_directory, callbacks)
+
+        backups_consolidated += len(group)
+        backups_created += 1
+
+    return ConsolidateBackupsResults(backups_consolidated, backups_created, len(backups))
+
+
+def _group_backups(
+    backups: Sequence[BackupMetadata], retained_names: set[str], skipped_paths_names: set[str], /
+) -> list[list[BackupMetadata]]:
+    """Splits backups into the groups to consolidate.
+
+    :param backups: All the backups, in chronological order.
+    :param retained_names: The names of the backups retained as restore points. Must include the newest backup.
+    :param skipped_paths_names: The names of the backups which skipped paths.
+    :return: The groups of 2 or more backups, in chronological order.
+    """
+
+    groups: list[list[BackupMetadata]] = []
+    group: list[BackupMetadata] = []
+    for backup in backups:
+        if group and group[-1].start_info.compression != backup.start_info.compression:
+            # Data of different compression can't be in the same backup.
+            groups.append(group)
+            group = []
+        elif group and backup.name in skipped_paths_names:
+            # The backup may have failed to copy a file modified since an earlier backup of the group copied it. The
+            # merged backup has the start time of its newest backup, so the earlier copy would then be considered up
+            # to date, and the file never backed up again.
+            groups.append(group)
+            group = []
+        group.append(backup)
+        if backup.name in retained_names:
+            groups.append(group)
+            group = []
+    if group:
+        groups.append(group)
+    return [g for g in groups if len(g) >= 2]
+
+
+def _get_backups_skipping_paths(backup_target_directory: Path, backups: Iterable[BackupMetadata], /) -> set[str]:
+    """Finds the names of the backups which skipped paths, according to their completion information. Backups whose
+    completion information can't be read are assumed to have skipped paths."""
+
+    names: set[str] = set()
+    for backup in backups:
+        try:
+            complete_info = read_backup_complete_info_file(
+                backup_target_directory / backup.name / COMPLETE_INFO_FILENAME
+            )
+        except (OSError, BackupCompleteInfoParseError):
+            names.add(backup.name)
+        else:
+            if complete_info.paths_skipped:
+                names.add(backup.name)
+    return names
+
+
+def _recover_consolidation(backup_target_directory: Path, callbacks: ConsolidateBackupsCallbacks, /) -> None:
+    """Completes or undoes a consolidation interrupted by an earlier run, if any.
+
+    The consolidation is completed if the new backup's completion information was written (which is written last),
+    otherwise the new backup is deleted.
+
+    :except ConsolidateBackupsError: If the consolidation record can't be read.
+    """
+
+    record_path = backup_target_directory / CONSOLIDATION_FILENAME
+    try:
+        consolidation = read_backup_consolidation_file(record_path)
+    except FileNotFoundError:
+        return
+    except (OSError, BackupConsolidationParseError) as e:
+        raise ConsolidateBackupsError(f"Failed to read consolidation record: {e}") from e
+
+    backup_path = backup_target_directory / consolidation.backup_name
+    new_backup: Optional[BackupMetadata]
+    try:
+        read_backup_complete_info_file(backup_path / COMPLETE_INFO_FILENAME)
+        new_backup = read_backup_metadata(backup_path, lazy_manifest=True)
+    except (OSError, BackupCompleteInfoParseError, BackupStartInfoParseError, BackupManifestParseError):
+        new_backup = None
+    completed = new_backup is not None
+
+    if new_backup is not None:
+        # The catalog only needs updating if it exists. Otherwise, readers enumerate the target directory, which
+        # finds the new backup once the old backups are deleted.
+        catalog_path = backup_target_directory / CATALOG_FILENAME
+        if catalog_path.exists():
+            try:
+                update_backup_catalog(backup_target_directory, (new_backup,), consolidation.replaced_backup_names)
+            except OSError as e:
+                (callbacks.on_update_catalog_error)(catalog_path, e)
+        for name in consolidation.replaced_backup_names:
+            _delete_backup(backup_target_directory / name, callbacks)
+    else:
+        _delete_backup(backup_path, callbacks)
+
+    _delete_consolidation_record(backup_target_directory, callbacks)
+    (callbacks.on_recover_consolidation)(consolidation, completed)
+
+
+def _delete_backup(backup_path: Path, callbacks: ConsolidateBackupsCallbacks, /) -> bool:
+    """Deletes a backup directory, if it exists.
+
+    The manifest is deleted first, so that if the rest can't be deleted, the directory is no longer considered a valid
+    backup.
+
+    :return: True if the backup was deleted completely.
+    """
+
+    success = True
+
+    def on_rmtree_error(function: Any, path: str, exc_info: tuple[type[OSError], OSError, Any]) -> None:
+        (callbacks.on_delete_error)(Path(path), exc_info[1])
+        nonlocal success
+        success = False
+
+    if not backup_path.exists():
+        return True
+
+    try:
+        (backup_path / MANIFEST_FILENAME).unlink(missing_ok=True)
+    except OSError as e:
+        (callbacks.on_delete_error)(backup_path / MANIFEST_FILENAME, e)
+        return False
+
+    try:
+        shutil.rmtree(backup_path, ignore_errors=False, onerror=on_rmtree_error)
+    except OSError as e:
+        # Unclear if exceptions can still occur when onerror is provided.
+        (callbacks.on_delete_error)(backup_path, e)
+        success = False
+    return success
+
+
+def _delete_consolidation_record(backup_target_directory: Path, callbacks: ConsolidateBackupsCallbacks, /) -> None:
+    record_path = backup_target_directory / CONSOLIDATION_FILENAME
+    try:
+        record_path.unlink(missing_ok=True)
+    except OSError as e:
+        (callbacks.on_delete_error)(record_path, e)
+
+
+def _consolidate_group(
+    backup_target_directory: Path,
+    older_backups: Sequence[BackupMetadata],
+    group: Sequence[BackupMetadata],
+    callbacks: ConsolidateBackupsCallbacks,
+    /,
+) -> Optional[BackupMetadata]:
+    """Creates the backup which replaces a group of backups, and records the consolidation. The old backups are not
+    deleted.
+
+    :param older_backups: The current backups older than the group.
+    :return: The metadata of the new backup, or `None` if it could not be created (in which case it's deleted).
+    """
+
+    try:
+        name = _create_consolidated_backup_directory(backup_target_directory, group)
+    except (OSError, BackupDirectoryCreationError) as e:
+        (callbacks.on_consolidate_error)(group, e)
+        return None
+    backup_path = backup_target_directory / name
+
+    try:
+        # The new backup represents the state of the newest backup of the group, so it has the same start time. That
+        # keeps the modification times compared by the next backup the same.
+        start_info = BackupStartInfo(group[-1].start_info.start_time, group[-1].start_info.compression)
+        write_backup_start_info_file(backup_path / START_INFO_FILENAME, start_info)
+
+        root = _merge_manifests(backup_target_directory, group)
+        _write_consolidated_backup(backup_target_directory, backup_path, root)
+
+        metadata = read_backup_metadata(backup_path, lazy_manifest=True)
+        checkpoint = load_backup_sum(backup_target_directory, (*older_backups, metadata), callbacks.load_backup_sum)
+        checkpoint_path = backup_path / SUM_CHECKPOINT_FILENAME
+        try:
+            write_backup_sum_checkpoint_file(checkpoint_path, checkpoint)
+        except OSError as e:
+            (callbacks.on_write_sum_checkpoint_error)(checkpoint_path, e)
+
+        # Written last, since it marks the new backup as complete (see `_recover_consolidation()`).
+        write_backup_complete_info_file(
+            backup_path / COMPLETE_INFO_FILENAME, _merge_complete_info(backup_target_directory, group)
+        )
+    except (OSError, BackupManifestParseError, BackupPackIndexParseError, BackupStartInfoParseError) as e:
+        (callbacks.on_consolidate_error)(group, e)
+        if _delete_backup(backup_path, callbacks):
+            _delete_consolidation_record(backup_target_directory, callbacks)
+        return None
+
+    return metadata
+
+
+def _create_consolidated_backup_directory(backup_target_directory: Path, group: Sequence[BackupMetadata], /) -> str:
+    """Chooses the name of the backup which replaces a group of backups, records the consolidation, then creates the
+    backup directory. The record is written first, so that an interrupted consolidation never leaves a directory which
+    the record doesn't name.
+
+    :return: The name of the new backup directory.
+    :except OSError: If the consolidation record could not be written.
+    :except BackupDirectoryCreationError: If the backup directory could not be created (in which case the record is
+        deleted).
+    """
+
+    record_path = backup_target_directory / CONSOLIDATION_FILENAME
+    replaced_names = tuple(backup.name for backup in group)
+    retries = BACKUP_DIRECTORY_CREATION_RETRIES
+    while True:
+        name = generate_backup_name()
+        path = backup_target_directory / name
+        # An existing directory must never be named by the record, since recovery would delete it.
+        if not path.exists():
+            write_backup_consolidation_file(record_path, BackupConsolidation(name, replaced_names))
+            try:
+                path.mkdir(exist_ok=False)
+            except OSError as e:
+                record_path.unlink(missing_ok=True)
+                raise BackupDirectoryCreationError(str(e)) from e
+            return name
+        elif retries <= 0:
+            raise BackupDirectoryCreationError(f"Name conflicts with existing directory: {name}")
+        else:
+            retries -= 1
+
+
+def _merge_complete_info(backup_target_directory: Path, group: Sequence[BackupMetadata], /) -> BackupCompleteInfo:
+    """Creates the completion information of the backup which replaces a group of backups.
+
+    Paths were skipped if any backup of the group skipped paths.
+    """
+
+    end_time: Optional[datetime] = None
+    paths_skipped = False
+    for backup in group:
+        try:
+            complete_info = read_backup_complete_info_file(
+                backup_target_directory / backup.name / COMPLETE_INFO_FILENAME
+            )
+        except (OSError, BackupCompleteInfoParseError):
+            end_time = None
+        else:
+            end_time = complete_info.end_time
+            paths_skipped = paths_skipped or complete_info.paths_skipped
+    if end_time is None:
+        end_time = datetime.now(timezone.utc)
+    return BackupCompleteInfo(end_time, paths_skipped)
+
+
+@dataclass(frozen=True)
+class _ConsolidatedFile:
+    """A file copied by a backup of a group being consolidated."""
+
+    name: str
+
+    backup: BackupMetadata
+    """The backup which copied the file."""
+
+    path: tuple[str, ...]
+    """The path components of the file relative to the backup source directory, as recorded in `backup`'s manifest."""
+
+    content_hash: Optional[str]
+    """See `ManifestCopiedFile.content_hash`."""
+
+
+class _ConsolidatedDirectory:
+    """Directory of the net manifest of a group of backups under construction. Entries are keyed by normalised name
+    (see `normalise_path_name()`), in order of insertion."""
+
+    __slots__ = ("name", "copied_files", "removed_files", "removed_directories", "subdirectories")
+
+    def __init__(self, name: str, /) -> None:
+        self.name = name
+        self.copied_files: dict[str, _ConsolidatedFile] = {}
+        self.removed_files: dict[str, str] = {}
+        self.removed_directories: dict[str, str] = {}
+        self.subdirectories: dict[str, _ConsolidatedDirectory] = {}
+
+    def enter_subdirectory(self, name: str, /) -> "_ConsolidatedDirectory":
+        """Gets the subdirectory with the given name, creating it if it doesn't exist."""
+
+        key = normalise_path_name(name)
+        subdirectory = self.subdirectories.get(key)
+        if subdirectory is None:
+            subdirectory = _ConsolidatedDirectory(name)
+            self.subdirectories[key] = subdirectory
+        return subdirectory
+
+    def copy_file(self, file: _ConsolidatedFile, /) -> None:
+        key = normalise_path_name(file.name)
+        self.removed_files.pop(key, None)
+        self.copied_files[key] = file
+
+    def remove_file(self, name: str, /) -> None:
+        # Removal is kept even if the file was copied earlier in the group, since it may predate the group.
+        key = normalise_path_name(name)
+        self.copied_files.pop(key, None)
+        self.removed_files[key] = name
+
+    def remove_directory(self, name: str, /) -> None:
+        # If the directory is entered again later, the removal applies first (as in the manifest format), so the
+        # directory starts empty.
+        key = normalise_path_name(name)
+        self.subdirectories.pop(key, None)
+        self.removed_directories[key] = name
+
+
+def _merge_manifests(backup_target_directory: Path, group: Sequence[BackupMetadata], /) -> _ConsolidatedDirectory:
+    """Computes the net manifest of a group of backups, i.e. the changes which applying all of them makes.
+
+    :param group: The backups to merge, in chronological order.
+    :return: The root directory of the net manifest.
+    :except OSError: If a manifest could not be read.
+    :except BackupManifestParseError: If a manifest is invalid.
+    """
+
+    root = _ConsolidatedDirectory("")
+    for backup in group:
+        stack = [root]
+        path: list[str] = []
+        for event in iter_backup_manifest_file(backup_target_directory / backup.name / MANIFEST_FILENAME):
+            if isinstance(event, ManifestEnterDirectory):
+                stack.append(stack[-1].enter_subdirectory(event.name))
+                path.append(event.name)
+            elif isinstance(event, ManifestBacktrack):
+                del stack[-event.count :]
+                del path[-event.count :]
+            elif isinstance(event, ManifestCopiedFile):
+                stack[-1].copy_file(_ConsolidatedFile(event.name, backup, (*path, event.name), event.content_hash))
+            elif isinstance(event, ManifestRemovedFile):
+                stack[-1].remove_file(event.name)
+            elif isinstance(event, ManifestRemovedDirectory):
+                stack[-1].remove_directory(event.name)
+    return root
+
+
+def _write_consolidated_backup(
+    backup_target_directory: Path, backup_path: Path, root: _ConsolidatedDirectory, /
+) -> None:
+    """Writes the data, pack files and manifest of the backup which replaces a group of backups.
+
+    Each file's data is put where its backup had it. Files in the object store stay there, except that the manifest
+    can't mix files in the object store with files in the data directory, so in such directories the objects are
+    linked into the data directory (which is possible since the data of backups using the object store is never
+    compressed).
+
+    The manifest is written to a temporary file which is renamed once everything else is written, as when creating a
+    backup, so a partially written consolidated backup never has a manifest.
+
+    :except OSError: If a file's data could not be read or written, or the manifest could not be written.
+    :except BackupPackIndexParseError: If the pack index of a backup is invalid.
+    """
+
+    data_path = backup_path / DATA_DIRECTORY_NAME
+    data_path.mkdir()
+    objects_path = backup_target_directory / OBJECTS_DIRECTORY_NAME
+    # Keyed by backup name.
+    pack_indices: dict[str, dict[tuple[str, ...], BackupPackIndex.Entry]] = {}
+
+    def get_pack_entry(file: _ConsolidatedFile, /) -> Optional[BackupPackIndex.Entry]:
+        pack_index = pack_indices.get(file.backup.name)
+        if pack_index is None:
+            index_path = backup_target_directory / file.backup.name / PACKS_DIRECTORY_NAME / PACK_INDEX_FILENAME
+            try:
+                entries = read_backup_pack_index_file(index_path).entries
+            except FileNotFoundError:
+                entries = []
+            pack_index = {tuple(normalise_path_name(c) for c in entry.path): entry for entry in entries}
+            pack_indices[file.backup.name] = pack_index
+        return pack_index.get(tuple(normalise_path_name(c) for c in file.path))
+
+    with ExitStack() as exit_stack:
+        manifest_file = exit_stack.enter_context(open(backup_path / (MANIFEST_FILENAME + ".tmp"), "w", encoding="utf8"))
+        manifest_writer = BackupManifestWriter(manifest_file)
+        pack_writer = BackupPackWriter(backup_path / PACKS_DIRECTORY_NAME)
+        exit_stack.callback(pack_writer.close)
+        # Keyed by pack file path.
+        pack_files: dict[Path, BinaryIO] = {}
+
+        search_stack: list[Union[tuple[_ConsolidatedDirectory, tuple[str, ...]], None]] = [(root, ())]
+        while search_stack:
+            node = search_stack.pop()
+            if node is None:
+                manifest_writer.exit_directory()
+                continue
+            directory, path = node
+
+            files = list(directory.copied_files.values())
+            store_objects = bool(files) and all(f.content_hash is not None for f in files)
+            if not store_objects:
+                for file in files:
+                    destination_path = data_path.joinpath(*path, file.name)
+                    if file.content_hash is not None:
+                        destination_path.parent.mkdir(parents=True, exist_ok=True)
+                        _link_or_copy_file(get_object_path(objects_path, file.content_hash), destination_path)
+                    elif (pack_entry := get_pack_entry(file)) is not None:
+                        pack_path = (
+                            backup_target_directory
+                            / file.backup.name
+                            / PACKS_DIRECTORY_NAME
+                            / get_pack_file_name(pack_entry.pack)
+                        )
+                        pack_file = pack_files.get(pack_path)
+                        if pack_file is None:
+                            pack_file = exit_stack.enter_context(open(pack_path, "rb"))
+                            pack_files[pack_path] = pack_file
+                        pack_file.seek(pack_entry.offset)
+                        data = pack_file.read(pack_entry.size)
+                        if len(data) != pack_entry.size:
+                            raise OSError(f"Pack file {pack_path} is truncated")
+                        pack_writer.add_file((*path, file.name), data, pack_entry.last_modified_ns, pack_entry.mode)
+                    else:
+                        source_path = backup_target_directory.joinpath(
+                            file.backup.name, DATA_DIRECTORY_NAME, *file.path
+                        )
+                        destination_path.parent.mkdir(parents=True, exist_ok=True)
+                        _link_or_copy_file(source_path, destination_path)
+
+            manifest_writer.enter_directory(
+                directory.name,
+                [f.name for f in files],
+                list(directory.removed_files.values()),
+                list(directory.removed_directories.values()),
+                [f.content_hash for f in files] if store_objects else (),
+            )
+            search_stack.append(None)
+            search_stack.extend((d, (*path, d.name)) for d in reversed(directory.subdirectories.values()))
+
+        pack_index = pack_writer.finish()
+        if pack_index.entries:
+            # Written before the manifest is complete, as when creating a backup.
+            write_backup_pack_index_file(backup_path / PACKS_DIRECTORY_NAME / PACK_INDEX_FILENAME, pack_index)
+        manifest_writer.finish()
+    # After the manifest file is closed.
+    os.replace(backup_path / (MANIFEST_FILENAME + ".tmp"), backup_path / MANIFEST_FILENAME)
+
+
+def _link_or_copy_file(source: Path, destination: Path, /) -> None:
+    """Hard links a file, or copies it if that's not possible (e.g. the filesystem doesn't support hard links).
+
+    :except OSError: If the file could not be linked or copied.
+    """
+
+    try:
+        os.link(source, destination)
+    except OSError:
+        copy_file(source, destination)
+
+
+class ConsolidateBackupsError(Exception):
+    def __init__(self, message: str) -> None:
+        super().__init__(message)
+        self.message = message
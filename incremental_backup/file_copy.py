@@ -0,0 +1,92 @@
+import os
+import shutil
+import sys
+from enum import Enum
+from typing import Optional
+
+from incremental_backup._utility import StrPath
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows.
+    fcntl = None
+
+__all__ = ["CopyMethod", "copy_file"]
+
+
+class CopyMethod(Enum):
+    """How the data of a file was copied by `copy_file()`."""
+
+    REFLINK = "reflink"
+    """The copy shares the data of the original until either is modified (copy-on-write). Requires a filesystem
+        supporting it, e.g. Btrfs or XFS."""
+
+    COPY_FILE_RANGE = "copy_file_range"
+    """The data was copied within the operating system kernel, with `os.copy_file_range()`."""
+
+    STANDARD = "standard"
+    """The data was copied with `shutil.copy2()`."""
+
+
+def copy_file(source: StrPath, destination: StrPath, /) -> CopyMethod:
+    """Copies a file's data and metadata, like `shutil.copy2()`, but using the fastest method available.
+
+    Tries a reflink first, then `os.copy_file_range()`, and finally falls back to `shutil.copy2()`. The first two are
+    only available on Linux, and only work for some filesystems.
+
+    :return: The method used to copy the file's data.
+    :except OSError: If the file could not be copied.
+    """
+
+    if _REFLINK_AVAILABLE or _COPY_FILE_RANGE_AVAILABLE:
+        with open(source, "rb") as source_file, open(destination, "wb") as destination_file:
+            method = _copy_file_data(source_file.fileno(), destination_file.fileno())
+        if method is not None:
+            shutil.copystat(source, destination)
+            return method
+    shutil.copy2(source, destination)
+    return CopyMethod.STANDARD
+
+
+_FICLONE = 0x40049409
+"""Linux ioctl request to make a file share all the data of another file."""
+
+_REFLINK_AVAILABLE = fcntl is not None and sys.platform.startswith("linux")
+
+_COPY_FILE_RANGE_AVAILABLE = hasattr(os, "copy_file_range")
+
+_COPY_FILE_RANGE_CHUNK_SIZE = 2**30
+
+
+def _copy_file_data(source_fd: int, destination_fd: int, /) -> Optional[CopyMethod]:
+    """Tries to copy a file's data with the methods faster than `shutil.copy2()`.
+
+    :param source_fd: File descriptor of the source file, open for reading at offset 0.
+    :param destination_fd: File descriptor of the empty destination file, open for writing at offset 0.
+    :return: The method used, or `None` if none worked, in which case the destination file is still empty.
+    """
+
+    if _REFLINK_AVAILABLE:
+        try:
+            fcntl.ioctl(destination_fd, _FICLONE, source_fd)
+        except OSError:
+            # Filesystem doesn't support it, or the files are on different filesystems.
+            pass
+        else:
+            return CopyMethod.REFLINK
+
+    if _COPY_FILE_RANGE_AVAILABLE:
+        try:
+            while os.copy_file_range(source_fd, destination_fd, _COPY_FILE_RANGE_CHUNK_SIZE) > 0:
+                pass
+        except OSError:
+            # Not supported for these files (e.g. on different filesystems with older kernels). Any real I/O error will
+            # occur again with the next method.
+            os.lseek(source_fd, 0, os.SEEK_SET)
+            os.lseek(destination_fd, 0, os.SEEK_SET)
+            os.ftruncate(destination_fd, 0)
+        else:
+            return CopyMethod.COPY_FILE_RANGE
+
+    return None
@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Sequence, Union
+
+from incremental_backup._utility import StrPath, normalise_path_name
+from incremental_backup.meta import (
+    MANIFEST_FILENAME,
+    BackupCatalog,
+    BackupManifestEvent,
+    BackupManifestParseError,
+    BackupMetadata,
+    ManifestBacktrack,
+    ManifestCopiedFile,
+    ManifestEnterDirectory,
+    ManifestRemovedDirectory,
+    ReadBackupsCallbacks,
+    iter_backup_manifest_file,
+    read_backups,
+)
+from incremental_backup.path_filter import PathFilter, split_relative_path
+
+__all__ = ["locate_file", "LocateFileCallbacks", "LocatedFile"]
+
+
+@dataclass(frozen=True)
+class LocatedFile:
+    """Return result of `locate_file()`."""
+
+    backup: BackupMetadata
+    """The newest backup which recorded the file as copied or removed."""
+
+    path: tuple[str, ...]
+    """The path components of the file relative to the backup source directory, as recorded in the backup's manifest
+        (which may differ in case from the requested path, on Windows)."""
+
+    removed: bool
+    """If true, `backup` recorded the file (or a directory containing it) as removed, so the file did not exist at the
+        requested time."""
+
+    content_hash: Optional[str] = None
+    """If the file was copied to the object store, its content hash (see `BackupManifest.Directory.copied_file_hashes`),
+        otherwise `None`."""
+
+
+@dataclass(frozen=True)
+class LocateFileCallbacks:
+    """Callbacks for events that occur in `locate_file()`."""
+
+    read_backups: ReadBackupsCallbacks = ReadBackupsCallbacks()
+    """Callbacks for `read_backups()`."""
+
+    on_read_manifest_error: Callable[[Path, Union[OSError, BackupManifestParseError]], None] = lambda path, error: None
+    """Called when reading the manifest of a backup fails. The backup is skipped.
+        First argument is the path of the backup, second argument is the raised exception."""
+
+
+def locate_file(
+    backup_target_directory: StrPath,
+    relative_path: str,
+    at_time: Optional[datetime] = None,
+    /,
+    callbacks: LocateFileCallbacks = LocateFileCallbacks(),
+    read_workers: int = 1,
+) -> Optional[LocatedFile]:
+    """Finds the backup containing the version of one file at some point in time, without summing the backups.
+
+    Backups are searched from newest to oldest, stopping at the first whose manifest records the file as copied or
+    removed. Only the directories of each manifest which contain the file are processed (see `iter_backup_manifest()`).
+    The result is the same as the file's entry in the sum of the backups (see `BackupSum`).
+
+    :param backup_target_directory: The directory containing the backups.
+    :param relative_path: The path of the file relative to the backup source directory, with components separated by
+        '/'.
+    :param at_time: If specified, only backups up to and including this time are searched, otherwise all backups.
+    :param callbacks: Callbacks for certain events during execution. See `LocateFileCallbacks`.
+    :param read_workers: Number of threads used to read backups' metadata. See `read_backups()`.
+    :return: Where the file was found, or `None` if no backup recorded it.
+    :except ValueError: If `relative_path` does not name a file (see `split_relative_path()`), or `read_workers` is
+        less than 1.
+    :except OSError: If the backup target directory cannot be enumerated.
+    """
+
+    path = split_relative_path(relative_path)
+    if not path:
+        raise ValueError(f'Path "{relative_path}" must name a file')
+    path_filter = PathFilter([relative_path])
+
+    def select_catalog_entries(entries: Sequence[BackupCatalog.Entry], /) -> Sequence[BackupCatalog.Entry]:
+        if at_time is None:
+            return entries
+        else:
+            return tuple(e for e in entries if e.start_time <= at_time)
+
+    backups = read_backups(
+        backup_target_directory,
+        callbacks.read_backups,
+        read_workers,
+        catalog_filter=select_catalog_entries,
+        lazy_manifests=True,
+    )
+    if at_time is not None:
+        backups = [b for b in backups if b.start_info.start_time <= at_time]
+    backups.sort(key=lambda backup: backup.start_info.start_time, reverse=True)
+
+    for backup in backups:
+        backup_path = Path(backup_target_directory, backup.name)
+        try:
+            located = _locate_in_manifest(
+                backup, iter_backup_manifest_file(backup_path / MANIFEST_FILENAME, path_filter), path
+            )
+        except (OSError, BackupManifestParseError) as e:
+            (callbacks.on_read_manifest_error)(backup_path, e)
+            continue
+        if located is not None:
+            return located
+    return None
+
+
+def _locate_in_manifest(
+    backup: BackupMetadata, events: Iterable[BackupManifestEvent], path: tuple[str, ...], /
+) -> Optional[LocatedFile]:
+    """Finds the last record of a file in a backup's manifest events. Later events take precedence, as when summing
+    backups (e.g. a directory may be removed and then entered again).
+
+    :param path: The path components of the file.
+    :except OSError: If reading the events failed.
+    :except BackupManifestParseError: If the manifest is invalid.
+    """
+
+    key = tuple(normalise_path_name(c) for c in path)
+    file_depth = len(key) - 1
+    # The current directory's path components as recorded in the manifest, and whether each is an ancestor of the file.
+    directory: list[str] = []
+    directory_matches: list[bool] = [True]
+    located: Optional[LocatedFile] = None
+    for event in events:
+        if isinstance(event, ManifestEnterDirectory):
+            depth = len(directory)
+            directory.append(event.name)
+            directory_matches.append(
+                directory_matches[-1] and depth < file_depth and normalise_path_name(event.name) == key[depth]
+            )
+        elif isinstance(event, ManifestBacktrack):
+            del directory[-event.count :]
+            del directory_matches[-event.count :]
+        elif directory_matches[-1]:
+            depth = len(directory)
+            if isinstance(event, ManifestRemovedDirectory):
+                if depth < file_depth and normalise_path_name(event.name) == key[depth]:
+                    located = LocatedFile(backup, (*directory, event.name, *path[depth + 1 :]), True)
+            elif depth == file_depth and normalise_path_name(event.name) == key[depth]:
+                if isinstance(event, ManifestCopiedFile):
+                    located = LocatedFile(backup, (*directory, event.name), False, event.content_hash)
+                else:
+                    located = LocatedFile(backup, (*directory, event.name), True)
+    return located
@@ -1,4 +1,8 @@
+from .catalog import *
 from .complete_info import *
+from .consolidation import *
+from .journal import *
 from .manifest import *
 from .meta import *
+from .pack import *
 from .start_info import *
@@ -0,0 +1,153 @@
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, NoReturn, Optional, cast
+
+from incremental_backup._utility import StrPath
+
+__all__ = [
+    "BackupCatalog",
+    "BackupCatalogParseError",
+    "deserialise_backup_catalog",
+    "read_backup_catalog_file",
+    "serialise_backup_catalog",
+    "write_backup_catalog_file",
+]
+
+
+@dataclass
+class BackupCatalog:
+    """Index of the backups in a backup target directory, so they can be found and selected without enumerating the
+    directory or reading every backup's metadata.
+
+    Backups are added when they are created, before they are complete, so the catalog lists every backup which may
+    have a manifest."""
+
+    @dataclass(frozen=True)
+    class Entry:
+        name: str
+        """The name of the backup directory."""
+
+        start_time: datetime
+        """See `BackupStartInfo.start_time`."""
+
+        manifest_size: int
+        """The size of the backup manifest file, in bytes. 0 if the backup is not valid."""
+
+        valid: bool
+        """Whether the backup's manifest was written, i.e. the backup can be read. Not valid while the backup is being
+            created, or if it was interrupted."""
+
+    entries: list[Entry] = field(default_factory=list)
+    """Entries for each backup, in order of start time."""
+
+
+def serialise_backup_catalog(value: BackupCatalog, /) -> str:
+    """Writes a backup catalog to a string."""
+
+    json_data = [
+        {
+            "name": entry.name,
+            "start_time": entry.start_time.isoformat(),
+            "manifest_size": entry.manifest_size,
+            "valid": entry.valid,
+        }
+        for entry in value.entries
+    ]
+    return json.dumps(json_data, indent=0, ensure_ascii=False)
+
+
+def write_backup_catalog_file(path: StrPath, value: BackupCatalog, /) -> None:
+    """Writes a backup catalog to file.
+
+    The file is replaced atomically (the new catalog is written to a temporary file first), so readers never see a
+    partially written catalog.
+
+    :except OSError: If the file could not be written to.
+    """
+
+    temp_path = f"{os.fspath(path)}.tmp"
+    with open(temp_path, "w", encoding="utf8") as file:
+        file.write(serialise_backup_catalog(value))
+    os.replace(temp_path, path)
+
+
+def deserialise_backup_catalog(string: str, /) -> BackupCatalog:
+    """Reads a backup catalog from a string.
+
+    :except BackupCatalogParseError: If the string is not a valid backup catalog.
+    """
+
+    def parse_error(reason: str, e: Optional[Exception] = None, /) -> NoReturn:
+        if e is None:
+            raise BackupCatalogParseError(reason)
+        else:
+            raise BackupCatalogParseError(reason) from e
+
+    try:
+        json_data = json.loads(string)
+    except json.JSONDecodeError as e:
+        parse_error(str(e), e)
+
+    if not isinstance(json_data, list):
+        parse_error("Expected a list")
+    json_data = cast(list[Any], json_data)
+
+    catalog = BackupCatalog()
+    for json_entry in json_data:
+        if not isinstance(json_entry, dict):
+            parse_error("Expected list elements to be objects")
+        json_entry = cast(dict[Any, Any], json_entry)
+
+        fields = {"name", "start_time", "manifest_size", "valid"}
+        if set(json_entry.keys()) != fields:
+            parse_error(f"Expected fields {fields}")
+
+        name = json_entry["name"]
+        if not isinstance(name, str):
+            parse_error('Field "name" must be a string')
+
+        try:
+            start_time = datetime.fromisoformat(json_entry["start_time"])
+        except (TypeError, ValueError) as e:
+            parse_error('Field "start_time" must be an ISO-8601 date string', e)
+
+        manifest_size = json_entry["manifest_size"]
+        if not isinstance(manifest_size, int) or isinstance(manifest_size, bool) or manifest_size < 0:
+            parse_error('Field "manifest_size" must be a nonnegative integer')
+
+        valid = json_entry["valid"]
+        if not isinstance(valid, bool):
+            parse_error('Field "valid" must be a boolean')
+
+        catalog.entries.append(BackupCatalog.Entry(name, start_time, manifest_size, valid))
+
+    return catalog
+
+
+def read_backup_catalog_file(path: StrPath, /) -> BackupCatalog:
+    """Reads a backup catalog from file.
+
+    :except OSError: If the file could not be read.
+    :except BackupCatalogParseError: If the file is not a valid backup catalog.
+    """
+
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return deserialise_backup_catalog(file.read())
+    except BackupCatalogParseError as e:
+        raise BackupCatalogParseError(e.reason, str(path)) from e
+
+
+class BackupCatalogParseError(Exception):
+    """Raised when a backup catalog file cannot be parsed due to invalid format."""
+
+    def __init__(self, reason: str, file_path: Optional[str] = None) -> None:
+        if file_path is None:
+            message = f"Failed to parse backup catalog: {reason}"
+        else:
+            message = f'Failed to parse backup catalog file "{file_path}": {reason}'
+        super().__init__(message)
+        self.reason = reason
+        self.file_path = file_path
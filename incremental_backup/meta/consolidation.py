@@ -0,0 +1,115 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, NoReturn, Optional, cast
+
+from incremental_backup._utility import StrPath
+
+__all__ = [
+    "BackupConsolidation",
+    "BackupConsolidationParseError",
+    "deserialise_backup_consolidation",
+    "read_backup_consolidation_file",
+    "serialise_backup_consolidation",
+    "write_backup_consolidation_file",
+]
+
+
+@dataclass(frozen=True)
+class BackupConsolidation:
+    """Records a consolidation of backups in progress, so that it can be finished or undone if interrupted."""
+
+    backup_name: str
+    """The name of the new backup which replaces the consolidated backups."""
+
+    replaced_backup_names: tuple[str, ...]
+    """The names of the backups being consolidated, in chronological order."""
+
+
+def serialise_backup_consolidation(value: BackupConsolidation, /) -> str:
+    """Writes a backup consolidation record to a string."""
+
+    json_data = {"backup": value.backup_name, "replaces": list(value.replaced_backup_names)}
+    return json.dumps(json_data, indent=4, ensure_ascii=False)
+
+
+def write_backup_consolidation_file(path: StrPath, value: BackupConsolidation, /) -> None:
+    """Writes a backup consolidation record to file.
+
+    The file is replaced atomically (the record is written to a temporary file first), so readers never see a partially
+    written record.
+
+    :except OSError: If the file could not be written to.
+    """
+
+    temp_path = f"{os.fspath(path)}.tmp"
+    with open(temp_path, "w", encoding="utf8") as file:
+        file.write(serialise_backup_consolidation(value))
+    os.replace(temp_path, path)
+
+
+def deserialise_backup_consolidation(string: str, /) -> BackupConsolidation:
+    """Reads a backup consolidation record from a string.
+
+    :except BackupConsolidationParseError: If the string is not a valid backup consolidation record.
+    """
+
+    def parse_error(reason: str, e: Optional[Exception] = None, /) -> NoReturn:
+        if e is None:
+            raise BackupConsolidationParseError(reason)
+        else:
+            raise BackupConsolidationParseError(reason) from e
+
+    try:
+        json_data = json.loads(string)
+    except json.JSONDecodeError as e:
+        parse_error(str(e), e)
+
+    if not isinstance(json_data, dict):
+        parse_error("Expected an object")
+    json_data = cast(dict[Any, Any], json_data)
+
+    fields = {"backup", "replaces"}
+    if set(json_data.keys()) != fields:
+        parse_error(f"Expected fields {fields}")
+
+    backup_name = json_data["backup"]
+    # Names are checked like backup directory names, since the record decides which directories are deleted.
+    if not isinstance(backup_name, str) or not backup_name.isalnum():
+        parse_error('Field "backup" must be an alphanumeric string')
+
+    replaced_backup_names = json_data["replaces"]
+    if not isinstance(replaced_backup_names, list) or not all(
+        isinstance(n, str) and n.isalnum() for n in replaced_backup_names
+    ):
+        parse_error('Field "replaces" must be a list of alphanumeric strings')
+    if backup_name in replaced_backup_names:
+        parse_error('Field "replaces" must not contain field "backup"')
+
+    return BackupConsolidation(backup_name, tuple(cast(list[str], replaced_backup_names)))
+
+
+def read_backup_consolidation_file(path: StrPath, /) -> BackupConsolidation:
+    """Reads a backup consolidation record from file.
+
+    :except OSError: If the file could not be read.
+    :except BackupConsolidationParseError: If the file is not a valid backup consolidation record.
+    """
+
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return deserialise_backup_consolidation(file.read())
+    except BackupConsolidationParseError as e:
+        raise BackupConsolidationParseError(e.reason, str(path)) from e
+
+
+class BackupConsolidationParseError(Exception):
+    """Raised when a backup consolidation record file cannot be parsed due to invalid format."""
+
+    def __init__(self, reason: str, file_path: Optional[str] = None) -> None:
+        if file_path is None:
+            message = f"Failed to parse backup consolidation record: {reason}"
+        else:
+            message = f'Failed to parse backup consolidation record file "{file_path}": {reason}'
+        super().__init__(message)
+        self.reason = reason
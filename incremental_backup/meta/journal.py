@@ -0,0 +1,167 @@
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, NoReturn, Optional, Sequence, TextIO
+
+from incremental_backup._utility import StrPath
+
+__all__ = [
+    "BackupJournal",
+    "BackupJournalParseError",
+    "BackupJournalWriter",
+    "deserialise_backup_journal",
+    "read_backup_journal_file",
+    "truncate_backup_journal_file",
+]
+
+
+@dataclass
+class BackupJournal:
+    """Records the progress of a backup which is copying files, so that it can be resumed if interrupted.
+
+    Written as files are copied (see `BackupJournalWriter`), one line per file. Only files copied to the backup data
+    directory or the object store are recorded (not packed files).
+    """
+
+    @dataclass(frozen=True)
+    class Entry:
+        path: tuple[str, ...]
+        """The path components of the file, relative to the backup source directory."""
+
+        last_modified_ns: int
+        """The last modification time of the source file just before it was copied, in nanoseconds since the Unix
+            epoch."""
+
+        size: int
+        """The size of the source file just before it was copied, in bytes."""
+
+        content_hash: Optional[str] = None
+        """The content hash of the file if it was stored in the object store, otherwise `None`."""
+
+    entries: list[Entry] = field(default_factory=list)
+    """Entries for each copied file, in the order they were copied. A file may have multiple entries (if the backup was
+        resumed and the file was copied again), in which case the last is current."""
+
+
+class BackupJournalWriter:
+    """Appends entries to a backup journal file as files are copied.
+
+    Entries are buffered and flushed to the file periodically, so the journal costs little, at the expense of losing
+    the last few entries if the backup is interrupted.
+    """
+
+    DEFAULT_FLUSH_INTERVAL = 5.0
+    """Default maximum time between flushing entries to the file, in seconds."""
+
+    def __init__(self, stream: TextIO, /, flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> None:
+        self._stream = stream
+        self._flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+
+    def add_file(
+        self, path: Sequence[str], last_modified_ns: int, size: int, content_hash: Optional[str] = None, /
+    ) -> None:
+        """Records that a file was copied. See `BackupJournal.Entry`.
+
+        :except OSError: If writing to the stream failed.
+        """
+
+        self._stream.write(json.dumps(["/".join(path), last_modified_ns, size, content_hash], ensure_ascii=False))
+        self._stream.write("\n")
+        now = time.monotonic()
+        if now - self._last_flush >= self._flush_interval:
+            self._stream.flush()
+            self._last_flush = now
+
+
+def deserialise_backup_journal(string: str, /) -> BackupJournal:
+    """Reads a backup journal from a string.
+
+    An incomplete last line (not terminated by a newline) is ignored, since it is expected if the backup was
+    interrupted while writing it.
+
+    :except BackupJournalParseError: If the string is not a valid backup journal.
+    """
+
+    def parse_error(reason: str, e: Optional[Exception] = None, /) -> NoReturn:
+        if e is None:
+            raise BackupJournalParseError(reason)
+        else:
+            raise BackupJournalParseError(reason) from e
+
+    def is_natural(value: Any, /) -> bool:
+        return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+    journal = BackupJournal()
+    lines = string.split("\n")
+    # The last element is empty if the string ends with a newline, otherwise it's an incomplete line.
+    for line_num, line in enumerate(lines[:-1], 1):
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError as e:
+            parse_error(f"Line {line_num}: {e}", e)
+        if not (
+            isinstance(entry, list)
+            and len(entry) == 4
+            and isinstance(entry[0], str)
+            and entry[0]
+            and isinstance(entry[1], int)
+            and not isinstance(entry[1], bool)
+            and is_natural(entry[2])
+            and (entry[3] is None or isinstance(entry[3], str))
+        ):
+            parse_error(f"Line {line_num}: expected [path, last modified, size, content hash]")
+        path, last_modified_ns, size, content_hash = entry
+        journal.entries.append(BackupJournal.Entry(tuple(path.split("/")), last_modified_ns, size, content_hash))
+    return journal
+
+
+def read_backup_journal_file(path: StrPath, /) -> BackupJournal:
+    """Reads a backup journal from file. See `deserialise_backup_journal()`.
+
+    :except OSError: If the file could not be read.
+    :except BackupJournalParseError: If the file is not a valid backup journal.
+    """
+
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return deserialise_backup_journal(file.read())
+    except BackupJournalParseError as e:
+        raise BackupJournalParseError(e.reason, str(path)) from e
+
+
+def truncate_backup_journal_file(path: StrPath, /) -> None:
+    """Removes an incomplete last line from a backup journal file (see `deserialise_backup_journal()`), so that more
+    entries can be appended to it.
+
+    :except OSError: If the file could not be read or written to.
+    """
+
+    with open(path, "rb+") as file:
+        size = file.seek(0, os.SEEK_END)
+        # Read backwards, to avoid reading the whole file.
+        position = size
+        while position > 0:
+            chunk_start = max(position - 4096, 0)
+            file.seek(chunk_start)
+            newline = file.read(position - chunk_start).rfind(b"\n")
+            if newline >= 0:
+                position = chunk_start + newline + 1
+                break
+            position = chunk_start
+        if position < size:
+            file.truncate(position)
+
+
+class BackupJournalParseError(Exception):
+    """Raised when a backup journal file cannot be parsed due to invalid format."""
+
+    def __init__(self, reason: str, file_path: Optional[str] = None) -> None:
+        if file_path is None:
+            message = f"Failed to parse backup journal: {reason}"
+        else:
+            message = f'Failed to parse backup journal file "{file_path}": {reason}'
+        super().__init__(message)
+        self.reason = reason
+        self.file_path = file_path
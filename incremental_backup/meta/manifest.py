@@ -1,13 +1,25 @@
+import io
 import json
+import sys
 from dataclasses import dataclass, field
-from typing import Any, Iterator, NoReturn, Optional, Union, cast
+from typing import Any, Callable, Generator, Iterable, Iterator, NoReturn, Optional, Sequence, TextIO, Union, cast
 
-from incremental_backup._utility import StrPath, path_name_equal
+from incremental_backup._utility import StrPath, add_slots, normalise_path_name
+from incremental_backup.path_filter import PathFilter
 
 __all__ = [
     "BackupManifest",
+    "BackupManifestEvent",
     "BackupManifestParseError",
+    "BackupManifestWriter",
     "deserialise_backup_manifest",
+    "iter_backup_manifest",
+    "iter_backup_manifest_file",
+    "ManifestBacktrack",
+    "ManifestCopiedFile",
+    "ManifestEnterDirectory",
+    "ManifestRemovedDirectory",
+    "ManifestRemovedFile",
     "read_backup_manifest_file",
     "serialise_backup_manifest",
     "write_backup_manifest_file",
@@ -20,6 +32,7 @@ class BackupManifest:
     The data is represented in a tree structure like a filesystem.
     """
 
+    @add_slots
     @dataclass
     class Directory:
         name: str
@@ -28,53 +41,116 @@ class BackupManifest:
         removed_directories: list[str] = field(default_factory=list)
         subdirectories: list["BackupManifest.Directory"] = field(default_factory=list)
 
+        copied_file_hashes: list[str] = field(default_factory=list)
+        """The content hashes of `copied_files`, in the same order, if their data was stored in the object store of
+            the target directory (see `store_file()`). Empty if their data was copied to the backup data directory."""
+
     root: Directory = field(default_factory=lambda: BackupManifest.Directory(""))
     """The root of the manifest tree. This object represents the backup source directory."""
 
 
-def serialise_backup_manifest(value: BackupManifest, /) -> str:
-    """Writes a backup manifest to a string."""
+class BackupManifestWriter:
+    """Writes a backup manifest to a text stream incrementally, as the directories of a depth-first search are visited.
+    Only the search depth is kept in memory, rather than the whole manifest.
 
-    def search(manifest: BackupManifest, /) -> Iterator[Optional[BackupManifest.Directory]]:
-        stack: list[Optional[BackupManifest.Directory]] = [manifest.root]
-        while stack:
-            node = stack.pop()
-            yield node
-            if node is not None:
-                stack.append(None)
-                stack.extend(reversed(node.subdirectories))
-
-    def compress_backtracks(
-        nodes: Iterator[Optional[BackupManifest.Directory]], /
-    ) -> Iterator[Union[BackupManifest.Directory, int]]:
-        backtrack_count = 0
-        for node in nodes:
-            if node is None:
-                backtrack_count += 1
-            else:
-                if backtrack_count > 0:
-                    yield backtrack_count
-                    backtrack_count = 0
-                yield node
-        # Also trims trailing backtracks since they are not required.
-
-    def node_to_object(node: Union[BackupManifest.Directory, int], /) -> Union[dict[str, Union[str, list[str]]], str]:
-        if isinstance(node, int):
-            return f"^{node}"
+    The first directory entered is the backup source directory. Call `finish()` after the search to complete the
+    manifest.
+    """
+
+    def __init__(self, stream: TextIO, /) -> None:
+        self._stream = stream
+        self._entry_count = 0
+        self._depth = 0
+        self._pending_backtracks = 0
+
+    def enter_directory(
+        self,
+        name: str,
+        copied_files: Sequence[str] = (),
+        removed_files: Sequence[str] = (),
+        removed_directories: Sequence[str] = (),
+        copied_file_hashes: Sequence[str] = (),
+    ) -> None:
+        """Writes an entry for entering a subdirectory of the current directory (or the backup source directory, if
+        this is the first call).
+
+        :param copied_file_hashes: See `BackupManifest.Directory.copied_file_hashes`.
+        :except ValueError: If the backup source directory has already been exited, or `copied_file_hashes` is
+            nonempty and not the same length as `copied_files`.
+        :except OSError: If writing to the stream failed.
+        """
+
+        if self._entry_count > 0 and self._depth == 0:
+            raise ValueError("Cannot enter a directory after exiting the backup source directory")
+        if copied_file_hashes and len(copied_file_hashes) != len(copied_files):
+            raise ValueError("Must have one content hash per copied file")
+
+        if self._pending_backtracks > 0:
+            self._write_entry(f"^{self._pending_backtracks}")
+            self._pending_backtracks = 0
+
+        entry: dict[str, Union[str, Sequence[str]]] = {"n": name}
+        if copied_files:
+            entry["cf"] = copied_files
+        if copied_file_hashes:
+            entry["ch"] = copied_file_hashes
+        if removed_files:
+            entry["rf"] = removed_files
+        if removed_directories:
+            entry["rd"] = removed_directories
+        self._write_entry(entry)
+        self._depth += 1
+
+    def exit_directory(self) -> None:
+        """Moves back up to the parent of the current directory.
+
+        :except ValueError: If there is no directory to exit.
+        """
+
+        if self._depth == 0:
+            raise ValueError("No directory to exit")
+        self._depth -= 1
+        # Backtracks are written lazily, so consecutive ones can be combined and trailing ones trimmed.
+        self._pending_backtracks += 1
+
+    def finish(self) -> None:
+        """Completes the manifest. The writer must not be used after this.
+
+        :except OSError: If writing to the stream failed.
+        """
+
+        if self._entry_count == 0:
+            # Always have an entry for the backup source directory, even if it's empty.
+            self.enter_directory("")
+        self._stream.write("\n]")
+
+    def _write_entry(self, entry: Union[dict[str, Union[str, Sequence[str]]], str], /) -> None:
+        self._stream.write(",\n" if self._entry_count > 0 else "[\n")
+        self._stream.write(json.dumps(entry, indent=0, ensure_ascii=False))
+        self._entry_count += 1
+
+
+def _write_backup_manifest(value: BackupManifest, writer: BackupManifestWriter, /) -> None:
+    search_stack: list[Optional[BackupManifest.Directory]] = [value.root]
+    while search_stack:
+        node = search_stack.pop()
+        if node is None:
+            writer.exit_directory()
         else:
-            obj: dict[str, Union[str, list[str]]] = {"n": node.name}
-            if node.copied_files:
-                obj["cf"] = node.copied_files
-            if node.removed_files:
-                obj["rf"] = node.removed_files
-            if node.removed_directories:
-                obj["rd"] = node.removed_directories
-            return obj
+            writer.enter_directory(
+                node.name, node.copied_files, node.removed_files, node.removed_directories, node.copied_file_hashes
+            )
+            search_stack.append(None)
+            search_stack.extend(reversed(node.subdirectories))
+    writer.finish()
 
-    nodes = list(compress_backtracks(search(value)))
-    json_data = [node_to_object(node) for node in nodes]
 
-    return json.dumps(json_data, indent=0, ensure_ascii=False)
+def serialise_backup_manifest(value: BackupManifest, /) -> str:
+    """Writes a backup manifest to a string."""
+
+    stream = io.StringIO()
+    _write_backup_manifest(value, BackupManifestWriter(stream))
+    return stream.getvalue()
 
 
 def write_backup_manifest_file(path: StrPath, value: BackupManifest, /) -> None:
@@ -84,13 +160,72 @@ def write_backup_manifest_file(path: StrPath, value: BackupManifest, /) -> None:
     """
 
     with open(path, "w", encoding="utf8") as file:
-        file.write(serialise_backup_manifest(value))
+        _write_backup_manifest(value, BackupManifestWriter(file))
 
 
-def deserialise_backup_manifest(string: str, /) -> BackupManifest:
-    """Reads a backup manifest from a string.
+@dataclass(frozen=True)
+class ManifestEnterDirectory:
+    """Manifest event: entered a subdirectory of the current directory."""
 
-    :except BackupManifestParseError: If the string is not a valid backup manifest.
+    name: str
+
+
+@dataclass(frozen=True)
+class ManifestCopiedFile:
+    """Manifest event: a file in the current directory was copied."""
+
+    name: str
+
+    content_hash: Optional[str] = None
+    """See `BackupManifest.Directory.copied_file_hashes`. `None` if the file's data is in the backup data directory."""
+
+
+@dataclass(frozen=True)
+class ManifestRemovedFile:
+    """Manifest event: a file in the current directory was removed."""
+
+    name: str
+
+
+@dataclass(frozen=True)
+class ManifestRemovedDirectory:
+    """Manifest event: a subdirectory of the current directory was removed."""
+
+    name: str
+
+
+@dataclass(frozen=True)
+class ManifestBacktrack:
+    """Manifest event: moved back up `count` levels of directories."""
+
+    count: int
+
+
+BackupManifestEvent = Union[
+    ManifestEnterDirectory, ManifestCopiedFile, ManifestRemovedFile, ManifestRemovedDirectory, ManifestBacktrack
+]
+"""An event from reading a manifest incrementally. See `iter_backup_manifest()`."""
+
+
+_MANIFEST_READ_SIZE = 2**16
+"""Number of characters to read from a manifest stream at a time."""
+
+
+def iter_backup_manifest(stream: TextIO, /, path_filter: Optional[PathFilter] = None) -> Iterator[BackupManifestEvent]:
+    """Reads a backup manifest incrementally from a stream, as a sequence of events.
+
+    The current directory starts as the backup source directory. For each directory, the copied files, removed files
+    and removed directories are given, then its subdirectories are entered. A directory may be entered more than once.
+
+    Only one manifest entry at a time is decoded and held in memory.
+
+    :param path_filter: If not `None`, only events for the files selected by this filter and the directories which may
+        contain them are produced. The entries of directories containing nothing selected are not validated or
+        converted to events, only counted to keep track of the current directory.
+
+    :except BackupManifestParseError: If the stream is not a valid backup manifest. Events before the invalid data
+        will have already been produced.
+    :except OSError: If reading from the stream failed.
     """
 
     def parse_error(reason: str, e: Optional[Exception] = None, /) -> NoReturn:
@@ -99,7 +234,9 @@ def deserialise_backup_manifest(string: str, /) -> BackupManifest:
         else:
             raise BackupManifestParseError(reason) from e
 
-    def parse_directory_entry(entry: dict[Any, Any], entry_num: int, /) -> tuple[str, list[str], list[str], list[str]]:
+    def parse_directory_entry(
+        entry: dict[Any, Any], entry_num: int, /
+    ) -> tuple[str, list[str], list[str], list[str], list[Optional[str]]]:
         try:
             name = entry.pop("n")
         except KeyError as e:
@@ -116,6 +253,17 @@ def deserialise_backup_manifest(string: str, /) -> BackupManifest:
             parse_error(f'Entry {entry_num}: field "cf" must be a list of strings')
         copied_files = cast(list[str], copied_files)
 
+        copied_file_hashes = entry.pop("ch", None)
+        if copied_file_hashes is None:
+            copied_file_hashes = [None] * len(copied_files)
+        elif (
+            not isinstance(copied_file_hashes, list)
+            or not all(isinstance(h, str) for h in copied_file_hashes)
+            or len(copied_file_hashes) != len(copied_files)
+        ):
+            parse_error(f'Entry {entry_num}: field "ch" must be a list of strings, one for each of field "cf"')
+        copied_file_hashes = cast(list[Optional[str]], copied_file_hashes)
+
         removed_files = entry.pop("rf", [])
         if not isinstance(removed_files, list) or not all(isinstance(f, str) for f in removed_files):
             parse_error(f'Entry {entry_num}: field "rf" must be a list of strings')
@@ -129,7 +277,7 @@ def deserialise_backup_manifest(string: str, /) -> BackupManifest:
         if extra_fields := list(entry.keys()):
             parse_error(f"Entry {entry_num}: invalid fields {extra_fields}")
 
-        return name, copied_files, removed_files, removed_directories
+        return name, copied_files, removed_files, removed_directories, copied_file_hashes
 
     def parse_backtrack(entry: str, entry_num: int, /) -> int:
         if not entry.startswith("^"):
@@ -144,66 +292,74 @@ def deserialise_backup_manifest(string: str, /) -> BackupManifest:
                 return backtracks
         parse_error(f"Entry {entry_num}: invalid backtrack amount, must be positive integer")
 
-    try:
-        json_data = json.loads(string)
-    except json.JSONDecodeError as e:
-        parse_error(str(e), e)
-
-    if not isinstance(json_data, list):
-        parse_error("Expected a list")
-    json_data = cast(list[Any], json_data)
-
-    backup_manifest = BackupManifest()
-    directory_stack: list[BackupManifest.Directory] = []
-    for entry_num, entry in enumerate(json_data, 1):
+    # Filter of each directory from the source directory to the current directory, or `None` for skipped directories.
+    # Skipped directories are always at the end, since everything in them is skipped.
+    filter_stack: list[Optional[PathFilter]] = [path_filter]
+    for entry_num, entry in enumerate(_iter_json_list(stream, parse_error), 1):
         if isinstance(entry, str):
             backtracks = parse_backtrack(entry, entry_num)
 
             # Backtrack to parent directory.
-            if len(directory_stack) <= backtracks:
+            if len(filter_stack) <= backtracks:
                 parse_error(f"Entry {entry_num}: cannot backtrack past backup source directory")
-            del directory_stack[-backtracks:]
+            if path_filter is None:
+                yield ManifestBacktrack(backtracks)
+            else:
+                skipped = 0
+                while skipped < backtracks and filter_stack[-1 - skipped] is None:
+                    skipped += 1
+                if backtracks > skipped:
+                    yield ManifestBacktrack(backtracks - skipped)
+            del filter_stack[-backtracks:]
         elif isinstance(entry, dict):
-            entry = cast(dict[Any, Any], entry)
             # Directory entry.
 
-            name, copied_files, removed_files, removed_directories = parse_directory_entry(entry, entry_num)
-
-            if entry_num == 1:
-                # Root directory. Unfortunately we need to handle this case differently, a bit inelegant...
-                directory = backup_manifest.root
-                directory.copied_files = copied_files
-                directory.removed_files = removed_files
-                directory.removed_directories = removed_directories
-            else:
-                # Not root directory.
-
-                # We explicitly allow re-entering a directory. It shouldn't occur in practice, though.
-                directory = next(
-                    (d for d in directory_stack[-1].subdirectories if path_name_equal(d.name, name)),
-                    None,
-                )
-                if directory is None:
-                    # We haven't entered this directory yet, need to create it.
-                    directory = BackupManifest.Directory(name, copied_files, removed_files, removed_directories)
-                    directory_stack[-1].subdirectories.append(directory)
+            if entry_num > 1 and path_filter is not None and filter_stack[-1] is None:
+                # Within a skipped directory.
+                filter_stack.append(None)
+                continue
+
+            name, copied_files, removed_files, removed_directories, copied_file_hashes = parse_directory_entry(
+                cast(dict[Any, Any], entry), entry_num
+            )
+            directory_filter = filter_stack[-1]
+            if entry_num > 1:
+                # The first entry is the source directory, which is already the current directory.
+                if directory_filter is not None:
+                    directory_filter = directory_filter.enter_directory(name)
+                    filter_stack.append(directory_filter)
+                    if directory_filter is None:
+                        continue
                 else:
-                    # Already entered this directory, need to update it.
-
-                    # Technically we should check if these have already been added, but I don't think it will cause any
-                    # issues, and checking would cost performance.
-                    directory.copied_files.extend(copied_files)
-                    directory.removed_files.extend(removed_files)
-                    directory.removed_directories.extend(removed_directories)
-            directory_stack.append(directory)
+                    filter_stack.append(None)
+                # Names are kept in backup sums for every backed up file, and repeat a lot across directories, so share
+                # the strings.
+                yield ManifestEnterDirectory(sys.intern(name))
+            if directory_filter is None or directory_filter.includes_all:
+                for file, content_hash in zip(copied_files, copied_file_hashes):
+                    yield ManifestCopiedFile(sys.intern(file), content_hash)
+                for file in removed_files:
+                    yield ManifestRemovedFile(file)
+                for directory in removed_directories:
+                    yield ManifestRemovedDirectory(directory)
+            else:
+                for file, content_hash in zip(copied_files, copied_file_hashes):
+                    if directory_filter.includes_file(file):
+                        yield ManifestCopiedFile(sys.intern(file), content_hash)
+                for file in removed_files:
+                    if directory_filter.includes_file(file):
+                        yield ManifestRemovedFile(file)
+                for directory in removed_directories:
+                    if directory_filter.enter_directory(directory) is not None:
+                        yield ManifestRemovedDirectory(directory)
         else:
             parse_error(f"Entry {entry_num}: invalid value, expected object or string")
 
-    return backup_manifest
 
-
-def read_backup_manifest_file(path: StrPath, /) -> BackupManifest:
-    """Reads a backup manifest from file.
+def iter_backup_manifest_file(
+    path: StrPath, /, path_filter: Optional[PathFilter] = None
+) -> Generator[BackupManifestEvent, None, None]:
+    """Reads a backup manifest incrementally from file. See `iter_backup_manifest()`.
 
     :except OSError: If the file could not be read.
     :except BackupManifestParseError: If the file is not a valid backup manifest.
@@ -211,12 +367,128 @@ def read_backup_manifest_file(path: StrPath, /) -> BackupManifest:
 
     try:
         with open(path, "r", encoding="utf8") as file:
-            return deserialise_backup_manifest(file.read())
+            yield from iter_backup_manifest(file, path_filter)
     except BackupManifestParseError as e:
-        # TODO: may be nicer to raise from the cause of e
         raise BackupManifestParseError(e.reason, str(path)) from e
 
 
+def _iter_json_list(stream: TextIO, parse_error: Callable[[str], NoReturn], /) -> Iterator[Any]:
+    """Decodes a JSON list from a stream one item at a time, reading only as much of the stream as needed."""
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    end_of_stream = False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, end_of_stream
+        if end_of_stream:
+            return False
+        # Read at least as much as is buffered, so decoding a large item takes linear time overall.
+        chunk = stream.read(max(_MANIFEST_READ_SIZE, len(buffer) - position))
+        if chunk:
+            buffer = buffer[position:] + chunk
+            position = 0
+        else:
+            end_of_stream = True
+        return bool(chunk)
+
+    def next_token() -> str:
+        """Skips whitespace and returns the next character without consuming it ("" at end of stream)."""
+
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\n\r":
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if not read_more():
+                return ""
+
+    if next_token() != "[":
+        parse_error("Expected a list")
+    position += 1
+
+    first = True
+    while True:
+        token = next_token()
+        if token == "]":
+            position += 1
+            break
+        if not first:
+            if token != ",":
+                parse_error(f"Expected ',' or ']' at character {position}")
+            position += 1
+            next_token()
+        first = False
+
+        while True:
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as e:
+                # Might just be that the item is incomplete in the buffer.
+                if not read_more():
+                    parse_error(str(e), e)
+            else:
+                break
+        yield item
+
+    if next_token() != "":
+        parse_error("Extra data after list")
+
+
+def deserialise_backup_manifest(string: str, /) -> BackupManifest:
+    """Reads a backup manifest from a string.
+
+    :except BackupManifestParseError: If the string is not a valid backup manifest.
+    """
+
+    return _build_backup_manifest(iter_backup_manifest(io.StringIO(string)))
+
+
+def read_backup_manifest_file(path: StrPath, /) -> BackupManifest:
+    """Reads a backup manifest from file.
+
+    :except OSError: If the file could not be read.
+    :except BackupManifestParseError: If the file is not a valid backup manifest.
+    """
+
+    return _build_backup_manifest(iter_backup_manifest_file(path))
+
+
+def _build_backup_manifest(events: Iterable[BackupManifestEvent], /) -> BackupManifest:
+    """Constructs a backup manifest tree from the events of `iter_backup_manifest()`."""
+
+    backup_manifest = BackupManifest()
+    directory_stack = [backup_manifest.root]
+    # Subdirectories of each directory by normalised name, to quickly detect re-entering a directory.
+    subdirectory_indexes: dict[int, dict[str, BackupManifest.Directory]] = {}
+    for event in events:
+        if isinstance(event, ManifestCopiedFile):
+            directory_stack[-1].copied_files.append(event.name)
+            if event.content_hash is not None:
+                directory_stack[-1].copied_file_hashes.append(event.content_hash)
+        elif isinstance(event, ManifestRemovedFile):
+            directory_stack[-1].removed_files.append(event.name)
+        elif isinstance(event, ManifestRemovedDirectory):
+            directory_stack[-1].removed_directories.append(event.name)
+        elif isinstance(event, ManifestEnterDirectory):
+            # We explicitly allow re-entering a directory. It shouldn't occur in practice, though.
+            # Technically we should check if the re-entered directory's items have already been added, but I don't
+            # think it will cause any issues, and checking would cost performance.
+            parent_subdirectories = subdirectory_indexes.setdefault(id(directory_stack[-1]), {})
+            directory = parent_subdirectories.get(normalise_path_name(event.name))
+            if directory is None:
+                # We haven't entered this directory yet, need to create it.
+                directory = BackupManifest.Directory(event.name)
+                directory_stack[-1].subdirectories.append(directory)
+                parent_subdirectories[normalise_path_name(event.name)] = directory
+            directory_stack.append(directory)
+        else:
+            del directory_stack[-event.count :]
+    return backup_manifest
+
+
 class BackupManifestParseError(Exception):
     """Raised when a backup manifest file cannot be parsed due to invalid format."""
 
@@ -228,3 +500,7 @@ class BackupManifestParseError(Exception):
         super().__init__(message)
         self.reason = reason
         self.file_path = file_path
+
+    def __reduce__(self) -> tuple[type, tuple[str, Optional[str]]]:
+        # So the exception can be pickled (e.g. to return from another process).
+        return type(self), (self.reason, self.file_path)
@@ -1,17 +1,28 @@
+import errno
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
 from random import Random
-from typing import Callable, Union
+from typing import Callable, Iterable, Optional, Sequence, Union, cast
 
 from incremental_backup._utility import StrPath
+from incremental_backup.meta.catalog import (
+    BackupCatalog,
+    BackupCatalogParseError,
+    read_backup_catalog_file,
+    write_backup_catalog_file,
+)
 from incremental_backup.meta.manifest import (
     BackupManifest,
     BackupManifestParseError,
+    deserialise_backup_manifest,
     read_backup_manifest_file,
 )
 from incremental_backup.meta.start_info import (
     BackupStartInfo,
     BackupStartInfoParseError,
+    deserialise_backup_start_info,
     read_backup_start_info_file,
 )
 
@@ -20,16 +31,25 @@ __all__ = [
     "BACKUP_NAME_LENGTH",
     "BackupDirectoryCreationError",
     "BackupMetadata",
+    "CATALOG_FILENAME",
     "COMPLETE_INFO_FILENAME",
+    "CONSOLIDATION_FILENAME",
     "create_new_backup_directory",
     "DATA_DIRECTORY_NAME",
     "generate_backup_name",
     "check_if_probably_backup",
+    "JOURNAL_FILENAME",
     "MANIFEST_FILENAME",
+    "OBJECTS_DIRECTORY_NAME",
+    "PACK_INDEX_FILENAME",
+    "PACKS_DIRECTORY_NAME",
+    "read_backup_catalog",
     "read_backup_metadata",
     "read_backups",
     "ReadBackupsCallbacks",
     "START_INFO_FILENAME",
+    "SUM_CHECKPOINT_FILENAME",
+    "update_backup_catalog",
 ]
 
 
@@ -42,9 +62,31 @@ START_INFO_FILENAME = "start.json"
 COMPLETE_INFO_FILENAME = "completion.json"
 """The name of the backup completion information file within a backup directory."""
 
+SUM_CHECKPOINT_FILENAME = "sum.json"
+"""The name of the backup sum checkpoint file within a backup directory."""
+
+CATALOG_FILENAME = "catalog.json"
+"""The name of the backup catalog file within a backup target directory."""
+
+CONSOLIDATION_FILENAME = "consolidation.json"
+"""The name of the backup consolidation record file within a backup target directory, which exists while backups are
+    being consolidated."""
+
+JOURNAL_FILENAME = "journal.jsonl"
+"""The name of the backup journal file within a backup directory, which exists while the backup is copying files."""
+
 DATA_DIRECTORY_NAME = "data"
 """The name of the backup data directory within a backup directory."""
 
+PACKS_DIRECTORY_NAME = "packs"
+"""The name of the directory containing the pack files within a backup directory."""
+
+PACK_INDEX_FILENAME = "index.json"
+"""The name of the backup pack index file within the packs directory of a backup."""
+
+OBJECTS_DIRECTORY_NAME = "objects"
+"""The name of the content-addressed object store directory within a backup target directory."""
+
 
 def check_if_probably_backup(directory: StrPath, /) -> bool:
     """Checks if a directory is likely to be a backup directory.
@@ -73,23 +115,71 @@ def check_if_probably_backup(directory: StrPath, /) -> bool:
     )
 
 
-@dataclass(frozen=True)
 class BackupMetadata:
-    """All useful metadata for a backup."""
+    """All useful metadata for a backup.
+
+    The manifest may be loaded lazily, since it can be large and is often not needed (e.g. for backups which are
+    excluded by time, or included in a backup sum checkpoint). In that case it is read when `manifest` is first
+    accessed.
+    """
 
-    name: str
-    start_info: BackupStartInfo
-    manifest: BackupManifest
+    def __init__(
+        self, name: str, start_info: BackupStartInfo, manifest: Union[BackupManifest, Callable[[], BackupManifest]]
+    ) -> None:
+        """
+        :param manifest: The backup manifest, or a function which loads it.
+        """
+
+        self.name = name
+        self.start_info = start_info
+        self._manifest: Optional[BackupManifest]
+        self._load_manifest: Optional[Callable[[], BackupManifest]]
+        if callable(manifest):
+            self._manifest = None
+            self._load_manifest = manifest
+        else:
+            self._manifest = manifest
+            self._load_manifest = None
 
     # Backup completion information is not here because it is currently not read by the application.
 
+    @property
+    def manifest(self) -> BackupManifest:
+        """The backup manifest. Loaded on first access, if it was not provided upfront.
+
+        :except OSError: If the manifest file could not be read. (Loading is attempted again on the next access.)
+        :except BackupManifestParseError: If the manifest file could not be parsed.
+        """
+
+        if self._load_manifest is not None:
+            self._manifest = self._load_manifest()
+            self._load_manifest = None
+        return cast(BackupManifest, self._manifest)
+
+    @property
+    def is_manifest_loaded(self) -> bool:
+        """Indicates if accessing `manifest` will not read the manifest file."""
+
+        return self._load_manifest is None
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, BackupMetadata):
+            return NotImplemented
+        return (self.name, self.start_info, self.manifest) == (other.name, other.start_info, other.manifest)
+
+    def __repr__(self) -> str:
+        manifest = repr(self._manifest) if self.is_manifest_loaded else "<not loaded>"
+        return f"BackupMetadata(name={self.name!r}, start_info={self.start_info!r}, manifest={manifest})"
+
 
 # TODO: (breaking) should refactor and simplify exceptions. Don't need so fine grained.
 
 
-def read_backup_metadata(backup_directory: StrPath, /) -> BackupMetadata:
+def read_backup_metadata(backup_directory: StrPath, /, lazy_manifest: bool = False) -> BackupMetadata:
     """Reads the metadata of a backup, i.e. the name, start information, and manifest.
 
+    :param lazy_manifest: If true, the manifest file is not read until the manifest is accessed (see
+        `BackupMetadata.manifest`), only checked for existence.
     :except OSError: If a metadata file could not be read.
     :except BackupStartInfoParseError: If the backup start information file could not be parsed.
     :except BackupManifestParseError: If the backup manifest file could not be parsed.
@@ -98,7 +188,14 @@ def read_backup_metadata(backup_directory: StrPath, /) -> BackupMetadata:
     backup_directory = Path(backup_directory)
     name = backup_directory.name
     start_info = read_backup_start_info_file(backup_directory / START_INFO_FILENAME)
-    manifest = read_backup_manifest_file(backup_directory / MANIFEST_FILENAME)
+    manifest_path = backup_directory / MANIFEST_FILENAME
+    manifest: Union[BackupManifest, Callable[[], BackupManifest]]
+    if lazy_manifest:
+        if not manifest_path.is_file():
+            raise FileNotFoundError(errno.ENOENT, "Backup manifest file not found", str(manifest_path))
+        manifest = partial(read_backup_manifest_file, manifest_path)
+    else:
+        manifest = read_backup_manifest_file(manifest_path)
     return BackupMetadata(name, start_info, manifest)
 
 
@@ -115,47 +212,224 @@ class ReadBackupsCallbacks:
     """Called when reading the metadata of a backup fails.
         First argument is the path of the backup, second argument is the raised exception."""
 
+    on_read_catalog_error: Callable[[Path, Union[OSError, BackupCatalogParseError]], None] = lambda path, error: None
+    """Called when reading the backup catalog file fails (excluding if it doesn't exist). The target directory is
+        enumerated instead.
+        First argument is the path of the catalog file, second argument is the raised exception."""
 
-def read_backups(
+
+def read_backup_catalog(
     directory: StrPath, /, callbacks: ReadBackupsCallbacks = ReadBackupsCallbacks()
+) -> Optional[BackupCatalog]:
+    """Reads the backup catalog of a backup target directory.
+
+    :return: The catalog, or `None` if it doesn't exist or could not be read.
+    """
+
+    path = Path(directory, CATALOG_FILENAME)
+    try:
+        return read_backup_catalog_file(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, BackupCatalogParseError) as e:
+        (callbacks.on_read_catalog_error)(path, e)
+        return None
+
+
+def read_backups(
+    directory: StrPath,
+    /,
+    callbacks: ReadBackupsCallbacks = ReadBackupsCallbacks(),
+    workers: int = 1,
+    parse_processes: int = 0,
+    catalog_filter: Optional[Callable[[Sequence[BackupCatalog.Entry]], Iterable[BackupCatalog.Entry]]] = None,
+    lazy_manifests: bool = False,
 ) -> list[BackupMetadata]:
     """Reads all backups present in a directory.
 
     If a backup is not valid or cannot be read, it is skipped.
 
+    If the directory contains a backup catalog (see `update_backup_catalog()`), the backups listed in it are read
+    instead of enumerating the directory. Backups are added to the catalog when created, and marked valid once
+    complete. Backups not marked valid are still read, since they may have completed after the catalog was last
+    updated (e.g. if the process was interrupted in between), but are skipped silently if they can't be read.
+
+    :param workers: Number of threads used to read backup metadata. If greater than 1, backups are read concurrently.
+        The results and the callbacks (which are always invoked from the calling thread, in the same order) do not
+        depend on this value.
+    :param parse_processes: If greater than 0, metadata files are parsed in a pool of this many processes (after being
+        read by the threads), which can help if parsing is CPU bound. Not used if `lazy_manifests` is true.
+    :param catalog_filter: If not `None` and the catalog is used, only the backups of the catalog entries returned by
+        this function are read. Allows selecting backups without reading their metadata. Note that all backups are
+        read if there is no catalog.
+    :param lazy_manifests: If true, backups' manifests are only read when accessed. See `read_backup_metadata()`.
+        Errors reading a manifest are then raised by `BackupMetadata.manifest`, rather than reported via `callbacks`.
+    :except ValueError: If `workers` is less than 1 or `parse_processes` is negative.
     :except OSError: If the directory cannot be accessed.
     """
 
-    directory = Path(directory)
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if parse_processes < 0:
+        raise ValueError("parse_processes must not be negative")
 
-    entries = list(directory.iterdir())
+    directory = Path(directory)
 
-    backups: list[BackupMetadata] = []
-    for entry in entries:
-        # Try to just read the backup metadata first, because check_if_probably_backup() is quite slow. That way we only
-        # pay the cost of check_if_probably_backup() if a directory is not backup, which is unlikely to occur in typical
-        # usage.
-        try:
-            metadata = read_backup_metadata(entry)
-        except (
-            OSError,
-            BackupStartInfoParseError,
-            BackupManifestParseError,
-        ) as read_error:
-            # Could be: a valid backup and a filesystem error occurred, or a backup with malformed metadata, or
-            # something that's not a backup at all.
-            try:
-                if check_if_probably_backup(entry):
-                    (callbacks.on_read_metadata_error)(entry, read_error)
-                # If the entry doesn't look like a backup at all then just ignore it.
-            except OSError as query_error:
-                (callbacks.on_query_entry_error)(entry, query_error)
+    catalog = read_backup_catalog(directory, callbacks)
+    # Names of backups which the catalog lists as not valid, i.e. in progress or interrupted.
+    incomplete_names: set[str] = set()
+    if catalog is None:
+        entries = list(directory.iterdir())
+    else:
+        catalog_entries = catalog.entries if catalog_filter is None else catalog_filter(tuple(catalog.entries))
+        entries = [directory / entry.name for entry in catalog_entries]
+        incomplete_names = {entry.name for entry in catalog_entries if not entry.valid}
+
+    process_executor = ProcessPoolExecutor(parse_processes) if parse_processes > 0 and not lazy_manifests else None
+    # Need a thread to wait for each process, otherwise reading files and parsing would not overlap.
+    thread_executor = ThreadPoolExecutor(workers) if workers > 1 or process_executor is not None else None
+    try:
+        if thread_executor is None:
+            # Defer reading until the result is needed, so backups are read strictly one at a time.
+            metadatas = [partial(read_backup_metadata, entry, lazy_manifests) for entry in entries]
+        elif process_executor is None:
+            metadatas = [
+                thread_executor.submit(read_backup_metadata, entry, lazy_manifests).result for entry in entries
+            ]
         else:
-            backups.append(metadata)
+            metadatas = [
+                thread_executor.submit(_read_backup_metadata_parse_in, entry, process_executor).result
+                for entry in entries
+            ]
+
+        backups: list[BackupMetadata] = []
+        for entry, metadata_result in zip(entries, metadatas):
+            # Try to just read the backup metadata first, because check_if_probably_backup() is quite slow. That way we
+            # only pay the cost of check_if_probably_backup() if a directory is not backup, which is unlikely to occur
+            # in typical usage.
+            try:
+                metadata = metadata_result()
+            except (
+                OSError,
+                BackupStartInfoParseError,
+                BackupManifestParseError,
+            ) as read_error:
+                if entry.name in incomplete_names:
+                    # Not complete yet, as expected.
+                    continue
+                # Could be: a valid backup and a filesystem error occurred, or a backup with malformed metadata, or
+                # something that's not a backup at all.
+                try:
+                    if check_if_probably_backup(entry):
+                        (callbacks.on_read_metadata_error)(entry, read_error)
+                    # If the entry doesn't look like a backup at all then just ignore it.
+                except OSError as query_error:
+                    (callbacks.on_query_entry_error)(entry, query_error)
+            else:
+                backups.append(metadata)
+    finally:
+        if thread_executor is not None:
+            thread_executor.shutdown(cancel_futures=True)
+        if process_executor is not None:
+            process_executor.shutdown(cancel_futures=True)
 
     return backups
 
 
+def _read_backup_metadata_parse_in(backup_directory: Path, executor: Executor, /) -> BackupMetadata:
+    """Like `read_backup_metadata()`, but the metadata files are parsed with `executor` (e.g. in another process)."""
+
+    start_info_path = backup_directory / START_INFO_FILENAME
+    manifest_path = backup_directory / MANIFEST_FILENAME
+    with open(start_info_path, "r", encoding="utf8") as file:
+        start_info_data = file.read()
+    with open(manifest_path, "r", encoding="utf8") as file:
+        manifest_data = file.read()
+    return executor.submit(
+        _parse_backup_metadata,
+        backup_directory.name,
+        start_info_data,
+        manifest_data,
+        str(start_info_path),
+        str(manifest_path),
+    ).result()
+
+
+def _parse_backup_metadata(
+    name: str, start_info_data: str, manifest_data: str, start_info_path: str, manifest_path: str, /
+) -> BackupMetadata:
+    """Parses the contents of a backup's metadata files. Errors are raised the same as `read_backup_metadata()`."""
+
+    try:
+        start_info = deserialise_backup_start_info(start_info_data)
+    except BackupStartInfoParseError as e:
+        raise BackupStartInfoParseError(e.reason, start_info_path) from e
+    try:
+        manifest = deserialise_backup_manifest(manifest_data)
+    except BackupManifestParseError as e:
+        raise BackupManifestParseError(e.reason, manifest_path) from e
+    return BackupMetadata(name, start_info, manifest)
+
+
+def update_backup_catalog(
+    target_directory: StrPath, added_backups: Iterable[BackupMetadata], removed_backup_names: Iterable[str] = (), /
+) -> None:
+    """Updates (or creates) the backup catalog of a backup target directory.
+
+    The catalog should be updated whenever backups are created or deleted, since readers use it instead of enumerating
+    the directory. A backup should be added as soon as its start information is written (while it is not valid), and
+    again once its manifest is written. If the catalog doesn't exist yet, `added_backups` should be all the backups in
+    the directory.
+
+    If the catalog cannot be updated, the existing catalog is deleted (if possible), so that it is not used while out
+    of date.
+
+    :param added_backups: New backups to add to the catalog, or existing ones to keep. Existing valid entries are
+        reused, otherwise the backup's manifest file is queried.
+    :param removed_backup_names: Names of backups which were deleted.
+    :except OSError: If a backup's files could not be queried or the catalog could not be written.
+    """
+
+    target_directory = Path(target_directory)
+    catalog_path = target_directory / CATALOG_FILENAME
+
+    try:
+        catalog = read_backup_catalog_file(catalog_path)
+    except (OSError, BackupCatalogParseError):
+        catalog = BackupCatalog()
+
+    try:
+        entries = {entry.name: entry for entry in catalog.entries}
+        for name in removed_backup_names:
+            entries.pop(name, None)
+        for backup in added_backups:
+            entry = entries.get(backup.name)
+            if entry is None or not entry.valid or entry.start_time != backup.start_info.start_time:
+                entries[backup.name] = _create_backup_catalog_entry(target_directory / backup.name, backup)
+        catalog = BackupCatalog(sorted(entries.values(), key=lambda e: e.start_time))
+        write_backup_catalog_file(catalog_path, catalog)
+    except OSError:
+        try:
+            catalog_path.unlink(missing_ok=True)
+        except OSError:
+            # The original error is more useful to report.
+            pass
+        raise
+
+
+def _create_backup_catalog_entry(backup_directory: Path, metadata: BackupMetadata, /) -> BackupCatalog.Entry:
+    """Creates the catalog entry for a backup. The backup is valid if its manifest file exists.
+
+    :except OSError: If the manifest file could not be queried.
+    """
+
+    try:
+        manifest_size = (backup_directory / MANIFEST_FILENAME).stat().st_size
+    except FileNotFoundError:
+        return BackupCatalog.Entry(metadata.name, metadata.start_info.start_time, 0, False)
+    return BackupCatalog.Entry(metadata.name, metadata.start_info.start_time, manifest_size, True)
+
+
 BACKUP_NAME_LENGTH = 16
 """The length of a backup directory name."""
 
@@ -0,0 +1,224 @@
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, NoReturn, Optional, Sequence, cast
+
+from incremental_backup._utility import StrPath
+
+__all__ = [
+    "BackupPackIndex",
+    "BackupPackIndexParseError",
+    "BackupPackWriter",
+    "deserialise_backup_pack_index",
+    "get_pack_file_name",
+    "read_backup_pack_index_file",
+    "read_packed_file",
+    "serialise_backup_pack_index",
+    "write_backup_pack_index_file",
+]
+
+
+@dataclass
+class BackupPackIndex:
+    """Locates the files whose data was appended to the pack files of a backup, rather than copied to the data
+    directory."""
+
+    @dataclass(frozen=True)
+    class Entry:
+        path: tuple[str, ...]
+        """The path components of the file, relative to the backup source directory."""
+
+        pack: int
+        """The number of the pack file containing the file's data. See `get_pack_file_name()`."""
+
+        offset: int
+        """The position of the file's data within the pack file, in bytes."""
+
+        size: int
+        """The size of the file's data, in bytes."""
+
+        last_modified_ns: int
+        """The last modification time of the file, in nanoseconds since the Unix epoch."""
+
+        mode: int
+        """The permission bits of the file (as from `stat.S_IMODE()`)."""
+
+    entries: list[Entry] = field(default_factory=list)
+    """Entries for each packed file, in the order they were packed."""
+
+
+def get_pack_file_name(pack: int, /) -> str:
+    """Gets the name of a pack file (within the packs directory of a backup) from its number."""
+
+    return f"{pack}.pack"
+
+
+class BackupPackWriter:
+    """Appends the data of small files to a few large pack files, so that backing up many small files doesn't create
+    as many files on the target filesystem.
+
+    Pack files are created in a directory as needed, each up to a maximum size (unless a single file is larger). Call
+    `finish()` when done to get the index of the packed files, and `close()` (even if an error occurs).
+    """
+
+    DEFAULT_MAX_PACK_SIZE = 2**26
+    """Default maximum size of each pack file, in bytes."""
+
+    def __init__(self, directory: StrPath, /, max_pack_size: int = DEFAULT_MAX_PACK_SIZE) -> None:
+        self._directory = Path(directory)
+        self._max_pack_size = max_pack_size
+        self._index = BackupPackIndex()
+        self._pack = -1
+        self._pack_file: Optional[BinaryIO] = None
+        self._pack_size = 0
+
+    def add_file(self, path: Sequence[str], data: bytes, last_modified_ns: int, mode: int, /) -> None:
+        """Appends a file's data to the current pack file, starting a new one if it would get too large.
+
+        :param path: The path components of the file, relative to the backup source directory.
+        :param mode: The permission bits of the file.
+        :except OSError: If writing to the pack file failed.
+        """
+
+        pack_file = self._pack_file
+        if pack_file is None or (self._pack_size > 0 and self._pack_size + len(data) > self._max_pack_size):
+            pack_file = self._start_pack()
+        pack_file.write(data)
+        self._index.entries.append(
+            BackupPackIndex.Entry(tuple(path), self._pack, self._pack_size, len(data), last_modified_ns, mode)
+        )
+        self._pack_size += len(data)
+
+    def finish(self) -> BackupPackIndex:
+        """Completes the pack files. The writer must not be used after this.
+
+        :return: The index of all the files packed.
+        :except OSError: If writing to the pack file failed.
+        """
+
+        self.close()
+        return self._index
+
+    def close(self) -> None:
+        """Closes the current pack file, if any."""
+
+        if self._pack_file is not None:
+            pack_file = self._pack_file
+            self._pack_file = None
+            pack_file.close()
+
+    def _start_pack(self) -> BinaryIO:
+        self.close()
+        if self._pack < 0:
+            self._directory.mkdir(exist_ok=True)
+        self._pack += 1
+        self._pack_file = open(self._directory / get_pack_file_name(self._pack), "xb")
+        self._pack_size = 0
+        return self._pack_file
+
+
+def read_packed_file(pack_file: BinaryIO, entry: BackupPackIndex.Entry, destination: StrPath, /) -> None:
+    """Extracts a file's data from a pack file, setting its permission bits and last modification time (as
+    `shutil.copy2()` would for a file copied to the data directory).
+
+    :param pack_file: The pack file `entry` refers to, open for reading.
+    :except OSError: If the data could not be read, or the destination file could not be written to.
+    """
+
+    pack_file.seek(entry.offset)
+    data = pack_file.read(entry.size)
+    if len(data) != entry.size:
+        raise OSError(f"Pack file {get_pack_file_name(entry.pack)} is truncated")
+    with open(destination, "wb") as file:
+        file.write(data)
+    os.chmod(destination, entry.mode)
+    os.utime(destination, ns=(entry.last_modified_ns, entry.last_modified_ns))
+
+
+def serialise_backup_pack_index(value: BackupPackIndex, /) -> str:
+    """Writes a backup pack index to a string."""
+
+    json_data = [
+        ["/".join(entry.path), entry.pack, entry.offset, entry.size, entry.last_modified_ns, entry.mode]
+        for entry in value.entries
+    ]
+    return json.dumps(json_data, indent=0, ensure_ascii=False)
+
+
+def write_backup_pack_index_file(path: StrPath, value: BackupPackIndex, /) -> None:
+    """Writes a backup pack index to file.
+
+    :except OSError: If the file could not be written to.
+    """
+
+    with open(path, "w", encoding="utf8") as file:
+        file.write(serialise_backup_pack_index(value))
+
+
+def deserialise_backup_pack_index(string: str, /) -> BackupPackIndex:
+    """Reads a backup pack index from a string.
+
+    :except BackupPackIndexParseError: If the string is not a valid backup pack index.
+    """
+
+    def parse_error(reason: str, e: Optional[Exception] = None, /) -> NoReturn:
+        if e is None:
+            raise BackupPackIndexParseError(reason)
+        else:
+            raise BackupPackIndexParseError(reason) from e
+
+    def is_natural(value: Any, /) -> bool:
+        return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+    try:
+        json_data = json.loads(string)
+    except json.JSONDecodeError as e:
+        parse_error(str(e), e)
+
+    if not isinstance(json_data, list):
+        parse_error("Expected a list")
+
+    index = BackupPackIndex()
+    for entry_num, entry in enumerate(cast(list[Any], json_data), 1):
+        if not (
+            isinstance(entry, list)
+            and len(entry) == 6
+            and isinstance(entry[0], str)
+            and entry[0]
+            and all(is_natural(v) for v in entry[1:4])
+            and isinstance(entry[4], int)
+            and not isinstance(entry[4], bool)
+            and is_natural(entry[5])
+        ):
+            parse_error(f"Entry {entry_num}: expected [path, pack, offset, size, last modified, mode]")
+        path, pack, offset, size, last_modified_ns, mode = entry
+        index.entries.append(BackupPackIndex.Entry(tuple(path.split("/")), pack, offset, size, last_modified_ns, mode))
+    return index
+
+
+def read_backup_pack_index_file(path: StrPath, /) -> BackupPackIndex:
+    """Reads a backup pack index from file.
+
+    :except OSError: If the file could not be read.
+    :except BackupPackIndexParseError: If the file is not a valid backup pack index.
+    """
+
+    try:
+        with open(path, "r", encoding="utf8") as file:
+            return deserialise_backup_pack_index(file.read())
+    except BackupPackIndexParseError as e:
+        raise BackupPackIndexParseError(e.reason, str(path)) from e
+
+
+class BackupPackIndexParseError(Exception):
+    """Raised when a backup pack index file cannot be parsed due to invalid format."""
+
+    def __init__(self, reason: str, file_path: Optional[str] = None) -> None:
+        if file_path is None:
+            message = f"Failed to parse backup pack index: {reason}"
+        else:
+            message = f'Failed to parse backup pack index file "{file_path}": {reason}'
+        super().__init__(message)
+        self.reason = reason
+        self.file_path = file_path
@@ -1,9 +1,11 @@
 import json
 from dataclasses import dataclass
 from datetime import datetime
+from functools import cached_property
 from typing import Any, NoReturn, Optional, cast
 
-from incremental_backup._utility import StrPath
+from incremental_backup._utility import StrPath, datetime_to_ns
+from incremental_backup.compression import Compression
 
 __all__ = [
     "BackupStartInfo",
@@ -22,11 +24,25 @@ class BackupStartInfo:
     start_time: datetime
     """The UTC time at which the backup operated started (just before any files were copied)."""
 
+    compression: Optional[Compression] = None
+    """The codec the data of the backup's copied files is compressed with (see `compress_file()`), or `None` if not
+        compressed."""
+
+    @cached_property
+    def start_time_ns(self) -> int:
+        """`start_time` in nanoseconds since the Unix epoch, for comparing with file modification times (see
+        `File.last_modified_ns`). Computed once, since it's compared against every file the backup copied."""
+
+        return datetime_to_ns(self.start_time)
+
 
 def serialise_backup_start_info(value: BackupStartInfo, /) -> str:
     """Writes backup start information to a string."""
 
     json_data = {"start_time": value.start_time.isoformat()}
+    # Only written if used, so uncompressed backups can still be read by older versions.
+    if value.compression is not None:
+        json_data["compression"] = value.compression.value
     return json.dumps(json_data, indent=4, ensure_ascii=False)
 
 
@@ -62,15 +78,24 @@ def deserialise_backup_start_info(string: str) -> BackupStartInfo:
     json_data = cast(dict[Any, Any], json_data)
 
     fields = {"start_time"}
-    if set(json_data.keys()) != fields:
-        parse_error(f"Expected fields {fields}")
+    optional_fields = {"compression"}
+    if not fields <= set(json_data.keys()) <= fields | optional_fields:
+        parse_error(f"Expected fields {fields} and optionally {optional_fields}")
 
     try:
         start_time = datetime.fromisoformat(json_data["start_time"])
     except (TypeError, ValueError) as e:
         parse_error('Field "start_time" must be an ISO-8601 date string', e)
 
-    return BackupStartInfo(start_time)
+    if "compression" in json_data:
+        try:
+            compression = Compression(json_data["compression"])
+        except ValueError as e:
+            parse_error(f'Field "compression" must be one of {[c.value for c in Compression]}', e)
+    else:
+        compression = None
+
+    return BackupStartInfo(start_time, compression)
 
 
 def read_backup_start_info_file(path: StrPath, /) -> BackupStartInfo:
@@ -99,3 +124,7 @@ class BackupStartInfoParseError(Exception):
         super().__init__(message)
         self.reason = reason
         self.file_path = file_path
+
+    def __reduce__(self) -> tuple[type, tuple[str, Optional[str]]]:
+        # So the exception can be pickled (e.g. to return from another process).
+        return type(self), (self.reason, self.file_path)
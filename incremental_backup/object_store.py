@@ -0,0 +1,92 @@
+import hashlib
+import os
+import shutil
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from incremental_backup._utility import StrPath
+
+__all__ = ["get_object_path", "hash_file", "store_file", "StoreFileResult"]
+
+
+_READ_SIZE = 2**20
+"""Number of bytes read from a file at a time when hashing or storing it."""
+
+
+def hash_file(path: StrPath, /) -> str:
+    """Computes the content hash of a file, which identifies it in an object store.
+
+    :return: The SHA-256 digest of the file's data, as a lowercase hexadecimal string.
+    :except OSError: If the file could not be read.
+    """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(_READ_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_object_path(objects_directory: StrPath, content_hash: str, /) -> Path:
+    """Gets the path of the object with the given content hash within an object store.
+
+    Objects are grouped into subdirectories by the first two characters of the hash, so no directory gets too large.
+    """
+
+    return Path(objects_directory, content_hash[:2], content_hash[2:])
+
+
+@dataclass(frozen=True)
+class StoreFileResult:
+    """Return results of `store_file()`."""
+
+    content_hash: str
+    """The content hash of the file's data."""
+
+    stored: bool
+    """`True` if the data was copied into the store, `False` if the store already had an object with the same
+        content."""
+
+
+def store_file(objects_directory: StrPath, source: StrPath, /) -> StoreFileResult:
+    """Stores a file's data in a content-addressed object store, unless an object with the same content already exists.
+
+    The file is hashed first, so data already in the store is only read, not copied. New data is copied to a temporary
+    file (hashing it again, in case the file was modified in the meantime) which is then renamed to its object path, so
+    the store never contains partially written objects. Objects get the metadata of the first file stored with that
+    content.
+
+    Safe to call concurrently for the same store, including for files with the same content.
+
+    :except OSError: If the file could not be read or stored.
+    """
+
+    content_hash = hash_file(source)
+    object_path = get_object_path(objects_directory, content_hash)
+    if object_path.exists():
+        return StoreFileResult(content_hash, False)
+
+    temp_path = Path(objects_directory, f"{uuid.uuid4().hex}.tmp")
+    Path(objects_directory).mkdir(parents=True, exist_ok=True)
+    try:
+        digest = hashlib.sha256()
+        with open(source, "rb") as source_file, open(temp_path, "wb") as temp_file:
+            while chunk := source_file.read(_READ_SIZE):
+                digest.update(chunk)
+                temp_file.write(chunk)
+        shutil.copystat(source, temp_path)
+        content_hash = digest.hexdigest()
+        object_path = get_object_path(objects_directory, content_hash)
+        if object_path.exists():
+            os.remove(temp_path)
+            return StoreFileResult(content_hash, False)
+        object_path.parent.mkdir(exist_ok=True)
+        os.replace(temp_path, object_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return StoreFileResult(content_hash, True)
@@ -1,7 +1,7 @@
 import re
-from typing import Iterable
+from typing import Iterable, Optional
 
-__all__ = ["PathExcludePattern", "is_path_excluded"]
+__all__ = ["PathExcludePattern", "PathExcludeSet", "is_path_excluded"]
 
 
 class PathExcludePattern:
@@ -29,3 +29,160 @@ def is_path_excluded(path: str, exclude_patterns: Iterable[PathExcludePattern],
     """
 
     return any(pattern.matches(path) for pattern in exclude_patterns)
+
+
+class PathExcludeSet:
+    """A set of path exclude patterns compiled for checking many paths.
+
+    The patterns are merged into a single regular expression, so each path is checked in one pass rather than once per
+    pattern. Also, `for_directory()` gives the subset of patterns which could match paths within a directory, based on
+    the literal text each pattern starts with. That way patterns anchored to other parts of the source directory are
+    not evaluated at all, and in a subtree no pattern can match, paths need not be checked.
+    """
+
+    def __init__(self, patterns: Iterable[PathExcludePattern], /) -> None:
+        self._patterns = tuple(_CompiledPattern(pattern) for pattern in patterns)
+        self._cache: dict[tuple[int, ...], PathExcludeSet] = {}
+        self._indices = tuple(range(len(self._patterns)))
+        self._init_matchers()
+
+    @property
+    def is_empty(self) -> bool:
+        """Indicates if there are no patterns, i.e. no path is matched."""
+
+        return not self._indices
+
+    def matches(self, path: str, /) -> bool:
+        """Checks if a path is matched by any pattern in the set.
+
+        :param path: The path in question, in the format described in `is_path_excluded()`.
+        """
+
+        if self._combined is not None and self._combined.fullmatch(path) is not None:
+            return True
+        return any(pattern.fullmatch(path) is not None for pattern in self._separate)
+
+    def for_directory(self, directory_path: str, /) -> "PathExcludeSet":
+        """Gets the set of patterns which could match any descendent of a directory. The result is only valid for
+        checking descendents of the directory, not the directory itself.
+
+        :param directory_path: The path of the directory, in the format described in `is_path_excluded()`. Should be a
+            descendent of the directories (if any) this set was obtained for.
+        """
+
+        indices = tuple(i for i in self._indices if self._patterns[i].may_match_within(directory_path))
+        if indices == self._indices:
+            return self
+        subset = self._cache.get(indices)
+        if subset is None:
+            subset = PathExcludeSet.__new__(PathExcludeSet)
+            subset._patterns = self._patterns
+            subset._cache = self._cache
+            subset._indices = indices
+            subset._init_matchers()
+            self._cache[indices] = subset
+        return subset
+
+    def _init_matchers(self) -> None:
+        combinable = [self._patterns[i].pattern for i in self._indices if self._patterns[i].combinable]
+        separate = [self._patterns[i].pattern for i in self._indices if not self._patterns[i].combinable]
+        self._combined: Optional[re.Pattern[str]] = None
+        if len(combinable) == 1:
+            self._combined = combinable[0]
+        elif combinable:
+            try:
+                self._combined = re.compile("|".join(f"(?:{p.pattern})" for p in combinable), re.DOTALL)
+            except re.error:
+                # E.g. the same group name is used in multiple patterns.
+                separate = combinable + separate
+        self._separate = tuple(separate)
+
+
+class _CompiledPattern:
+    """Exclude pattern with the information needed by `PathExcludeSet`."""
+
+    def __init__(self, pattern: PathExcludePattern, /) -> None:
+        self.pattern = pattern.pattern
+        source = self.pattern.pattern
+        # Patterns with global inline flags, or which refer to groups by number, would have a different meaning as part
+        # of a larger expression.
+        self.combinable = _GLOBAL_FLAGS_REGEX.search(source) is None and _GROUP_REFERENCE_REGEX.search(source) is None
+        self.prefix, self.literal = _literal_prefix(self.pattern)
+
+    def may_match_within(self, directory_path: str, /) -> bool:
+        """Checks if this pattern could match a path which starts with and is longer than `directory_path`."""
+
+        if self.literal:
+            return len(self.prefix) > len(directory_path) and self.prefix.startswith(directory_path)
+        else:
+            return self.prefix.startswith(directory_path) or directory_path.startswith(self.prefix)
+
+
+_GLOBAL_FLAGS_REGEX = re.compile(r"\(\?[aiLmsux]+\)")
+_GROUP_REFERENCE_REGEX = re.compile(r"\\[0-9]|\(\?P=|\(\?\(")
+_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+_QUANTIFIER_CHARS = frozenset("*+?{")
+
+
+def _literal_prefix(pattern: re.Pattern[str], /) -> tuple[str, bool]:
+    """Finds literal text which every string fully matched by a pattern starts with. Not necessarily the longest such
+    text; an empty string is always correct.
+
+    :return: The prefix, and whether the whole pattern is literal (i.e. the prefix is the only string it matches).
+    """
+
+    source = pattern.pattern
+    if pattern.flags & (re.IGNORECASE | re.VERBOSE) or _has_top_level_alternation(source):
+        return "", False
+
+    prefix: list[str] = []
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if char == "\\":
+            if i + 1 >= len(source) or source[i + 1].isalnum():
+                # Character class, anchor, group reference or other escape sequence.
+                break
+            char = source[i + 1]
+            i += 2
+        elif char in _SPECIAL_CHARS:
+            break
+        else:
+            i += 1
+        if i < len(source) and source[i] in _QUANTIFIER_CHARS:
+            # The character may be repeated or omitted.
+            break
+        prefix.append(char)
+    else:
+        return "".join(prefix), True
+    return "".join(prefix), False
+
+
+def _has_top_level_alternation(source: str, /) -> bool:
+    """Checks if a regular expression contains '|' outside of any group or character set."""
+
+    depth = 0
+    in_set = False
+    i = 0
+    while i < len(source):
+        char = source[i]
+        if char == "\\":
+            i += 1
+        elif in_set:
+            if char == "]":
+                in_set = False
+        elif char == "[":
+            in_set = True
+            # ']' is literal if it is the first character of the set.
+            if source.startswith("^", i + 1):
+                i += 1
+            if source.startswith("]", i + 1):
+                i += 1
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "|" and depth == 0:
+            return True
+        i += 1
+    return False
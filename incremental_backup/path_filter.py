@@ -0,0 +1,98 @@
+from typing import Iterable, Optional
+
+from incremental_backup._utility import normalise_path_name
+from incremental_backup.path_exclude import PathExcludePattern, PathExcludeSet
+
+__all__ = ["PathFilter", "split_relative_path"]
+
+
+class PathFilter:
+    """Selects part of the backup source directory, e.g. to restore only some files.
+
+    A file is selected if it is within any of the given paths (if any), and it or a directory containing it matches any
+    of the given include patterns (if any). With neither, everything is selected.
+
+    The filter is applied while walking down the directory tree: `enter_directory()` gives the filter for a
+    subdirectory, or `None` if nothing in it can be selected, so that subtree can be skipped entirely.
+    """
+
+    def __init__(self, paths: Iterable[str] = (), include_patterns: Iterable[PathExcludePattern] = (), /) -> None:
+        """
+        :param paths: Paths of files or directories relative to the backup source directory, with components
+            separated by '/'.
+        :param include_patterns: Patterns in the same format as path exclude patterns (see `is_path_excluded()`), which
+            select the files and directories they match.
+        :except ValueError: If a path is absolute or contains "..".
+        """
+
+        path_components = [tuple(normalise_path_name(c) for c in split_relative_path(path)) for path in paths]
+        include_set = PathExcludeSet(include_patterns)
+
+        self._directory_path = "/"
+        # Remaining components of the paths from this directory, or `None` if this directory is within one of them.
+        self._paths: Optional[tuple[tuple[str, ...], ...]] = (
+            None if not path_components or () in path_components else tuple(path_components)
+        )
+        # Patterns which may select files within this directory, or `None` if this directory is selected by a pattern.
+        self._patterns: Optional[PathExcludeSet] = None if include_set.is_empty else include_set.for_directory("/")
+
+    @property
+    def includes_all(self) -> bool:
+        """Indicates if everything within the current directory is selected."""
+
+        return self._paths is None and self._patterns is None
+
+    def enter_directory(self, name: str, /) -> Optional["PathFilter"]:
+        """Gets the filter for a subdirectory of the current directory.
+
+        :return: The filter, or `None` if nothing within the subdirectory is selected.
+        """
+
+        key = normalise_path_name(name)
+        directory_path = f"{self._directory_path}{key}/"
+
+        paths = self._paths
+        if paths is not None:
+            paths = tuple(p[1:] for p in paths if p[0] == key)
+            if not paths:
+                return None
+            if () in paths:
+                paths = None
+
+        patterns = self._patterns
+        if patterns is not None:
+            if patterns.matches(directory_path):
+                patterns = None
+            else:
+                patterns = patterns.for_directory(directory_path)
+                if patterns.is_empty:
+                    return None
+
+        path_filter = PathFilter.__new__(PathFilter)
+        path_filter._directory_path = directory_path
+        path_filter._paths = paths
+        path_filter._patterns = patterns
+        return path_filter
+
+    def includes_file(self, name: str, /) -> bool:
+        """Checks if a file in the current directory is selected."""
+
+        key = normalise_path_name(name)
+        if self._paths is not None and (key,) not in self._paths:
+            return False
+        return self._patterns is None or self._patterns.matches(self._directory_path + key)
+
+
+def split_relative_path(path: str, /) -> tuple[str, ...]:
+    """Splits a path relative to the backup source directory into its components, which are separated by '/'. Empty and
+    "." components are ignored, so the source directory itself has no components.
+
+    :except ValueError: If the path is absolute or contains "..".
+    """
+
+    if path.startswith("/"):
+        raise ValueError(f'Path "{path}" must be relative to the backup source directory')
+    components = tuple(c for c in path.split("/") if c not in ("", "."))
+    if ".." in components:
+        raise ValueError(f'Path "{path}" must not contain ".."')
+    return components
@@ -6,13 +6,19 @@ from typing import Any, Callable
 
 from incremental_backup._utility import StrPath
 from incremental_backup.meta import (
+    CATALOG_FILENAME,
     COMPLETE_INFO_FILENAME,
+    CONSOLIDATION_FILENAME,
     DATA_DIRECTORY_NAME,
     MANIFEST_FILENAME,
     START_INFO_FILENAME,
+    SUM_CHECKPOINT_FILENAME,
+    BackupManifestParseError,
     BackupMetadata,
     ReadBackupsCallbacks,
+    iter_backup_manifest_file,
     read_backups,
+    update_backup_catalog,
 )
 
 __all__ = [
@@ -44,19 +50,30 @@ def is_backup_prunable(
 ) -> bool:
     """Checks if a backup is useless and can be deleted.
 
+    If the backup's manifest is not loaded yet (see `BackupMetadata.manifest`), only its beginning is read.
+
     :except OSError: If querying the backup contents failed.
+    :except BackupManifestParseError: If the backup manifest file could not be parsed.
     """
 
     backup_path = Path(backup_path)
 
     def is_backup_empty() -> bool:
-        manifest_root = backup_metadata.manifest.root
-        manifest_nonempty = (
-            manifest_root.copied_files
-            or manifest_root.removed_files
-            or manifest_root.removed_directories
-            or manifest_root.subdirectories
-        )
+        if backup_metadata.is_manifest_loaded:
+            manifest_root = backup_metadata.manifest.root
+            manifest_nonempty = (
+                manifest_root.copied_files
+                or manifest_root.removed_files
+                or manifest_root.removed_directories
+                or manifest_root.subdirectories
+            )
+        else:
+            # Any event means the manifest records some change.
+            events = iter_backup_manifest_file(backup_path / MANIFEST_FILENAME)
+            try:
+                manifest_nonempty = next(events, None) is not None
+            finally:
+                events.close()
         if manifest_nonempty:
             return False
 
@@ -71,6 +88,8 @@ def is_backup_prunable(
     def backup_contains_other_data() -> bool:
         # Can raise OSError
         backup_contents = {entry.name for entry in backup_path.iterdir()}
+        # Backups created by older versions don't have a backup sum checkpoint.
+        backup_contents.discard(SUM_CHECKPOINT_FILENAME)
         expected_contents = {
             START_INFO_FILENAME,
             MANIFEST_FILENAME,
@@ -97,6 +116,9 @@ class PruneBackupsConfig:
 
     prunability_options: BackupPrunabilityOptions
 
+    read_workers: int = 1
+    """Number of threads used to read backups' metadata. See `read_backups()`."""
+
 
 @dataclass(frozen=True)
 class PruneBackupsCallbacks:
@@ -119,6 +141,10 @@ class PruneBackupsCallbacks:
     """Called when an error is raised deleting a file or directory.
         First argument is the path, second argument is the raised exception."""
 
+    on_update_catalog_error: Callable[[Path, OSError], None] = lambda path, error: None
+    """Called when updating the backup catalog file of the target directory fails.
+        First argument is the path to the file, second argument is the raised exception."""
+
 
 @dataclass(frozen=True)
 class PruneBackupsResults:
@@ -146,15 +172,31 @@ def prune_backups(
     :param config: Options to tune what and how backups are pruned.
     :param callbacks: Callbacks for certain events during execution. See `PruneBackupsCallbacks`.
     :return: Summary information for the prune operation.
+    :except ValueError: If `config.read_workers` is less than 1.
     :except PruneBackupsError: If an error occurs that prevents the prune operation from completing.
     """
 
+    if config.read_workers < 1:
+        raise ValueError("read_workers must be at least 1.")
+
     backup_target_directory = Path(backup_target_directory)
 
+    try:
+        consolidation_pending = (backup_target_directory / CONSOLIDATION_FILENAME).exists()
+    except OSError as e:
+        raise PruneBackupsError(f"Failed to query backup target directory: {e}") from e
+    if consolidation_pending:
+        # The backups of the consolidation may be partially deleted or written.
+        raise PruneBackupsError(
+            "Backup target directory has an interrupted consolidation, run the consolidate command to finish it first"
+        )
+
     callbacks.on_before_read_backups()
 
     try:
-        backups = read_backups(backup_target_directory, callbacks.read_backups)
+        backups = read_backups(
+            backup_target_directory, callbacks.read_backups, config.read_workers, lazy_manifests=True
+        )
     except OSError as e:
         raise PruneBackupsError(f"Failed to query backup target directory: {e}") from e
     callbacks.on_after_read_backups(tuple(backups))
@@ -167,12 +209,15 @@ def prune_backups(
         except OSError as e:
             # TODO: this is kinda dodgy, can we get better error handling?
             callbacks.read_backups.on_read_metadata_error(Path(e.filename), e)
+        except BackupManifestParseError as e:
+            callbacks.read_backups.on_read_metadata_error(backup_path, e)
         else:
             if is_prunable:
                 prunable_backups.append(backup)
     callbacks.on_selected_backups(tuple(prunable_backups))
 
     empty_backups_removed = 0
+    removed_backup_names: set[str] = set()
     for backup in prunable_backups:
         success = True
 
@@ -193,6 +238,14 @@ def prune_backups(
 
         if success:
             empty_backups_removed += 1
+            removed_backup_names.add(backup.name)
+
+    if not config.dry_run:
+        remaining_backups = [b for b in backups if b.name not in removed_backup_names]
+        try:
+            update_backup_catalog(backup_target_directory, remaining_backups, removed_backup_names)
+        except OSError as e:
+            callbacks.on_update_catalog_error(backup_target_directory / CATALOG_FILENAME, e)
 
     total_backups_removed = empty_backups_removed
     backups_remaining = len(backups) - total_backups_removed
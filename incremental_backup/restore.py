@@ -1,21 +1,43 @@
-import shutil
-from dataclasses import dataclass
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
-from functools import partial
 from pathlib import Path
-from typing import Callable, Optional, Sequence
-
-from incremental_backup._utility import StrPath
-from incremental_backup.backup import BackupSum
+from typing import Callable, Optional, Sequence, Union, cast
+
+from incremental_backup._utility import StrPath, normalise_path_name
+from incremental_backup.backup import (
+    DEFAULT_PIPELINE_QUEUE_SIZE,
+    BackupSum,
+    LoadBackupSumCallbacks,
+    load_backup_sum,
+    load_partial_backup_sum,
+)
+from incremental_backup.compression import Compression, decompress_file
+from incremental_backup.file_copy import CopyMethod, copy_file
+from incremental_backup.locate import LocatedFile
 from incremental_backup.meta import (
+    CONSOLIDATION_FILENAME,
     DATA_DIRECTORY_NAME,
+    OBJECTS_DIRECTORY_NAME,
+    PACK_INDEX_FILENAME,
+    PACKS_DIRECTORY_NAME,
+    BackupCatalog,
     BackupMetadata,
+    BackupPackIndex,
+    BackupPackIndexParseError,
     ReadBackupsCallbacks,
+    get_pack_file_name,
+    read_backup_pack_index_file,
     read_backups,
+    read_packed_file,
 )
+from incremental_backup.object_store import get_object_path
+from incremental_backup.path_filter import PathFilter
 
 __all__ = [
     "perform_restore",
+    "restore_file",
     "restore_files",
     "RestoreError",
     "RestoreFilesCallbacks",
@@ -32,6 +54,10 @@ class RestoreFilesResults:
     files_restored: int
     paths_skipped: bool
 
+    copy_methods: dict[CopyMethod, int] = field(default_factory=dict, compare=False)
+    """The number of files copied with each method (see `copy_file()`). Only for diagnostics, since it depends on the
+        platform and filesystems, so not included in comparisons."""
+
 
 @dataclass(frozen=True)
 class RestoreFilesCallbacks:
@@ -46,41 +72,202 @@ class RestoreFilesCallbacks:
         First argument is the source path, second argument is the destination path, third argument is the raised
         exception."""
 
+    on_read_pack_index_error: Callable[[Path, Exception], None] = lambda path, error: None
+    """Called when a backup's pack index file exists but can't be read. The backup's files are then restored as if it
+        had no pack files.
+        First argument is the path to the file, second argument is the raised exception (`OSError` or
+        `BackupPackIndexParseError`)."""
+
 
 def restore_files(
     backup_target_directory: StrPath,
     backup_sum: BackupSum,
     destination_directory: StrPath,
     callbacks: RestoreFilesCallbacks = RestoreFilesCallbacks(),
+    workers: int = 1,
+    queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE,
 ) -> RestoreFilesResults:
     """Restores files and directories from backups to a new location.
 
+    Destination directories are all created first, then files are copied grouped by the source they are read from:
+    each backup's data directory (in search order), each backup's pack files (in offset order), and the object store
+    (in hash order, which is directory order), so reads from each backup directory are close together.
+
     :param backup_target_directory: The directory containing the backups which are being restored. I.e. the
         "target directory" from the backup creation operation.
-    :param backup_sum: Sum of backups to restore files from.
+    :param backup_sum: Sum of backups to restore files from. Files with a content hash are read from the object store
+        of the target directory, other files from the pack files or data directory of their backup (decompressing them
+        if the backup's start information specifies compression).
     :param destination_directory: Directory where files will be restored to. Need not exist.
-    :param callbacks: Callbacks for certain events during execution. See `RestoreFilesCallbacks`.
+    :param callbacks: Callbacks for certain events during execution. See `RestoreFilesCallbacks`. All are invoked from
+        the calling thread, in the same order regardless of the number of workers.
+    :param workers: Number of threads used to copy files. If greater than 1, files are copied concurrently, with up to
+        `queue_size` groups submitted to the threads ahead of the one being waited on, so memory use is bounded. The
+        results do not depend on this value.
+    :param queue_size: See `workers`.
+    :except ValueError: If `workers` or `queue_size` is less than 1.
     """
 
-    paths_skipped = False
-    files_restored = 0
-    search_stack: list[Callable[[], None]] = []
-    path_segments: list[str] = []
-    is_root = True
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    if queue_size < 1:
+        raise ValueError("queue_size must be at least 1")
 
-    def pop_path_segment() -> None:
-        del path_segments[-1]
+    batches, paths_skipped = _list_file_restores(backup_target_directory, backup_sum, destination_directory, callbacks)
 
-    def visit_directory(search_directory: BackupSum.Directory, /) -> None:
+    files_restored = 0
+    copy_methods: dict[CopyMethod, int] = {}
+
+    def handle_results(batch: Sequence[_FileRestore], results: list[Union[CopyMethod, None, OSError]], /) -> None:
         nonlocal paths_skipped
         nonlocal files_restored
 
-        if not is_root:
-            path_segments.append(search_directory.name)
-            search_stack.append(pop_path_segment)
+        for file, result in zip(batch, results):
+            if isinstance(result, OSError):
+                paths_skipped = True
+
+                (callbacks.on_copy_error)(file.source_path, file.destination_path, result)
+            else:
+                files_restored += 1
+                if result is not None:
+                    copy_methods[result] = copy_methods.get(result, 0) + 1
+
+    if workers == 1:
+        for batch in batches:
+            handle_results(batch, _restore_file_batch(batch))
+    else:
+        # Batches submitted to the executor and not yet handled, in submission order.
+        submitted: deque[tuple[Sequence[_FileRestore], Future[list[Union[CopyMethod, None, OSError]]]]] = deque()
+        next_batch = 0
+        with ThreadPoolExecutor(workers) as executor:
+            while next_batch < len(batches) or submitted:
+                while next_batch < len(batches) and len(submitted) < queue_size:
+                    submitted.append((batches[next_batch], executor.submit(_restore_file_batch, batches[next_batch])))
+                    next_batch += 1
+
+                # Results are handled in submission order, to invoke the callbacks deterministically.
+                batch, results = submitted.popleft()
+                handle_results(batch, results.result())
+
+    return RestoreFilesResults(files_restored, paths_skipped, copy_methods)
+
+
+def _read_pack_index(
+    backup_target_directory: StrPath, backup_name: str, callbacks: RestoreFilesCallbacks, /
+) -> dict[tuple[str, ...], BackupPackIndex.Entry]:
+    """Reads a backup's pack index, keyed by normalised path. Empty if the backup has no pack index or it can't be
+    read."""
+
+    index_path = Path(backup_target_directory, backup_name, PACKS_DIRECTORY_NAME, PACK_INDEX_FILENAME)
+    try:
+        entries = read_backup_pack_index_file(index_path).entries
+    except FileNotFoundError:
+        entries = []
+    except (OSError, BackupPackIndexParseError) as e:
+        entries = []
+        (callbacks.on_read_pack_index_error)(index_path, e)
+    return {tuple(normalise_path_name(c) for c in entry.path): entry for entry in entries}
+
+
+def _copy_restored_file(
+    source_path: Path, destination_path: Path, compression: Optional[Compression], /
+) -> Optional[CopyMethod]:
+    """Copies a backed up file's data to its destination, decompressing it if needed.
+
+    :return: The copy method used, or `None` if decompressed.
+    :except OSError: If the file could not be copied.
+    """
+
+    if compression is None:
+        return copy_file(source_path, destination_path)
+    else:
+        decompress_file(source_path, destination_path, compression)
+        return None
+
+
+@dataclass(frozen=True)
+class _FileRestore:
+    """A file to be restored, and where its data is read from."""
+
+    source_path: Path
+    """The file containing the file's data: a data directory file, an object, or a pack file."""
+
+    destination_path: Path
+
+    compression: Optional[Compression] = None
+
+    pack_entry: Optional[BackupPackIndex.Entry] = None
+    """Locates the file's data within `source_path`, if it's a pack file."""
+
+
+def _resolve_file_restore(
+    backup_target_directory: StrPath,
+    backup: BackupMetadata,
+    path: Sequence[str],
+    content_hash: Optional[str],
+    destination_path: Path,
+    get_pack_index: Callable[[str], dict[tuple[str, ...], BackupPackIndex.Entry]],
+    /,
+) -> _FileRestore:
+    """Finds where a backed up file's data is read from: the object store if it has a content hash, otherwise its
+    backup's pack files or data directory.
+
+    :param backup: The backup the file was last backed up in.
+    :param path: The path components of the file, relative to the backup source directory.
+    :param get_pack_index: Gets a backup's pack index by backup name (see `_read_pack_index()`).
+    """
+
+    if content_hash is not None:
+        # Objects are never compressed.
+        return _FileRestore(
+            get_object_path(Path(backup_target_directory, OBJECTS_DIRECTORY_NAME), content_hash), destination_path
+        )
+
+    pack_entry = get_pack_index(backup.name).get(tuple(normalise_path_name(c) for c in path))
+    if pack_entry is None:
+        source_path = Path(backup_target_directory, backup.name, DATA_DIRECTORY_NAME, *path)
+        return _FileRestore(source_path, destination_path, backup.start_info.compression)
+    else:
+        source_path = Path(
+            backup_target_directory, backup.name, PACKS_DIRECTORY_NAME, get_pack_file_name(pack_entry.pack)
+        )
+        return _FileRestore(source_path, destination_path, pack_entry=pack_entry)
+
+
+def _list_file_restores(
+    backup_target_directory: StrPath,
+    backup_sum: BackupSum,
+    destination_directory: StrPath,
+    callbacks: RestoreFilesCallbacks,
+    /,
+) -> tuple[list[Sequence[_FileRestore]], bool]:
+    """Creates all the destination directories for `restore_files()` and lists the files to restore, grouped by
+    source.
+
+    :return: Tuple of (batches, paths_skipped). Each batch is restored by one worker (see `_restore_file_batch()`).
+        Files from the same pack file are in the same batch, to read it sequentially with one open file.
+    """
 
-        relative_directory_path = Path(*path_segments)
-        directory_path = destination_directory / relative_directory_path
+    paths_skipped = False
+    # Pack indices keyed by backup name. Read when first needed.
+    pack_indices: dict[str, dict[tuple[str, ...], BackupPackIndex.Entry]] = {}
+    # Keyed by backup name, in order of first use.
+    data_files: dict[str, list[_FileRestore]] = {}
+    # Keyed by pack file path.
+    packed_files: dict[Path, list[_FileRestore]] = {}
+    object_files: list[_FileRestore] = []
+
+    def get_pack_index(backup_name: str, /) -> dict[tuple[str, ...], BackupPackIndex.Entry]:
+        pack_index = pack_indices.get(backup_name)
+        if pack_index is None:
+            pack_index = _read_pack_index(backup_target_directory, backup_name, callbacks)
+            pack_indices[backup_name] = pack_index
+        return pack_index
+
+    search_stack: list[tuple[BackupSum.Directory, tuple[str, ...]]] = [(backup_sum.root, ())]
+    while search_stack:
+        search_directory, path_segments = search_stack.pop()
+        directory_path = Path(destination_directory, *path_segments)
 
         try:
             directory_path.mkdir(parents=True, exist_ok=True)
@@ -88,35 +275,105 @@ def restore_files(
             paths_skipped = True
 
             (callbacks.on_mkdir_error)(directory_path, e)
-        else:
-            for file in search_directory.files:
-                relative_file_path = relative_directory_path / file.name
-                source_file_path = Path(
-                    backup_target_directory,
-                    file.last_backup.name,
-                    DATA_DIRECTORY_NAME,
-                    relative_file_path,
-                )
-                destination_file_path = destination_directory / relative_file_path
+            continue
+
+        for file in search_directory.files:
+            file_restore = _resolve_file_restore(
+                backup_target_directory,
+                file.last_backup,
+                (*path_segments, file.name),
+                file.content_hash,
+                directory_path / file.name,
+                get_pack_index,
+            )
+            if file.content_hash is not None:
+                object_files.append(file_restore)
+            elif file_restore.pack_entry is None:
+                data_files.setdefault(file.last_backup.name, []).append(file_restore)
+            else:
+                packed_files.setdefault(file_restore.source_path, []).append(file_restore)
+
+        search_stack.extend((d, (*path_segments, d.name)) for d in reversed(search_directory.subdirectories))
+
+    batches: list[Sequence[_FileRestore]] = []
+    for files in data_files.values():
+        batches.extend((f,) for f in files)
+    for files in packed_files.values():
+        files.sort(key=lambda f: cast(BackupPackIndex.Entry, f.pack_entry).offset)
+        batches.append(files)
+    # Object paths are ordered by hash.
+    object_files.sort(key=lambda f: f.source_path)
+    batches.extend((f,) for f in object_files)
+    return batches, paths_skipped
+
+
+def _restore_file_batch(batch: Sequence[_FileRestore], /) -> list[Union[CopyMethod, None, OSError]]:
+    """Restores files in order, all from the same source file if packed. May run on a worker thread.
+
+    :return: The copy method used (or `None` if decompressed or unpacked) or the error raised, for each file.
+    """
 
+    results: list[Union[CopyMethod, None, OSError]] = []
+    if batch[0].pack_entry is None:
+        for file in batch:
+            try:
+                results.append(_copy_restored_file(file.source_path, file.destination_path, file.compression))
+            except OSError as e:
+                results.append(e)
+    else:
+        try:
+            pack_file = open(batch[0].source_path, "rb")
+        except OSError as e:
+            return [e] * len(batch)
+        with pack_file:
+            for file in batch:
                 try:
-                    shutil.copy2(source_file_path, destination_file_path)
+                    read_packed_file(pack_file, cast(BackupPackIndex.Entry, file.pack_entry), file.destination_path)
                 except OSError as e:
-                    paths_skipped = True
-
-                    (callbacks.on_copy_error)(source_file_path, destination_file_path, e)
+                    results.append(e)
                 else:
-                    files_restored += 1
+                    results.append(None)
+    return results
 
-            # Need to use partial instead of lambda to avoid name rebinding issues.
-            search_stack.extend(partial(visit_directory, d) for d in reversed(search_directory.subdirectories))
 
-    search_stack.append(partial(visit_directory, backup_sum.root))
-    while search_stack:
-        search_stack.pop()()
-        is_root = False
+def restore_file(
+    backup_target_directory: StrPath,
+    located_file: LocatedFile,
+    destination_path: StrPath,
+    /,
+    callbacks: RestoreFilesCallbacks = RestoreFilesCallbacks(),
+) -> Optional[CopyMethod]:
+    """Restores a single file found by `locate_file()`, like `restore_files()` does for each file.
+
+    :param backup_target_directory: The directory containing the backups. I.e. the "target directory" from the backup
+        creation operation.
+    :param located_file: Where the file was found. Must not be removed.
+    :param destination_path: Path of the file to restore to. Its parent directory is created if it doesn't exist, and
+        an existing file is overwritten.
+    :param callbacks: Callbacks for certain events during execution. Only `on_read_pack_index_error` is used, errors
+        copying the file are raised.
+    :return: The copy method used, or `None` if the file was decompressed or unpacked.
+    :except ValueError: If `located_file` was removed.
+    :except OSError: If the file could not be restored.
+    """
 
-    return RestoreFilesResults(files_restored, paths_skipped)
+    if located_file.removed:
+        raise ValueError("located_file must not be removed")
+
+    destination_path = Path(destination_path)
+    destination_path.parent.mkdir(parents=True, exist_ok=True)
+    file_restore = _resolve_file_restore(
+        backup_target_directory,
+        located_file.backup,
+        located_file.path,
+        located_file.content_hash,
+        destination_path,
+        lambda backup_name: _read_pack_index(backup_target_directory, backup_name, callbacks),
+    )
+    (result,) = _restore_file_batch((file_restore,))
+    if isinstance(result, OSError):
+        raise result
+    return result
 
 
 @dataclass(frozen=True)
@@ -126,6 +383,9 @@ class RestoreResults:
     files_restored: int
     paths_skipped: bool
 
+    copy_methods: dict[CopyMethod, int] = field(default_factory=dict, compare=False)
+    """The number of files copied with each method. See `RestoreFilesResults.copy_methods`."""
+
 
 @dataclass(frozen=True)
 class RestoreCallbacks:
@@ -145,6 +405,9 @@ class RestoreCallbacks:
     """Called when the backups to be used for the restore operation have been selected.
         Argument is the collection of backup metadatas (in arbitrary order)."""
 
+    load_backup_sum: LoadBackupSumCallbacks = LoadBackupSumCallbacks()
+    """Callbacks for `load_backup_sum()`."""
+
     on_before_initialise_restore: Callable[[], None] = lambda: None
     """Called just before creating the destination directory (if necessary)."""
 
@@ -161,6 +424,9 @@ def perform_restore(
     backup_name: Optional[str] = None,
     backup_time: Optional[datetime] = None,
     callbacks: RestoreCallbacks = RestoreCallbacks(),
+    read_workers: int = 1,
+    copy_workers: int = 1,
+    path_filter: Optional[PathFilter] = None,
 ) -> RestoreResults:
     """Restores files and directories from existing backups.
 
@@ -172,8 +438,13 @@ def perform_restore(
     :param backup_time: If specified, only backups up to and including this time will be used to restore files.
         Cannot be specified if `backup_name` is also specified.
     :param callbacks: Callbacks for certain events during execution. See `RestoreCallbacks`.
+    :param read_workers: Number of threads used to read backups' metadata. See `read_backups()`.
+    :param copy_workers: Number of threads used to copy files. See `restore_files()`.
+    :param path_filter: If not `None`, only the files selected by this filter are restored. Only the parts of the
+        backups' manifests which may contain selected files are processed (see `load_partial_backup_sum()`).
     :return: Summary information for the restore operation.
-    :except ValueError: If both `backup_name` and `backup_time` are not `None`.
+    :except ValueError: If both `backup_name` and `backup_time` are not `None`, or `read_workers` or `copy_workers` is
+        less than 1.
     :except RestoreError: If an error occurs that prevents the restore operation from completing. See `RestoreError`.
     """
 
@@ -183,6 +454,9 @@ def perform_restore(
         backup_name,
         backup_time,
         callbacks,
+        read_workers,
+        copy_workers,
+        path_filter,
     ).perform_restore()
 
 
@@ -196,19 +470,30 @@ class _RestoreOperation:
         backup_name: Optional[str] = None,
         backup_time: Optional[datetime] = None,
         callbacks: RestoreCallbacks = RestoreCallbacks(),
+        read_workers: int = 1,
+        copy_workers: int = 1,
+        path_filter: Optional[PathFilter] = None,
     ) -> None:
         """
-        :except ValueError: If both `backup_name` and `backup_time` are not `None`.
+        :except ValueError: If both `backup_name` and `backup_time` are not `None`, or `read_workers` or
+            `copy_workers` is less than 1.
         """
 
         if backup_name is not None and backup_time is not None:
             raise ValueError("backup_name and backup_time should not both be specified.")
+        if read_workers < 1:
+            raise ValueError("read_workers must be at least 1.")
+        if copy_workers < 1:
+            raise ValueError("copy_workers must be at least 1.")
 
         self.backup_name = backup_name
         self.backup_time = backup_time
         self.backup_target_directory = Path(backup_target_directory)
         self.destination_directory = Path(destination_directory)
         self.callbacks = callbacks
+        self.read_workers = read_workers
+        self.copy_workers = copy_workers
+        self.path_filter = path_filter
 
     def perform_restore(self) -> RestoreResults:
         """Restores files from the specified backups.
@@ -222,7 +507,7 @@ class _RestoreOperation:
 
         previous_backups = self._read_previous_backups()
         selected_backups = self._select_backups_to_restore(previous_backups)
-        backup_sum = BackupSum.from_backups(selected_backups)
+        backup_sum = self._load_backup_sum(selected_backups)
 
         (self.callbacks.on_before_initialise_restore)()
         self._create_destination()
@@ -235,7 +520,8 @@ class _RestoreOperation:
         """Validates the backup target directory.
         Should mostly prevent other parts of the restore operation from failing strangely for invalid inputs.
 
-        :except Restore: If the backup target directory is not an accessible directory.
+        :except Restore: If the backup target directory is not an accessible directory, or has an interrupted
+            consolidation.
         """
 
         try:
@@ -243,8 +529,15 @@ class _RestoreOperation:
                 raise RestoreError("Backup target directory not found")
             if not self.backup_target_directory.is_dir():
                 raise RestoreError("Backup target directory is not a directory")
+            consolidation_pending = (self.backup_target_directory / CONSOLIDATION_FILENAME).exists()
         except OSError as e:
             raise RestoreError(f"Failed to query backup target directory: {e}") from e
+        if consolidation_pending:
+            # The backups of the consolidation may be partially deleted or written.
+            raise RestoreError(
+                "Backup target directory has an interrupted consolidation, "
+                "run the consolidate command to finish it first"
+            )
 
     def _validate_destination_directory(self) -> None:
         """Validates the restore destination directory.
@@ -261,8 +554,9 @@ class _RestoreOperation:
             raise RestoreError(f"Failed to query destination directory: {e}") from e
 
     def _read_previous_backups(self) -> Sequence[BackupMetadata]:
-        """Reads all existing backups' metadata from the backup target directory.
+        """Reads existing backups' metadata from the backup target directory.
 
+        If the target directory has a backup catalog, backups newer than requested are not read.
         If any backup's metadata cannot be read, skips that backup.
 
         :except RestoreError: If the target directory cannot be enumerated.
@@ -271,7 +565,13 @@ class _RestoreOperation:
         (self.callbacks.on_before_read_previous_backups)()
 
         try:
-            backups = read_backups(self.backup_target_directory, self.callbacks.read_backups)
+            backups = read_backups(
+                self.backup_target_directory,
+                self.callbacks.read_backups,
+                self.read_workers,
+                catalog_filter=self._select_catalog_entries,
+                lazy_manifests=True,
+            )
         except OSError as e:
             raise RestoreError(f"Failed to enumerate backup target directory: {e}") from e
         backups = tuple(backups)
@@ -280,6 +580,23 @@ class _RestoreOperation:
 
         return backups
 
+    def _select_catalog_entries(self, entries: Sequence[BackupCatalog.Entry], /) -> Sequence[BackupCatalog.Entry]:
+        """Selects the backup catalog entries of backups which may be restored from, like
+        `_select_backups_to_restore()`, so that newer backups' metadata need not be read."""
+
+        if self.backup_name is not None:
+            entry = next((e for e in entries if e.name == self.backup_name), None)
+            if entry is None:
+                # Let _select_backups_to_restore() report the backup as not found, if it's not in the target directory.
+                return entries
+            backup_time = entry.start_time
+        else:
+            backup_time = self.backup_time
+        if backup_time is None:
+            return entries
+        else:
+            return tuple(e for e in entries if e.start_time <= backup_time)
+
     def _select_backups_to_restore(self, previous_backups: Sequence[BackupMetadata], /) -> Sequence[BackupMetadata]:
         """Returns backups from `self.previous_backups` requested to restore files from, based on `self.backup_name`
         and `self.backup_time`.
@@ -309,6 +626,18 @@ class _RestoreOperation:
 
         return selected_backups
 
+    def _load_backup_sum(self, selected_backups: Sequence[BackupMetadata], /) -> BackupSum:
+        """Computes the sum of the selected backups, or only of the files selected by `self.path_filter`."""
+
+        if self.path_filter is None or self.path_filter.includes_all:
+            return load_backup_sum(
+                self.backup_target_directory, selected_backups, self.callbacks.load_backup_sum
+            ).backup_sum
+        else:
+            return load_partial_backup_sum(
+                self.backup_target_directory, selected_backups, self.path_filter, self.callbacks.load_backup_sum
+            )
+
     def _create_destination(self) -> None:
         """Creates the restore destination directory.
 
@@ -336,9 +665,12 @@ class _RestoreOperation:
             backup_sum,
             self.destination_directory,
             self.callbacks.restore_files,
+            self.copy_workers,
         )
 
-        return RestoreResults(restore_results.files_restored, restore_results.paths_skipped)
+        return RestoreResults(
+            restore_results.files_restored, restore_results.paths_skipped, restore_results.copy_methods
+        )
 
 
 class RestoreError(Exception):
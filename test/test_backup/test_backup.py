@@ -1,24 +1,37 @@
+import bz2
+import hashlib
+import os
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any
+from typing import Any, Sequence
 
 import pytest
 
 from incremental_backup.backup.backup import (
     BackupCallbacks,
     BackupError,
+    BackupOptions,
     perform_backup,
 )
 from incremental_backup.backup.filesystem import ScanFilesystemCallbacks
 from incremental_backup.backup.plan import ExecuteBackupPlanCallbacks
+from incremental_backup.backup.sum_checkpoint import LoadBackupSumCallbacks
+from incremental_backup.compression import Compression
+from incremental_backup.meta.catalog import BackupCatalog, read_backup_catalog_file, write_backup_catalog_file
+from incremental_backup.meta.journal import BackupJournalWriter
 from incremental_backup.meta.manifest import (
     BackupManifest,
     BackupManifestParseError,
     read_backup_manifest_file,
 )
-from incremental_backup.meta.meta import ReadBackupsCallbacks
-from incremental_backup.meta.start_info import BackupStartInfoParseError
+from incremental_backup.meta.meta import CATALOG_FILENAME, ReadBackupsCallbacks
+from incremental_backup.meta.pack import read_backup_pack_index_file
+from incremental_backup.meta.start_info import (
+    BackupStartInfoParseError,
+    read_backup_start_info_file,
+)
 from incremental_backup.path_exclude import PathExcludePattern
+from incremental_backup.restore import perform_restore
 
 from test.helpers import (
     AssertFilesystemUnmodified,
@@ -207,7 +220,7 @@ def test_perform_backup_new_target(tmpdir: Path) -> None:
     end_time = datetime.now(timezone.utc)
 
     assert target_path.is_dir()
-    backup_paths = list(target_path.iterdir())
+    backup_paths = list(set(target_path.iterdir()) - {target_path / CATALOG_FILENAME})
     assert len(backup_paths) == 1
     backup_path = backup_paths[0]
 
@@ -245,6 +258,7 @@ def test_perform_backup_new_target(tmpdir: Path) -> None:
         "start.json",
         "manifest.json",
         "completion.json",
+        "sum.json",
     }
 
     assert dir_entries(backup_path / "data") == {"foo.txt", "bar"}
@@ -328,7 +342,7 @@ def test_perform_backup_no_previous_backups(tmpdir: Path) -> None:
     end_time = datetime.now(timezone.utc)
 
     assert target_path.is_dir()
-    backup_paths = list(target_path.iterdir())
+    backup_paths = list(set(target_path.iterdir()) - {target_path / CATALOG_FILENAME})
     assert len(backup_paths) == 1
     backup_path = backup_paths[0]
 
@@ -366,6 +380,7 @@ def test_perform_backup_no_previous_backups(tmpdir: Path) -> None:
         "start.json",
         "manifest.json",
         "completion.json",
+        "sum.json",
     }
 
     assert dir_entries(backup_path / "data") == {
@@ -537,7 +552,9 @@ def test_perform_backup_some_previous_backups(tmpdir: Path) -> None:
         results = perform_backup(source_path, target_path, exclude_patterns, callbacks)
     end_time = datetime.now(timezone.utc)
 
-    backup_path = (set(target_path.iterdir()) - {backup1_path, backup2_path, backup3_path}).pop()
+    backup_path = (
+        set(target_path.iterdir()) - {backup1_path, backup2_path, backup3_path, target_path / CATALOG_FILENAME}
+    ).pop()
 
     assert len(actual_callbacks) == 8
     assert actual_callbacks[0] == "before_read_previous_backups"
@@ -589,8 +606,17 @@ def test_perform_backup_some_previous_backups(tmpdir: Path) -> None:
         "start.json",
         "manifest.json",
         "completion.json",
+        "sum.json",
     }
 
+    catalog = read_backup_catalog_file(target_path / CATALOG_FILENAME)
+    assert unordered_equal(
+        [e.name for e in catalog.entries],
+        ["sadhf8o3947yfqgfaw", "gsel45o8ise45ytq87", "0345guyes8yfg73", backup_path.name],
+    )
+    assert catalog.entries[-1].name == backup_path.name
+    assert catalog.entries[-1].valid
+
     assert dir_entries(backup_path / "data") == {
         "root_file3.txt",
         "dir1\u1076\u0223",
@@ -727,6 +753,9 @@ def test_perform_backup_some_invalid_backups(tmpdir: Path) -> None:
         on_after_read_previous_backups=lambda backups: actual_callbacks.append(
             ("after_read_previous_backups", backups)
         ),
+        load_backup_sum=LoadBackupSumCallbacks(
+            on_read_manifest_error=lambda path, error: actual_callbacks.append(("invalid_manifest", path, error))
+        ),
         on_before_initialise_backup=lambda: actual_callbacks.append("before_initialise_backup"),
         on_created_backup_directory=lambda path: actual_callbacks.append(("created_backup_directory", path)),
         on_before_scan_source=lambda: actual_callbacks.append("before_scan_source"),
@@ -752,30 +781,23 @@ def test_perform_backup_some_invalid_backups(tmpdir: Path) -> None:
     end_time = datetime.now(timezone.utc)
 
     backup_path = (
-        set(target_path.iterdir()) - {invalid1, invalid2, invalid3, invalid4, invalid5, invalid6, backup1, backup2}
+        set(target_path.iterdir())
+        - {invalid1, invalid2, invalid3, invalid4, invalid5, invalid6, backup1, backup2, target_path / CATALOG_FILENAME}
     ).pop()
 
     assert len(actual_callbacks) == 9
     assert actual_callbacks[0] == "before_read_previous_backups"
-    assert unordered_equal(
-        [(c, path, type(error)) for c, path, error in actual_callbacks[1:3]],
-        [
-            (
-                "invalid_backup",
-                target_path / "038574tq374gfh",
-                BackupManifestParseError,
-            ),
-            (
-                "invalid_backup",
-                target_path / "90435fgjwf43fy43",
-                BackupStartInfoParseError,
-            ),
-        ],
-    )
-    assert actual_callbacks[3][0] == "after_read_previous_backups"
+    assert actual_callbacks[1][:2] == ("invalid_backup", target_path / "90435fgjwf43fy43")
+    assert type(actual_callbacks[1][2]) is BackupStartInfoParseError
+    assert actual_callbacks[2][0] == "after_read_previous_backups"
+    # Manifests are loaded lazily, so the malformed manifest is only found when computing the backup sum.
     # I can't be bothered testing that all the metadata is the same, I assume it is otherwise other things will likely
     # break anyway
-    assert unordered_equal([b.name for b in actual_callbacks[3][1]], ["83547tgwyedfg", "6789345g3w4ywfd"])
+    assert unordered_equal(
+        [b.name for b in actual_callbacks[2][1]], ["83547tgwyedfg", "6789345g3w4ywfd", "038574tq374gfh"]
+    )
+    assert actual_callbacks[3][:2] == ("invalid_manifest", target_path / "038574tq374gfh")
+    assert type(actual_callbacks[3][2]) is BackupManifestParseError
     assert actual_callbacks[4] == "before_initialise_backup"
     assert actual_callbacks[5] == ("created_backup_directory", backup_path)
     assert actual_callbacks[6] == "before_scan_source"
@@ -802,6 +824,7 @@ def test_perform_backup_some_invalid_backups(tmpdir: Path) -> None:
         "start.json",
         "manifest.json",
         "completion.json",
+        "sum.json",
     }
 
     assert dir_entries(backup_path / "data") == {"new.txt"}
@@ -831,6 +854,45 @@ def test_perform_backup_some_invalid_backups(tmpdir: Path) -> None:
     assert actual_manifest_str == expected_manifest_str
 
 
+def test_perform_backup_catalog_incomplete(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    catalog_path = target_path / CATALOG_FILENAME
+    (source_path / "a.txt").write_text("a")
+    backup1 = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert backup1 is not None
+
+    # The backup is in the catalog while in progress, as not valid.
+    catalogs: list[BackupCatalog] = []
+    (source_path / "b.txt").write_text("b")
+    backup2 = perform_backup(
+        source_path,
+        target_path,
+        (),
+        BackupCallbacks(on_before_copy_files=lambda: catalogs.append(read_backup_catalog_file(catalog_path))),
+        skip_empty=False,
+    )
+    assert backup2 is not None
+    assert [(e.name, e.valid) for e in catalogs[0].entries] == [
+        (backup1.backup_path.name, True),
+        (backup2.backup_path.name, False),
+    ]
+
+    # E.g. interrupted after the manifest was written, before the catalog was updated.
+    write_backup_catalog_file(catalog_path, catalogs[0])
+
+    backup3 = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert backup3 is not None
+    assert backup3.files_copied == 0
+    catalog = read_backup_catalog_file(catalog_path)
+    assert [(e.name, e.valid) for e in catalog.entries] == [
+        (backup1.backup_path.name, True),
+        (backup2.backup_path.name, True),
+        (backup3.backup_path.name, True),
+    ]
+
+
 def test_perform_backup_skip_empty(tmpdir: Path) -> None:
     # skip_empty option is specified and there are no changes to record.
 
@@ -884,4 +946,290 @@ def test_perform_backup_skip_empty(tmpdir: Path) -> None:
     ]
 
 
+def test_perform_backup_deduplicate(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "a.txt").write_text("same")
+    (source_path / "dir/b.txt").write_text("same")
+    (source_path / "c.txt").write_text("different")
+    target_path = tmpdir / "target"
+    options = BackupOptions(deduplicate=True)
+
+    with AssertFilesystemUnmodified(source_path):
+        results1 = perform_backup(source_path, target_path, (), skip_empty=False, options=options)
+
+    same_hash = hashlib.sha256(b"same").hexdigest()
+    different_hash = hashlib.sha256(b"different").hexdigest()
+    assert results1 is not None
+    assert results1.files_copied == 3
+    assert results1.files_deduplicated == 1
+    root = results1.manifest.root
+    # Files may be in any order.
+    assert dict(zip(root.copied_files, root.copied_file_hashes)) == {"a.txt": same_hash, "c.txt": different_hash}
+    assert root.subdirectories == [
+        BackupManifest.Directory("dir", copied_files=["b.txt"], copied_file_hashes=[same_hash])
+    ]
+    assert dir_entries(results1.backup_path / "data") == set()
+    objects_path = target_path / "objects"
+    assert (objects_path / same_hash[:2] / same_hash[2:]).read_text() == "same"
+    assert (objects_path / different_hash[:2] / different_hash[2:]).read_text() == "different"
+
+    # A moved file's content is already stored.
+    (source_path / "c.txt").rename(source_path / "dir/moved.txt")
+    os.utime(source_path / "dir/moved.txt")
+    with AssertFilesystemUnmodified(objects_path):
+        results2 = perform_backup(source_path, target_path, (), skip_empty=False, options=options)
+
+    assert results2 is not None
+    assert results2.files_copied == 1
+    assert results2.files_deduplicated == 1
+    assert results2.manifest == BackupManifest(
+        BackupManifest.Directory(
+            "",
+            removed_files=["c.txt"],
+            subdirectories=[
+                BackupManifest.Directory("dir", copied_files=["moved.txt"], copied_file_hashes=[different_hash])
+            ],
+        )
+    )
+    assert dir_entries(target_path) == {results1.backup_path.name, results2.backup_path.name, "objects", "catalog.json"}
+
+
+def test_perform_backup_pack(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "small.txt").write_text("small")
+    (source_path / "dir/big.txt").write_text("this file is too big to pack")
+    (source_path / "dir/empty.txt").touch()
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(source_path):
+        results = perform_backup(
+            source_path, target_path, (), skip_empty=False, options=BackupOptions(pack_threshold=8)
+        )
+
+    assert results is not None
+    assert results.files_copied == 3
+    assert results.files_packed == 2
+    assert dir_entries(results.backup_path / "data") == {"dir"}
+    assert dir_entries(results.backup_path / "data/dir") == {"big.txt"}
+    assert dir_entries(results.backup_path / "packs") == {"0.pack", "index.json"}
+    pack_index = read_backup_pack_index_file(results.backup_path / "packs/index.json")
+    # Files may be in any order.
+    assert {e.path: e.size for e in pack_index.entries} == {("small.txt",): 5, ("dir", "empty.txt"): 0}
+    assert (results.backup_path / "packs/0.pack").read_text() == "small"
+
+
+def test_perform_backup_pack_nothing_packed(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    (source_path / "file.txt").write_text("not small")
+    target_path = tmpdir / "target"
+
+    results = perform_backup(source_path, target_path, (), skip_empty=False, options=BackupOptions(pack_threshold=2))
+
+    assert results is not None
+    assert results.files_packed == 0
+    assert dir_entries(results.backup_path) == {"start.json", "data", "manifest.json", "completion.json", "sum.json"}
+
+
+def test_perform_backup_compression(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "dir/file.log").write_text("log line\n" * 1000)
+    target_path = tmpdir / "target"
+
+    options = BackupOptions(compression=Compression.BZ2)
+    with AssertFilesystemUnmodified(source_path):
+        results = perform_backup(source_path, target_path, (), skip_empty=False, options=options)
+
+    assert results is not None
+    assert results.files_copied == 1
+    assert results.start_info.compression == Compression.BZ2
+    assert read_backup_start_info_file(results.backup_path / "start.json") == results.start_info
+    with bz2.open(results.backup_path / "data/dir/file.log", "rt") as file:
+        assert file.read() == "log line\n" * 1000
+
+    with pytest.raises(ValueError):
+        perform_backup(
+            source_path,
+            target_path,
+            (),
+            skip_empty=False,
+            options=BackupOptions(compression=Compression.GZIP, deduplicate=True),
+        )
+
+
+def test_perform_backup_invalid_pack_threshold(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+
+    for options in (BackupOptions(pack_threshold=-1), BackupOptions(pack_threshold=10, deduplicate=True)):
+        with AssertFilesystemUnmodified(tmpdir):
+            with pytest.raises(ValueError):
+                perform_backup(source_path, target_path, (), skip_empty=False, options=options)
+
+
+def test_perform_backup_pipeline(tmpdir: Path) -> None:
+    # Pipelined backup should record the same as a non-pipelined backup.
+
+    source_path = tmpdir / "source"
+    for i in range(3):
+        (source_path / f"dir{i}/sub").mkdir(parents=True)
+        (source_path / f"dir{i}/file{i}").write_text(f"file {i}")
+        (source_path / f"dir{i}/sub/file").write_text(f"sub {i}")
+    (source_path / "root.txt").write_text("root")
+
+    def back_up(target_path: Path, pipeline: bool) -> BackupManifest:
+        options = BackupOptions(pipeline=pipeline, copy_workers=3)
+        with AssertFilesystemUnmodified(source_path):
+            results = perform_backup(source_path, target_path, (), skip_empty=False, options=options)
+        assert results is not None
+        assert results.files_copied == 7
+        assert read_backup_manifest_file(results.backup_path / "manifest.json") == results.manifest
+        assert dir_entries(results.backup_path / "data") == {"dir0", "dir1", "dir2", "root.txt"}
+        return results.manifest
+
+    assert back_up(tmpdir / "target1", True) == back_up(tmpdir / "target2", False)
+
+
+def test_perform_backup_pipeline_skip_empty(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    target_path = tmpdir / "target"
+    target_path.mkdir()
+
+    actual_callbacks: list[Any] = []
+    callbacks = BackupCallbacks(
+        on_before_initialise_backup=lambda: actual_callbacks.append("before_initialise_backup"),
+        on_before_scan_source=lambda: actual_callbacks.append("before_scan_source"),
+        on_before_copy_files=lambda: actual_callbacks.append("before_copy_files"),
+    )
+
+    with AssertFilesystemUnmodified(tmpdir):
+        results = perform_backup(
+            source_path, target_path, (), callbacks, skip_empty=True, options=BackupOptions(pipeline=True)
+        )
+
+    assert results is None
+    assert actual_callbacks == ["before_scan_source", "before_copy_files"]
+
+
+def _interrupt_backup(backup_path: Path, journaled_files: Sequence[tuple[str, ...]], source_path: Path) -> None:
+    """Makes a complete backup look as if it was interrupted while copying files, after journaling some files."""
+
+    for name in ("manifest.json", "completion.json", "sum.json"):
+        (backup_path / name).unlink()
+    (backup_path.parent / CATALOG_FILENAME).unlink()
+    with open(backup_path / "journal.jsonl", "w", encoding="utf8") as file:
+        writer = BackupJournalWriter(file)
+        for path in journaled_files:
+            stat = source_path.joinpath(*path).stat()
+            writer.add_file(path, stat.st_mtime_ns, stat.st_size)
+        file.write('["torn')
+
+
+def test_perform_backup_resume(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "a.txt").write_text("a")
+    (source_path / "dir/b.txt").write_text("b")
+    (source_path / "dir/c.txt").write_text("c")
+
+    for pipeline in (False, True):
+        target_path = tmpdir / f"target_{pipeline}"
+        options = BackupOptions(pipeline=pipeline, resume=True)
+        # Nothing to resume, so creates a new backup.
+        interrupted = perform_backup(source_path, target_path, (), skip_empty=False, options=options)
+        assert interrupted is not None
+        assert interrupted.files_resumed == 0
+        backup_path = interrupted.backup_path
+        assert dir_entries(backup_path) == {"start.json", "data", "manifest.json", "completion.json", "sum.json"}
+
+        _interrupt_backup(backup_path, [("a.txt",), ("dir", "b.txt")], source_path)
+        # Marks the copy, to check it isn't copied again.
+        (backup_path / "data/a.txt").write_text("A")
+        (source_path / "dir/b.txt").write_text("b modified")
+
+        actual_callbacks: list[Any] = []
+        callbacks = BackupCallbacks(
+            on_before_initialise_backup=lambda: actual_callbacks.append("before_initialise_backup"),
+            on_resume_backup=lambda path: actual_callbacks.append(("resume_backup", path)),
+        )
+        # Skipping empty backups has no effect when resuming.
+        with AssertFilesystemUnmodified(source_path):
+            results = perform_backup(source_path, target_path, (), callbacks, skip_empty=True, options=options)
+
+        assert results is not None
+        assert actual_callbacks == [("resume_backup", backup_path)]
+        assert results.backup_path == backup_path
+        assert results.start_info == interrupted.start_info
+        assert results.manifest == interrupted.manifest
+        assert (results.files_copied, results.files_resumed) == (3, 1)
+        assert dir_entries(target_path) == {backup_path.name, CATALOG_FILENAME}
+        assert dir_entries(backup_path) == {"start.json", "data", "manifest.json", "completion.json", "sum.json"}
+        assert read_backup_manifest_file(backup_path / "manifest.json") == results.manifest
+        assert (backup_path / "data/a.txt").read_text() == "A"
+        assert (backup_path / "data/dir/b.txt").read_text() == "b modified"
+        assert (backup_path / "data/dir/c.txt").read_text() == "c"
+
+        (source_path / "dir/b.txt").write_text("b")
+
+
+def test_perform_backup_resume_compression_mismatch(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    (source_path / "a.txt").write_text("a")
+    target_path = tmpdir / "target"
+
+    results = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert results is not None
+    _interrupt_backup(results.backup_path, [("a.txt",)], source_path)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(BackupError):
+            perform_backup(
+                source_path,
+                target_path,
+                (),
+                skip_empty=False,
+                options=BackupOptions(compression=Compression.GZIP, resume=True),
+            )
+
+
+def test_perform_backup_resume_outdated(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+
+    (source_path / "f").write_text("v2")
+    interrupted = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert interrupted is not None
+    _interrupt_backup(interrupted.backup_path, [("f",)], source_path)
+    (source_path / "f").write_text("v3")
+    completed = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert completed is not None
+    (source_path / "f").write_text("v4")
+
+    skipped: list[Path] = []
+    callbacks = BackupCallbacks(
+        on_resume_backup=lambda path: pytest.fail(f"Unexpected on_resume_backup: {path=}"),
+        on_skip_outdated_backup=skipped.append,
+    )
+    # Resuming would order the copy of v4 before the newer backup of v3.
+    results = perform_backup(
+        source_path, target_path, (), callbacks, skip_empty=False, options=BackupOptions(resume=True)
+    )
+    assert results is not None
+    assert skipped == [interrupted.backup_path]
+    assert results.backup_path not in (interrupted.backup_path, completed.backup_path)
+    assert results.files_resumed == 0
+    assert not (interrupted.backup_path / "manifest.json").exists()
+
+    restore_path = tmpdir / "restore"
+    perform_restore(target_path, restore_path)
+    assert (restore_path / "f").read_text() == "v4"
+
+
 METADATA_TIME_TOLERANCE = 5  # Seconds
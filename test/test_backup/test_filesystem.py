@@ -1,16 +1,28 @@
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any
 
 import pytest
 
+from incremental_backup._utility import datetime_to_ns
+from incremental_backup.backup import filesystem
 from incremental_backup.backup.filesystem import (
+    DEFAULT_SCAN_QUEUE_SIZE,
     Directory,
+    File,
+    ScanEnterDirectory,
+    ScanExitDirectory,
     ScanFilesystemCallbacks,
+    iter_scan_filesystem,
     scan_filesystem,
 )
 from incremental_backup.path_exclude import PathExcludePattern
 
-from test.helpers import AssertFilesystemUnmodified, unordered_equal
+from test.helpers import (
+    AssertFilesystemUnmodified,
+    unordered_equal,
+    write_file_with_mtime,
+)
 
 
 def test_directory_init() -> None:
@@ -152,5 +164,154 @@ def test_scan_filesystem_some_excludes(tmpdir: Path) -> None:
     assert unordered_equal(actual_excludes, expected_excludes)
 
 
+def test_scan_filesystem_anchored_excludes(tmpdir: Path) -> None:
+    # Patterns anchored to particular directories should only apply there.
+
+    exclude_patterns = tuple(map(PathExcludePattern, ("/a/b/file", "/a/b/sub/", r"/a/c\.d/.*\.log", "/x/y|/z")))
+
+    (tmpdir / "a/b/sub").mkdir(parents=True)
+    (tmpdir / "a/b/sub/file").touch()
+    (tmpdir / "a/b/file").touch()
+    (tmpdir / "a/b/other").touch()
+    (tmpdir / "a/bb").mkdir()
+    (tmpdir / "a/bb/file").touch()
+    (tmpdir / "a/c.d/deep").mkdir(parents=True)
+    (tmpdir / "a/c.d/deep/x.log").touch()
+    (tmpdir / "a/c.d/deep/x.txt").touch()
+    (tmpdir / "a/cxd").mkdir()
+    (tmpdir / "a/cxd/x.log").touch()
+    (tmpdir / "x").mkdir()
+    (tmpdir / "x/y").touch()
+    (tmpdir / "z").touch()
+
+    excludes: list[Path] = []
+    callbacks = ScanFilesystemCallbacks(
+        on_exclude=excludes.append,
+        on_listdir_error=lambda path, error: pytest.fail(f"Unexpected on_listdir_error: {path=} {error=}"),
+        on_metadata_error=lambda path, error: pytest.fail(f"Unexpected on_metadata_error: {path=} {error=}"),
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        results = scan_filesystem(tmpdir, exclude_patterns, callbacks)
+
+    expected_excludes = (
+        tmpdir / "a/b/file",
+        tmpdir / "a/b/sub",
+        tmpdir / "a/c.d/deep/x.log",
+        tmpdir / "x/y",
+        tmpdir / "z",
+    )
+    assert unordered_equal(excludes, expected_excludes)
+    a = next(d for d in results.tree.subdirectories if d.name == "a")
+    b = next(d for d in a.subdirectories if d.name == "b")
+    assert [f.name for f in b.files] == ["other"] and b.subdirectories == []
+    bb = next(d for d in a.subdirectories if d.name == "bb")
+    assert [f.name for f in bb.files] == ["file"]
+    cxd = next(d for d in a.subdirectories if d.name == "cxd")
+    assert [f.name for f in cxd.files] == ["x.log"]
+
+
+def test_scan_filesystem_workers(tmpdir: Path) -> None:
+    # Results and callbacks should be identical regardless of the number of worker threads.
+
+    exclude_patterns = tuple(map(PathExcludePattern, (r".*/excluded/", r".*\.tmp")))
+
+    for i in range(5):
+        (tmpdir / f"dir{i}/excluded").mkdir(parents=True)
+        (tmpdir / f"dir{i}/excluded/file").touch()
+        (tmpdir / f"dir{i}/file{i}.txt").touch()
+        (tmpdir / f"dir{i}/file{i}.tmp").touch()
+        for j in range(4):
+            (tmpdir / f"dir{i}/sub{j}/subsub").mkdir(parents=True)
+            (tmpdir / f"dir{i}/sub{j}/file{j}").touch()
+            (tmpdir / f"dir{i}/sub{j}/subsub/file").touch()
+    (tmpdir / "root_file").touch()
+
+    def scan(workers: int, queue_size: int = DEFAULT_SCAN_QUEUE_SIZE) -> tuple[Directory, list[Path]]:
+        excludes: list[Path] = []
+        callbacks = ScanFilesystemCallbacks(
+            on_exclude=lambda path: excludes.append(path),
+            on_listdir_error=lambda path, error: pytest.fail(f"Unexpected on_listdir_error: {path=} {error=}"),
+            on_metadata_error=lambda path, error: pytest.fail(f"Unexpected on_metadata_error: {path=} {error=}"),
+        )
+        results = scan_filesystem(tmpdir, exclude_patterns, callbacks, workers, queue_size)
+        assert not results.paths_skipped
+        return results.tree, excludes
+
+    with AssertFilesystemUnmodified(tmpdir):
+        sequential_tree, sequential_excludes = scan(1)
+        parallel_tree, parallel_excludes = scan(4)
+        bounded_tree, bounded_excludes = scan(4, 2)
+
+    assert len(sequential_tree.subdirectories) == 5
+    assert len(sequential_excludes) == 10
+    assert parallel_tree == sequential_tree
+    assert parallel_excludes == sequential_excludes
+    assert bounded_tree == sequential_tree
+    assert bounded_excludes == sequential_excludes
+
+
+def test_scan_filesystem_invalid_workers(tmpdir: Path) -> None:
+    with pytest.raises(ValueError):
+        scan_filesystem(tmpdir, (), workers=0)
+    with pytest.raises(ValueError):
+        scan_filesystem(tmpdir, (), workers=2, queue_size=0)
+
+
+def test_iter_scan_filesystem(tmpdir: Path) -> None:
+    time = datetime(2021, 5, 6, tzinfo=timezone.utc)
+    (tmpdir / "a/b").mkdir(parents=True)
+    (tmpdir / "c").mkdir()
+    write_file_with_mtime(tmpdir / "a/b/file1", "", time)
+    write_file_with_mtime(tmpdir / "root_file", "", time)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        events = list(iter_scan_filesystem(tmpdir, (PathExcludePattern("/c/"),)))
+
+    # Directories are traversed depth-first, with the root first.
+    assert len(events) == 6
+    assert isinstance(events[0], ScanEnterDirectory)
+    assert events[0].name == ""
+    assert events[0].files == [File("root_file", datetime_to_ns(time))]
+    assert events[0].subdirectory_names == ["a"]
+    assert events[1] == ScanEnterDirectory("a", [], ["b"])
+    assert events[2] == ScanEnterDirectory("b", [File("file1", datetime_to_ns(time))], [])
+    assert events[3:] == [ScanExitDirectory()] * 3
+
+
+def test_iter_scan_filesystem_workers_queue_size(tmpdir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Only up to queue_size directories are listed ahead of the search, however many subdirectories are found.
+
+    for i in range(20):
+        for j in range(5):
+            (tmpdir / f"dir{i}/sub{j}").mkdir(parents=True)
+
+    list_directory = filesystem._list_directory
+    directories_listed: list[Path] = []
+
+    def counting_list_directory(directory: Path, *args: Any) -> Any:
+        directories_listed.append(directory)
+        return list_directory(directory, *args)
+
+    monkeypatch.setattr(filesystem, "_list_directory", counting_list_directory)
+
+    directories_entered = 0
+    for event in iter_scan_filesystem(tmpdir, (), workers=4, queue_size=3):
+        if isinstance(event, ScanEnterDirectory):
+            directories_entered += 1
+            assert len(directories_listed) - directories_entered <= 3
+
+    assert directories_entered == 1 + 20 + 20 * 5
+    assert len(directories_listed) == directories_entered
+
+
+def test_iter_scan_filesystem_root_excluded(tmpdir: Path) -> None:
+    (tmpdir / "file").touch()
+
+    with AssertFilesystemUnmodified(tmpdir):
+        events = list(iter_scan_filesystem(tmpdir, (PathExcludePattern("/"),)))
+
+    assert events == [ScanEnterDirectory("", [], []), ScanExitDirectory()]
+
+
 # Tolerance on file last modification time for testing scan_filesystem().
 FILE_MODIFY_TIME_TOLERANCE = 5  # Seconds
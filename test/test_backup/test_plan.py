@@ -1,21 +1,55 @@
+import gzip
+import hashlib
+import io
+import time
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Any, Optional
 
 import pytest
 
+from incremental_backup._utility import datetime_to_ns
 from incremental_backup.backup import filesystem
+from incremental_backup.backup import plan as plan_module
 from incremental_backup.backup.plan import (
+    DEFAULT_PIPELINE_QUEUE_SIZE,
+    BackupDestinationOptions,
+    BackupPipelineDestination,
     BackupPlan,
+    ExecuteBackupPipelineCallbacks,
     ExecuteBackupPlanCallbacks,
     ExecuteBackupPlanResults,
+    execute_backup_pipeline,
     execute_backup_plan,
 )
 from incremental_backup.backup.sum import BackupSum
-from incremental_backup.meta.manifest import BackupManifest
+from incremental_backup.compression import Compression
+from incremental_backup.meta.journal import (
+    BackupJournal,
+    BackupJournalWriter,
+    deserialise_backup_journal,
+)
+from incremental_backup.meta.manifest import (
+    BackupManifest,
+    BackupManifestWriter,
+    serialise_backup_manifest,
+)
 from incremental_backup.meta.meta import BackupMetadata
+from incremental_backup.meta.pack import BackupPackWriter
 from incremental_backup.meta.start_info import BackupStartInfo
+from incremental_backup.path_exclude import PathExcludePattern
+
+from test.helpers import (
+    AssertFilesystemUnmodified,
+    compute_directory_hash,
+    dir_entries,
+    unordered_equal,
+    write_file_with_mtime,
+)
 
-from test.helpers import AssertFilesystemUnmodified, dir_entries
+
+def make_file(name: str, last_modified: datetime, /) -> filesystem.File:
+    return filesystem.File(name, datetime_to_ns(last_modified))
 
 
 def test_backup_plan_directory_init() -> None:
@@ -83,23 +117,23 @@ def test_backup_plan_new() -> None:
         "",
         files=[
             # file_x.pdf removed
-            filesystem.File("file_z", datetime(2010, 7, 3, 8, 9, 3, tzinfo=timezone.utc)),  # New
-            filesystem.File("file_y", datetime(2010, 11, 2, 3, 30, 30, tzinfo=timezone.utc)),  # Existing modified
+            make_file("file_z", datetime(2010, 7, 3, 8, 9, 3, tzinfo=timezone.utc)),  # New
+            make_file("file_y", datetime(2010, 11, 2, 3, 30, 30, tzinfo=timezone.utc)),  # Existing modified
         ],
         subdirectories=[
             filesystem.Directory(
                 "dir_a",  # Existing
                 files=[
-                    filesystem.File(
+                    make_file(
                         "file_a_d.docx",
                         datetime(2010, 9, 9, 9, 9, 9, tzinfo=timezone.utc),
                     ),  # New
-                    filesystem.File(
+                    make_file(
                         "file_a_a.txt",
                         datetime(2010, 1, 7, 12, 34, 22, tzinfo=timezone.utc),
                     ),  # Existing unmodified
                     # file_a_c.exe removed
-                    filesystem.File(
+                    make_file(
                         "file_a_b.png",
                         datetime(2010, 6, 2, 20, 1, 1, tzinfo=timezone.utc),
                     ),  # Existing modified
@@ -109,7 +143,7 @@ def test_backup_plan_new() -> None:
                     filesystem.Directory(
                         "dir_a_b",  # New
                         files=[
-                            filesystem.File(
+                            make_file(
                                 "new_file",
                                 datetime(2011, 1, 1, 1, 1, 1, tzinfo=timezone.utc),
                             )
@@ -119,12 +153,12 @@ def test_backup_plan_new() -> None:
             ),
             filesystem.Directory(
                 "dir_b",
-                files=[filesystem.File("foo", datetime(2010, 5, 1, 12, 4, 2, tzinfo=timezone.utc))],  # Existing
+                files=[make_file("foo", datetime(2010, 5, 1, 12, 4, 2, tzinfo=timezone.utc))],  # Existing
             ),  # Existing unmodified
             filesystem.Directory(
                 "dir_c",  # Existing
                 files=[
-                    filesystem.File(
+                    make_file(
                         "bar.lnk",
                         datetime(2009, 11, 23, 22, 50, 12, tzinfo=timezone.utc),
                     )
@@ -143,7 +177,7 @@ def test_backup_plan_new() -> None:
                             filesystem.Directory(
                                 "final new dir... maybe",  # New
                                 files=[
-                                    filesystem.File(
+                                    make_file(
                                         "wrgauh",
                                         datetime(
                                             2012,
@@ -226,18 +260,18 @@ def test_backup_plan_new_empty_sum() -> None:
     source_tree = filesystem.Directory(
         "",
         files=[
-            filesystem.File("1 file", datetime(1999, 3, 2, 1, 2, 55, tzinfo=timezone.utc)),
-            filesystem.File("two files", datetime.now(timezone.utc)),
+            make_file("1 file", datetime(1999, 3, 2, 1, 2, 55, tzinfo=timezone.utc)),
+            make_file("two files", datetime.now(timezone.utc)),
         ],
         subdirectories=[
             filesystem.Directory(
                 "seriously",
                 files=[
-                    filesystem.File(
+                    make_file(
                         "running.out",
                         datetime(2010, 10, 12, 13, 14, 16, tzinfo=timezone.utc),
                     ),
-                    filesystem.File(
+                    make_file(
                         "of_names.jpg",
                         datetime(2015, 10, 10, 10, 10, 10, tzinfo=timezone.utc),
                     ),
@@ -247,7 +281,7 @@ def test_backup_plan_new_empty_sum() -> None:
                     filesystem.Directory(
                         "NOT EMPTY",
                         files=[
-                            filesystem.File(
+                            make_file(
                                 "foo&bar",
                                 datetime(2001, 3, 2, 4, 1, 5, tzinfo=timezone.utc),
                             )
@@ -258,7 +292,7 @@ def test_backup_plan_new_empty_sum() -> None:
             filesystem.Directory(
                 "LAST_dir",
                 files=[
-                    filesystem.File(
+                    make_file(
                         "qux",
                         datetime(2020, 2, 20, 20, 20, 20, 42, tzinfo=timezone.utc),
                     )
@@ -359,6 +393,36 @@ def test_backup_plan_new_all_removed() -> None:
     assert actual_plan == expected_plan
 
 
+def test_backup_plan_new_modified_time_precision() -> None:
+    # Modification times are compared to the nanosecond, finer than datetime can represent.
+
+    backup_time = datetime(2020, 1, 1, 10, 0, 0, 5, tzinfo=timezone.utc)
+    backup1 = BackupMetadata("fhw8o34tyh", BackupStartInfo(backup_time), None)
+    backup_sum = BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[
+                BackupSum.File("before", backup1),
+                BackupSum.File("same", backup1),
+                BackupSum.File("after", backup1),
+            ],
+        )
+    )
+    backup_time_ns = datetime_to_ns(backup_time)
+    source_tree = filesystem.Directory(
+        "",
+        files=[
+            filesystem.File("before", backup_time_ns - 1),
+            filesystem.File("same", backup_time_ns),
+            filesystem.File("after", backup_time_ns + 1),
+        ],
+    )
+
+    plan = BackupPlan.new(source_tree, backup_sum)
+
+    assert plan.root.copied_files == ["after"]
+
+
 def test_execute_backup_plan(tmpdir: Path) -> None:
     # Test some errors.
 
@@ -452,8 +516,13 @@ def test_execute_backup_plan(tmpdir: Path) -> None:
         on_copy_error=lambda s, d, e: copy_errors.append((s, d, e)),
     )
 
+    manifest_stream = io.StringIO()
+    manifest_writer = BackupManifestWriter(manifest_stream)
     with AssertFilesystemUnmodified(source_path):
-        actual_results = execute_backup_plan(plan, source_path, destination_path, callbacks)
+        actual_results = execute_backup_plan(
+            plan, source_path, destination_path, callbacks, manifest_writer=manifest_writer
+        )
+    manifest_writer.finish()
 
     (destination_path / "something/uh oh").unlink(missing_ok=False)
 
@@ -499,6 +568,8 @@ def test_execute_backup_plan(tmpdir: Path) -> None:
     assert dir_entries(destination_path / "nonexistent_directory") == set()
 
     assert actual_results == expected_results
+    assert sum(actual_results.copy_methods.values()) == 4
+    assert manifest_stream.getvalue() == serialise_backup_manifest(expected_manifest)
 
     assert len(mkdir_errors) == 1
     assert mkdir_errors[0][0] == destination_path / "something/uh oh"
@@ -513,6 +584,479 @@ def test_execute_backup_plan(tmpdir: Path) -> None:
     assert isinstance(copy_errors[1][2], FileNotFoundError)
 
 
+def test_execute_backup_plan_workers(tmpdir: Path) -> None:
+    # Results and callbacks should be identical regardless of the number of worker threads.
+
+    source_path = tmpdir / "source"
+    plan = BackupPlan(BackupPlan.Directory("", contains_copied_files=True, contains_removed_items=True))
+    for i in range(5):
+        directory = BackupPlan.Directory(
+            f"dir{i}", removed_files=[f"removed{i}"], contains_copied_files=True, contains_removed_items=True
+        )
+        plan.root.subdirectories.append(directory)
+        (source_path / f"dir{i}").mkdir(parents=True)
+        for j in range(10):
+            (source_path / f"dir{i}/file{j}").write_text(f"contents {i} {j}")
+            directory.copied_files.append(f"file{j}")
+        directory.copied_files.insert(3, "nonexistent")
+        subdirectory = BackupPlan.Directory("sub", copied_files=["subfile"], contains_copied_files=True)
+        directory.subdirectories.append(subdirectory)
+        (source_path / f"dir{i}/sub").mkdir()
+        (source_path / f"dir{i}/sub/subfile").write_text("sub")
+
+    def execute(
+        workers: int, queue_size: int = DEFAULT_PIPELINE_QUEUE_SIZE
+    ) -> tuple[ExecuteBackupPlanResults, list[tuple[Path, Path]], list[Path], Path]:
+        destination_path = tmpdir / f"{workers}_{queue_size}" / "destination"
+        # Force a directory creation failure.
+        (destination_path / "dir2").mkdir(parents=True)
+        write_file_with_mtime(destination_path / "dir2/sub", "", datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+        mkdir_errors: list[Path] = []
+        copy_errors: list[tuple[Path, Path]] = []
+        callbacks = ExecuteBackupPlanCallbacks(
+            on_mkdir_error=lambda p, e: mkdir_errors.append(p.relative_to(destination_path)),
+            on_copy_error=lambda s, d, e: copy_errors.append(
+                (s.relative_to(source_path), d.relative_to(destination_path))
+            ),
+        )
+        results = execute_backup_plan(plan, source_path, destination_path, callbacks, workers, queue_size=queue_size)
+        return results, copy_errors, mkdir_errors, destination_path
+
+    with AssertFilesystemUnmodified(source_path):
+        sequential_results, sequential_copy_errors, sequential_mkdir_errors, sequential_path = execute(1)
+        for workers, queue_size in ((4, DEFAULT_PIPELINE_QUEUE_SIZE), (4, 1), (4, 12)):
+            parallel_results, parallel_copy_errors, parallel_mkdir_errors, parallel_path = execute(workers, queue_size)
+
+            assert parallel_results == sequential_results
+            assert parallel_copy_errors == sequential_copy_errors
+            assert parallel_mkdir_errors == sequential_mkdir_errors
+            assert compute_directory_hash(parallel_path) == compute_directory_hash(sequential_path)
+
+    assert sequential_results.files_copied == 5 * 11 - 1
+    assert len(sequential_copy_errors) == 5
+    assert sequential_mkdir_errors == [Path("dir2/sub")]
+
+
+def test_execute_backup_plan_workers_queue_size(tmpdir: Path) -> None:
+    # Directories are only started a limited distance ahead of the manifest.
+
+    source_path = tmpdir / "source"
+    destination_path = tmpdir / "destination"
+    plan = BackupPlan(BackupPlan.Directory("", contains_copied_files=True))
+    for i in range(5):
+        plan.root.subdirectories.append(
+            BackupPlan.Directory(f"dir{i}", copied_files=["nonexistent", "file"], contains_copied_files=True)
+        )
+        (source_path / f"dir{i}").mkdir(parents=True)
+        (source_path / f"dir{i}/file").write_text(str(i))
+
+    created_directories: list[set[str]] = []
+    callbacks = ExecuteBackupPlanCallbacks(
+        on_copy_error=lambda s, d, e: created_directories.append(dir_entries(destination_path))
+    )
+    results = execute_backup_plan(plan, source_path, destination_path, callbacks, workers=4, queue_size=2)
+
+    assert results.files_copied == 5
+    assert created_directories[0] == {"dir0", "dir1"}
+    assert created_directories[-1] == {"dir0", "dir1", "dir2", "dir3", "dir4"}
+
+
+def test_execute_backup_plan_object_store(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "a.txt").write_text("same")
+    (source_path / "b.txt").write_text("different")
+    (source_path / "dir/c.txt").write_text("same")
+    objects_path = tmpdir / "objects"
+    destination_path = tmpdir / "destination"
+    destination_path.mkdir()
+
+    plan = BackupPlan(
+        BackupPlan.Directory(
+            "",
+            copied_files=["a.txt", "b.txt", "nonexistent"],
+            removed_files=["removed"],
+            subdirectories=[BackupPlan.Directory("dir", copied_files=["c.txt"], contains_copied_files=True)],
+            contains_copied_files=True,
+            contains_removed_items=True,
+        )
+    )
+
+    copy_errors: list[tuple[Path, Path]] = []
+    callbacks = ExecuteBackupPlanCallbacks(
+        on_mkdir_error=lambda path, error: pytest.fail(f"Unexpected on_mkdir_error: {path=} {error=}"),
+        on_copy_error=lambda src, dest, error: copy_errors.append((src, dest)),
+    )
+    for workers in (1, 3):
+        with AssertFilesystemUnmodified(source_path), AssertFilesystemUnmodified(destination_path):
+            results = execute_backup_plan(
+                plan,
+                source_path,
+                destination_path,
+                callbacks,
+                workers,
+                options=BackupDestinationOptions(objects_directory=objects_path),
+            )
+
+        same_hash = hashlib.sha256(b"same").hexdigest()
+        different_hash = hashlib.sha256(b"different").hexdigest()
+        expected_manifest = BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["a.txt", "b.txt"],
+                copied_file_hashes=[same_hash, different_hash],
+                removed_files=["removed"],
+                subdirectories=[
+                    BackupManifest.Directory("dir", copied_files=["c.txt"], copied_file_hashes=[same_hash])
+                ],
+            )
+        )
+        # Second time around, all the contents are already stored.
+        expected_deduplicated = 1 if workers == 1 else 3
+        assert results == ExecuteBackupPlanResults(expected_manifest, True, 3, 1, {}, expected_deduplicated)
+        assert dir_entries(objects_path) == {same_hash[:2], different_hash[:2]}
+        assert (objects_path / same_hash[:2] / same_hash[2:]).read_text() == "same"
+        assert (objects_path / different_hash[:2] / different_hash[2:]).read_text() == "different"
+    assert copy_errors == [(source_path / "nonexistent", objects_path)] * 2
+
+
+def test_execute_backup_plan_pack(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "small_dir").mkdir(parents=True)
+    (source_path / "big_dir").mkdir()
+    write_file_with_mtime(source_path / "a.txt", "small", datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc))
+    (source_path / "small_dir/b.txt").write_text("tiny")
+    (source_path / "small_dir/b.txt").chmod(0o600)
+    (source_path / "big_dir/c.txt").write_text("large file contents")
+    (source_path / "big_dir/d.txt").write_text("1234567890")
+
+    plan = BackupPlan(
+        BackupPlan.Directory(
+            "",
+            copied_files=["a.txt", "nonexistent"],
+            subdirectories=[
+                BackupPlan.Directory("small_dir", copied_files=["b.txt"], contains_copied_files=True),
+                BackupPlan.Directory("big_dir", copied_files=["c.txt", "d.txt"], contains_copied_files=True),
+            ],
+            contains_copied_files=True,
+        )
+    )
+    expected_manifest = BackupManifest(
+        BackupManifest.Directory(
+            "",
+            copied_files=["a.txt"],
+            subdirectories=[
+                BackupManifest.Directory("small_dir", copied_files=["b.txt"]),
+                BackupManifest.Directory("big_dir", copied_files=["c.txt", "d.txt"]),
+            ],
+        )
+    )
+
+    for workers in (1, 3):
+        destination_path = tmpdir / f"destination{workers}"
+        destination_path.mkdir()
+        packs_path = tmpdir / f"packs{workers}"
+        copy_errors: list[tuple[Path, Path]] = []
+        callbacks = ExecuteBackupPlanCallbacks(
+            on_mkdir_error=lambda path, error: pytest.fail(f"Unexpected on_mkdir_error: {path=} {error=}"),
+            on_copy_error=lambda src, dest, error: copy_errors.append((src, dest)),
+        )
+        pack_writer = BackupPackWriter(packs_path)
+        with AssertFilesystemUnmodified(source_path):
+            results = execute_backup_plan(
+                plan,
+                source_path,
+                destination_path,
+                callbacks,
+                workers,
+                options=BackupDestinationOptions(pack_writer=pack_writer, pack_threshold=10),
+            )
+        pack_index = pack_writer.finish()
+
+        assert results == ExecuteBackupPlanResults(expected_manifest, True, 4, 0, {}, 0, 3)
+        assert copy_errors == [(source_path / "nonexistent", destination_path / "nonexistent")]
+        # Directories are only created for files which aren't packed.
+        assert dir_entries(destination_path) == {"big_dir"}
+        assert dir_entries(destination_path / "big_dir") == {"c.txt"}
+        assert (destination_path / "big_dir/c.txt").read_text() == "large file contents"
+        # Packed in plan order regardless of the number of workers.
+        assert [(e.path, e.offset, e.size) for e in pack_index.entries] == [
+            (("a.txt",), 0, 5),
+            (("small_dir", "b.txt"), 5, 4),
+            (("big_dir", "d.txt"), 9, 10),
+        ]
+        assert pack_index.entries[0].last_modified_ns == (source_path / "a.txt").stat().st_mtime_ns
+        assert pack_index.entries[1].mode == 0o600
+        assert (packs_path / "0.pack").read_text() == "smalltiny1234567890"
+
+
+def test_execute_backup_plan_pack_bounded_reads(tmpdir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Small files' data is held until packed in order, so workers only read a few files ahead of the pack.
+
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    plan = BackupPlan(BackupPlan.Directory("", copied_files=["nonexistent"], contains_copied_files=True))
+    for i in range(100):
+        (source_path / f"{i}.txt").write_text(str(i))
+        plan.root.copied_files.append(f"{i}.txt")
+
+    files_read: list[Path] = []
+
+    def pack_or_copy_file(source: Path, destination: Path, /, **kwargs: Any) -> Any:
+        files_read.append(source)
+        return original_pack_or_copy_file(source, destination, **kwargs)
+
+    original_pack_or_copy_file = plan_module._pack_or_copy_file
+    monkeypatch.setattr(plan_module, "_pack_or_copy_file", pack_or_copy_file)
+
+    files_read_at_first_result: list[int] = []
+
+    def on_copy_error(source: Path, destination: Path, error: OSError) -> None:
+        # Give the workers time to read all they can.
+        time.sleep(0.2)
+        files_read_at_first_result.append(len(files_read))
+
+    pack_writer = BackupPackWriter(tmpdir / "packs")
+    results = execute_backup_plan(
+        plan,
+        source_path,
+        tmpdir / "destination",
+        ExecuteBackupPlanCallbacks(on_copy_error=on_copy_error),
+        workers=2,
+        options=BackupDestinationOptions(pack_writer=pack_writer, pack_threshold=10),
+    )
+    pack_writer.finish()
+
+    assert results.files_packed == 100
+    # Plus one submitted once the first copy completed.
+    assert files_read_at_first_result[0] <= 2 * plan_module._COPIES_IN_FLIGHT_PER_WORKER + 1
+    assert len(files_read) == 101
+
+
+def test_execute_backup_plan_compression(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    mtime = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    write_file_with_mtime(source_path / "a.txt", "compressible " * 1000, mtime)
+    (source_path / "dir/b.txt").write_text("b")
+
+    plan = BackupPlan(
+        BackupPlan.Directory(
+            "",
+            copied_files=["a.txt"],
+            subdirectories=[BackupPlan.Directory("dir", copied_files=["b.txt"], contains_copied_files=True)],
+            contains_copied_files=True,
+        )
+    )
+    expected_manifest = BackupManifest(
+        BackupManifest.Directory(
+            "", copied_files=["a.txt"], subdirectories=[BackupManifest.Directory("dir", copied_files=["b.txt"])]
+        )
+    )
+
+    for workers in (1, 3):
+        destination_path = tmpdir / f"destination{workers}"
+        with AssertFilesystemUnmodified(source_path):
+            results = execute_backup_plan(
+                plan,
+                source_path,
+                destination_path,
+                workers=workers,
+                options=BackupDestinationOptions(compression=Compression.GZIP),
+            )
+
+        assert results == ExecuteBackupPlanResults(expected_manifest, False, 2, 0, {})
+        assert results.copy_methods == {}
+        with gzip.open(destination_path / "a.txt", "rt") as file:
+            assert file.read() == "compressible " * 1000
+        assert (destination_path / "a.txt").stat().st_mtime == mtime.timestamp()
+        with gzip.open(destination_path / "dir/b.txt", "rt") as file:
+            assert file.read() == "b"
+
+
+def test_execute_backup_plan_journal(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "a.txt").write_text("small")
+    (source_path / "dir/b.txt").write_text("large file contents")
+
+    plan = BackupPlan(
+        BackupPlan.Directory(
+            "",
+            copied_files=["a.txt", "nonexistent"],
+            subdirectories=[BackupPlan.Directory("dir", copied_files=["b.txt"], contains_copied_files=True)],
+            contains_copied_files=True,
+        )
+    )
+
+    for workers in (1, 3):
+        destination_path = tmpdir / f"destination{workers}"
+        journal_stream = io.StringIO()
+        pack_writer = BackupPackWriter(tmpdir / f"packs{workers}")
+        with AssertFilesystemUnmodified(source_path):
+            results = execute_backup_plan(
+                plan,
+                source_path,
+                destination_path,
+                workers=workers,
+                options=BackupDestinationOptions(
+                    pack_writer=pack_writer, pack_threshold=10, journal_writer=BackupJournalWriter(journal_stream)
+                ),
+            )
+        pack_writer.finish()
+
+        assert results.files_copied == 2
+        assert results.files_packed == 1
+        # Packed files and failed copies aren't journaled.
+        assert deserialise_backup_journal(journal_stream.getvalue()) == BackupJournal(
+            [BackupJournal.Entry(("dir", "b.txt"), (source_path / "dir/b.txt").stat().st_mtime_ns, 19)]
+        )
+
+
+def test_execute_backup_plan_resume(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    for name in ("a.txt", "b.txt", "c.txt", "dir/d.txt"):
+        (source_path / name).write_text(f"{name} contents")
+
+    plan = BackupPlan(
+        BackupPlan.Directory(
+            "",
+            copied_files=["a.txt", "b.txt", "c.txt"],
+            subdirectories=[BackupPlan.Directory("dir", copied_files=["d.txt"], contains_copied_files=True)],
+            contains_copied_files=True,
+        )
+    )
+    expected_manifest = BackupManifest(
+        BackupManifest.Directory(
+            "",
+            copied_files=["a.txt", "b.txt", "c.txt"],
+            subdirectories=[BackupManifest.Directory("dir", copied_files=["d.txt"])],
+        )
+    )
+
+    for workers in (1, 3):
+        destination_path = tmpdir / f"destination{workers}"
+        first_journal_stream = io.StringIO()
+        execute_backup_plan(
+            plan,
+            source_path,
+            destination_path,
+            workers=workers,
+            options=BackupDestinationOptions(journal_writer=BackupJournalWriter(first_journal_stream)),
+        )
+        journal = deserialise_backup_journal(first_journal_stream.getvalue())
+        # As if the backup was interrupted before c.txt was journaled.
+        journal.entries = [e for e in journal.entries if e.path != ("c.txt",)]
+        # Marks the copy, to check it isn't copied again.
+        (destination_path / "a.txt").write_text("A.TXT CONTENTS")
+        (source_path / "b.txt").write_text("b.txt modified")
+        (destination_path / "dir/d.txt").unlink()
+
+        journal_stream = io.StringIO()
+        with AssertFilesystemUnmodified(source_path):
+            results = execute_backup_plan(
+                plan,
+                source_path,
+                destination_path,
+                workers=workers,
+                options=BackupDestinationOptions(
+                    journal_writer=BackupJournalWriter(journal_stream), resume_journal=journal
+                ),
+            )
+
+        assert results == ExecuteBackupPlanResults(expected_manifest, False, 4, 0, results.copy_methods, 0, 0, 1)
+        assert (destination_path / "a.txt").read_text() == "A.TXT CONTENTS"
+        assert (destination_path / "b.txt").read_text() == "b.txt modified"
+        assert (destination_path / "c.txt").read_text() == "c.txt contents"
+        assert (destination_path / "dir/d.txt").read_text() == "dir/d.txt contents"
+        # Only the files copied again are journaled again.
+        assert [e.path for e in deserialise_backup_journal(journal_stream.getvalue()).entries] == [
+            ("b.txt",),
+            ("c.txt",),
+            ("dir", "d.txt"),
+        ]
+
+        (source_path / "b.txt").write_text("b.txt contents")
+
+
+def test_execute_backup_plan_resume_object_store(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    (source_path / "a.txt").write_text("a")
+    (source_path / "b.txt").write_text("b")
+    objects_path = tmpdir / "objects"
+    destination_path = tmpdir / "destination"
+    destination_path.mkdir()
+
+    plan = BackupPlan(BackupPlan.Directory("", copied_files=["a.txt", "b.txt"], contains_copied_files=True))
+    a_hash = hashlib.sha256(b"a").hexdigest()
+    b_hash = hashlib.sha256(b"b").hexdigest()
+
+    journal_stream = io.StringIO()
+    execute_backup_plan(
+        plan,
+        source_path,
+        destination_path,
+        options=BackupDestinationOptions(
+            objects_directory=objects_path, journal_writer=BackupJournalWriter(journal_stream)
+        ),
+    )
+    journal = deserialise_backup_journal(journal_stream.getvalue())
+    assert journal == BackupJournal(
+        [
+            BackupJournal.Entry(("a.txt",), (source_path / "a.txt").stat().st_mtime_ns, 1, a_hash),
+            BackupJournal.Entry(("b.txt",), (source_path / "b.txt").stat().st_mtime_ns, 1, b_hash),
+        ]
+    )
+    # The object is missing, so the file must be stored again.
+    (objects_path / b_hash[:2] / b_hash[2:]).unlink()
+
+    with AssertFilesystemUnmodified(source_path), AssertFilesystemUnmodified(destination_path):
+        results = execute_backup_plan(
+            plan,
+            source_path,
+            destination_path,
+            options=BackupDestinationOptions(objects_directory=objects_path, resume_journal=journal),
+        )
+
+    assert results.manifest == BackupManifest(
+        BackupManifest.Directory("", copied_files=["a.txt", "b.txt"], copied_file_hashes=[a_hash, b_hash])
+    )
+    assert results.files_resumed == 1
+    assert results.files_deduplicated == 0
+    assert (objects_path / b_hash[:2] / b_hash[2:]).read_text() == "b"
+
+
+def test_execute_backup_plan_pack_and_object_store(tmpdir: Path) -> None:
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(ValueError):
+            execute_backup_plan(
+                BackupPlan(),
+                tmpdir / "source",
+                tmpdir / "destination",
+                options=BackupDestinationOptions(
+                    objects_directory=tmpdir / "objects", pack_writer=BackupPackWriter(tmpdir / "packs")
+                ),
+            )
+        with pytest.raises(ValueError):
+            execute_backup_plan(
+                BackupPlan(),
+                tmpdir / "source",
+                tmpdir / "destination",
+                options=BackupDestinationOptions(objects_directory=tmpdir / "objects", compression=Compression.BZ2),
+            )
+
+
+def test_execute_backup_plan_invalid_workers(tmpdir: Path) -> None:
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(ValueError):
+            execute_backup_plan(BackupPlan(), tmpdir / "source", tmpdir / "destination", workers=0)
+        with pytest.raises(ValueError):
+            execute_backup_plan(BackupPlan(), tmpdir / "source", tmpdir / "destination", workers=2, queue_size=0)
+
+
 def test_execute_backup_plan_empty_plan(tmpdir: Path) -> None:
     # Empty backup plan and empty source directory.
 
@@ -536,3 +1080,195 @@ def test_execute_backup_plan_empty_plan(tmpdir: Path) -> None:
     assert actual_results == expected_results
 
     assert dir_entries(destination_path) == set()
+
+
+def test_execute_backup_pipeline(tmpdir: Path) -> None:
+    # Should be equivalent to scanning, planning and executing the plan separately.
+
+    source_path = tmpdir / "source"
+    old_time = datetime(2010, 1, 1, tzinfo=timezone.utc)
+    backup1 = BackupMetadata("sdfjhgw4k", BackupStartInfo(datetime(2015, 1, 1, tzinfo=timezone.utc)), None)
+    backup_sum = BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[BackupSum.File("unchanged", backup1), BackupSum.File("removed", backup1)],
+            subdirectories=[
+                BackupSum.Directory("unchanged_dir", files=[BackupSum.File("file", backup1)]),
+                BackupSum.Directory("removed_dir", files=[BackupSum.File("file", backup1)]),
+            ],
+        )
+    )
+    (source_path / "unchanged_dir").mkdir(parents=True)
+    write_file_with_mtime(source_path / "unchanged", "old", old_time)
+    write_file_with_mtime(source_path / "unchanged_dir/file", "old", old_time)
+    (source_path / "new_file").write_text("new")
+    for i in range(6):
+        (source_path / f"dir{i}/empty").mkdir(parents=True)
+        for j in range(i):
+            (source_path / f"dir{i}/sub{j}").mkdir()
+            (source_path / f"dir{i}/sub{j}/file{j}").write_text(f"{i} {j}")
+        (source_path / f"dir{i}/excluded.tmp").touch()
+    exclude_patterns = (PathExcludePattern(r".*\.tmp"),)
+
+    def execute_separately() -> tuple[ExecuteBackupPlanResults, str, Path]:
+        destination_path = tmpdir / "separate/destination"
+        destination_path.parent.mkdir()
+        manifest_stream = io.StringIO()
+        manifest_writer = BackupManifestWriter(manifest_stream)
+        tree = filesystem.scan_filesystem(source_path, exclude_patterns).tree
+        plan = BackupPlan.new(tree, backup_sum)
+        results = execute_backup_plan(plan, source_path, destination_path, manifest_writer=manifest_writer)
+        manifest_writer.finish()
+        return results, manifest_stream.getvalue(), destination_path
+
+    def execute_pipeline(
+        copy_workers: int, queue_size: int
+    ) -> tuple[Optional[ExecuteBackupPlanResults], str, Path, list[Path]]:
+        destination_path = tmpdir / f"pipeline{copy_workers}_{queue_size}/destination"
+        destination_path.parent.mkdir()
+        manifest_stream = io.StringIO()
+        manifest_writer = BackupManifestWriter(manifest_stream)
+        excludes: list[Path] = []
+        callbacks = ExecuteBackupPipelineCallbacks(
+            scan_source=filesystem.ScanFilesystemCallbacks(on_exclude=lambda p: excludes.append(p))
+        )
+        results = execute_backup_pipeline(
+            source_path,
+            exclude_patterns,
+            backup_sum,
+            lambda: BackupPipelineDestination(destination_path, manifest_writer),
+            callbacks,
+            copy_workers=copy_workers,
+            queue_size=queue_size,
+        )
+        manifest_writer.finish()
+        return results, manifest_stream.getvalue(), destination_path, excludes
+
+    with AssertFilesystemUnmodified(source_path):
+        expected_results, expected_manifest, expected_path = execute_separately()
+        for copy_workers, queue_size in ((1, 1), (1, 1000), (3, 1), (3, 2), (3, 1000)):
+            actual_results, actual_manifest, actual_path, excludes = execute_pipeline(copy_workers, queue_size)
+            assert actual_results == expected_results
+            assert actual_manifest == expected_manifest
+            assert compute_directory_hash(actual_path) == compute_directory_hash(expected_path)
+            assert len(excludes) == 6
+
+    assert expected_results.files_copied == 16
+    assert expected_results.files_removed == 2
+
+
+def test_execute_backup_pipeline_mkdir_error(tmpdir: Path) -> None:
+    # The manifest, created directories and errors should still match executing the plan separately.
+
+    source_path = tmpdir / "source"
+    backup1 = BackupMetadata("sdfjhgw4k", BackupStartInfo(datetime(2015, 1, 1, tzinfo=timezone.utc)), None)
+    backup_sum = BackupSum(
+        BackupSum.Directory(
+            "",
+            subdirectories=[
+                BackupSum.Directory(
+                    "blocked", subdirectories=[BackupSum.Directory("sub2", files=[BackupSum.File("removed", backup1)])]
+                ),
+                BackupSum.Directory(
+                    "failed", subdirectories=[BackupSum.Directory("inner", files=[BackupSum.File("removed", backup1)])]
+                ),
+            ],
+        )
+    )
+    (source_path / "blocked/sub1").mkdir(parents=True)
+    (source_path / "blocked/sub2").mkdir()
+    (source_path / "failed/inner").mkdir(parents=True)
+    (source_path / "file").write_text("copied")
+    (source_path / "blocked/sub1/file").write_text("not copied")
+    (source_path / "blocked/sub2/file").write_text("not copied")
+    (source_path / "failed/file").write_text("not copied")
+    (source_path / "failed/inner/file").write_text("not copied")
+
+    def make_destination(name: str) -> Path:
+        destination_path = tmpdir / name / "destination"
+        destination_path.mkdir(parents=True)
+        # Force directory creation failures.
+        (destination_path / "blocked").touch()
+        (destination_path / "failed").touch()
+        return destination_path
+
+    def execute_separately(workers: int) -> tuple[ExecuteBackupPlanResults, str, list[Path]]:
+        destination_path = make_destination(f"separate{workers}")
+        manifest_stream = io.StringIO()
+        manifest_writer = BackupManifestWriter(manifest_stream)
+        mkdir_errors: list[Path] = []
+        callbacks = ExecuteBackupPlanCallbacks(
+            on_mkdir_error=lambda p, e: mkdir_errors.append(p.relative_to(destination_path))
+        )
+        plan = BackupPlan.new(filesystem.scan_filesystem(source_path, ()).tree, backup_sum)
+        results = execute_backup_plan(plan, source_path, destination_path, callbacks, workers, manifest_writer)
+        manifest_writer.finish()
+        return results, manifest_stream.getvalue(), mkdir_errors
+
+    def execute_pipeline(copy_workers: int) -> tuple[Optional[ExecuteBackupPlanResults], str, list[Path]]:
+        destination_path = make_destination(f"pipeline{copy_workers}")
+        manifest_stream = io.StringIO()
+        manifest_writer = BackupManifestWriter(manifest_stream)
+        mkdir_errors: list[Path] = []
+        callbacks = ExecuteBackupPipelineCallbacks(
+            execute_plan=ExecuteBackupPlanCallbacks(
+                on_mkdir_error=lambda p, e: mkdir_errors.append(p.relative_to(destination_path))
+            )
+        )
+        results = execute_backup_pipeline(
+            source_path,
+            (),
+            backup_sum,
+            lambda: BackupPipelineDestination(destination_path, manifest_writer),
+            callbacks,
+            copy_workers=copy_workers,
+        )
+        manifest_writer.finish()
+        return results, manifest_stream.getvalue(), mkdir_errors
+
+    with AssertFilesystemUnmodified(source_path):
+        expected_results, expected_manifest, expected_mkdir_errors = execute_separately(1)
+        assert execute_separately(3) == (expected_results, expected_manifest, expected_mkdir_errors)
+        for copy_workers in (1, 3):
+            assert execute_pipeline(copy_workers) == (expected_results, expected_manifest, expected_mkdir_errors)
+
+    # Directories containing nothing backed up are omitted, however they failed.
+    root = expected_results.manifest.root
+    assert root.copied_files == ["file"]
+    assert unordered_equal(
+        root.subdirectories,
+        [
+            BackupManifest.Directory(
+                "blocked", subdirectories=[BackupManifest.Directory("sub2", removed_files=["removed"])]
+            ),
+            BackupManifest.Directory(
+                "failed", subdirectories=[BackupManifest.Directory("inner", removed_files=["removed"])]
+            ),
+        ],
+    )
+    assert unordered_equal(expected_mkdir_errors, [Path("blocked/sub1"), Path("blocked/sub2"), Path("failed")])
+
+
+def test_execute_backup_pipeline_no_changes(tmpdir: Path) -> None:
+    time = datetime(2010, 1, 1, tzinfo=timezone.utc)
+    backup1 = BackupMetadata("sdfjhgw4k", BackupStartInfo(datetime(2015, 1, 1, tzinfo=timezone.utc)), None)
+    backup_sum = BackupSum(BackupSum.Directory("", files=[BackupSum.File("file", backup1)]))
+    write_file_with_mtime(tmpdir / "file", "", time)
+    (tmpdir / "empty").mkdir()
+
+    def initialise() -> BackupPipelineDestination:
+        pytest.fail("Unexpected initialise")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        assert execute_backup_pipeline(tmpdir, (), backup_sum, initialise) is None
+        assert execute_backup_pipeline(tmpdir, (), backup_sum, initialise, copy_workers=4) is None
+
+
+def test_execute_backup_pipeline_invalid_arguments(tmpdir: Path) -> None:
+    def initialise() -> BackupPipelineDestination:
+        pytest.fail("Unexpected initialise")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        for kwargs in ({"scan_workers": 0}, {"copy_workers": 0}, {"queue_size": 0}):
+            with pytest.raises(ValueError):
+                execute_backup_pipeline(tmpdir, (), BackupSum(), initialise, **kwargs)
@@ -1,9 +1,21 @@
+import io
 from datetime import datetime, timezone
+from typing import Iterator
 
 from incremental_backup.backup.sum import BackupSum
-from incremental_backup.meta.manifest import BackupManifest
+from incremental_backup.meta.manifest import (
+    BackupManifest,
+    BackupManifestEvent,
+    iter_backup_manifest,
+    serialise_backup_manifest,
+)
 from incremental_backup.meta.meta import BackupMetadata
 from incremental_backup.meta.start_info import BackupStartInfo
+from incremental_backup.path_filter import PathFilter
+
+
+def manifest_events(metadata: BackupMetadata, /) -> tuple[BackupMetadata, Iterator[BackupManifestEvent]]:
+    return metadata, iter_backup_manifest(io.StringIO(serialise_backup_manifest(metadata.manifest)))
 
 
 def test_backup_sum_empty() -> None:
@@ -171,6 +183,7 @@ def test_backup_sum_multiple_backups() -> None:
     )
 
     backup_sum = BackupSum.from_backups((metadata2, metadata1, metadata3))
+    events_sum = BackupSum.from_manifest_events(map(manifest_events, (metadata1, metadata2, metadata3)))
 
     expected = BackupSum(
         BackupSum.Directory(
@@ -198,6 +211,59 @@ def test_backup_sum_multiple_backups() -> None:
     )
 
     assert backup_sum == expected
+    assert events_sum == expected
+
+
+def test_backup_sum_readded() -> None:
+    # Files and directories which are removed and later backed up again.
+
+    metadata1 = BackupMetadata(
+        "5hj34k5g2g5",
+        BackupStartInfo(datetime(2022, 1, 1, tzinfo=timezone.utc)),
+        BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["a", "b", "c"],
+                subdirectories=[
+                    BackupManifest.Directory("x", copied_files=["x1"]),
+                    BackupManifest.Directory("y", copied_files=["y1"]),
+                ],
+            )
+        ),
+    )
+    metadata2 = BackupMetadata(
+        "8934h5g2jhg",
+        BackupStartInfo(datetime(2022, 1, 2, tzinfo=timezone.utc)),
+        BackupManifest(BackupManifest.Directory("", removed_files=["a"], removed_directories=["x"])),
+    )
+    metadata3 = BackupMetadata(
+        "uy46ui3g4kj",
+        BackupStartInfo(datetime(2022, 1, 3, tzinfo=timezone.utc)),
+        BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["b", "a"],
+                subdirectories=[BackupManifest.Directory("x", copied_files=["x2"])],
+            )
+        ),
+    )
+
+    backup_sum = BackupSum.from_backups((metadata3, metadata2, metadata1))
+    events_sum = BackupSum.from_manifest_events(map(manifest_events, (metadata1, metadata2, metadata3)))
+
+    expected = BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[BackupSum.File("b", metadata3), BackupSum.File("c", metadata1), BackupSum.File("a", metadata3)],
+            subdirectories=[
+                BackupSum.Directory("y", files=[BackupSum.File("y1", metadata1)]),
+                BackupSum.Directory("x", files=[BackupSum.File("x2", metadata3)]),
+            ],
+        )
+    )
+
+    assert backup_sum == expected
+    assert events_sum == expected
 
 
 def test_backup_sum_count_contained_files() -> None:
@@ -229,3 +295,79 @@ def test_backup_sum_count_contained_files() -> None:
     assert dir5.count_contained_files() == 6
     assert dir6.count_contained_files() == 1
     assert dir7.count_contained_files() == 9
+
+
+def test_backup_sum_content_hashes() -> None:
+    backup1 = BackupMetadata(
+        "gh894hg8o3h",
+        BackupStartInfo(datetime(2023, 1, 1, tzinfo=timezone.utc)),
+        BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["a", "b"],
+                copied_file_hashes=["1" * 64, "2" * 64],
+                subdirectories=[BackupManifest.Directory("c", copied_files=["d"])],
+            )
+        ),
+    )
+    backup2 = BackupMetadata(
+        "w4g8hs98rgh",
+        BackupStartInfo(datetime(2023, 1, 2, tzinfo=timezone.utc)),
+        BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["b"],
+                subdirectories=[BackupManifest.Directory("c", copied_files=["d"], copied_file_hashes=["3" * 64])],
+            )
+        ),
+    )
+
+    expected = BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[BackupSum.File("a", backup1, "1" * 64), BackupSum.File("b", backup2)],
+            subdirectories=[BackupSum.Directory("c", files=[BackupSum.File("d", backup2, "3" * 64)])],
+        )
+    )
+    assert BackupSum.from_backups((backup2, backup1)) == expected
+    assert BackupSum.from_manifest_events(map(manifest_events, (backup1, backup2))) == expected
+
+
+def test_backup_sum_filtered() -> None:
+    backup = BackupMetadata(
+        "sdfh4598h24ueg",
+        BackupStartInfo(datetime(2023, 1, 1, tzinfo=timezone.utc)),
+        BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["a", "b"],
+                subdirectories=[
+                    BackupManifest.Directory(
+                        "c", copied_files=["d"], subdirectories=[BackupManifest.Directory("e", copied_files=["f"])]
+                    ),
+                    BackupManifest.Directory("g", copied_files=["h"]),
+                ],
+            )
+        ),
+    )
+    backup_sum = BackupSum.from_backups([backup])
+
+    assert backup_sum.filtered(PathFilter()) == backup_sum
+    assert backup_sum.filtered(PathFilter(["b", "c/e"])) == BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[BackupSum.File("b", backup)],
+            subdirectories=[
+                BackupSum.Directory("c", subdirectories=[BackupSum.Directory("e", [BackupSum.File("f", backup)])])
+            ],
+        )
+    )
+    # Directories containing nothing selected are omitted.
+    assert backup_sum.filtered(PathFilter(["g/x", "c/e/f"])) == BackupSum(
+        BackupSum.Directory(
+            "",
+            subdirectories=[
+                BackupSum.Directory("c", subdirectories=[BackupSum.Directory("e", [BackupSum.File("f", backup)])])
+            ],
+        )
+    )
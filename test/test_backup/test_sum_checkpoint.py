@@ -0,0 +1,326 @@
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+import pytest
+
+from incremental_backup.backup.sum import BackupSum
+from incremental_backup.backup.sum_checkpoint import (
+    BackupSumCheckpoint,
+    BackupSumCheckpointParseError,
+    LoadBackupSumCallbacks,
+    load_backup_sum,
+    load_partial_backup_sum,
+    read_backup_sum_checkpoint_file,
+    write_backup_sum_checkpoint_file,
+)
+from incremental_backup.meta.manifest import BackupManifest, write_backup_manifest_file
+from incremental_backup.meta.meta import (
+    MANIFEST_FILENAME,
+    SUM_CHECKPOINT_FILENAME,
+    BackupMetadata,
+)
+from incremental_backup.meta.start_info import BackupStartInfo
+from incremental_backup.path_filter import PathFilter
+
+from test.helpers import AssertFilesystemUnmodified
+
+
+def make_backups() -> tuple[BackupMetadata, BackupMetadata, BackupMetadata, BackupMetadata]:
+    backup1 = BackupMetadata(
+        "sdfh4598h24ueg",
+        BackupStartInfo(datetime(2022, 3, 4, 5, 6, 7, tzinfo=timezone.utc)),
+        BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["a.txt", "b"],
+                subdirectories=[
+                    BackupManifest.Directory(
+                        "dir⨀",
+                        copied_files=["c"],
+                        subdirectories=[BackupManifest.Directory("sub", copied_files=['d"\n'])],
+                    )
+                ],
+            )
+        ),
+    )
+    backup2 = BackupMetadata(
+        "a98h34gaf7", BackupStartInfo(datetime(2022, 3, 5, 5, 6, 7, tzinfo=timezone.utc)), BackupManifest()
+    )
+    backup3 = BackupMetadata(
+        "09h5ygw4uohgeg",
+        BackupStartInfo(datetime(2022, 3, 6, 5, 6, 7, tzinfo=timezone.utc)),
+        BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["b"],
+                removed_files=["a.txt"],
+                subdirectories=[BackupManifest.Directory("dir⨀", removed_directories=["sub"])],
+            )
+        ),
+    )
+    backup4 = BackupMetadata(
+        "ergh8ow3e4ha",
+        BackupStartInfo(datetime(2022, 3, 7, 5, 6, 7, tzinfo=timezone.utc)),
+        BackupManifest(BackupManifest.Directory("", subdirectories=[BackupManifest.Directory("new", ["e"])])),
+    )
+    return backup1, backup2, backup3, backup4
+
+
+def write_checkpoint(target_directory: Path, checkpoint: BackupSumCheckpoint) -> Path:
+    backup_path = target_directory / checkpoint.backup_names[-1]
+    backup_path.mkdir(exist_ok=True)
+    path = backup_path / SUM_CHECKPOINT_FILENAME
+    write_backup_sum_checkpoint_file(path, checkpoint)
+    return path
+
+
+def write_manifests(target_directory: Path, backups: Iterable[BackupMetadata]) -> None:
+    for backup in backups:
+        backup_path = target_directory / backup.name
+        backup_path.mkdir(exist_ok=True)
+        write_backup_manifest_file(backup_path / MANIFEST_FILENAME, backup.manifest)
+
+
+def test_backup_sum_checkpoint_from_backups() -> None:
+    backups = make_backups()
+
+    checkpoint = BackupSumCheckpoint.from_backups(reversed(backups))
+    assert checkpoint.backup_sum == BackupSum.from_backups(backups)
+    assert checkpoint.backup_names == tuple(b.name for b in backups)
+    assert checkpoint.empty_backup_names == {backups[1].name}
+
+    base = BackupSumCheckpoint.from_backups(backups[:2])
+    assert BackupSumCheckpoint.from_backups(backups[2:], base) == checkpoint
+
+    assert checkpoint.is_valid_for(backups)
+    # Empty backup deleted.
+    assert checkpoint.is_valid_for((backups[0], backups[2], backups[3]))
+    # Nonempty backup deleted.
+    assert not checkpoint.is_valid_for(backups[1:])
+    # Backup not in checkpoint.
+    assert not base.is_valid_for(backups)
+
+
+def test_write_read_backup_sum_checkpoint_file(tmpdir: Path) -> None:
+    backups = make_backups()
+    path = tmpdir / "sum.json"
+    checkpoint = BackupSumCheckpoint.from_backups(backups)
+
+    write_backup_sum_checkpoint_file(path, checkpoint)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_sum_checkpoint_file(path, backups)
+    assert actual == checkpoint
+
+    # The empty backup may be deleted.
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_sum_checkpoint_file(path, (backups[0], backups[2], backups[3]))
+    assert actual is not None
+    assert actual.backup_sum == checkpoint.backup_sum
+
+    with AssertFilesystemUnmodified(tmpdir):
+        assert read_backup_sum_checkpoint_file(path, backups[:3]) is None
+        assert read_backup_sum_checkpoint_file(path, backups[1:]) is None
+
+
+def test_write_read_backup_sum_checkpoint_file_content_hashes(tmpdir: Path) -> None:
+    backup = BackupMetadata(
+        "4wg98h4w9ghw",
+        BackupStartInfo(datetime(2023, 1, 1, tzinfo=timezone.utc)),
+        BackupManifest(
+            BackupManifest.Directory(
+                "",
+                copied_files=["a", "b"],
+                copied_file_hashes=["1" * 64, "2" * 64],
+                subdirectories=[BackupManifest.Directory("c", copied_files=["d"])],
+            )
+        ),
+    )
+    path = tmpdir / "sum.json"
+    checkpoint = BackupSumCheckpoint.from_backups((backup,))
+
+    write_backup_sum_checkpoint_file(path, checkpoint)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_sum_checkpoint_file(path, (backup,))
+    assert actual == checkpoint
+    assert actual.backup_sum.root.files[0].content_hash == "1" * 64
+    assert actual.backup_sum.root.subdirectories[0].files[0].content_hash is None
+
+
+def test_read_backup_sum_checkpoint_file_invalid(tmpdir: Path) -> None:
+    backups = make_backups()
+    names = '["sdfh4598h24ueg", "a98h34gaf7", "09h5ygw4uohgeg", "ergh8ow3e4ha"]'
+    datas = (
+        "",
+        "[]",
+        "null",
+        '{"backups": [], "tree": [{"n": ""}]}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": ""}}], "extra": 1}}',
+        f'{{"backups": {names}, "empty_backups": ["abc"], "tree": [{{"n": ""}}]}}',
+        '{"backups": [1, 2], "empty_backups": [], "tree": [{"n": ""}]}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": []}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": ["^1"]}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": ""}}, "^1"]}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": ""}}, {{"f": []}}]}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": "", "f": [["a", 4]]}}]}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": "", "f": [["a"]]}}]}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": "", "f": "a"}}]}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": "", "f": [["a", 0, 5]]}}]}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": "", "f": [["a", 0, "h", "x"]]}}]}}',
+        f'{{"backups": {names}, "empty_backups": [], "tree": [{{"n": "", "x": 2}}]}}',
+        f'{{"backups": {names}, "empty_backups": ["a98h34gaf7"], "tree": [{{"n": "", "f": [["a", 1]]}}]}}',
+    )
+
+    for i, data in enumerate(datas):
+        path = tmpdir / f"sum_invalid_{i}.json"
+        path.write_text(data, encoding="utf8")
+
+        with AssertFilesystemUnmodified(tmpdir):
+            with pytest.raises(BackupSumCheckpointParseError):
+                read_backup_sum_checkpoint_file(path, backups)
+
+
+def test_load_backup_sum_no_checkpoints(tmpdir: Path) -> None:
+    backups = make_backups()
+    used: list[BackupMetadata] = []
+    callbacks = LoadBackupSumCallbacks(on_checkpoint_used=used.append)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_backup_sum(tmpdir, backups, callbacks)
+    assert actual == BackupSumCheckpoint.from_backups(backups)
+    assert used == []
+
+
+def test_load_backup_sum_newest_valid_checkpoint(tmpdir: Path) -> None:
+    backups = make_backups()
+    write_checkpoint(tmpdir, BackupSumCheckpoint.from_backups(backups[:1]))
+    write_checkpoint(tmpdir, BackupSumCheckpoint.from_backups(backups[:3]))
+    # Stale, doesn't include the third backup.
+    stale_path = tmpdir / backups[3].name / SUM_CHECKPOINT_FILENAME
+    stale_path.parent.mkdir()
+    write_backup_sum_checkpoint_file(stale_path, BackupSumCheckpoint.from_backups((backups[0], backups[1], backups[3])))
+
+    used: list[BackupMetadata] = []
+    errors: list[Path] = []
+    callbacks = LoadBackupSumCallbacks(
+        on_read_checkpoint_error=lambda path, error: errors.append(path), on_checkpoint_used=used.append
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_backup_sum(tmpdir, backups, callbacks)
+    assert actual == BackupSumCheckpoint.from_backups(backups)
+    assert used == [backups[2]]
+    assert errors == []
+
+
+def test_load_backup_sum_invalid_checkpoint(tmpdir: Path) -> None:
+    backups = make_backups()
+    write_checkpoint(tmpdir, BackupSumCheckpoint.from_backups(backups[:2]))
+    invalid_path = write_checkpoint(tmpdir, BackupSumCheckpoint.from_backups(backups[:3]))
+    invalid_path.write_text('{"backups": ', encoding="utf8")
+
+    used: list[BackupMetadata] = []
+    errors: list[Path] = []
+    callbacks = LoadBackupSumCallbacks(
+        on_read_checkpoint_error=lambda path, error: errors.append(path), on_checkpoint_used=used.append
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_backup_sum(tmpdir, backups, callbacks)
+    assert actual == BackupSumCheckpoint.from_backups(backups)
+    assert used == [backups[1]]
+    assert errors == [invalid_path]
+
+
+def test_load_backup_sum_empty_backup_deleted(tmpdir: Path) -> None:
+    backups = make_backups()
+    write_checkpoint(tmpdir, BackupSumCheckpoint.from_backups(backups[:3]))
+    remaining = (backups[0], backups[2], backups[3])
+
+    used: list[BackupMetadata] = []
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_backup_sum(tmpdir, remaining, LoadBackupSumCallbacks(on_checkpoint_used=used.append))
+    assert actual.backup_sum == BackupSum.from_backups(remaining)
+    assert used == [backups[2]]
+
+
+def test_load_backup_sum_lazy_manifests(tmpdir: Path) -> None:
+    backups = make_backups()
+    write_checkpoint(tmpdir, BackupSumCheckpoint.from_backups(backups[:3]))
+
+    def unreadable_manifest() -> BackupManifest:
+        raise OSError("Manifest should not be read")
+
+    lazy_backups = [BackupMetadata(b.name, b.start_info, unreadable_manifest) for b in backups[:3]]
+    lazy_backups.append(BackupMetadata(backups[3].name, backups[3].start_info, lambda: backups[3].manifest))
+
+    errors: list[Path] = []
+    callbacks = LoadBackupSumCallbacks(on_read_manifest_error=lambda path, error: errors.append(path))
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_backup_sum(tmpdir, lazy_backups, callbacks)
+    assert [b.is_manifest_loaded for b in lazy_backups] == [False, False, False, True]
+    assert errors == []
+    # Comparing the sum would compare the backups' manifests.
+    assert actual.backup_names == tuple(b.name for b in backups)
+    assert (
+        actual.backup_sum.root.count_contained_files() == BackupSum.from_backups(backups).root.count_contained_files()
+    )
+
+
+def test_load_backup_sum_manifest_error(tmpdir: Path) -> None:
+    backups = make_backups()
+
+    def unreadable_manifest() -> BackupManifest:
+        raise OSError("Failed to read manifest")
+
+    lazy_backups = list(backups)
+    lazy_backups[2] = BackupMetadata(backups[2].name, backups[2].start_info, unreadable_manifest)
+
+    errors: list[Path] = []
+    callbacks = LoadBackupSumCallbacks(on_read_manifest_error=lambda path, error: errors.append(path))
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_backup_sum(tmpdir, lazy_backups, callbacks)
+    expected_backups = (backups[0], backups[1], backups[3])
+    assert actual == BackupSumCheckpoint.from_backups(expected_backups)
+    assert errors == [tmpdir / backups[2].name]
+
+
+def test_load_partial_backup_sum_no_checkpoints(tmpdir: Path) -> None:
+    backups = make_backups()
+    write_manifests(tmpdir, backups)
+    path_filter = PathFilter(["b", "dir⨀/sub", "new"])
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_partial_backup_sum(tmpdir, backups, path_filter)
+    assert actual == BackupSum.from_backups(backups).filtered(path_filter)
+
+
+def test_load_partial_backup_sum_checkpoint(tmpdir: Path) -> None:
+    backups = make_backups()
+    write_manifests(tmpdir, backups[3:])
+    write_checkpoint(tmpdir, BackupSumCheckpoint.from_backups(backups[:3]))
+    path_filter = PathFilter(["a.txt", "dir⨀"])
+
+    used: list[BackupMetadata] = []
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_partial_backup_sum(
+            tmpdir, backups, path_filter, LoadBackupSumCallbacks(on_checkpoint_used=used.append)
+        )
+    assert actual == BackupSum.from_backups(backups).filtered(path_filter)
+    assert used == [backups[2]]
+
+
+def test_load_partial_backup_sum_manifest_error(tmpdir: Path) -> None:
+    backups = make_backups()
+    write_manifests(tmpdir, backups)
+    (tmpdir / backups[2].name / MANIFEST_FILENAME).write_text('[{"n": "", "cf": ["b"]}, ', encoding="utf8")
+    (tmpdir / backups[3].name / MANIFEST_FILENAME).unlink()
+    path_filter = PathFilter(["b", "dir⨀"])
+
+    errors: list[Path] = []
+    callbacks = LoadBackupSumCallbacks(on_read_manifest_error=lambda path, error: errors.append(path))
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = load_partial_backup_sum(tmpdir, backups, path_filter, callbacks)
+    # The invalid manifest isn't partially applied.
+    assert actual == BackupSum.from_backups(backups[:2]).filtered(path_filter)
+    assert errors == [tmpdir / backups[2].name, tmpdir / backups[3].name]
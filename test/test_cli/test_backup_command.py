@@ -129,7 +129,9 @@ def test_backup_normal(tmpdir: Path) -> None:
 
     assert process.returncode == 0
 
-    backup_path = (set(target_path.iterdir()) - {backup1_path, backup2_path, backup3_path}).pop()
+    backup_path = (
+        set(target_path.iterdir()) - {backup1_path, backup2_path, backup3_path, target_path / "catalog.json"}
+    ).pop()
 
     assert backup_path.name.isascii() and backup_path.name.isalnum() and len(backup_path.name) >= 10
     assert dir_entries(backup_path) == {
@@ -137,6 +139,7 @@ def test_backup_normal(tmpdir: Path) -> None:
         "start.json",
         "manifest.json",
         "completion.json",
+        "sum.json",
     }
 
     assert dir_entries(backup_path / "data") == {
@@ -195,3 +198,177 @@ def test_backup_normal(tmpdir: Path) -> None:
 
 
 METADATA_TIME_TOLERANCE = 5  # Seconds
+
+
+def test_backup_deduplicate(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "file1").write_text("duplicated")
+    (source_path / "dir" / "file2").write_text("duplicated")
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(source_path):
+        process = run_application("backup", str(source_path), str(target_path), "--deduplicate")
+    assert process.returncode == 0
+    assert "1 files already stored" in process.stdout
+
+    # Data should be in the object store, which the restore command reads from.
+    objects = [p for p in (target_path / "objects").rglob("*") if p.is_file()]
+    assert len(objects) == 1 and objects[0].read_text() == "duplicated"
+
+    destination_path = tmpdir / "destination"
+    with AssertFilesystemUnmodified(target_path):
+        process = run_application("restore", str(target_path), str(destination_path))
+    assert process.returncode == 0
+    assert (destination_path / "file1").read_text() == "duplicated"
+    assert (destination_path / "dir" / "file2").read_text() == "duplicated"
+
+
+def test_backup_pack_threshold(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "small").write_text("small")
+    (source_path / "dir" / "big").write_text("big enough to not be packed")
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(source_path):
+        process = run_application("backup", str(source_path), str(target_path), "--pack-threshold", "10")
+    assert process.returncode == 0
+    assert "1 files packed" in process.stdout
+
+    destination_path = tmpdir / "destination"
+    with AssertFilesystemUnmodified(target_path):
+        process = run_application("restore", str(target_path), str(destination_path))
+    assert process.returncode == 0
+    assert (destination_path / "small").read_text() == "small"
+    assert (destination_path / "dir" / "big").read_text() == "big enough to not be packed"
+
+
+def test_backup_invalid_pack_threshold(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("backup", str(source_path), str(target_path), "--pack-threshold", "-1")
+        assert process.returncode == 1
+        process = run_application(
+            "backup", str(source_path), str(target_path), "--pack-threshold", "10", "--deduplicate"
+        )
+        assert process.returncode == 1
+
+
+def test_backup_compression(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "dir" / "file.log").write_text("log line\n" * 1000)
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(source_path):
+        process = run_application(
+            "backup", str(source_path), str(target_path), "--compression", "gzip", "--copy-workers", "2"
+        )
+    assert process.returncode == 0
+    assert "Compression: gzip" in process.stdout
+
+    # The restore command decompresses automatically.
+    destination_path = tmpdir / "destination"
+    with AssertFilesystemUnmodified(target_path):
+        process = run_application("restore", str(target_path), str(destination_path))
+    assert process.returncode == 0
+    assert (destination_path / "dir" / "file.log").read_text() == "log line\n" * 1000
+
+
+def test_backup_pipeline(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    (source_path / "dir" / "file.txt").write_text("contents")
+    (source_path / "root.txt").write_text("root")
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(source_path):
+        process = run_application(
+            "backup", str(source_path), str(target_path), "--pipeline", "--scan-workers", "2", "--copy-workers", "2"
+        )
+    assert process.returncode == 0
+    assert "Pipeline: yes" in process.stdout
+    assert "+2 / -0 files" in process.stdout
+
+    destination_path = tmpdir / "destination"
+    with AssertFilesystemUnmodified(target_path):
+        process = run_application("restore", str(target_path), str(destination_path))
+    assert process.returncode == 0
+    assert (destination_path / "dir" / "file.txt").read_text() == "contents"
+    assert (destination_path / "root.txt").read_text() == "root"
+
+
+def test_backup_resume(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    (source_path / "a.txt").write_text("a")
+    (source_path / "b.txt").write_text("b")
+    target_path = tmpdir / "target"
+
+    process = run_application("backup", str(source_path), str(target_path))
+    assert process.returncode == 0
+    # Make the backup look as if it was interrupted after copying a.txt.
+    (backup_path,) = target_path.glob("*/")
+    for name in ("manifest.json", "completion.json", "sum.json"):
+        (backup_path / name).unlink()
+    (target_path / "catalog.json").unlink()
+    a_stat = (source_path / "a.txt").stat()
+    (backup_path / "journal.jsonl").write_text(f'["a.txt", {a_stat.st_mtime_ns}, 1, null]\n', encoding="utf8")
+
+    with AssertFilesystemUnmodified(source_path):
+        process = run_application("backup", str(source_path), str(target_path), "--resume")
+    assert process.returncode == 0
+    assert "Resume: yes" in process.stdout
+    assert f"Resuming incomplete backup {backup_path.name}" in process.stdout
+    assert "+2 / -0 files" in process.stdout
+    assert "1 files already copied before resuming" in process.stdout
+    assert not (backup_path / "journal.jsonl").exists()
+    assert (backup_path / "manifest.json").is_file()
+
+
+def test_backup_invalid_compression(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("backup", str(source_path), str(target_path), "--compression", "zip")
+        assert process.returncode != 0
+        process = run_application(
+            "backup", str(source_path), str(target_path), "--compression", "gzip", "--deduplicate"
+        )
+        assert process.returncode == 1
+
+
+def test_backup_invalid_scan_workers(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("backup", str(source_path), str(target_path), "--scan-workers", "0")
+    assert process.returncode == 1
+
+
+def test_backup_invalid_copy_workers(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("backup", str(source_path), str(target_path), "--copy-workers", "-2")
+    assert process.returncode == 1
+
+
+def test_backup_invalid_read_workers(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("backup", str(source_path), str(target_path), "--read-workers", "0")
+    assert process.returncode == 1
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+from incremental_backup.backup import perform_backup
+
+from test.helpers import AssertFilesystemUnmodified, dir_entries, run_application
+
+
+def test_collect_orphans_no_args() -> None:
+    process = run_application("collect-orphans")
+    assert process.returncode == 1
+
+
+def test_collect_orphans(tmpdir: Path) -> None:
+    source_dir = tmpdir / "source"
+    source_dir.mkdir()
+    target_dir = tmpdir / "backups"
+    (source_dir / "a.txt").write_text("a")
+    results = perform_backup(source_dir, target_dir, (), skip_empty=False)
+    assert results is not None
+    (results.backup_path / "data" / "stray.txt").write_text("1234")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("collect-orphans", str(target_dir))
+    assert process.returncode == 0
+    assert "DRY RUN" in process.stdout
+    assert "Deleted 1 data files and 0 objects" in process.stdout
+    assert "Reclaimed 4 bytes" in process.stdout
+
+    process = run_application("collect-orphans", str(target_dir), "--commit")
+    assert process.returncode == 0
+    assert "DRY RUN" not in process.stdout
+    assert "Reclaimed 4 bytes" in process.stdout
+    assert dir_entries(results.backup_path / "data") == {"a.txt"}
+
+
+def test_collect_orphans_nonexistent_target(tmpdir: Path) -> None:
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("collect-orphans", str(tmpdir / "nonexistent"), "--commit")
+    assert process.returncode == 2
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+from incremental_backup.backup import perform_backup
+
+from test.helpers import AssertFilesystemUnmodified, dir_entries, run_application
+
+
+def test_consolidate_no_args() -> None:
+    process = run_application("consolidate")
+    assert process.returncode == 1
+
+
+def test_consolidate_invalid_args(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    target_dir.mkdir()
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("consolidate", str(target_dir), "--keep-last", "0")
+        assert process.returncode == 1
+        process = run_application("consolidate", str(target_dir), "--keep-daily", "-1")
+        assert process.returncode == 1
+        process = run_application("consolidate", str(target_dir), "--read-workers", "0")
+        assert process.returncode == 1
+
+
+def test_consolidate(tmpdir: Path) -> None:
+    source_dir = tmpdir / "source"
+    source_dir.mkdir()
+    target_dir = tmpdir / "backups"
+    for i in range(3):
+        (source_dir / f"{i}.txt").write_text(str(i))
+        perform_backup(source_dir, target_dir, (), skip_empty=False)
+    backup_names = dir_entries(target_dir) - {"catalog.json"}
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("consolidate", str(target_dir), "--keep-last", "2")
+    assert process.returncode == 0
+    assert "DRY RUN" in process.stdout
+    assert "Merged 2 backups into 1 backups" in process.stdout
+
+    process = run_application("consolidate", str(target_dir), "--keep-last", "2", "--commit")
+    assert process.returncode == 0
+    assert "2 backups remaining" in process.stdout
+    new_backup_names = dir_entries(target_dir) - {"catalog.json"}
+    assert len(new_backup_names) == 2
+    assert len(new_backup_names & backup_names) == 1
+
+    restore_dir = tmpdir / "restored"
+    process = run_application("restore", str(target_dir), str(restore_dir))
+    assert process.returncode == 0
+    assert dir_entries(restore_dir) == {"0.txt", "1.txt", "2.txt"}
+
+
+def test_consolidate_nonexistent_target(tmpdir: Path) -> None:
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("consolidate", str(tmpdir / "nonexistent"), "--commit")
+    assert process.returncode == 2
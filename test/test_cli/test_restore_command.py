@@ -17,6 +17,36 @@ def test_restore_too_few_args(tmpdir: Path) -> None:
     assert process.returncode == 1
 
 
+def test_restore_invalid_read_workers(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    target_dir.mkdir()
+    destination_dir = tmpdir / "destination"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("restore", str(target_dir), str(destination_dir), "--read-workers", "0")
+    assert process.returncode == 1
+
+
+def test_restore_invalid_copy_workers(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    target_dir.mkdir()
+    destination_dir = tmpdir / "destination"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("restore", str(target_dir), str(destination_dir), "--copy-workers", "0")
+    assert process.returncode == 1
+
+
+def test_restore_invalid_path(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    target_dir.mkdir()
+    destination_dir = tmpdir / "destination"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("restore", str(target_dir), str(destination_dir), "--path", "../foo")
+    assert process.returncode == 1
+
+
 def test_restore_all(tmpdir: Path) -> None:
     # Neither backup name nor time specified, restore from all backups.
 
@@ -77,6 +107,26 @@ def test_restore_all(tmpdir: Path) -> None:
     assert dir_entries(destination_dir / "myDir") == {"bar-qux"}
     assert (destination_dir / "myDir" / "bar-qux").read_text() == "final content"
 
+    workers_destination_dir = tmpdir / "workers_destination"
+    with AssertFilesystemUnmodified(target_dir):
+        process = run_application("restore", str(target_dir), str(workers_destination_dir), "--copy-workers", "3")
+
+    assert process.returncode == 0
+    assert "Copy workers: 3" in process.stdout
+    assert dir_entries(workers_destination_dir) == {"foo.jpg", "manama", "yes.no", "myDir"}
+    assert (workers_destination_dir / "myDir" / "bar-qux").read_text() == "final content"
+
+    paths_destination_dir = tmpdir / "paths_destination"
+    with AssertFilesystemUnmodified(target_dir):
+        process = run_application(
+            "restore", str(target_dir), str(paths_destination_dir), "--path", "myDir", "foo.jpg", "--include", ".*-.*"
+        )
+
+    assert process.returncode == 0
+    assert dir_entries(paths_destination_dir) == {"myDir"}
+    assert dir_entries(paths_destination_dir / "myDir") == {"bar-qux"}
+    assert (paths_destination_dir / "myDir" / "bar-qux").read_text() == "final content"
+
 
 def test_restore_name(tmpdir: Path) -> None:
     # Backup name specified, restore up to that backup.
@@ -0,0 +1,88 @@
+from pathlib import Path
+
+from test.helpers import AssertFilesystemUnmodified, dir_entries, run_application
+
+
+def make_backups(target_dir: Path) -> None:
+    backup1_dir = target_dir / "ws3e48ohitv"
+    backup1_dir.mkdir(parents=True)
+    (backup1_dir / "start.json").write_text('{"start_time": "2022-03-12T11:53:22.954665+00:00"}', encoding="utf8")
+    (backup1_dir / "data" / "myDir").mkdir(parents=True)
+    (backup1_dir / "data" / "myDir" / "bar-qux").write_text("first content")
+    (backup1_dir / "data" / "foo.jpg").write_text("hello world")
+    (backup1_dir / "manifest.json").write_text(
+        """[{"n": "", "cf": ["foo.jpg"]}, {"n": "myDir", "cf": ["bar-qux"]}]""", encoding="utf8"
+    )
+
+    backup2_dir = target_dir / "9w384rapw9ssa"
+    backup2_dir.mkdir()
+    (backup2_dir / "start.json").write_text('{"start_time": "2022-04-12T11:53:22.954665+00:00"}', encoding="utf8")
+    (backup2_dir / "data" / "myDir").mkdir(parents=True)
+    (backup2_dir / "data" / "myDir" / "bar-qux").write_text("final content")
+    (backup2_dir / "manifest.json").write_text(
+        """[{"n": "", "rf": ["foo.jpg"]}, {"n": "myDir", "cf": ["bar-qux"]}]""", encoding="utf8"
+    )
+
+
+def test_restore_file_no_args() -> None:
+    process = run_application("restore-file")
+    assert process.returncode == 1
+
+
+def test_restore_file_invalid_args(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    target_dir.mkdir()
+    destination = tmpdir / "restored"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("restore-file", str(target_dir), "../foo", str(destination))
+        assert process.returncode == 1
+        process = run_application("restore-file", str(target_dir), ".", str(destination))
+        assert process.returncode == 1
+        process = run_application("restore-file", str(target_dir), "foo", str(destination), "not a time")
+        assert process.returncode == 1
+        process = run_application("restore-file", str(target_dir), "foo", str(destination), "--read-workers", "0")
+        assert process.returncode == 1
+
+
+def test_restore_file(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    make_backups(target_dir)
+    destination = tmpdir / "restored" / "bar-qux"
+
+    with AssertFilesystemUnmodified(target_dir):
+        process = run_application("restore-file", str(target_dir), "myDir/bar-qux", str(destination))
+    assert process.returncode == 0
+    assert "Found file in backup 9w384rapw9ssa" in process.stdout
+    assert dir_entries(tmpdir / "restored") == {"bar-qux"}
+    assert destination.read_text() == "final content"
+
+    # Destination already exists.
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("restore-file", str(target_dir), "myDir/bar-qux", str(destination))
+    assert process.returncode == 2
+
+    old_destination = tmpdir / "old"
+    with AssertFilesystemUnmodified(target_dir):
+        process = run_application(
+            "restore-file", str(target_dir), "myDir/bar-qux", str(old_destination), "2022-04-01T00:00:00+00:00"
+        )
+    assert process.returncode == 0
+    assert old_destination.read_text() == "first content"
+
+
+def test_restore_file_not_found(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    make_backups(target_dir)
+    destination = tmpdir / "restored"
+
+    with AssertFilesystemUnmodified(tmpdir):
+        process = run_application("restore-file", str(target_dir), "nonexistent", str(destination))
+        assert process.returncode == 2
+
+        process = run_application("restore-file", str(target_dir), "foo.jpg", str(destination))
+        assert process.returncode == 2
+        assert "removed in backup 9w384rapw9ssa" in process.stderr
+
+        process = run_application("restore-file", str(tmpdir / "nonexistent"), "foo.jpg", str(destination))
+        assert process.returncode == 2
@@ -0,0 +1,178 @@
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from incremental_backup.backup import BackupOptions, perform_backup
+from incremental_backup.collect_orphans import (
+    CollectOrphansCallbacks,
+    CollectOrphansConfig,
+    CollectOrphansError,
+    CollectOrphansResults,
+    collect_orphans,
+)
+from incremental_backup.consolidate import ConsolidateBackupsConfig, RetentionPolicy, consolidate_backups
+from incremental_backup.meta.consolidation import BackupConsolidation, write_backup_consolidation_file
+from incremental_backup.object_store import hash_file
+from incremental_backup.restore import perform_restore
+
+from test.helpers import AssertFilesystemUnmodified, compute_directory_hash, dir_entries
+
+
+def unexpected_callbacks() -> CollectOrphansCallbacks:
+    return CollectOrphansCallbacks(
+        on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+        on_read_backup_error=lambda path, error: pytest.fail(f"Unexpected on_read_backup_error: {path=} {error=}"),
+        on_delete_error=lambda path, error: pytest.fail(f"Unexpected on_delete_error: {path=} {error=}"),
+    )
+
+
+def restore_hash(target_path: Path, destination_path: Path) -> bytes:
+    # The hash includes the directory name.
+    destination_path.mkdir()
+    destination_path = destination_path / "restored"
+    perform_restore(target_path, destination_path, backup_time=datetime.now(timezone.utc))
+    return compute_directory_hash(destination_path)
+
+
+def test_collect_orphans_data(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    target_path = tmpdir / "target"
+    (source_path / "a.txt").write_text("aaa")
+    (source_path / "dir" / "b.txt").write_text("bbb")
+    (source_path / "dir" / "packed").write_text("p")
+    results = perform_backup(source_path, target_path, (), skip_empty=False, options=BackupOptions(pack_threshold=1))
+    assert results is not None
+    data_path = results.backup_path / "data"
+    expected_hash = restore_hash(target_path, tmpdir / "expected")
+
+    # E.g. copied by an interrupted backup, which was then resumed when the files no longer existed.
+    (data_path / "removed.txt").write_text("12345")
+    (data_path / "other").mkdir()
+    (data_path / "other" / "c.txt").write_text("123")
+    (data_path / "dir" / "packed").write_text("1")
+    (results.backup_path / "packs" / "3.pack").write_text("1234")
+    (results.backup_path / "packs" / "notes.txt").write_text("not a pack file")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        gc_results = collect_orphans(target_path, CollectOrphansConfig(dry_run=True), unexpected_callbacks())
+    assert gc_results == CollectOrphansResults(4, 0, 13)
+
+    gc_results = collect_orphans(target_path, CollectOrphansConfig(dry_run=False), unexpected_callbacks())
+    assert gc_results == CollectOrphansResults(4, 0, 13)
+    assert dir_entries(data_path) == {"a.txt", "dir", "other"}
+    assert dir_entries(data_path / "dir") == {"b.txt"}
+    assert dir_entries(data_path / "other") == set()
+    assert dir_entries(results.backup_path / "packs") == {"0.pack", "index.json", "notes.txt"}
+    assert restore_hash(target_path, tmpdir / "actual") == expected_hash
+
+    gc_results = collect_orphans(target_path, CollectOrphansConfig(dry_run=False), unexpected_callbacks())
+    assert gc_results == CollectOrphansResults(0, 0, 0)
+
+
+def test_collect_orphans_objects(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    options = BackupOptions(deduplicate=True)
+    (source_path / "a.txt").write_text("version 1")
+    (source_path / "b.txt").write_text("unchanged")
+    perform_backup(source_path, target_path, (), skip_empty=False, options=options)
+    old_hash = hash_file(source_path / "a.txt")
+    (source_path / "a.txt").write_text("version 2!")
+    perform_backup(source_path, target_path, (), skip_empty=False, options=options)
+    expected_hash = restore_hash(target_path, tmpdir / "expected")
+    objects_path = target_path / "objects"
+    (objects_path / "0123abcd.tmp").write_text("partial")
+    (objects_path / "readme.txt").write_text("not an object")
+
+    # The old version of a.txt is still reachable from the first backup.
+    results = collect_orphans(target_path, CollectOrphansConfig(dry_run=False), unexpected_callbacks())
+    assert results == CollectOrphansResults(0, 1, 7)
+    assert (objects_path / old_hash[:2] / old_hash[2:]).exists()
+
+    consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(), dry_run=False))
+
+    with AssertFilesystemUnmodified(tmpdir):
+        results = collect_orphans(target_path, CollectOrphansConfig(dry_run=True), unexpected_callbacks())
+    assert results == CollectOrphansResults(0, 1, 9)
+
+    results = collect_orphans(target_path, CollectOrphansConfig(dry_run=False), unexpected_callbacks())
+    assert results == CollectOrphansResults(0, 1, 9)
+    assert not (objects_path / old_hash[:2] / old_hash[2:]).exists()
+    assert (objects_path / "readme.txt").exists()
+    assert restore_hash(target_path, tmpdir / "actual") == expected_hash
+
+
+def test_collect_orphans_incomplete_backup(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    (source_path / "a.txt").write_text("copied by the incomplete backup")
+    results = perform_backup(source_path, target_path, (), skip_empty=False, options=BackupOptions(deduplicate=True))
+    assert results is not None
+    content_hash = hash_file(source_path / "a.txt")
+    # Make it look like the backup was interrupted while copying files.
+    (results.backup_path / "manifest.json").unlink()
+    (results.backup_path / "data" / "a.txt").write_text("copied before the object store was used")
+    (results.backup_path / "journal.jsonl").write_text(f'["a.txt", 0, 31, "{content_hash}"]\n', encoding="utf8")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        gc_results = collect_orphans(target_path, CollectOrphansConfig(dry_run=False), unexpected_callbacks())
+    assert gc_results == CollectOrphansResults(0, 0, 0)
+
+
+def test_collect_orphans_read_error(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    (source_path / "a.txt").write_text("a")
+    results = perform_backup(source_path, target_path, (), skip_empty=False, options=BackupOptions(deduplicate=True))
+    assert results is not None
+    backup_path = results.backup_path
+    (backup_path / "manifest.json").write_text("[{}, 5]", encoding="utf8")
+    (backup_path / "data" / "stray.txt").write_text("stray")
+    (target_path / "objects" / "0123abcd.tmp").write_text("partial")
+
+    errors: list[Path] = []
+    callbacks = CollectOrphansCallbacks(
+        on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+        on_read_backup_error=lambda path, error: errors.append(path),
+        on_delete_error=lambda path, error: pytest.fail(f"Unexpected on_delete_error: {path=} {error=}"),
+    )
+    # The backup may reference any object or data file.
+    with AssertFilesystemUnmodified(tmpdir):
+        gc_results = collect_orphans(target_path, CollectOrphansConfig(dry_run=False), callbacks)
+    assert gc_results == CollectOrphansResults(0, 0, 0)
+    assert errors == [backup_path]
+
+
+@pytest.mark.skipif(not hasattr(os, "link"), reason="Requires hard links")
+def test_collect_orphans_hard_link(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    (source_path / "a.txt").write_text("a")
+    results = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert results is not None
+    os.link(results.backup_path / "data" / "a.txt", results.backup_path / "data" / "linked.txt")
+
+    # Deleting a file with other links frees nothing.
+    gc_results = collect_orphans(target_path, CollectOrphansConfig(dry_run=False), unexpected_callbacks())
+    assert gc_results == CollectOrphansResults(1, 0, 0)
+
+
+def test_collect_orphans_invalid(tmpdir: Path) -> None:
+    with pytest.raises(CollectOrphansError):
+        collect_orphans(tmpdir / "nonexistent", CollectOrphansConfig(dry_run=True))
+
+    target_path = tmpdir / "target"
+    target_path.mkdir()
+    write_backup_consolidation_file(
+        target_path / "consolidation.json", BackupConsolidation("abcdefghij1234", ("abcdefghij5678",))
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(CollectOrphansError):
+            collect_orphans(target_path, CollectOrphansConfig(dry_run=False))
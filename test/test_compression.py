@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from incremental_backup.compression import Compression, compress_file, decompress_file
+
+from test.helpers import AssertFilesystemUnmodified, write_file_with_mtime
+
+
+def test_compress_decompress_file(tmpdir: Path) -> None:
+    source = tmpdir / "source.log"
+    contents = "2021-08-13 16:54:33 INFO Something happened\n" * 100000
+    mtime = datetime(2021, 8, 13, 16, 54, 33, tzinfo=timezone.utc)
+    write_file_with_mtime(source, contents, mtime)
+
+    for compression in Compression:
+        compressed = tmpdir / f"compressed.{compression.value}"
+        with AssertFilesystemUnmodified(source):
+            compress_file(source, compressed, compression)
+        assert compressed.stat().st_size < source.stat().st_size // 10
+        assert compressed.stat().st_mtime == mtime.timestamp()
+
+        decompressed = tmpdir / f"decompressed.{compression.value}"
+        with AssertFilesystemUnmodified(compressed):
+            decompress_file(compressed, decompressed, compression)
+        assert decompressed.read_text() == contents
+        assert decompressed.stat().st_mtime == mtime.timestamp()
+
+
+def test_compress_decompress_file_empty(tmpdir: Path) -> None:
+    source = tmpdir / "empty"
+    source.touch()
+
+    for compression in Compression:
+        compress_file(source, tmpdir / "compressed", compression)
+        decompress_file(tmpdir / "compressed", tmpdir / "decompressed", compression)
+        assert (tmpdir / "decompressed").read_bytes() == b""
+
+
+def test_compress_file_nonexistent(tmpdir: Path) -> None:
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(FileNotFoundError):
+            compress_file(tmpdir / "nonexistent", tmpdir / "destination", Compression.GZIP)
+
+
+def test_decompress_file_invalid(tmpdir: Path) -> None:
+    source = tmpdir / "source"
+    source.write_text("some data " * 1000)
+
+    for compression in Compression:
+        not_compressed = tmpdir / "not_compressed"
+        not_compressed.write_text("not compressed data")
+        truncated = tmpdir / "truncated"
+        compress_file(source, truncated, compression)
+        truncated.write_bytes(truncated.read_bytes()[:-20])
+
+        for path in (not_compressed, truncated):
+            with pytest.raises(OSError):
+                decompress_file(path, tmpdir / "destination", compression)
@@ -0,0 +1,433 @@
+import shutil
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+import pytest
+
+from incremental_backup import consolidate as consolidate_module
+from incremental_backup.backup import BackupError, BackupOptions, perform_backup
+from incremental_backup.backup import plan as plan_module
+from incremental_backup.compression import Compression
+from incremental_backup.consolidate import (
+    ConsolidateBackupsCallbacks,
+    ConsolidateBackupsConfig,
+    ConsolidateBackupsError,
+    ConsolidateBackupsResults,
+    RetentionPolicy,
+    consolidate_backups,
+    select_retained_backups,
+)
+from incremental_backup.meta.catalog import read_backup_catalog_file
+from incremental_backup.meta.consolidation import BackupConsolidation, write_backup_consolidation_file
+from incremental_backup.meta.manifest import BackupManifest, read_backup_manifest_file
+from incremental_backup.meta.meta import BackupDirectoryCreationError, BackupMetadata, ReadBackupsCallbacks
+from incremental_backup.meta.start_info import BackupStartInfo
+from incremental_backup.prune import BackupPrunabilityOptions, PruneBackupsConfig, PruneBackupsError, prune_backups
+from incremental_backup.restore import RestoreError, perform_restore
+
+from test.helpers import AssertFilesystemUnmodified, compute_directory_hash, dir_entries
+
+
+def make_metadata(name: str, start_time: datetime) -> BackupMetadata:
+    return BackupMetadata(name, BackupStartInfo(start_time), BackupManifest())
+
+
+def unexpected_callbacks() -> ConsolidateBackupsCallbacks:
+    return ConsolidateBackupsCallbacks(
+        read_backups=ReadBackupsCallbacks(
+            on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+            on_read_metadata_error=lambda path, error: pytest.fail(
+                f"Unexpected on_read_metadata_error: {path=} {error=}"
+            ),
+        ),
+        on_consolidate_error=lambda group, error: pytest.fail(f"Unexpected on_consolidate_error: {group=} {error=}"),
+        on_write_sum_checkpoint_error=lambda path, error: pytest.fail(
+            f"Unexpected on_write_sum_checkpoint_error: {path=} {error=}"
+        ),
+        on_delete_error=lambda path, error: pytest.fail(f"Unexpected on_delete_error: {path=} {error=}"),
+        on_update_catalog_error=lambda path, error: pytest.fail(
+            f"Unexpected on_update_catalog_error: {path=} {error=}"
+        ),
+    )
+
+
+def restore_hash(target_path: Path, destination_path: Path, backup_time: datetime) -> bytes:
+    # The hash includes the directory name.
+    destination_path.mkdir()
+    destination_path = destination_path / "restored"
+    perform_restore(target_path, destination_path, backup_time=backup_time)
+    return compute_directory_hash(destination_path)
+
+
+def test_select_retained_backups() -> None:
+    backups = [
+        make_metadata("a", datetime(2023, 1, 30, 10, tzinfo=timezone.utc)),
+        make_metadata("b", datetime(2023, 2, 6, 10, tzinfo=timezone.utc)),
+        make_metadata("c", datetime(2023, 2, 20, 10, tzinfo=timezone.utc)),
+        make_metadata("d", datetime(2023, 2, 21, 9, tzinfo=timezone.utc)),
+        make_metadata("e", datetime(2023, 2, 21, 18, tzinfo=timezone.utc)),
+        make_metadata("f", datetime(2023, 2, 22, 8, tzinfo=timezone.utc)),
+    ]
+
+    def retained(policy: RetentionPolicy, tz: timezone = timezone.utc) -> list[str]:
+        return [b.name for b in select_retained_backups(reversed(backups), policy, tz)]
+
+    assert retained(RetentionPolicy()) == ["f"]
+    assert retained(RetentionPolicy(last=3)) == ["d", "e", "f"]
+    assert retained(RetentionPolicy(daily=2)) == ["e", "f"]
+    # Monday 20 Feb is in the same week as the newest backup.
+    assert retained(RetentionPolicy(weekly=3)) == ["a", "b", "f"]
+    assert retained(RetentionPolicy(monthly=5)) == ["a", "f"]
+    assert retained(RetentionPolicy(last=1, daily=3, monthly=2)) == ["a", "c", "e", "f"]
+    assert retained(RetentionPolicy(last=100)) == ["a", "b", "c", "d", "e", "f"]
+    # In UTC+10, e is on the same day as f.
+    assert retained(RetentionPolicy(daily=3), timezone(timedelta(hours=10))) == ["c", "d", "f"]
+
+    assert select_retained_backups((), RetentionPolicy(daily=2)) == []
+
+    for policy in (RetentionPolicy(last=0), RetentionPolicy(daily=-1), RetentionPolicy(monthly=-2)):
+        with pytest.raises(ValueError):
+            select_retained_backups(backups, policy)
+
+
+def test_consolidate_backups(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    target_path = tmpdir / "target"
+    (source_path / "docs").mkdir(parents=True)
+    (source_path / "old").mkdir()
+    (source_path / "top.txt").write_text("top 1")
+    (source_path / "docs" / "a.txt").write_text("a 1")
+    (source_path / "docs" / "b.txt").write_text("b 1")
+    (source_path / "old" / "x.txt").write_text("x")
+    results1 = perform_backup(source_path, target_path, (), skip_empty=False)
+
+    (source_path / "docs" / "a.txt").write_text("a 2")
+    (source_path / "docs" / "b.txt").unlink()
+    (source_path / "new.txt").write_text("new")
+    results2 = perform_backup(source_path, target_path, (), skip_empty=False)
+
+    # Directory removed, then created again with different contents.
+    shutil.rmtree(source_path / "old")
+    results3 = perform_backup(source_path, target_path, (), skip_empty=False)
+    (source_path / "old").mkdir()
+    (source_path / "old" / "y.txt").write_text("y")
+    (source_path / "docs" / "b.txt").write_text("b 2")
+    results4 = perform_backup(source_path, target_path, (), skip_empty=False)
+
+    (source_path / "top.txt").write_text("top 2")
+    results5 = perform_backup(source_path, target_path, (), skip_empty=False)
+
+    assert results1 and results2 and results3 and results4 and results5
+    time4 = results4.start_info.start_time
+    time5 = results5.start_info.start_time
+    expected_hash4 = restore_hash(target_path, tmpdir / "expected4", time4)
+    expected_hash5 = restore_hash(target_path, tmpdir / "expected5", time5)
+
+    config = ConsolidateBackupsConfig(RetentionPolicy(last=2), dry_run=False)
+    with AssertFilesystemUnmodified(source_path):
+        results = consolidate_backups(target_path, config, unexpected_callbacks())
+    assert results == ConsolidateBackupsResults(4, 1, 2)
+
+    new_backups = dir_entries(target_path) - {"catalog.json", results5.backup_path.name}
+    assert len(new_backups) == 1
+    new_backup_path = target_path / new_backups.pop()
+    assert dir_entries(new_backup_path) == {"start.json", "manifest.json", "completion.json", "sum.json", "data"}
+    # Only the files still present are kept.
+    assert dir_entries(new_backup_path / "data") == {"top.txt", "docs", "new.txt", "old"}
+    assert dir_entries(new_backup_path / "data" / "docs") == {"a.txt", "b.txt"}
+    assert (new_backup_path / "data" / "docs" / "a.txt").read_text() == "a 2"
+    assert dir_entries(new_backup_path / "data" / "old") == {"y.txt"}
+    catalog = read_backup_catalog_file(target_path / "catalog.json")
+    assert [e.name for e in catalog.entries] == [new_backup_path.name, results5.backup_path.name]
+    assert catalog.entries[0].start_time == time4
+
+    assert restore_hash(target_path, tmpdir / "actual4", time4) == expected_hash4
+    assert restore_hash(target_path, tmpdir / "actual5", time5) == expected_hash5
+
+    # Backups continue from the consolidated state.
+    (source_path / "docs" / "a.txt").write_text("a 3")
+    results6 = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert results6 is not None
+    assert results6.files_copied == 1
+    assert results6.files_removed == 0
+
+    # Nothing more to consolidate.
+    results = consolidate_backups(
+        target_path, ConsolidateBackupsConfig(RetentionPolicy(last=3), dry_run=False), unexpected_callbacks()
+    )
+    assert results == ConsolidateBackupsResults(0, 0, 3)
+
+
+def test_consolidate_backups_dry_run(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    for i in range(3):
+        (source_path / f"{i}.txt").write_text(str(i))
+        perform_backup(source_path, target_path, (), skip_empty=False)
+
+    groups: list[list[str]] = []
+    callbacks = ConsolidateBackupsCallbacks(
+        on_selected_groups=lambda g: groups.extend([b.name for b in group] for group in g),
+        on_before_consolidate_group=lambda group: pytest.fail("Unexpected on_before_consolidate_group"),
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        results = consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(), dry_run=True), callbacks)
+    assert results == ConsolidateBackupsResults(3, 1, 1)
+    assert len(groups) == 1
+    assert set(groups[0]) == dir_entries(target_path) - {"catalog.json"}
+
+
+def test_consolidate_backups_objects_and_packs(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    (source_path / "dir").mkdir(parents=True)
+    target_path = tmpdir / "target"
+    (source_path / "dir" / "stored.txt").write_text("stored in the object store")
+    (source_path / "only_stored.txt").write_text("also stored")
+    perform_backup(source_path, target_path, (), skip_empty=False, options=BackupOptions(deduplicate=True))
+    (source_path / "dir" / "packed.txt").write_text("tiny")
+    (source_path / "dir" / "copied.txt").write_text("too big for a pack")
+    results = perform_backup(source_path, target_path, (), skip_empty=False, options=BackupOptions(pack_threshold=8))
+    assert results is not None
+    expected_hash = restore_hash(target_path, tmpdir / "expected", results.start_info.start_time)
+
+    results = consolidate_backups(
+        target_path, ConsolidateBackupsConfig(RetentionPolicy(), dry_run=False), unexpected_callbacks()
+    )
+    assert results == ConsolidateBackupsResults(2, 1, 1)
+
+    new_backup_path = next(p for p in target_path.iterdir() if p.name not in {"catalog.json", "objects"})
+    assert dir_entries(new_backup_path / "packs") == {"0.pack", "index.json"}
+    # Objects are linked into the data directory only where mixed with other files.
+    assert dir_entries(new_backup_path / "data") == {"dir"}
+    assert dir_entries(new_backup_path / "data" / "dir") == {"stored.txt", "copied.txt"}
+    manifest = read_backup_manifest_file(new_backup_path / "manifest.json")
+    assert manifest.root.copied_files == ["only_stored.txt"]
+    assert len(manifest.root.copied_file_hashes) == 1
+    assert manifest.root.subdirectories[0].copied_file_hashes == []
+
+    assert restore_hash(target_path, tmpdir / "actual", datetime.now(timezone.utc)) == expected_hash
+
+
+def test_consolidate_backups_compression(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    for i, compression in enumerate((None, None, Compression.GZIP, Compression.GZIP)):
+        (source_path / f"{i}.txt").write_text(str(i) * 100)
+        perform_backup(source_path, target_path, (), skip_empty=False, options=BackupOptions(compression=compression))
+    expected_hash = restore_hash(target_path, tmpdir / "expected", datetime.now(timezone.utc))
+
+    groups: list[int] = []
+    callbacks = ConsolidateBackupsCallbacks(on_selected_groups=lambda g: groups.extend(len(group) for group in g))
+    results = consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(), dry_run=False), callbacks)
+    # Backups of different compression are not merged.
+    assert groups == [2, 2]
+    assert results == ConsolidateBackupsResults(4, 2, 2)
+
+    assert restore_hash(target_path, tmpdir / "actual", datetime.now(timezone.utc)) == expected_hash
+
+
+def test_consolidate_backups_skipped_paths(tmpdir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # A file a backup failed to copy must still be backed up by the next backup after consolidation, rather than the
+    # older copy being considered up to date.
+
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    (source_path / "f").write_text("v1")
+    (source_path / "g").write_text("g")
+    perform_backup(source_path, target_path, (), skip_empty=False)
+
+    (source_path / "f").write_text("v2")
+    copy_file = plan_module._copy_file
+
+    def failing_copy_file(source: Path, destination: Path, /, compression: Optional[Compression]) -> Any:
+        if source.name == "f":
+            return OSError("Copy failed")
+        return copy_file(source, destination, compression=compression)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(plan_module, "_copy_file", failing_copy_file)
+        results2 = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert results2 is not None
+    assert results2.complete_info.paths_skipped
+
+    groups: list[int] = []
+    callbacks = ConsolidateBackupsCallbacks(on_selected_groups=lambda g: groups.extend(len(group) for group in g))
+    results = consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(), dry_run=False), callbacks)
+    # Not merged across the backup which skipped paths.
+    assert groups == []
+    assert results == ConsolidateBackupsResults(0, 0, 2)
+
+    results3 = perform_backup(source_path, target_path, (), skip_empty=False)
+    assert results3 is not None
+    assert results3.files_copied == 1
+    perform_restore(target_path, tmpdir / "restored")
+    assert (tmpdir / "restored" / "f").read_text() == "v2"
+
+
+def test_consolidate_backups_recover(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    names: list[str] = []
+    for i in range(2):
+        (source_path / f"{i}.txt").write_text(str(i))
+        results = perform_backup(source_path, target_path, (), skip_empty=False)
+        assert results is not None
+        names.append(results.backup_path.name)
+
+    # Interrupted before the new backup was complete: undone.
+    incomplete_path = target_path / "incomplete4523"
+    (incomplete_path / "data").mkdir(parents=True)
+    (incomplete_path / "start.json").write_text('{"start_time": "2022-03-12T11:53:22.954665+00:00"}')
+    write_backup_consolidation_file(
+        target_path / "consolidation.json", BackupConsolidation(incomplete_path.name, tuple(names))
+    )
+    recovered: list[tuple[str, bool]] = []
+    callbacks = ConsolidateBackupsCallbacks(
+        on_recover_consolidation=lambda c, completed: recovered.append((c.backup_name, completed))
+    )
+    results = consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(last=2), False), callbacks)
+    assert results == ConsolidateBackupsResults(0, 0, 2)
+    assert recovered == [(incomplete_path.name, False)]
+    assert dir_entries(target_path) == {*names, "catalog.json"}
+
+    # Interrupted before the new backup directory was created: undone.
+    recovered.clear()
+    write_backup_consolidation_file(
+        target_path / "consolidation.json", BackupConsolidation("missing7426", tuple(names))
+    )
+    results = consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(last=2), False), callbacks)
+    assert results == ConsolidateBackupsResults(0, 0, 2)
+    assert recovered == [("missing7426", False)]
+    assert dir_entries(target_path) == {*names, "catalog.json"}
+
+    # Interrupted after the new backup was complete: completed.
+    recovered.clear()
+    complete_path = target_path / "complete8763"
+    shutil.copytree(target_path / names[1], complete_path)
+    (target_path / names[1] / "manifest.json").write_text("")
+    write_backup_consolidation_file(
+        target_path / "consolidation.json", BackupConsolidation(complete_path.name, tuple(names))
+    )
+    catalog_path = target_path / "catalog.json"
+    catalog_path.write_text(catalog_path.read_text().replace(names[1], complete_path.name))
+    results = consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(last=2), False), callbacks)
+    assert results == ConsolidateBackupsResults(0, 0, 1)
+    assert recovered == [(complete_path.name, True)]
+    assert dir_entries(target_path) == {complete_path.name, "catalog.json"}
+    assert [e.name for e in read_backup_catalog_file(catalog_path).entries] == [complete_path.name]
+
+
+def test_consolidate_backups_interrupted_blocks_commands(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    names: list[str] = []
+    for i in range(2):
+        (source_path / f"{i}.txt").write_text(str(i))
+        results = perform_backup(source_path, target_path, (), skip_empty=False)
+        assert results is not None
+        names.append(results.backup_path.name)
+
+    # Interrupted while writing the manifest of the new backup.
+    incomplete_path = target_path / "incomplete4523"
+    (incomplete_path / "data").mkdir(parents=True)
+    (incomplete_path / "start.json").write_text('{"start_time": "2022-03-12T11:53:22.954665+00:00"}')
+    (incomplete_path / "manifest.json.tmp").write_text('[{"n": "", "cf": ["0.t')
+    write_backup_consolidation_file(
+        target_path / "consolidation.json", BackupConsolidation(incomplete_path.name, tuple(names))
+    )
+
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(BackupError):
+            perform_backup(source_path, target_path, (), skip_empty=False)
+        with pytest.raises(PruneBackupsError):
+            prune_backups(target_path, PruneBackupsConfig(False, BackupPrunabilityOptions(True, False)))
+        with pytest.raises(RestoreError):
+            perform_restore(target_path, tmpdir / "restored")
+
+    consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(last=2), False))
+    assert dir_entries(target_path) == {*names, "catalog.json"}
+    assert perform_backup(source_path, target_path, (), skip_empty=False) is not None
+
+
+def test_consolidate_backups_error(tmpdir: Path) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    names: list[str] = []
+    for i in range(3):
+        (source_path / f"{i}.txt").write_text(str(i))
+        results = perform_backup(source_path, target_path, (), skip_empty=False)
+        assert results is not None
+        names.append(results.backup_path.name)
+    # Data missing.
+    (target_path / names[1] / "data" / "1.txt").unlink()
+
+    errors: list[list[str]] = []
+    callbacks = ConsolidateBackupsCallbacks(
+        on_consolidate_error=lambda group, error: errors.append([b.name for b in group])
+    )
+    results = consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(), False), callbacks)
+    assert results == ConsolidateBackupsResults(0, 0, 3)
+    assert errors == [names]
+    # The new backup is deleted.
+    assert dir_entries(target_path) == {*names, "catalog.json"}
+
+
+def test_consolidate_backups_create_directory(tmpdir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    source_path = tmpdir / "source"
+    source_path.mkdir()
+    target_path = tmpdir / "target"
+    names: list[str] = []
+    for i in range(2):
+        (source_path / f"{i}.txt").write_text(str(i))
+        results = perform_backup(source_path, target_path, (), skip_empty=False)
+        assert results is not None
+        names.append(results.backup_path.name)
+
+    # The name of an existing backup is never chosen for the new backup.
+    generated_names = iter((names[0], "newbackup8317"))
+    monkeypatch.setattr(consolidate_module, "generate_backup_name", lambda: next(generated_names))
+    # The consolidation is recorded before the new backup directory is created.
+    original_mkdir = Path.mkdir
+    records: list[str] = []
+
+    def mkdir(self: Path, *args: Any, **kwargs: Any) -> None:
+        if self.parent == target_path:
+            records.append((target_path / "consolidation.json").read_text())
+            raise PermissionError("mkdir failed")
+        original_mkdir(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "mkdir", mkdir)
+
+    errors: list[Exception] = []
+    callbacks = ConsolidateBackupsCallbacks(on_consolidate_error=lambda group, error: errors.append(error))
+    results = consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(), False), callbacks)
+    assert results == ConsolidateBackupsResults(0, 0, 2)
+    assert len(records) == 1 and "newbackup8317" in records[0]
+    assert len(errors) == 1 and isinstance(errors[0], BackupDirectoryCreationError)
+    # The record is deleted.
+    assert dir_entries(target_path) == {*names, "catalog.json"}
+
+
+def test_consolidate_backups_invalid(tmpdir: Path) -> None:
+    target_path = tmpdir / "target"
+    target_path.mkdir()
+
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(ValueError):
+            consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(last=0), False))
+        with pytest.raises(ValueError):
+            consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(), False, read_workers=0))
+        with pytest.raises(ConsolidateBackupsError):
+            consolidate_backups(tmpdir / "nonexistent", ConsolidateBackupsConfig(RetentionPolicy(), False))
+
+    (target_path / "consolidation.json").write_text('{"backup": "../x", "replaces": []}')
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(ConsolidateBackupsError):
+            consolidate_backups(target_path, ConsolidateBackupsConfig(RetentionPolicy(), False))
@@ -0,0 +1,72 @@
+import errno
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from incremental_backup import file_copy
+from incremental_backup.file_copy import CopyMethod, copy_file
+
+from test.helpers import AssertFilesystemUnmodified, write_file_with_mtime
+
+
+def test_copy_file(tmpdir: Path) -> None:
+    source = tmpdir / "source.txt"
+    mtime = datetime(2019, 4, 5, 6, 7, 8, tzinfo=timezone.utc)
+    write_file_with_mtime(source, "some file contents\n" * 1000, mtime)
+    destination = tmpdir / "destination.txt"
+
+    method = copy_file(source, destination)
+
+    assert isinstance(method, CopyMethod)
+    assert destination.read_text() == source.read_text()
+    assert destination.stat().st_mtime == mtime.timestamp()
+
+
+def test_copy_file_empty(tmpdir: Path) -> None:
+    source = tmpdir / "empty"
+    source.touch()
+    destination = tmpdir / "empty copy"
+
+    copy_file(source, destination)
+
+    assert destination.read_bytes() == b""
+
+
+def test_copy_file_standard(tmpdir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(file_copy, "_REFLINK_AVAILABLE", False)
+    monkeypatch.setattr(file_copy, "_COPY_FILE_RANGE_AVAILABLE", False)
+    source = tmpdir / "source"
+    source.write_text("qwerty")
+    destination = tmpdir / "destination"
+
+    assert copy_file(source, destination) == CopyMethod.STANDARD
+    assert destination.read_text() == "qwerty"
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="Requires os.copy_file_range()")
+def test_copy_file_copy_file_range_fails(tmpdir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Should start again with the next method if copy_file_range() fails partway.
+
+    monkeypatch.setattr(file_copy, "_REFLINK_AVAILABLE", False)
+    real_copy_file_range = os.copy_file_range
+
+    def copy_file_range(source_fd: int, destination_fd: int, count: int) -> int:
+        if real_copy_file_range(source_fd, destination_fd, 3) == 0:
+            return 0
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    monkeypatch.setattr(os, "copy_file_range", copy_file_range)
+    source = tmpdir / "source"
+    source.write_text("0123456789")
+    destination = tmpdir / "destination"
+
+    assert copy_file(source, destination) == CopyMethod.STANDARD
+    assert destination.read_text() == "0123456789"
+
+
+def test_copy_file_nonexistent(tmpdir: Path) -> None:
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(FileNotFoundError):
+            copy_file(tmpdir / "nonexistent", tmpdir / "destination")
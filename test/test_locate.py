@@ -0,0 +1,162 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from incremental_backup.locate import LocateFileCallbacks, locate_file
+from incremental_backup.meta.meta import ReadBackupsCallbacks
+
+from test.helpers import AssertFilesystemUnmodified
+
+CONTENT_HASH = "ab" + "c" * 62
+
+
+def write_backup(target_dir: Path, name: str, start_time: str, manifest: str) -> None:
+    backup_dir = target_dir / name
+    backup_dir.mkdir(parents=True)
+    (backup_dir / "start.json").write_text(f'{{"start_time": "{start_time}"}}', encoding="utf8")
+    (backup_dir / "manifest.json").write_text(manifest, encoding="utf8")
+
+
+def make_backups(target_dir: Path) -> None:
+    write_backup(
+        target_dir,
+        "ws3e48ohitv",
+        "2022-03-12T11:53:22.954665+00:00",
+        """[{"n": "", "cf": ["top.txt"]}, {"n": "docs", "cf": ["report.doc", "notes.txt"]},
+            {"n": "old", "cf": ["x"]}, "^2", {"n": "photos", "cf": ["beach.jpg"], "ch": ["%s"]}]"""
+        % CONTENT_HASH,
+    )
+    write_backup(
+        target_dir,
+        "9w384rapw9ssa",
+        "2022-04-12T11:53:22.954665+00:00",
+        """[{"n": ""}, {"n": "docs", "cf": ["report.doc"], "rf": ["notes.txt"], "rd": ["old"]}]""",
+    )
+    # docs removed, then created again with a different file.
+    write_backup(
+        target_dir,
+        "98P678676h9645",
+        "2022-04-25T14:50:59.430968+00:00",
+        """[{"n": "", "rd": ["docs"]}, {"n": "other", "cf": ["report.doc"]}, "^1", {"n": "docs", "cf": ["new.txt"]}]""",
+    )
+
+
+def test_locate_file(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    make_backups(target_dir)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        located = locate_file(target_dir, "top.txt")
+    assert located is not None
+    assert located.backup.name == "ws3e48ohitv"
+    assert located.path == ("top.txt",)
+    assert not located.removed
+    assert located.content_hash is None
+
+    with AssertFilesystemUnmodified(tmpdir):
+        located = locate_file(target_dir, "./photos//beach.jpg")
+    assert located is not None
+    assert located.backup.name == "ws3e48ohitv"
+    assert located.path == ("photos", "beach.jpg")
+    assert located.content_hash == CONTENT_HASH
+
+    with AssertFilesystemUnmodified(tmpdir):
+        located = locate_file(target_dir, "docs/new.txt")
+    assert located is not None
+    assert located.backup.name == "98P678676h9645"
+    assert located.path == ("docs", "new.txt")
+    assert not located.removed
+
+    with AssertFilesystemUnmodified(tmpdir):
+        assert locate_file(target_dir, "nonexistent") is None
+        assert locate_file(target_dir, "docs") is None
+
+
+def test_locate_file_removed(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    make_backups(target_dir)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        # Containing directory removed, then created again in the same backup.
+        located = locate_file(target_dir, "docs/report.doc")
+    assert located is not None
+    assert located.backup.name == "98P678676h9645"
+    assert located.path == ("docs", "report.doc")
+    assert located.removed
+
+    with AssertFilesystemUnmodified(tmpdir):
+        located = locate_file(target_dir, "docs/old/x")
+    assert located is not None
+    assert located.backup.name == "98P678676h9645"
+    assert located.removed
+
+    with AssertFilesystemUnmodified(tmpdir):
+        located = locate_file(target_dir, "docs/notes.txt", datetime(2022, 4, 20, tzinfo=timezone.utc))
+    assert located is not None
+    assert located.backup.name == "9w384rapw9ssa"
+    assert located.removed
+
+
+def test_locate_file_at_time(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    make_backups(target_dir)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        located = locate_file(target_dir, "docs/report.doc", datetime(2022, 4, 20, tzinfo=timezone.utc))
+    assert located is not None
+    assert located.backup.name == "9w384rapw9ssa"
+    assert not located.removed
+
+    with AssertFilesystemUnmodified(tmpdir):
+        located = locate_file(target_dir, "docs/notes.txt", datetime(2022, 4, 1, tzinfo=timezone.utc))
+    assert located is not None
+    assert located.backup.name == "ws3e48ohitv"
+    assert not located.removed
+
+    with AssertFilesystemUnmodified(tmpdir):
+        assert locate_file(target_dir, "top.txt", datetime(2022, 1, 1, tzinfo=timezone.utc)) is None
+
+
+def test_locate_file_manifest_error(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    make_backups(target_dir)
+    # Invalid only within a directory which doesn't contain the file, so not read.
+    (target_dir / "98P678676h9645" / "manifest.json").write_text(
+        """[{"n": ""}, {"n": "other"}, {"n": "sub", "cf": 5}]""", encoding="utf8"
+    )
+    (target_dir / "9w384rapw9ssa" / "manifest.json").write_text(
+        """[{"n": ""}, {"n": "docs", "cf": 5}]""", encoding="utf8"
+    )
+
+    errors: list[Path] = []
+    callbacks = LocateFileCallbacks(
+        read_backups=ReadBackupsCallbacks(
+            on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+            on_read_metadata_error=lambda path, error: pytest.fail(
+                f"Unexpected on_read_metadata_error: {path=} {error=}"
+            ),
+        ),
+        on_read_manifest_error=lambda path, error: errors.append(path),
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        located = locate_file(target_dir, "docs/report.doc", None, callbacks)
+    assert located is not None
+    assert located.backup.name == "ws3e48ohitv"
+    assert not located.removed
+    assert errors == [target_dir / "9w384rapw9ssa"]
+
+
+def test_locate_file_invalid_args(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    make_backups(target_dir)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        for path in ("", ".", "/top.txt", "docs/../top.txt"):
+            with pytest.raises(ValueError):
+                locate_file(target_dir, path)
+        with pytest.raises(ValueError):
+            locate_file(target_dir, "top.txt", None, read_workers=0)
+
+    with pytest.raises(OSError):
+        locate_file(tmpdir / "nonexistent", "top.txt")
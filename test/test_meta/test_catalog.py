@@ -0,0 +1,80 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from incremental_backup.meta.catalog import (
+    BackupCatalog,
+    BackupCatalogParseError,
+    read_backup_catalog_file,
+    write_backup_catalog_file,
+)
+
+from test.helpers import AssertFilesystemUnmodified, dir_entries
+
+
+def test_write_backup_catalog_file(tmpdir: Path) -> None:
+    path = tmpdir / "catalog.json"
+    catalog = BackupCatalog(
+        [
+            BackupCatalog.Entry(
+                "a9w384yt9w8y", datetime(2021, 8, 13, 16, 54, 33, 1234, tzinfo=timezone.utc), 345, True
+            ),
+            BackupCatalog.Entry("q39g4uq3948ty", datetime(2021, 8, 14, tzinfo=timezone.utc), 0, False),
+        ]
+    )
+    write_backup_catalog_file(path, catalog)
+    data = path.read_text(encoding="utf8")
+    expected = (
+        "[\n"
+        '{\n"name": "a9w384yt9w8y",\n"start_time": "2021-08-13T16:54:33.001234+00:00",\n'
+        '"manifest_size": 345,\n"valid": true\n},\n'
+        '{\n"name": "q39g4uq3948ty",\n"start_time": "2021-08-14T00:00:00+00:00",\n'
+        '"manifest_size": 0,\n"valid": false\n}\n'
+        "]"
+    )
+    assert data == expected
+    # Temporary file should be gone.
+    assert dir_entries(tmpdir) == {"catalog.json"}
+
+
+def test_write_read_backup_catalog_file(tmpdir: Path) -> None:
+    path = tmpdir / "catalog.json"
+    catalog = BackupCatalog(
+        [
+            BackupCatalog.Entry("sdfgh48tw9h8", datetime(2022, 1, 2, 3, 4, 5, tzinfo=timezone.utc), 0, False),
+            BackupCatalog.Entry("丫5e8g7wn47", datetime(2022, 2, 2, 3, 4, 5, tzinfo=timezone.utc), 9876543210, True),
+        ]
+    )
+    write_backup_catalog_file(path, catalog)
+    # Overwriting should work too.
+    write_backup_catalog_file(path, catalog)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_catalog_file(path)
+    assert actual == catalog
+
+
+def test_read_backup_catalog_file_invalid(tmpdir: Path) -> None:
+    entry = '"name": "abc", "start_time": "2022-01-02T03:04:05+00:00"'
+    datas = (
+        "",
+        "{}",
+        "[1]",
+        '[{"name": "abc"}]',
+        f'[{{{entry}, "manifest_size": 1}}]',
+        f'[{{{entry}, "manifest_size": 1, "valid": true, "extra": 2}}]',
+        '[{"name": "abc", "start_time": "yesterday", "manifest_size": 1, "valid": true}]',
+        f'[{{{entry}, "manifest_size": -1, "valid": false}}]',
+        f'[{{{entry}, "manifest_size": true, "valid": false}}]',
+        f'[{{{entry}, "manifest_size": 1, "valid": 0}}]',
+        '[{"name": 3, "start_time": "2022-01-02T03:04:05+00:00", "manifest_size": 1, "valid": false}]',
+    )
+
+    for i, data in enumerate(datas):
+        path = tmpdir / f"catalog_invalid_{i}.json"
+        path.write_text(data, encoding="utf8")
+
+        with AssertFilesystemUnmodified(tmpdir):
+            with pytest.raises(BackupCatalogParseError):
+                read_backup_catalog_file(path)
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import pytest
+
+from incremental_backup.meta.consolidation import (
+    BackupConsolidation,
+    BackupConsolidationParseError,
+    read_backup_consolidation_file,
+    write_backup_consolidation_file,
+)
+
+from test.helpers import AssertFilesystemUnmodified, dir_entries
+
+
+def test_write_backup_consolidation_file(tmpdir: Path) -> None:
+    path = tmpdir / "consolidation.json"
+    write_backup_consolidation_file(path, BackupConsolidation("q39g4uq3948ty", ("a9w384yt9w8y", "sdfgh48tw9h8")))
+    data = path.read_text(encoding="utf8")
+    expected = (
+        '{\n    "backup": "q39g4uq3948ty",\n'
+        '    "replaces": [\n        "a9w384yt9w8y",\n        "sdfgh48tw9h8"\n    ]\n}'
+    )
+    assert data == expected
+    # Temporary file should be gone.
+    assert dir_entries(tmpdir) == {"consolidation.json"}
+
+
+def test_write_read_backup_consolidation_file(tmpdir: Path) -> None:
+    path = tmpdir / "consolidation.json"
+    consolidation = BackupConsolidation("丫5e8g7wn47", ("sdfgh48tw9h8",))
+    write_backup_consolidation_file(path, consolidation)
+    # Overwriting should work too.
+    write_backup_consolidation_file(path, consolidation)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_consolidation_file(path)
+    assert actual == consolidation
+
+
+def test_read_backup_consolidation_file_invalid(tmpdir: Path) -> None:
+    datas = (
+        "",
+        "[]",
+        '{"backup": "abc"}',
+        '{"backup": "abc", "replaces": [], "extra": 1}',
+        '{"backup": 3, "replaces": []}',
+        '{"backup": "", "replaces": []}',
+        '{"backup": "../abc", "replaces": []}',
+        '{"backup": "abc", "replaces": "def"}',
+        '{"backup": "abc", "replaces": ["def", 2]}',
+        '{"backup": "abc", "replaces": ["de/f"]}',
+        '{"backup": "abc", "replaces": ["def", "abc"]}',
+    )
+
+    for i, data in enumerate(datas):
+        path = tmpdir / f"consolidation_invalid_{i}.json"
+        path.write_text(data, encoding="utf8")
+
+        with AssertFilesystemUnmodified(tmpdir):
+            with pytest.raises(BackupConsolidationParseError):
+                read_backup_consolidation_file(path)
@@ -0,0 +1,100 @@
+from pathlib import Path
+
+import pytest
+
+from incremental_backup.meta.journal import (
+    BackupJournal,
+    BackupJournalParseError,
+    BackupJournalWriter,
+    deserialise_backup_journal,
+    read_backup_journal_file,
+    truncate_backup_journal_file,
+)
+
+from test.helpers import AssertFilesystemUnmodified
+
+
+def test_backup_journal_writer(tmpdir: Path) -> None:
+    path = tmpdir / "journal.jsonl"
+    with open(path, "w", encoding="utf8") as file:
+        writer = BackupJournalWriter(file)
+        writer.add_file(("a", "丫 b", "c.txt"), 1_600_000_000_123456789, 123)
+        writer.add_file(("d",), -5, 0, "0123456789abcdef")
+
+    assert path.read_text(encoding="utf8") == (
+        '["a/丫 b/c.txt", 1600000000123456789, 123, null]\n["d", -5, 0, "0123456789abcdef"]\n'
+    )
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_journal_file(path)
+    assert actual == BackupJournal(
+        [
+            BackupJournal.Entry(("a", "丫 b", "c.txt"), 1_600_000_000_123456789, 123),
+            BackupJournal.Entry(("d",), -5, 0, "0123456789abcdef"),
+        ]
+    )
+
+
+def test_backup_journal_writer_flush_interval(tmpdir: Path) -> None:
+    path = tmpdir / "journal.jsonl"
+    with open(path, "w", encoding="utf8") as file:
+        writer = BackupJournalWriter(file, flush_interval=0)
+        writer.add_file(("a",), 1, 2)
+        # Flushed immediately, so an interruption at this point loses nothing.
+        assert path.read_text(encoding="utf8") == '["a", 1, 2, null]\n'
+
+
+def test_deserialise_backup_journal_incomplete_line() -> None:
+    assert deserialise_backup_journal("") == BackupJournal()
+    assert deserialise_backup_journal('["a", 1, 2, null]') == BackupJournal()
+    assert deserialise_backup_journal('["a", 1, 2, null]\n["b", 3, 4') == BackupJournal(
+        [BackupJournal.Entry(("a",), 1, 2)]
+    )
+
+
+def test_read_backup_journal_file_invalid(tmpdir: Path) -> None:
+    datas = (
+        "\n",
+        "{}\n",
+        "[1]\n",
+        '["a", 0, 1]\n',
+        '["a", 0, 1, null, 2]\n',
+        '["", 0, 1, null]\n',
+        "[1, 0, 1, null]\n",
+        '["a", 0.5, 1, null]\n',
+        '["a", 0, -1, null]\n',
+        '["a", 0, true, null]\n',
+        '["a", 0, 1, 2]\n',
+        '["a", 0, 1, null]\ninvalid\n',
+    )
+
+    for i, data in enumerate(datas):
+        path = tmpdir / f"journal_invalid_{i}.jsonl"
+        path.write_text(data, encoding="utf8")
+
+        with AssertFilesystemUnmodified(tmpdir):
+            with pytest.raises(BackupJournalParseError):
+                read_backup_journal_file(path)
+
+
+def test_truncate_backup_journal_file(tmpdir: Path) -> None:
+    path = tmpdir / "journal.jsonl"
+    complete = '["a", 1, 2, null]\n' * 1000
+
+    path.write_text(complete + '["b", 3', encoding="utf8")
+    truncate_backup_journal_file(path)
+    assert path.read_text(encoding="utf8") == complete
+
+    # Already complete.
+    truncate_backup_journal_file(path)
+    assert path.read_text(encoding="utf8") == complete
+
+    # Incomplete line longer than the chunk size.
+    path.write_text(complete + '["' + "c" * 10000, encoding="utf8")
+    truncate_backup_journal_file(path)
+    assert path.read_text(encoding="utf8") == complete
+
+    # No complete lines.
+    path.write_text('["d", 5', encoding="utf8")
+    truncate_backup_journal_file(path)
+    assert path.read_text(encoding="utf8") == ""
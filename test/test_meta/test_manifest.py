@@ -1,13 +1,26 @@
+import io
 from pathlib import Path
 
 import pytest
 
+from incremental_backup.meta import manifest as manifest_module
 from incremental_backup.meta.manifest import (
     BackupManifest,
     BackupManifestParseError,
+    BackupManifestWriter,
+    ManifestBacktrack,
+    ManifestCopiedFile,
+    ManifestEnterDirectory,
+    ManifestRemovedDirectory,
+    ManifestRemovedFile,
+    deserialise_backup_manifest,
+    iter_backup_manifest,
+    iter_backup_manifest_file,
     read_backup_manifest_file,
+    serialise_backup_manifest,
     write_backup_manifest_file,
 )
+from incremental_backup.path_filter import PathFilter
 
 from test.helpers import AssertFilesystemUnmodified
 
@@ -19,6 +32,7 @@ def test_backup_manifest_directory_init() -> None:
     assert directory.removed_files == []
     assert directory.removed_directories == []
     assert directory.subdirectories == []
+    assert directory.copied_file_hashes == []
 
 
 def test_backup_manifest_init() -> None:
@@ -120,6 +134,53 @@ def test_write_backup_manifest_file(tmpdir: Path) -> None:
     assert actual == expected
 
 
+def test_backup_manifest_writer() -> None:
+    stream = io.StringIO()
+    writer = BackupManifestWriter(stream)
+    writer.enter_directory("", copied_files=["a"])
+    writer.enter_directory("b", removed_files=["ba", "bb"])
+    writer.enter_directory("bc", removed_directories=["bca"])
+    writer.exit_directory()
+    writer.exit_directory()
+    writer.enter_directory("c")
+    writer.enter_directory("ca", copied_files=["caa"])
+    writer.exit_directory()
+    writer.exit_directory()
+    writer.finish()
+
+    expected = BackupManifest(
+        BackupManifest.Directory(
+            "",
+            copied_files=["a"],
+            subdirectories=[
+                BackupManifest.Directory(
+                    "b",
+                    removed_files=["ba", "bb"],
+                    subdirectories=[BackupManifest.Directory("bc", removed_directories=["bca"])],
+                ),
+                BackupManifest.Directory("c", subdirectories=[BackupManifest.Directory("ca", copied_files=["caa"])]),
+            ],
+        )
+    )
+    assert stream.getvalue() == serialise_backup_manifest(expected)
+
+
+def test_backup_manifest_writer_empty() -> None:
+    stream = io.StringIO()
+    BackupManifestWriter(stream).finish()
+    assert stream.getvalue() == serialise_backup_manifest(BackupManifest())
+
+
+def test_backup_manifest_writer_invalid() -> None:
+    writer = BackupManifestWriter(io.StringIO())
+    with pytest.raises(ValueError):
+        writer.exit_directory()
+    writer.enter_directory("")
+    writer.exit_directory()
+    with pytest.raises(ValueError):
+        writer.enter_directory("foo")
+
+
 def test_read_backup_manifest_file_valid(tmpdir: Path) -> None:
     path = tmpdir / "manifest_valid.json"
     contents = """[
@@ -182,7 +243,7 @@ def test_read_backup_manifest_file_invalid(tmpdir: Path) -> None:
         "{}",
         "null",
         "29",
-        "[null]" '["^"]',
+        '[null]["^"]',
         '["^1"]',
         '["^4"]',
         '[{"n": ""}, "^"]',
@@ -199,6 +260,9 @@ def test_read_backup_manifest_file_invalid(tmpdir: Path) -> None:
         '[{"n": "", "cf": ["f1"], "rf": ["f2"], "extra": "value"}]',
         '[{n: "", "cf": ["f1"]}]',
         '[{"n": "", "cf": ["something"]}, {"n": "mydir", ',
+        '[{"n": "", "cf": ["f1", "f2"], "ch": ["aa"]}]',
+        '[{"n": "", "cf": ["f1"], "ch": [1]}]',
+        '[{"n": "", "ch": "aa"}]',
     )
 
     for i, data in enumerate(datas):
@@ -210,6 +274,118 @@ def test_read_backup_manifest_file_invalid(tmpdir: Path) -> None:
                 read_backup_manifest_file(path)
 
 
+def test_iter_backup_manifest_file(tmpdir: Path) -> None:
+    path = tmpdir / "manifest_events.json"
+    contents = """ [{"cf": ["a", "b"], "n": ""}, {"n": "dir1", "rf": ["c"], "rd": ["d"]}, {"n": "dir2"},
+        "^2" , {"n":"dir3","cf":["e"]}] """
+    path.write_text(contents, encoding="utf8")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = list(iter_backup_manifest_file(path))
+
+    expected = [
+        ManifestCopiedFile("a"),
+        ManifestCopiedFile("b"),
+        ManifestEnterDirectory("dir1"),
+        ManifestRemovedFile("c"),
+        ManifestRemovedDirectory("d"),
+        ManifestEnterDirectory("dir2"),
+        ManifestBacktrack(2),
+        ManifestEnterDirectory("dir3"),
+        ManifestCopiedFile("e"),
+    ]
+    assert actual == expected
+
+
+def test_iter_backup_manifest_file_path_filter(tmpdir: Path) -> None:
+    path = tmpdir / "manifest_events.json"
+    # Entries within skipped directories aren't validated.
+    contents = """[{"n": "", "cf": ["a", "b"], "rd": ["dir1", "dir4"]},
+        {"n": "dir1", "cf": ["c"], "rf": ["d"]}, {"n": "dir2", "cf": ["e"]}, "^2",
+        {"n": "dir3"}, {"n": "dir5", "cf": [1], "invalid": true}, "^2",
+        {"n": "dir4"}, {"n": "dir6", "cf": ["f"]}]"""
+    path.write_text(contents, encoding="utf8")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = list(iter_backup_manifest_file(path, PathFilter(["dir1/dir2", "dir1/d", "a", "dir4/dir6"])))
+
+    expected = [
+        ManifestCopiedFile("a"),
+        ManifestRemovedDirectory("dir1"),
+        ManifestRemovedDirectory("dir4"),
+        ManifestEnterDirectory("dir1"),
+        ManifestRemovedFile("d"),
+        ManifestEnterDirectory("dir2"),
+        ManifestCopiedFile("e"),
+        ManifestBacktrack(2),
+        ManifestEnterDirectory("dir4"),
+        ManifestEnterDirectory("dir6"),
+        ManifestCopiedFile("f"),
+    ]
+    assert actual == expected
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = list(iter_backup_manifest_file(path, PathFilter(["other"])))
+    assert actual == []
+
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(BackupManifestParseError):
+            list(iter_backup_manifest_file(path, PathFilter(["dir3"])))
+
+
+def test_backup_manifest_content_hashes(tmpdir: Path) -> None:
+    path = tmpdir / "manifest.json"
+    backup_manifest = BackupManifest(
+        BackupManifest.Directory(
+            "",
+            copied_files=["a", "b"],
+            copied_file_hashes=["a" * 64, "b" * 64],
+            subdirectories=[BackupManifest.Directory("c", copied_files=["d"], removed_files=["e"])],
+        )
+    )
+
+    write_backup_manifest_file(path, backup_manifest)
+    assert '"ch": [\n"' + "a" * 64 in path.read_text(encoding="utf8")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        assert read_backup_manifest_file(path) == backup_manifest
+        actual_events = list(iter_backup_manifest_file(path))
+    expected_events = [
+        ManifestCopiedFile("a", "a" * 64),
+        ManifestCopiedFile("b", "b" * 64),
+        ManifestEnterDirectory("c"),
+        ManifestCopiedFile("d"),
+        ManifestRemovedFile("e"),
+    ]
+    assert actual_events == expected_events
+
+    with pytest.raises(ValueError):
+        BackupManifestWriter(io.StringIO()).enter_directory("", copied_files=["a", "b"], copied_file_hashes=["a"])
+
+
+def test_iter_backup_manifest_small_reads(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Items split across multiple reads from the stream.
+
+    manifest = BackupManifest(
+        BackupManifest.Directory(
+            "",
+            copied_files=["file" * 20],
+            subdirectories=[
+                BackupManifest.Directory("dir\u5673", removed_files=["x", "y"], removed_directories=["z" * 100]),
+                BackupManifest.Directory("dir2", subdirectories=[BackupManifest.Directory("sub", copied_files=["f"])]),
+            ],
+        )
+    )
+    string = serialise_backup_manifest(manifest)
+    expected = list(iter_backup_manifest(io.StringIO(string)))
+    assert len(expected) == 9
+
+    for read_size in (1, 2, 7, 50):
+        monkeypatch.setattr(manifest_module, "_MANIFEST_READ_SIZE", read_size)
+        assert list(iter_backup_manifest(io.StringIO(string))) == expected
+        assert deserialise_backup_manifest(string) == manifest
+
+
 def test_read_backup_manifest_file_nonexistent(tmpdir: Path) -> None:
     path = tmpdir / "manifest_nonexistent.json"
     with AssertFilesystemUnmodified(tmpdir):
@@ -3,13 +3,16 @@ from pathlib import Path
 
 import pytest
 
+from incremental_backup.meta.catalog import BackupCatalog, read_backup_catalog_file
 from incremental_backup.meta.manifest import BackupManifest, BackupManifestParseError
 from incremental_backup.meta.meta import (
     BACKUP_NAME_LENGTH,
+    CATALOG_FILENAME,
     COMPLETE_INFO_FILENAME,
     DATA_DIRECTORY_NAME,
     MANIFEST_FILENAME,
     START_INFO_FILENAME,
+    SUM_CHECKPOINT_FILENAME,
     BackupDirectoryCreationError,
     BackupMetadata,
     ReadBackupsCallbacks,
@@ -18,6 +21,7 @@ from incremental_backup.meta.meta import (
     generate_backup_name,
     read_backup_metadata,
     read_backups,
+    update_backup_catalog,
 )
 from incremental_backup.meta.start_info import BackupStartInfo
 
@@ -32,14 +36,16 @@ def test_backup_filenames() -> None:
                 DATA_DIRECTORY_NAME,
                 MANIFEST_FILENAME,
                 START_INFO_FILENAME,
+                SUM_CHECKPOINT_FILENAME,
             }
         )
-        == 4
+        == 5
     )
     assert COMPLETE_INFO_FILENAME.isascii()
     assert DATA_DIRECTORY_NAME.isascii()
     assert MANIFEST_FILENAME.isascii()
     assert START_INFO_FILENAME.isascii()
+    assert SUM_CHECKPOINT_FILENAME.isascii()
 
 
 def test_check_if_probably_backup_true(tmpdir: Path) -> None:
@@ -125,6 +131,48 @@ def test_read_backup_metadata_ok(tmpdir: Path) -> None:
     assert actual == expected
 
 
+def test_read_backup_metadata_lazy_manifest(tmpdir: Path) -> None:
+    backup_dir = tmpdir / "a65jh8t7opui7sa"
+    backup_dir.mkdir()
+    (backup_dir / "start.json").write_text('{"start_time": "2021-11-22T16:15:04+00:00"}', encoding="utf8")
+    manifest_path = backup_dir / "manifest.json"
+    manifest_path.write_text('[{"n": "", "cf": ["foo.txt"]}', encoding="utf8")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_metadata(backup_dir, lazy_manifest=True)
+    assert actual.name == "a65jh8t7opui7sa"
+    assert actual.start_info == BackupStartInfo(datetime(2021, 11, 22, 16, 15, 4, tzinfo=timezone.utc))
+    assert not actual.is_manifest_loaded
+    assert "<not loaded>" in repr(actual)
+
+    # Manifest is invalid, should only be found when accessed.
+    with pytest.raises(BackupManifestParseError):
+        actual.manifest
+    assert not actual.is_manifest_loaded
+
+    manifest_path.write_text('[{"n": "", "cf": ["foo.txt"]}]', encoding="utf8")
+    expected = BackupMetadata(
+        "a65jh8t7opui7sa",
+        BackupStartInfo(datetime(2021, 11, 22, 16, 15, 4, tzinfo=timezone.utc)),
+        BackupManifest(BackupManifest.Directory("", copied_files=["foo.txt"])),
+    )
+    assert actual.manifest == expected.manifest
+    assert actual.is_manifest_loaded
+    # Should not be read again.
+    manifest_path.unlink()
+    assert actual == expected
+
+
+def test_read_backup_metadata_lazy_manifest_missing(tmpdir: Path) -> None:
+    backup_dir = tmpdir / "a65jh8t7opui7sa"
+    backup_dir.mkdir()
+    (backup_dir / "start.json").write_text('{"start_time": "2021-11-22T16:15:04+00:00"}', encoding="utf8")
+
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(FileNotFoundError):
+            read_backup_metadata(backup_dir, lazy_manifest=True)
+
+
 def test_read_backup_metadata_nonexistent_dir(tmpdir: Path) -> None:
     backup_dir = tmpdir / "567lkjh2378dsfg3"
     with AssertFilesystemUnmodified(tmpdir):
@@ -209,6 +257,178 @@ def test_read_backups(tmpdir: Path) -> None:
     )
 
 
+def test_read_backups_workers(tmpdir: Path) -> None:
+    for i in range(20):
+        backup_path = tmpdir / f"backup{i:02}aw4h9g8s"
+        backup_path.mkdir()
+        (backup_path / "start.json").write_text(
+            f'{{"start_time": "2020-11-04T22:{i:02}:17.458067+00:00"}}', encoding="utf8"
+        )
+        (backup_path / "manifest.json").write_text(f'[{{"n": "", "cf": ["file{i}"]}}]', encoding="utf8")
+    (tmpdir / "backup07aw4h9g8s" / "manifest.json").write_text('[{"n": "", "cf": 3}]', encoding="utf8")
+    (tmpdir / "backup13aw4h9g8s" / "start.json").write_text("{}", encoding="utf8")
+    (tmpdir / "not a backup").mkdir()
+
+    def read(workers: int, parse_processes: int) -> tuple[list[BackupMetadata], list[tuple[Path, str]]]:
+        errors: list[tuple[Path, str]] = []
+        callbacks = ReadBackupsCallbacks(
+            on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+            on_read_metadata_error=lambda path, error: errors.append((path, f"{type(error).__name__}: {error}")),
+        )
+        with AssertFilesystemUnmodified(tmpdir):
+            backups = read_backups(tmpdir, callbacks, workers, parse_processes)
+        return backups, errors
+
+    expected_backups, expected_errors = read(1, 0)
+    assert len(expected_backups) == 18
+    assert len(expected_errors) == 2
+
+    # Results and callbacks should be in the same order, regardless of concurrency.
+    assert read(4, 0) == (expected_backups, expected_errors)
+    assert read(1, 2) == (expected_backups, expected_errors)
+    assert read(3, 2) == (expected_backups, expected_errors)
+
+
+def test_read_backups_lazy_manifests(tmpdir: Path) -> None:
+    backup1 = write_simple_backup(tmpdir, "49hwg8w4h5gy", datetime(2022, 5, 6, tzinfo=timezone.utc), True)
+    backup2 = write_simple_backup(tmpdir, "aq398yfh98we", datetime(2022, 5, 7, tzinfo=timezone.utc), True)
+    (tmpdir / backup2.name / MANIFEST_FILENAME).write_text("[{", encoding="utf8")
+    # Invalid start info, should still be detected.
+    (tmpdir / "w3e4gw48o7gh").mkdir()
+    (tmpdir / "w3e4gw48o7gh" / START_INFO_FILENAME).write_text("{}", encoding="utf8")
+    (tmpdir / "w3e4gw48o7gh" / MANIFEST_FILENAME).write_text("[]", encoding="utf8")
+
+    read_metadata_errors: list[Path] = []
+    callbacks = ReadBackupsCallbacks(
+        on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+        on_read_metadata_error=lambda path, error: read_metadata_errors.append(path),
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backups(tmpdir, callbacks, lazy_manifests=True)
+    assert sorted(b.name for b in actual) == [backup1.name, backup2.name]
+    assert not any(b.is_manifest_loaded for b in actual)
+    assert read_metadata_errors == [tmpdir / "w3e4gw48o7gh"]
+
+    actual.sort(key=lambda b: b.name)
+    assert actual[0] == backup1
+    with pytest.raises(BackupManifestParseError):
+        actual[1].manifest
+
+
+def test_read_backups_invalid_workers(tmpdir: Path) -> None:
+    with pytest.raises(ValueError):
+        read_backups(tmpdir, ReadBackupsCallbacks(), 0)
+    with pytest.raises(ValueError):
+        read_backups(tmpdir, ReadBackupsCallbacks(), 1, -1)
+
+
+def write_simple_backup(target_directory: Path, name: str, start_time: datetime, complete: bool) -> BackupMetadata:
+    backup_path = target_directory / name
+    backup_path.mkdir()
+    (backup_path / START_INFO_FILENAME).write_text(f'{{"start_time": "{start_time.isoformat()}"}}', encoding="utf8")
+    (backup_path / MANIFEST_FILENAME).write_text(f'[{{"n": "", "cf": ["{name}"]}}]', encoding="utf8")
+    if complete:
+        (backup_path / COMPLETE_INFO_FILENAME).write_text(
+            f'{{"end_time": "{start_time.isoformat()}", "paths_skipped": false}}', encoding="utf8"
+        )
+    return BackupMetadata(
+        name, BackupStartInfo(start_time), BackupManifest(BackupManifest.Directory("", copied_files=[name]))
+    )
+
+
+def test_update_backup_catalog(tmpdir: Path) -> None:
+    catalog_path = tmpdir / CATALOG_FILENAME
+    time1 = datetime(2022, 5, 6, 7, 8, 9, tzinfo=timezone.utc)
+    time2 = datetime(2022, 5, 7, 7, 8, 9, tzinfo=timezone.utc)
+    time3 = datetime(2022, 5, 8, 7, 8, 9, tzinfo=timezone.utc)
+    backup1 = write_simple_backup(tmpdir, "49hwg8w4h5gy", time1, True)
+    backup2 = write_simple_backup(tmpdir, "aq398yfh98we", time2, False)
+    # In progress, no manifest yet.
+    (tmpdir / backup2.name / MANIFEST_FILENAME).unlink()
+
+    update_backup_catalog(tmpdir, (backup2, backup1))
+
+    expected_entry1 = BackupCatalog.Entry(backup1.name, time1, 35, True)
+    assert read_backup_catalog_file(catalog_path) == BackupCatalog(
+        [expected_entry1, BackupCatalog.Entry(backup2.name, time2, 0, False)]
+    )
+
+    # Existing valid entries should be reused rather than queried from the backup, but not valid ones should be
+    # queried again.
+    (tmpdir / backup1.name / MANIFEST_FILENAME).unlink()
+    (tmpdir / backup2.name / MANIFEST_FILENAME).write_text("[]", encoding="utf8")
+    backup3 = write_simple_backup(tmpdir, "p9384hf98hf", time3, True)
+    update_backup_catalog(tmpdir, (backup1, backup2, backup3))
+
+    expected_entry2 = BackupCatalog.Entry(backup2.name, time2, 2, True)
+    expected_entry3 = BackupCatalog.Entry(backup3.name, time3, 34, True)
+    assert read_backup_catalog_file(catalog_path) == BackupCatalog([expected_entry1, expected_entry2, expected_entry3])
+
+    update_backup_catalog(tmpdir, (), (backup1.name, backup2.name))
+
+    assert read_backup_catalog_file(catalog_path) == BackupCatalog([expected_entry3])
+
+
+def test_update_backup_catalog_error(tmpdir: Path) -> None:
+    # If the catalog can't be updated, it should be deleted.
+
+    backup1 = write_simple_backup(tmpdir, "49hwg8w4h5gy", datetime(2022, 5, 6, tzinfo=timezone.utc), True)
+    update_backup_catalog(tmpdir, (backup1,))
+    assert (tmpdir / CATALOG_FILENAME).exists()
+
+    # Manifest can't be queried.
+    backup2 = BackupMetadata(
+        "q3948yfhwe8f", BackupStartInfo(datetime(2022, 5, 7, tzinfo=timezone.utc)), BackupManifest()
+    )
+    (tmpdir / backup2.name).write_text("not a directory")
+    with pytest.raises(OSError):
+        update_backup_catalog(tmpdir, (backup2,))
+    assert not (tmpdir / CATALOG_FILENAME).exists()
+
+
+def test_read_backups_catalog(tmpdir: Path) -> None:
+    backup1 = write_simple_backup(tmpdir, "49hwg8w4h5gy", datetime(2022, 5, 6, tzinfo=timezone.utc), True)
+    backup2 = write_simple_backup(tmpdir, "aq398yfh98we", datetime(2022, 5, 7, tzinfo=timezone.utc), True)
+    backup3 = write_simple_backup(tmpdir, "p9384hf98hf", datetime(2022, 5, 8, tzinfo=timezone.utc), True)
+    # Backup 4 was interrupted after its manifest was written, before the catalog was updated, and backup 5 is in
+    # progress.
+    backup4 = write_simple_backup(tmpdir, "w3e4gw48o7gh", datetime(2022, 5, 9, tzinfo=timezone.utc), True)
+    backup5 = write_simple_backup(tmpdir, "o8w7ghwo84f", datetime(2022, 5, 10, tzinfo=timezone.utc), False)
+    (tmpdir / backup4.name / MANIFEST_FILENAME).rename(tmpdir / "manifest.json")
+    (tmpdir / backup5.name / MANIFEST_FILENAME).unlink()
+    update_backup_catalog(tmpdir, (backup1, backup2, backup3, backup4, backup5))
+    (tmpdir / "manifest.json").rename(tmpdir / backup4.name / MANIFEST_FILENAME)
+    # Not in the catalog, so not read.
+    write_simple_backup(tmpdir, "p98w4hf9w8gq", datetime(2022, 5, 11, tzinfo=timezone.utc), True)
+
+    callbacks = ReadBackupsCallbacks(
+        on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+        on_read_metadata_error=lambda path, error: pytest.fail(f"Unexpected on_read_metadata_error: {path=} {error=}"),
+        on_read_catalog_error=lambda path, error: pytest.fail(f"Unexpected on_read_catalog_error: {path=} {error=}"),
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        assert read_backups(tmpdir, callbacks) == [backup1, backup2, backup3, backup4]
+        actual = read_backups(tmpdir, callbacks, catalog_filter=lambda entries: entries[1:2])
+    assert actual == [backup2]
+
+
+def test_read_backups_invalid_catalog(tmpdir: Path) -> None:
+    backup1 = write_simple_backup(tmpdir, "49hwg8w4h5gy", datetime(2022, 5, 6, tzinfo=timezone.utc), True)
+    backup2 = write_simple_backup(tmpdir, "aq398yfh98we", datetime(2022, 5, 7, tzinfo=timezone.utc), False)
+    (tmpdir / CATALOG_FILENAME).write_text("[{]", encoding="utf8")
+
+    catalog_errors: list[Path] = []
+    callbacks = ReadBackupsCallbacks(
+        on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+        on_read_metadata_error=lambda path, error: pytest.fail(f"Unexpected on_read_metadata_error: {path=} {error=}"),
+        on_read_catalog_error=lambda path, error: catalog_errors.append(path),
+    )
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backups(tmpdir, callbacks, catalog_filter=lambda entries: ())
+    assert unordered_equal(actual, (backup1, backup2))
+    assert catalog_errors == [tmpdir / CATALOG_FILENAME]
+
+
 def test_backup_name_length() -> None:
     assert BACKUP_NAME_LENGTH >= 10
 
@@ -0,0 +1,116 @@
+import stat
+from pathlib import Path
+
+import pytest
+
+from incremental_backup.meta.pack import (
+    BackupPackIndex,
+    BackupPackIndexParseError,
+    BackupPackWriter,
+    read_backup_pack_index_file,
+    read_packed_file,
+    write_backup_pack_index_file,
+)
+
+from test.helpers import AssertFilesystemUnmodified, dir_entries
+
+
+def test_backup_pack_writer(tmpdir: Path) -> None:
+    directory = tmpdir / "packs"
+    writer = BackupPackWriter(directory, max_pack_size=10)
+    try:
+        writer.add_file(("a.txt",), b"12345", 1_600_000_000_123456789, 0o644)
+        writer.add_file(("dir", "b.txt"), b"6789", 1_500_000_000_000000000, 0o644)
+        # Doesn't fit in the current pack.
+        writer.add_file(("dir", "c"), b"abc", 0, 0o644)
+        # Larger than the maximum size, gets its own pack.
+        writer.add_file(("dir", "big"), b"0123456789abcdef", 1, 0o644)
+        writer.add_file(("empty",), b"", 2, 0o644)
+        index = writer.finish()
+    finally:
+        writer.close()
+
+    assert index == BackupPackIndex(
+        [
+            BackupPackIndex.Entry(("a.txt",), 0, 0, 5, 1_600_000_000_123456789, 0o644),
+            BackupPackIndex.Entry(("dir", "b.txt"), 0, 5, 4, 1_500_000_000_000000000, 0o644),
+            BackupPackIndex.Entry(("dir", "c"), 1, 0, 3, 0, 0o644),
+            BackupPackIndex.Entry(("dir", "big"), 2, 0, 16, 1, 0o644),
+            BackupPackIndex.Entry(("empty",), 3, 0, 0, 2, 0o644),
+        ]
+    )
+    assert dir_entries(directory) == {"0.pack", "1.pack", "2.pack", "3.pack"}
+    assert (directory / "0.pack").read_bytes() == b"123456789"
+    assert (directory / "1.pack").read_bytes() == b"abc"
+    assert (directory / "2.pack").read_bytes() == b"0123456789abcdef"
+    assert (directory / "3.pack").read_bytes() == b""
+
+
+def test_backup_pack_writer_nothing_packed(tmpdir: Path) -> None:
+    writer = BackupPackWriter(tmpdir / "packs")
+    with AssertFilesystemUnmodified(tmpdir):
+        assert writer.finish() == BackupPackIndex()
+
+
+def test_read_packed_file(tmpdir: Path) -> None:
+    writer = BackupPackWriter(tmpdir / "packs")
+    writer.add_file(("x",), b"first file", 1_234_567_890_987654321, 0o755)
+    writer.add_file(("y",), b"second", 1_000_000_000_000000000, 0o400)
+    index = writer.finish()
+
+    with open(tmpdir / "packs/0.pack", "rb") as pack_file:
+        read_packed_file(pack_file, index.entries[1], tmpdir / "y")
+        read_packed_file(pack_file, index.entries[0], tmpdir / "x")
+        with pytest.raises(OSError):
+            read_packed_file(pack_file, BackupPackIndex.Entry(("z",), 0, 10, 7, 0, 0o644), tmpdir / "z")
+
+    assert (tmpdir / "x").read_bytes() == b"first file"
+    assert (tmpdir / "x").stat().st_mtime_ns == 1_234_567_890_987654321
+    assert stat.S_IMODE((tmpdir / "x").stat().st_mode) == 0o755
+    assert (tmpdir / "y").read_bytes() == b"second"
+    assert (tmpdir / "y").stat().st_mtime_ns == 1_000_000_000_000000000
+    assert stat.S_IMODE((tmpdir / "y").stat().st_mode) == 0o400
+
+
+def test_write_read_backup_pack_index_file(tmpdir: Path) -> None:
+    path = tmpdir / "index.json"
+    index = BackupPackIndex(
+        [
+            BackupPackIndex.Entry(("a", "丫 b", "c.txt"), 0, 0, 123, 1_600_000_000_000000001, 0o644),
+            BackupPackIndex.Entry(("d",), 3, 98765, 0, -5, 0o4755),
+        ]
+    )
+    write_backup_pack_index_file(path, index)
+    assert path.read_text(encoding="utf8") == (
+        '[\n[\n"a/丫 b/c.txt",\n0,\n0,\n123,\n1600000000000000001,\n420\n],\n[\n"d",\n3,\n98765,\n0,\n-5,\n2541\n]\n]'
+    )
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_pack_index_file(path)
+    assert actual == index
+
+
+def test_read_backup_pack_index_file_invalid(tmpdir: Path) -> None:
+    datas = (
+        "",
+        "{}",
+        "[1]",
+        '[["a", 0, 0, 1, 2]]',
+        '[["a", 0, 0, 1, 2, 3, 4]]',
+        '[["", 0, 0, 1, 2, 3]]',
+        "[[1, 0, 0, 1, 2, 3]]",
+        '[["a", -1, 0, 1, 2, 3]]',
+        '[["a", 0, 0.5, 1, 2, 3]]',
+        '[["a", 0, 0, true, 2, 3]]',
+        '[["a", 0, 0, 1, "2", 3]]',
+        '[["a", 0, 0, 1, 2, -3]]',
+        '[["a", 0, 0, 1, 2, false]]',
+    )
+
+    for i, data in enumerate(datas):
+        path = tmpdir / f"index_invalid_{i}.json"
+        path.write_text(data, encoding="utf8")
+
+        with AssertFilesystemUnmodified(tmpdir):
+            with pytest.raises(BackupPackIndexParseError):
+                read_backup_pack_index_file(path)
@@ -3,6 +3,7 @@ from pathlib import Path
 
 import pytest
 
+from incremental_backup.compression import Compression
 from incremental_backup.meta.start_info import (
     BackupStartInfo,
     BackupStartInfoParseError,
@@ -13,6 +14,13 @@ from incremental_backup.meta.start_info import (
 from test.helpers import AssertFilesystemUnmodified
 
 
+def test_backup_start_info_start_time_ns() -> None:
+    start_info = BackupStartInfo(datetime(2021, 8, 13, 16, 54, 33, 1234, tzinfo=timezone.utc))
+    assert start_info.start_time_ns == 1628873673001234000
+    # Not part of the value.
+    assert start_info == BackupStartInfo(datetime(2021, 8, 13, 16, 54, 33, 1234, tzinfo=timezone.utc))
+
+
 def test_write_backup_start_info_file(tmpdir: Path) -> None:
     path = tmpdir / "start_info.json"
     start_info = BackupStartInfo(datetime(2021, 8, 13, 16, 54, 33, 1234, tzinfo=timezone.utc))
@@ -33,15 +41,31 @@ def test_read_backup_start_info_file_valid(tmpdir: Path) -> None:
     assert actual == expected
 
 
+def test_write_backup_start_info_file_compression(tmpdir: Path) -> None:
+    path = tmpdir / "start_info.json"
+    start_info = BackupStartInfo(datetime(2021, 8, 13, 16, 54, 33, tzinfo=timezone.utc), Compression.LZMA)
+    write_backup_start_info_file(path, start_info)
+    data = path.read_text(encoding="utf8")
+    expected = '{\n    "start_time": "2021-08-13T16:54:33+00:00",\n    "compression": "lzma"\n}'
+    assert data == expected
+
+    with AssertFilesystemUnmodified(tmpdir):
+        actual = read_backup_start_info_file(path)
+    assert actual == start_info
+
+
 def test_read_backup_start_info_file_invalid(tmpdir: Path) -> None:
     datas = (
         "",
-        "null" "{}",
+        "null{}",
         "[]",
         "2020-05-01T09:34:10.123456",
         '{"start_time": "2000-01-01T01:01:01"',
-        '{"start_time": 1.20}' '{"start_time": ""',
+        '{"start_time": 1.20}{"start_time": ""',
         '{"start_time": "2100-02-14T00:00:00", "foo": 75.23}',
+        '{"start_time": "2100-02-14T00:00:00", "compression": "zip"}',
+        '{"start_time": "2100-02-14T00:00:00", "compression": null}',
+        '{"compression": "gzip"}',
     )
 
     for i, data in enumerate(datas):
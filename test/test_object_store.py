@@ -0,0 +1,87 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from incremental_backup import object_store
+from incremental_backup.object_store import (
+    StoreFileResult,
+    get_object_path,
+    hash_file,
+    store_file,
+)
+
+from test.helpers import AssertFilesystemUnmodified, dir_entries, write_file_with_mtime
+
+
+def test_hash_file(tmpdir: Path) -> None:
+    path = tmpdir / "file"
+    data = b"some data\n" * 300000
+    path.write_bytes(data)
+
+    with AssertFilesystemUnmodified(tmpdir):
+        assert hash_file(path) == hashlib.sha256(data).hexdigest()
+
+
+def test_get_object_path(tmpdir: Path) -> None:
+    content_hash = "3a" + "f" * 62
+    assert get_object_path(tmpdir, content_hash) == tmpdir / "3a" / ("f" * 62)
+
+
+def test_store_file(tmpdir: Path) -> None:
+    objects = tmpdir / "objects"
+    source = tmpdir / "source.txt"
+    mtime = datetime(2020, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    write_file_with_mtime(source, "file contents", mtime)
+    content_hash = hashlib.sha256(b"file contents").hexdigest()
+
+    assert store_file(objects, source) == StoreFileResult(content_hash, True)
+
+    object_path = get_object_path(objects, content_hash)
+    assert object_path.read_text() == "file contents"
+    assert object_path.stat().st_mtime == mtime.timestamp()
+    assert dir_entries(objects) == {content_hash[:2]}
+
+    # Same content, different file, shouldn't be stored again.
+    duplicate = tmpdir / "duplicate"
+    duplicate.write_text("file contents")
+    with AssertFilesystemUnmodified(objects):
+        assert store_file(objects, duplicate) == StoreFileResult(content_hash, False)
+
+    other = tmpdir / "other"
+    other.write_text("other contents")
+    other_hash = hashlib.sha256(b"other contents").hexdigest()
+    assert store_file(objects, other) == StoreFileResult(other_hash, True)
+    assert get_object_path(objects, other_hash).read_text() == "other contents"
+    # No temporary files left behind.
+    assert dir_entries(objects) == {content_hash[:2], other_hash[:2]}
+
+
+def test_store_file_modified(tmpdir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # If the file is modified after hashing, the object should be stored under the hash of the data copied.
+
+    objects = tmpdir / "objects"
+    source = tmpdir / "source"
+    source.write_text("old")
+
+    real_hash_file = object_store.hash_file
+
+    def hash_file_then_modify(path: os.PathLike) -> str:
+        content_hash = real_hash_file(path)
+        source.write_text("new")
+        return content_hash
+
+    monkeypatch.setattr(object_store, "hash_file", hash_file_then_modify)
+
+    new_hash = hashlib.sha256(b"new").hexdigest()
+    assert store_file(objects, source) == StoreFileResult(new_hash, True)
+    assert get_object_path(objects, new_hash).read_text() == "new"
+    assert not get_object_path(objects, hashlib.sha256(b"old").hexdigest()).exists()
+
+
+def test_store_file_nonexistent(tmpdir: Path) -> None:
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(FileNotFoundError):
+            store_file(tmpdir / "objects", tmpdir / "nonexistent")
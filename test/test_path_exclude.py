@@ -1,6 +1,6 @@
 import re
 
-from incremental_backup.path_exclude import PathExcludePattern, is_path_excluded
+from incremental_backup.path_exclude import PathExcludePattern, PathExcludeSet, is_path_excluded
 
 
 def test_path_exclude_pattern_init() -> None:
@@ -104,3 +104,93 @@ def test_is_path_excluded_advanced() -> None:
     assert not is_path_excluded("/foo.git/", patterns)
     assert not is_path_excluded("/.git.bar/", patterns)
     assert not is_path_excluded("/__pycache__/yeah/man/", patterns)
+
+
+def test_path_exclude_set_matches() -> None:
+    patterns = (
+        r".*/\.git/",
+        "/path/to/file",
+        r"/\$RECYCLE\.BIN/",
+        r"/foo/(a|b)+/",
+        "/alt/x|/alt/y",
+        r"(?i)/case/insensitive",
+        r"/(.)/\1",
+        r"/(?P<name>n)/",
+        r"/(?P<name>n)/more",
+    )
+    paths = (
+        "/",
+        "/.git/",
+        "/my/code/.git/",
+        "/.git/file",
+        "/path/to/file",
+        "/path/to/file/",
+        "/$RECYCLE.BIN/",
+        "/foo/abba/",
+        "/foo/abc/",
+        "/alt/x",
+        "/alt/y",
+        "/alt/z",
+        "/CASE/insensitive",
+        "/case/insensitive/",
+        "/a/a",
+        "/a/b",
+        "/n/",
+        "/n/more",
+        "/n/less",
+    )
+    patterns = tuple(map(PathExcludePattern, patterns))
+
+    exclude_set = PathExcludeSet(patterns)
+    assert not exclude_set.is_empty
+    for path in paths:
+        assert exclude_set.matches(path) == is_path_excluded(path, patterns), path
+
+
+def test_path_exclude_set_empty() -> None:
+    exclude_set = PathExcludeSet(())
+    assert exclude_set.is_empty
+    assert not exclude_set.matches("/")
+    assert not exclude_set.matches("/foo/bar")
+    assert exclude_set.for_directory("/foo/") is exclude_set
+
+
+def test_path_exclude_set_for_directory() -> None:
+    patterns = (
+        "/foo/bar/file",
+        r"/foo/ba\.z/",
+        "/foo/qux.*",
+        "/foo/qu?",
+        "/x|/foo/bar/y",
+    )
+    patterns = tuple(map(PathExcludePattern, patterns))
+    exclude_set = PathExcludeSet(patterns)
+
+    assert exclude_set.for_directory("/") is exclude_set
+
+    foo = exclude_set.for_directory("/foo/")
+    assert foo is exclude_set
+    assert foo.matches("/foo/bar/file")
+
+    bar = foo.for_directory("/foo/bar/")
+    assert not bar.is_empty
+    assert bar.matches("/foo/bar/file")
+    assert bar.matches("/foo/bar/y")
+    assert not bar.matches("/foo/bar/other")
+    # Should get the same object for the same subset of patterns.
+    assert foo.for_directory("/foo/bar/") is bar
+
+    qux = foo.for_directory("/foo/quxx/")
+    assert qux.matches("/foo/quxx/a")
+    assert not qux.matches("/foo/bar/file")
+
+    # Only the unanchored patterns could match.
+    other = exclude_set.for_directory("/other/")
+    assert not other.is_empty
+    assert other.matches("/other/x") is False
+
+    anchored = PathExcludeSet(map(PathExcludePattern, ("/foo/bar/file", r"/foo/ba\.z/")))
+    assert anchored.for_directory("/other/").is_empty
+    assert anchored.for_directory("/foo/ba.z/").is_empty
+    assert anchored.for_directory("/foo/b/").is_empty
+    assert not anchored.for_directory("/foo/").is_empty
@@ -0,0 +1,108 @@
+import pytest
+
+from incremental_backup.path_exclude import PathExcludePattern
+from incremental_backup.path_filter import PathFilter, split_relative_path
+
+
+def test_path_filter_empty() -> None:
+    path_filter = PathFilter()
+    assert path_filter.includes_all
+    assert path_filter.includes_file("a")
+    subdirectory_filter = path_filter.enter_directory("dir")
+    assert subdirectory_filter is not None
+    assert subdirectory_filter.includes_all
+
+
+def test_path_filter_paths() -> None:
+    path_filter = PathFilter(["projects/website/", "./notes.txt", "projects//app/src/main.c"])
+    assert not path_filter.includes_all
+    assert path_filter.includes_file("notes.txt")
+    assert not path_filter.includes_file("other.txt")
+    assert path_filter.enter_directory("other") is None
+
+    projects_filter = path_filter.enter_directory("projects")
+    assert projects_filter is not None
+    assert not projects_filter.includes_all
+    # A path may name a file or a directory.
+    assert projects_filter.includes_file("website")
+    assert not projects_filter.includes_file("readme.md")
+    assert projects_filter.enter_directory("old") is None
+
+    website_filter = projects_filter.enter_directory("website")
+    assert website_filter is not None
+    assert website_filter.includes_all
+    assert website_filter.includes_file("index.html")
+    sub_filter = website_filter.enter_directory("css")
+    assert sub_filter is not None
+    assert sub_filter.includes_all
+
+    app_filter = projects_filter.enter_directory("app")
+    assert app_filter is not None
+    src_filter = app_filter.enter_directory("src")
+    assert src_filter is not None
+    assert src_filter.includes_file("main.c")
+    assert not src_filter.includes_file("util.c")
+    assert src_filter.enter_directory("main.c") is not None
+    assert src_filter.enter_directory("include") is None
+
+
+def test_path_filter_whole_source() -> None:
+    assert PathFilter([""]).includes_all
+    assert PathFilter(["a", "."]).includes_all
+
+
+def test_path_filter_include_patterns() -> None:
+    path_filter = PathFilter((), [PathExcludePattern(r".*\.txt"), PathExcludePattern("/projects/website/")])
+    assert not path_filter.includes_all
+    assert path_filter.includes_file("notes.txt")
+    assert not path_filter.includes_file("image.jpg")
+
+    projects_filter = path_filter.enter_directory("projects")
+    assert projects_filter is not None
+    assert not projects_filter.includes_all
+    website_filter = projects_filter.enter_directory("website")
+    assert website_filter is not None
+    assert website_filter.includes_all
+    assert website_filter.includes_file("image.jpg")
+
+
+def test_path_filter_include_patterns_skip_directories() -> None:
+    path_filter = PathFilter((), [PathExcludePattern("/projects/website/.*"), PathExcludePattern("/notes/todo")])
+    assert not path_filter.includes_file("todo")
+    # No pattern can match anything within these directories.
+    assert path_filter.enter_directory("other") is None
+    projects_filter = path_filter.enter_directory("projects")
+    assert projects_filter is not None
+    assert projects_filter.enter_directory("app") is None
+    notes_filter = path_filter.enter_directory("notes")
+    assert notes_filter is not None
+    assert notes_filter.includes_file("todo")
+    assert not notes_filter.includes_file("done")
+
+
+def test_path_filter_paths_and_include_patterns() -> None:
+    path_filter = PathFilter(["projects"], [PathExcludePattern(r".*\.py")])
+    assert not path_filter.includes_file("setup.py")
+    projects_filter = path_filter.enter_directory("projects")
+    assert projects_filter is not None
+    assert not projects_filter.includes_all
+    assert projects_filter.includes_file("setup.py")
+    assert not projects_filter.includes_file("readme.md")
+
+
+def test_path_filter_invalid() -> None:
+    with pytest.raises(ValueError):
+        PathFilter(["/absolute"])
+    with pytest.raises(ValueError):
+        PathFilter(["a/../b"])
+
+
+def test_split_relative_path() -> None:
+    assert split_relative_path("") == ()
+    assert split_relative_path("./") == ()
+    assert split_relative_path("a") == ("a",)
+    assert split_relative_path("a//b/./c.txt/") == ("a", "b", "c.txt")
+    with pytest.raises(ValueError):
+        split_relative_path("/a")
+    with pytest.raises(ValueError):
+        split_relative_path("a/../b")
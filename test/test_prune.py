@@ -3,7 +3,8 @@ from typing import Any
 
 import pytest
 
-from incremental_backup.meta.meta import ReadBackupsCallbacks
+from incremental_backup.meta.catalog import read_backup_catalog_file
+from incremental_backup.meta.meta import CATALOG_FILENAME, ReadBackupsCallbacks
 from incremental_backup.prune import (
     BackupPrunabilityOptions,
     PruneBackupsCallbacks,
@@ -120,6 +121,17 @@ def test_is_backup_prunable_other_data(tmpdir: Path) -> None:
     )
 
 
+def test_is_backup_prunable_sum_checkpoint(tmpdir: Path) -> None:
+    backup_path, backup_metadata = MakeBackup.empty()(tmpdir)
+    (backup_path / "sum.json").write_text('{"backups": [], "empty_backups": [], "tree": [{"n": ""}]}')
+
+    assert is_backup_prunable(
+        backup_path,
+        backup_metadata,
+        BackupPrunabilityOptions(prune_empty=True, prune_other_data=False),
+    )
+
+
 def test_prune_backups_nonexistent_target(tmpdir: Path) -> None:
     # Backup target directory doesn't exist.
 
@@ -213,6 +225,9 @@ def test_prune_backups_delete_empty(tmpdir: Path) -> None:
         on_after_read_backups=lambda backups: actual_callbacks.append(("on_after_read_backups", backups)),
         on_selected_backups=lambda backups: actual_callbacks.append(("on_selected_backups", backups)),
         on_delete_error=lambda path, error: pytest.fail(f"Unexpected on_delete_error: {path=} {error=}"),
+        on_update_catalog_error=lambda path, error: pytest.fail(
+            f"Unexpected on_update_catalog_error: {path=} {error=}"
+        ),
     )
 
     with AssertFilesystemUnmodified(backup2_path):
@@ -237,6 +252,9 @@ def test_prune_backups_delete_empty(tmpdir: Path) -> None:
         [backup.name for backup in actual_callbacks[2][1]],
     )
 
+    catalog = read_backup_catalog_file(tmpdir / CATALOG_FILENAME)
+    assert [entry.name for entry in catalog.entries] == [backup2_metadata.name]
+
 
 def test_prune_backups_dry_run(tmpdir: Path) -> None:
     # Normal behaviour of deleting empty backups.
@@ -1,11 +1,26 @@
+import stat
+import time
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any
 
 import pytest
 
+from incremental_backup import restore as restore_module
+from incremental_backup.backup.plan import DEFAULT_PIPELINE_QUEUE_SIZE
 from incremental_backup.backup.sum import BackupSum
+from incremental_backup.compression import Compression, compress_file
+from incremental_backup.locate import LocatedFile
+from incremental_backup.meta.catalog import BackupCatalog, write_backup_catalog_file
 from incremental_backup.meta.meta import BackupMetadata, ReadBackupsCallbacks
+from incremental_backup.meta.pack import (
+    BackupPackIndex,
+    BackupPackWriter,
+    write_backup_pack_index_file,
+)
+from incremental_backup.meta.start_info import BackupStartInfo
+from incremental_backup.path_exclude import PathExcludePattern
+from incremental_backup.path_filter import PathFilter
 from incremental_backup.restore import (
     RestoreCallbacks,
     RestoreError,
@@ -13,10 +28,17 @@ from incremental_backup.restore import (
     RestoreFilesResults,
     RestoreResults,
     perform_restore,
+    restore_file,
     restore_files,
 )
 
-from test.helpers import AssertFilesystemUnmodified, dir_entries, unordered_equal
+from test.helpers import (
+    AssertFilesystemUnmodified,
+    compute_directory_hash,
+    dir_entries,
+    unordered_equal,
+    write_file_with_mtime,
+)
 
 
 def test_restore_files_empty(tmpdir: Path) -> None:
@@ -49,14 +71,14 @@ def test_restore_files(tmpdir: Path) -> None:
     target_dir.mkdir()
 
     # I can't be bothered filling in the rest of the metadata here, it shouldn't be used anyway.
-    backup1 = BackupMetadata("apwerfuhv4835t", None, None)
+    backup1 = BackupMetadata("apwerfuhv4835t", BackupStartInfo(datetime(2021, 1, 1, tzinfo=timezone.utc)), None)
     backup1_data_dir = target_dir / "apwerfuhv4835t/data"
     backup1_data_dir.mkdir(parents=True)
     (backup1_data_dir / "foo.txt").write_text("some thing here")
     (backup1_data_dir / "dir1").mkdir()
     (backup1_data_dir / "dir1/dir1_file1.1").write_text("dir1_file1 text")
 
-    backup2 = BackupMetadata("sfoynbsebo8756s", None, None)
+    backup2 = BackupMetadata("sfoynbsebo8756s", BackupStartInfo(datetime(2021, 1, 1, tzinfo=timezone.utc)), None)
     backup2_data_dir = target_dir / "sfoynbsebo8756s/data"
     backup2_data_dir.mkdir(parents=True)
     (backup2_data_dir / "dir1").mkdir()
@@ -64,7 +86,7 @@ def test_restore_files(tmpdir: Path) -> None:
     (backup2_data_dir / "dir2").mkdir()
     (backup2_data_dir / "dir2/dir2_file").write_text(" < > & ~ & < >")
 
-    backup3 = BackupMetadata("dlrtioyuw3405g", None, None)
+    backup3 = BackupMetadata("dlrtioyuw3405g", BackupStartInfo(datetime(2021, 1, 1, tzinfo=timezone.utc)), None)
     backup3_data_dir = target_dir / "dlrtioyuw3405g/data"
     backup3_data_dir.mkdir(parents=True)
     (backup3_data_dir / "dir2/dir2\u5487\u45fe").mkdir(parents=True)
@@ -126,15 +148,16 @@ def test_restore_files(tmpdir: Path) -> None:
     (destination_dir / "dir1/mkdir_error").unlink(missing_ok=False)
 
     assert [(p, type(e)) for p, e in mkdir_errors] == [(destination_dir / "dir1/mkdir_error", FileExistsError)]
+    # Grouped by backup, in order of first use.
     assert [(s, d, type(e)) for s, d, e in copy_errors] == [
         (
-            target_dir / "sfoynbsebo8756s/data/nonexistent.file",
-            destination_dir / "nonexistent.file",
+            target_dir / "apwerfuhv4835t/data/dir2/nonexistentContents/foo",
+            destination_dir / "dir2/nonexistentContents/foo",
             FileNotFoundError,
         ),
         (
-            target_dir / "apwerfuhv4835t/data/dir2/nonexistentContents/foo",
-            destination_dir / "dir2/nonexistentContents/foo",
+            target_dir / "sfoynbsebo8756s/data/nonexistent.file",
+            destination_dir / "nonexistent.file",
             FileNotFoundError,
         ),
         (
@@ -146,6 +169,7 @@ def test_restore_files(tmpdir: Path) -> None:
 
     expected_results = RestoreFilesResults(5, True)
     assert actual_results == expected_results
+    assert sum(actual_results.copy_methods.values()) == 5
 
     assert dir_entries(destination_dir) == {"foo.txt", "dir1", "dir2"}
     assert (destination_dir / "foo.txt").read_text() == "some thing here"
@@ -163,6 +187,310 @@ def test_restore_files(tmpdir: Path) -> None:
     assert dir_entries(destination_dir / "dir2/nonexistentContents") == set()
 
 
+def test_restore_files_object_store(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    backup1 = BackupMetadata("w948tyhw9ey8", BackupStartInfo(datetime(2021, 1, 1, tzinfo=timezone.utc)), None)
+    backup1_data_dir = target_dir / "w948tyhw9ey8/data"
+    backup1_data_dir.mkdir(parents=True)
+    (backup1_data_dir / "plain.txt").write_text("not deduplicated")
+    backup2 = BackupMetadata("ae4g09w8jh4w", BackupStartInfo(datetime(2021, 1, 1, tzinfo=timezone.utc)), None)
+    (target_dir / "ae4g09w8jh4w/data").mkdir(parents=True)
+    objects_dir = target_dir / "objects"
+    (objects_dir / "ab").mkdir(parents=True)
+    (objects_dir / "ab" / ("c" * 62)).write_text("shared content")
+
+    backup_sum = BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[BackupSum.File("plain.txt", backup1), BackupSum.File("a", backup2, "ab" + "c" * 62)],
+            subdirectories=[
+                BackupSum.Directory(
+                    "dir",
+                    files=[BackupSum.File("b", backup2, "ab" + "c" * 62), BackupSum.File("c", backup2, "f" * 64)],
+                )
+            ],
+        )
+    )
+    destination_dir = tmpdir / "destination"
+
+    copy_errors: list[tuple[Path, Path]] = []
+    callbacks = RestoreFilesCallbacks(
+        on_mkdir_error=lambda path, error: pytest.fail(f"Unexpected on_mkdir_error: {path=} {error=}"),
+        on_copy_error=lambda src, dest, error: copy_errors.append((src, dest)),
+    )
+    with AssertFilesystemUnmodified(target_dir):
+        actual_results = restore_files(target_dir, backup_sum, destination_dir, callbacks)
+
+    assert actual_results == RestoreFilesResults(3, True)
+    assert copy_errors == [(objects_dir / "ff" / ("f" * 62), destination_dir / "dir/c")]
+    assert dir_entries(destination_dir) == {"plain.txt", "a", "dir"}
+    assert (destination_dir / "plain.txt").read_text() == "not deduplicated"
+    assert (destination_dir / "a").read_text() == "shared content"
+    assert dir_entries(destination_dir / "dir") == {"b"}
+    assert (destination_dir / "dir/b").read_text() == "shared content"
+
+
+def test_restore_files_pack(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    backup1 = BackupMetadata("w948tyhw9ey8", BackupStartInfo(datetime(2021, 1, 1, tzinfo=timezone.utc)), None)
+    (target_dir / "w948tyhw9ey8/data/dir").mkdir(parents=True)
+    (target_dir / "w948tyhw9ey8/data/dir/big.txt").write_text("not packed")
+    writer = BackupPackWriter(target_dir / "w948tyhw9ey8/packs", max_pack_size=4)
+    writer.add_file(("a",), b"aaaa", 1_600_000_000_000000000, 0o644)
+    writer.add_file(("dir", "b"), b"bb", 1_500_000_000_123456789, 0o600)
+    writer.add_file(("dir", "truncated"), b"x", 0, 0o644)
+    index = writer.finish()
+    index.entries[2] = BackupPackIndex.Entry(("dir", "truncated"), 1, 2, 5, 0, 0o644)
+    write_backup_pack_index_file(target_dir / "w948tyhw9ey8/packs/index.json", index)
+    backup2 = BackupMetadata("ae4g09w8jh4w", BackupStartInfo(datetime(2021, 1, 1, tzinfo=timezone.utc)), None)
+    (target_dir / "ae4g09w8jh4w/data").mkdir(parents=True)
+    (target_dir / "ae4g09w8jh4w/data/a").write_text("newer, not packed")
+    (target_dir / "ae4g09w8jh4w/packs").mkdir()
+    (target_dir / "ae4g09w8jh4w/packs/index.json").write_text("invalid")
+
+    backup_sum = BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[BackupSum.File("a", backup2)],
+            subdirectories=[
+                BackupSum.Directory(
+                    "dir",
+                    files=[
+                        BackupSum.File("big.txt", backup1),
+                        BackupSum.File("b", backup1),
+                        BackupSum.File("truncated", backup1),
+                    ],
+                )
+            ],
+        )
+    )
+    destination_dir = tmpdir / "destination"
+
+    copy_errors: list[tuple[Path, Path]] = []
+    index_errors: list[Path] = []
+    callbacks = RestoreFilesCallbacks(
+        on_mkdir_error=lambda path, error: pytest.fail(f"Unexpected on_mkdir_error: {path=} {error=}"),
+        on_copy_error=lambda src, dest, error: copy_errors.append((src, dest)),
+        on_read_pack_index_error=lambda path, error: index_errors.append(path),
+    )
+    with AssertFilesystemUnmodified(target_dir):
+        actual_results = restore_files(target_dir, backup_sum, destination_dir, callbacks)
+
+    assert actual_results == RestoreFilesResults(3, True)
+    assert copy_errors == [(target_dir / "w948tyhw9ey8/packs/1.pack", destination_dir / "dir/truncated")]
+    assert index_errors == [target_dir / "ae4g09w8jh4w/packs/index.json"]
+    assert (destination_dir / "a").read_text() == "newer, not packed"
+    assert (destination_dir / "dir/big.txt").read_text() == "not packed"
+    assert (destination_dir / "dir/b").read_text() == "bb"
+    assert (destination_dir / "dir/b").stat().st_mtime_ns == 1_500_000_000_123456789
+    assert stat.S_IMODE((destination_dir / "dir/b").stat().st_mode) == 0o600
+
+
+def test_restore_files_compression(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    start_time = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    backup1 = BackupMetadata("w948tyhw9ey8", BackupStartInfo(start_time, Compression.LZMA), None)
+    (target_dir / "w948tyhw9ey8/data/dir").mkdir(parents=True)
+    mtime = datetime(2020, 5, 6, 7, 8, 9, tzinfo=timezone.utc)
+    write_file_with_mtime(tmpdir / "uncompressed", "compressed data", mtime)
+    compress_file(tmpdir / "uncompressed", target_dir / "w948tyhw9ey8/data/dir/a", Compression.LZMA)
+    (target_dir / "w948tyhw9ey8/data/dir/corrupt").write_text("not compressed")
+    backup2 = BackupMetadata("ae4g09w8jh4w", BackupStartInfo(start_time), None)
+    (target_dir / "ae4g09w8jh4w/data").mkdir(parents=True)
+    (target_dir / "ae4g09w8jh4w/data/b").write_text("not compressed")
+
+    backup_sum = BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[BackupSum.File("b", backup2)],
+            subdirectories=[
+                BackupSum.Directory("dir", files=[BackupSum.File("a", backup1), BackupSum.File("corrupt", backup1)])
+            ],
+        )
+    )
+    destination_dir = tmpdir / "destination"
+
+    copy_errors: list[tuple[Path, Path]] = []
+    callbacks = RestoreFilesCallbacks(
+        on_mkdir_error=lambda path, error: pytest.fail(f"Unexpected on_mkdir_error: {path=} {error=}"),
+        on_copy_error=lambda src, dest, error: copy_errors.append((src, dest)),
+    )
+    with AssertFilesystemUnmodified(target_dir):
+        actual_results = restore_files(target_dir, backup_sum, destination_dir, callbacks)
+
+    assert actual_results == RestoreFilesResults(2, True)
+    assert copy_errors == [(target_dir / "w948tyhw9ey8/data/dir/corrupt", destination_dir / "dir/corrupt")]
+    assert (destination_dir / "b").read_text() == "not compressed"
+    assert (destination_dir / "dir/a").read_text() == "compressed data"
+    assert (destination_dir / "dir/a").stat().st_mtime == mtime.timestamp()
+
+
+def test_restore_file(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    start_time = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    backup1 = BackupMetadata("w948tyhw9ey8", BackupStartInfo(start_time), None)
+    (target_dir / "w948tyhw9ey8/data/dir").mkdir(parents=True)
+    (target_dir / "w948tyhw9ey8/data/dir/plain.txt").write_text("plain")
+    writer = BackupPackWriter(target_dir / "w948tyhw9ey8/packs", max_pack_size=4)
+    writer.add_file(("a",), b"aaaa", 1_600_000_000_000000000, 0o644)
+    writer.add_file(("dir", "b"), b"bb", 1_500_000_000_123456789, 0o644)
+    write_backup_pack_index_file(target_dir / "w948tyhw9ey8/packs/index.json", writer.finish())
+    backup2 = BackupMetadata("ae4g09w8jh4w", BackupStartInfo(start_time, Compression.GZIP), None)
+    (target_dir / "ae4g09w8jh4w/data").mkdir(parents=True)
+    (tmpdir / "uncompressed").write_text("compressed data")
+    compress_file(tmpdir / "uncompressed", target_dir / "ae4g09w8jh4w/data/c", Compression.GZIP)
+    (target_dir / "objects/ab").mkdir(parents=True)
+    (target_dir / "objects/ab" / ("c" * 62)).write_text("shared content")
+
+    destination_dir = tmpdir / "destination"
+    with AssertFilesystemUnmodified(target_dir):
+        restore_file(target_dir, LocatedFile(backup1, ("dir", "plain.txt"), False), destination_dir / "1")
+        assert restore_file(target_dir, LocatedFile(backup1, ("dir", "b"), False), destination_dir / "sub/2") is None
+        assert restore_file(target_dir, LocatedFile(backup2, ("c",), False), destination_dir / "3") is None
+        restore_file(target_dir, LocatedFile(backup2, ("d",), False, "ab" + "c" * 62), destination_dir / "4")
+
+        with pytest.raises(OSError):
+            restore_file(target_dir, LocatedFile(backup2, ("missing",), False), destination_dir / "5")
+        with pytest.raises(ValueError):
+            restore_file(target_dir, LocatedFile(backup1, ("dir", "plain.txt"), True), destination_dir / "6")
+
+    assert dir_entries(destination_dir) == {"1", "sub", "3", "4"}
+    assert (destination_dir / "1").read_text() == "plain"
+    assert (destination_dir / "sub/2").read_text() == "bb"
+    assert (destination_dir / "sub/2").stat().st_mtime_ns == 1_500_000_000_123456789
+    assert (destination_dir / "3").read_text() == "compressed data"
+    assert (destination_dir / "4").read_text() == "shared content"
+
+
+def test_restore_files_workers(tmpdir: Path) -> None:
+    # Restoring with workers should give the same results and callbacks as without. Reads are grouped by source.
+
+    target_dir = tmpdir / "backups"
+    start_time = datetime(2021, 1, 1, tzinfo=timezone.utc)
+    backup1 = BackupMetadata("w948tyhw9ey8", BackupStartInfo(start_time), None)
+    (target_dir / "w948tyhw9ey8/data/dir").mkdir(parents=True)
+    (target_dir / "w948tyhw9ey8/data/a").write_text("backup 1 a")
+    (target_dir / "w948tyhw9ey8/data/dir/b").write_text("backup 1 b")
+    writer = BackupPackWriter(target_dir / "w948tyhw9ey8/packs")
+    writer.add_file(("dir", "packed2"), b"packed second", 1_500_000_000_000000000, 0o644)
+    writer.add_file(("packed1",), b"packed first", 1_600_000_000_000000000, 0o644)
+    write_backup_pack_index_file(target_dir / "w948tyhw9ey8/packs/index.json", writer.finish())
+    backup2 = BackupMetadata("ae4g09w8jh4w", BackupStartInfo(start_time, Compression.GZIP), None)
+    (target_dir / "ae4g09w8jh4w/data/dir").mkdir(parents=True)
+    (tmpdir / "uncompressed").write_text("backup 2 c")
+    compress_file(tmpdir / "uncompressed", target_dir / "ae4g09w8jh4w/data/c", Compression.GZIP)
+    compress_file(tmpdir / "uncompressed", target_dir / "ae4g09w8jh4w/data/dir/d", Compression.GZIP)
+    objects_dir = target_dir / "objects"
+    (objects_dir / "ab").mkdir(parents=True)
+    (objects_dir / "ab" / ("c" * 62)).write_text("object")
+
+    backup_sum = BackupSum(
+        BackupSum.Directory(
+            "",
+            files=[
+                BackupSum.File("a", backup1),
+                BackupSum.File("c", backup2),
+                BackupSum.File("packed1", backup1),
+                BackupSum.File("object", backup2, "ab" + "c" * 62),
+                BackupSum.File("missing1", backup2),
+            ],
+            subdirectories=[
+                BackupSum.Directory(
+                    "dir",
+                    files=[
+                        BackupSum.File("d", backup2),
+                        BackupSum.File("b", backup1),
+                        BackupSum.File("packed2", backup1),
+                        BackupSum.File("missing2", backup1),
+                        BackupSum.File("object", backup1, "ab" + "c" * 62),
+                    ],
+                    subdirectories=[BackupSum.Directory("mkdir_error", files=[BackupSum.File("x", backup1)])],
+                )
+            ],
+        )
+    )
+
+    all_copy_errors: list[list[tuple[Path, Path]]] = []
+    directory_hashes: list[bytes] = []
+    for workers, queue_size in ((1, DEFAULT_PIPELINE_QUEUE_SIZE), (3, DEFAULT_PIPELINE_QUEUE_SIZE), (3, 1)):
+        destination_dir = tmpdir / f"{workers}_{queue_size}" / "destination"
+        (destination_dir / "dir").mkdir(parents=True)
+        (destination_dir / "dir/mkdir_error").touch()
+        mkdir_errors: list[Path] = []
+        copy_errors: list[tuple[Path, Path]] = []
+        callbacks = RestoreFilesCallbacks(
+            on_mkdir_error=lambda path, error: mkdir_errors.append(path),
+            on_copy_error=lambda src, dest, error: copy_errors.append((src, dest)),
+        )
+        with AssertFilesystemUnmodified(target_dir):
+            actual_results = restore_files(target_dir, backup_sum, destination_dir, callbacks, workers, queue_size)
+        (destination_dir / "dir/mkdir_error").unlink()
+
+        assert actual_results == RestoreFilesResults(8, True)
+        assert sum(actual_results.copy_methods.values()) == 4
+        assert mkdir_errors == [destination_dir / "dir/mkdir_error"]
+        all_copy_errors.append([(s.relative_to(target_dir), d.relative_to(destination_dir)) for s, d in copy_errors])
+        directory_hashes.append(compute_directory_hash(destination_dir))
+        assert (destination_dir / "dir/packed2").read_text() == "packed second"
+        assert (destination_dir / "dir/d").read_text() == "backup 2 c"
+
+    assert directory_hashes[0] == directory_hashes[1] == directory_hashes[2]
+    # Grouped by backup, in order of first use.
+    assert (
+        all_copy_errors[0]
+        == all_copy_errors[1]
+        == all_copy_errors[2]
+        == [
+            (Path("w948tyhw9ey8/data/dir/missing2"), Path("dir/missing2")),
+            (Path("ae4g09w8jh4w/data/missing1"), Path("missing1")),
+        ]
+    )
+
+
+def test_restore_files_workers_queue_size(tmpdir: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Only a few batches are submitted to the workers ahead of the one whose results are being handled.
+
+    target_dir = tmpdir / "backups"
+    backup = BackupMetadata("w948tyhw9ey8", BackupStartInfo(datetime(2021, 1, 1, tzinfo=timezone.utc)), None)
+    (target_dir / "w948tyhw9ey8/data").mkdir(parents=True)
+    backup_sum = BackupSum(BackupSum.Directory("", files=[BackupSum.File("missing", backup)]))
+    for i in range(100):
+        (target_dir / f"w948tyhw9ey8/data/{i}.txt").write_text(str(i))
+        backup_sum.root.files.append(BackupSum.File(f"{i}.txt", backup))
+
+    batches_restored: list[Any] = []
+
+    def restore_file_batch(batch: Any, /) -> Any:
+        batches_restored.append(batch)
+        return original_restore_file_batch(batch)
+
+    original_restore_file_batch = restore_module._restore_file_batch
+    monkeypatch.setattr(restore_module, "_restore_file_batch", restore_file_batch)
+
+    batches_restored_at_first_result: list[int] = []
+
+    def on_copy_error(source: Path, destination: Path, error: OSError) -> None:
+        # Give the workers time to restore all they can.
+        time.sleep(0.2)
+        batches_restored_at_first_result.append(len(batches_restored))
+
+    results = restore_files(
+        target_dir, backup_sum, tmpdir / "destination", RestoreFilesCallbacks(on_copy_error=on_copy_error), 2, 4
+    )
+
+    assert results == RestoreFilesResults(100, True, results.copy_methods)
+    assert batches_restored_at_first_result == [4]
+    assert len(batches_restored) == 101
+
+
+def test_restore_files_invalid_workers(tmpdir: Path) -> None:
+    with AssertFilesystemUnmodified(tmpdir):
+        with pytest.raises(ValueError):
+            restore_files(tmpdir / "backups", BackupSum(), tmpdir / "destination", workers=0)
+        with pytest.raises(ValueError):
+            restore_files(tmpdir / "backups", BackupSum(), tmpdir / "destination", workers=2, queue_size=0)
+
+
 def test_perform_restore_invalid_args(tmpdir: Path) -> None:
     target_dir = tmpdir / "backups"
     destination_dir = tmpdir / "destination"
@@ -192,6 +520,8 @@ def test_perform_restore_invalid_args(tmpdir: Path) -> None:
     with AssertFilesystemUnmodified(tmpdir):
         with pytest.raises(ValueError):
             perform_restore(target_dir, destination_dir, backup_name, backup_time, callbacks)
+        with pytest.raises(ValueError):
+            perform_restore(target_dir, destination_dir, callbacks=callbacks, copy_workers=0)
 
 
 def test_perform_restore_nonexistent_target(tmpdir: Path) -> None:
@@ -612,3 +942,125 @@ def test_perform_restore_time(tmpdir: Path) -> None:
     assert (destination_dir / "foo.jpg").read_text() == "hello world"
     assert (destination_dir / "manama").read_text() == "goodbye world"
     assert (destination_dir / "yes.no").read_text() == "hello world 2"
+
+
+def test_perform_restore_catalog(tmpdir: Path) -> None:
+    # With a backup catalog, backups newer than the requested backup should not be read at all.
+
+    target_dir = tmpdir / "backups"
+    target_dir.mkdir()
+
+    backup1_dir = target_dir / "ws3e48ohitv"
+    backup1_dir.mkdir()
+    (backup1_dir / "start.json").write_text('{"start_time": "2022-03-12T11:53:22.954665+00:00"}', encoding="utf8")
+    (backup1_dir / "data").mkdir()
+    (backup1_dir / "data" / "foo.jpg").write_text("hello world")
+    (backup1_dir / "manifest.json").write_text('[{"n": "", "cf": ["foo.jpg"]}]', encoding="utf8")
+
+    backup2_dir = target_dir / "9w384rapw9ssa"
+    backup2_dir.mkdir()
+    (backup2_dir / "start.json").write_text('{"start_time": "2022-04-12T11:53:22.954665+00:00"}', encoding="utf8")
+    (backup2_dir / "data").mkdir()
+    (backup2_dir / "data" / "yes.no").write_text("hello world 2")
+    (backup2_dir / "manifest.json").write_text('[{"n": "", "cf": ["yes.no"]}]', encoding="utf8")
+
+    # Invalid, would be reported if read.
+    backup3_dir = target_dir / "98P678676h9645"
+    backup3_dir.mkdir()
+    (backup3_dir / "start.json").write_text('{"start_time": "2022-04-25T14:50:59.430968+00:00"}', encoding="utf8")
+    (backup3_dir / "manifest.json").write_text('[{"n": "", "cf": "yes.no"}]', encoding="utf8")
+
+    write_backup_catalog_file(
+        target_dir / "catalog.json",
+        BackupCatalog(
+            [
+                BackupCatalog.Entry(
+                    "ws3e48ohitv", datetime(2022, 3, 12, 11, 53, 22, 954665, tzinfo=timezone.utc), 30, True
+                ),
+                BackupCatalog.Entry(
+                    "9w384rapw9ssa", datetime(2022, 4, 12, 11, 53, 22, 954665, tzinfo=timezone.utc), 29, True
+                ),
+                BackupCatalog.Entry(
+                    "98P678676h9645", datetime(2022, 4, 25, 14, 50, 59, 430968, tzinfo=timezone.utc), 27, True
+                ),
+            ]
+        ),
+    )
+
+    destination_dir = tmpdir / "destination"
+
+    read_backups: list[BackupMetadata] = []
+    callbacks = RestoreCallbacks(
+        read_backups=ReadBackupsCallbacks(
+            on_query_entry_error=lambda path, error: pytest.fail(f"Unexpected on_query_entry_error: {path=} {error=}"),
+            on_read_metadata_error=lambda path, error: pytest.fail(
+                f"Unexpected on_read_metadata_error: {path=} {error=}"
+            ),
+            on_read_catalog_error=lambda path, error: pytest.fail(
+                f"Unexpected on_read_catalog_error: {path=} {error=}"
+            ),
+        ),
+        on_after_read_previous_backups=read_backups.extend,
+    )
+
+    with AssertFilesystemUnmodified(target_dir):
+        actual_results = perform_restore(target_dir, destination_dir, backup_name="9w384rapw9ssa", callbacks=callbacks)
+
+    assert [b.name for b in read_backups] == ["ws3e48ohitv", "9w384rapw9ssa"]
+    assert actual_results == RestoreResults(2, False)
+    assert dir_entries(destination_dir) == {"foo.jpg", "yes.no"}
+
+
+def test_perform_restore_path_filter(tmpdir: Path) -> None:
+    target_dir = tmpdir / "backups"
+    target_dir.mkdir()
+
+    backup1_dir = target_dir / "ws3e48ohitv"
+    backup1_dir.mkdir()
+    (backup1_dir / "start.json").write_text('{"start_time": "2022-03-12T11:53:22.954665+00:00"}', encoding="utf8")
+    backup1_data_dir = backup1_dir / "data"
+    (backup1_data_dir / "photos" / "2021").mkdir(parents=True)
+    (backup1_data_dir / "photos" / "2021" / "beach.jpg").write_text("beach")
+    (backup1_data_dir / "photos" / "2021" / "notes.txt").write_text("notes")
+    (backup1_data_dir / "music").mkdir()
+    (backup1_data_dir / "music" / "song.mp3").write_text("song")
+    (backup1_data_dir / "readme.txt").write_text("readme")
+    (backup1_dir / "manifest.json").write_text(
+        """[{"n": "", "cf": ["readme.txt"]}, {"n": "photos"}, {"n": "2021", "cf": ["beach.jpg", "notes.txt"]}, "^2",
+            {"n": "music", "cf": ["song.mp3"]}]""",
+        encoding="utf8",
+    )
+
+    backup2_dir = target_dir / "9w384rapw9ssa"
+    backup2_dir.mkdir()
+    (backup2_dir / "start.json").write_text('{"start_time": "2022-04-12T11:53:22.954665+00:00"}', encoding="utf8")
+    backup2_data_dir = backup2_dir / "data"
+    (backup2_data_dir / "photos" / "2022").mkdir(parents=True)
+    (backup2_data_dir / "photos" / "2022" / "snow.jpg").write_text("snow")
+    # Entries within music are invalid, but not read since nothing in music is selected.
+    (backup2_dir / "manifest.json").write_text(
+        """[{"n": ""}, {"n": "photos"}, {"n": "2022", "cf": ["snow.jpg"]}, "^1", {"n": "2021", "rf": ["notes.txt"]},
+            "^2", {"n": "music"}, {"n": "sub", "cf": 5}]""",
+        encoding="utf8",
+    )
+
+    destination_dir = tmpdir / "destination"
+    with AssertFilesystemUnmodified(target_dir):
+        actual_results = perform_restore(target_dir, destination_dir, path_filter=PathFilter(["photos"]))
+    assert actual_results == RestoreResults(2, False)
+    assert dir_entries(destination_dir) == {"photos"}
+    assert dir_entries(destination_dir / "photos") == {"2021", "2022"}
+    assert (destination_dir / "photos" / "2021" / "beach.jpg").read_text() == "beach"
+    assert dir_entries(destination_dir / "photos" / "2021") == {"beach.jpg"}
+    assert (destination_dir / "photos" / "2022" / "snow.jpg").read_text() == "snow"
+
+    destination_dir = tmpdir / "destination2"
+    with AssertFilesystemUnmodified(target_dir):
+        actual_results = perform_restore(
+            target_dir,
+            destination_dir,
+            path_filter=PathFilter((), [PathExcludePattern(r"/readme\.txt"), PathExcludePattern(r"/photos/.*\.txt")]),
+        )
+    assert actual_results == RestoreResults(1, False)
+    assert dir_entries(destination_dir) == {"readme.txt"}
+    assert (destination_dir / "readme.txt").read_text() == "readme"
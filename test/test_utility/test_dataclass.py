@@ -0,0 +1,38 @@
+import pickle
+from dataclasses import dataclass, field
+
+import pytest
+
+from incremental_backup._utility.dataclass import add_slots
+from incremental_backup.meta.manifest import BackupManifest
+
+
+@add_slots
+@dataclass
+class _Node:
+    name: str
+    children: list["_Node"] = field(default_factory=list)
+    size: int = 0
+
+    def total_size(self) -> int:
+        return self.size + sum(c.total_size() for c in self.children)
+
+
+def test_add_slots() -> None:
+    node = _Node("root", [_Node("child", size=3)], 2)
+    assert _Node.__slots__ == ("name", "children", "size")
+    assert not hasattr(node, "__dict__")
+    assert node == _Node("root", [_Node("child", [], 3)], 2)
+    assert _Node("x").children == []
+    assert _Node("x").children is not _Node("x").children
+    assert node.total_size() == 5
+    assert repr(_Node("x")) == "_Node(name='x', children=[], size=0)"
+    with pytest.raises(AttributeError):
+        node.other = 1  # type: ignore
+
+
+def test_add_slots_pickle() -> None:
+    # Nested classes can be pickled (e.g. to return from another process).
+    manifest = BackupManifest(BackupManifest.Directory("", ["file"], subdirectories=[BackupManifest.Directory("dir")]))
+    assert BackupManifest.Directory.__qualname__ == "BackupManifest.Directory"
+    assert pickle.loads(pickle.dumps(manifest)) == manifest
@@ -0,0 +1,20 @@
+from datetime import datetime, timedelta, timezone
+
+from incremental_backup._utility.time import datetime_from_ns, datetime_to_ns
+
+
+def test_datetime_to_ns() -> None:
+    assert datetime_to_ns(datetime(1970, 1, 1, tzinfo=timezone.utc)) == 0
+    assert datetime_to_ns(datetime(2021, 5, 6, 1, 2, 3, 456789, tzinfo=timezone.utc)) == 1620262923456789000
+    assert datetime_to_ns(datetime(2021, 5, 6, 9, 2, 3, 456789, tzinfo=timezone(timedelta(hours=8)))) == (
+        1620262923456789000
+    )
+    assert datetime_to_ns(datetime(1969, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc)) == -1000
+
+
+def test_datetime_from_ns() -> None:
+    assert datetime_from_ns(0) == datetime(1970, 1, 1, tzinfo=timezone.utc)
+    assert datetime_from_ns(1620262923456789999) == datetime(2021, 5, 6, 1, 2, 3, 456789, tzinfo=timezone.utc)
+    assert datetime_from_ns(-1) == datetime(1969, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc)
+    value = datetime(2030, 12, 31, 23, 59, 59, 1, tzinfo=timezone.utc)
+    assert datetime_from_ns(datetime_to_ns(value)) == value